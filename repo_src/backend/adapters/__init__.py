@@ -0,0 +1 @@
+# Adapters package
@@ -0,0 +1,158 @@
+"""
+Async CRUD for projects and their stored artifacts.
+
+Artifacts are upserted by their natural key: (project, kind) for single
+documents such as the outline, plus (chapter_index, scene_index) for scene
+breakdowns and narratives.
+"""
+import hashlib
+import uuid
+from dataclasses import dataclass
+from typing import AsyncIterator, Optional
+
+from sqlalchemy import and_, delete, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from repo_src.backend.database.models import Project, Artifact
+
+# Rows fetched per round trip when streaming scenes for export.
+EXPORT_FETCH_SIZE = 32
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+@dataclass(frozen=True)
+class SceneText:
+    """The slice of a scene artifact needed to assemble a manuscript."""
+    chapter_index: int
+    chapter_title: str
+    scene_index: int
+    content: str
+
+
+async def create_project(session: AsyncSession, title: str, owner_id: Optional[str] = None) -> Project:
+    project = Project(id=str(uuid.uuid4()), title=title, owner_id=owner_id)
+    session.add(project)
+    await session.commit()
+    await session.refresh(project)
+    return project
+
+
+async def get_project(session: AsyncSession, project_id: str) -> Optional[Project]:
+    return await session.get(Project, project_id)
+
+
+async def upsert_artifact(
+    session: AsyncSession,
+    project_id: str,
+    kind: str,
+    content: str,
+    chapter_index: Optional[int] = None,
+    chapter_title: Optional[str] = None,
+    scene_index: Optional[int] = None,
+    approved: bool = False,
+) -> Artifact:
+    result = await session.execute(
+        select(Artifact).where(
+            Artifact.project_id == project_id,
+            Artifact.kind == kind,
+            Artifact.chapter_index.is_(None) if chapter_index is None else Artifact.chapter_index == chapter_index,
+            Artifact.scene_index.is_(None) if scene_index is None else Artifact.scene_index == scene_index,
+        )
+    )
+    artifact = result.scalars().first()
+    if artifact is None:
+        artifact = Artifact(project_id=project_id, kind=kind, chapter_index=chapter_index, scene_index=scene_index)
+        session.add(artifact)
+    artifact.content = content
+    artifact.content_hash = content_hash(content)
+    artifact.chapter_title = chapter_title
+    artifact.approved = approved
+    await session.commit()
+    await session.refresh(artifact)
+    return artifact
+
+
+async def replace_chapter_artifacts(
+    session: AsyncSession,
+    project_id: str,
+    kind: str,
+    chapter_index: int,
+    chapter_title: Optional[str],
+    contents: list[str],
+) -> None:
+    """Stores one `kind` artifact per scene of a chapter (scene_index 0..n-1), dropping any others."""
+    await session.execute(
+        delete(Artifact).where(
+            Artifact.project_id == project_id, Artifact.kind == kind, Artifact.chapter_index == chapter_index
+        )
+    )
+    session.add_all(
+        Artifact(
+            project_id=project_id, kind=kind, chapter_index=chapter_index, chapter_title=chapter_title,
+            scene_index=scene_index, content=content, content_hash=content_hash(content),
+        )
+        for scene_index, content in enumerate(contents)
+    )
+    await session.commit()
+
+
+async def get_chapter_artifacts(session: AsyncSession, project_id: str, kind: str, chapter_index: int) -> list[Artifact]:
+    """A chapter's `kind` artifacts in scene order."""
+    result = await session.execute(
+        select(Artifact)
+        .where(Artifact.project_id == project_id, Artifact.kind == kind, Artifact.chapter_index == chapter_index)
+        .order_by(Artifact.scene_index)
+    )
+    return list(result.scalars())
+
+
+async def get_artifact_content(session: AsyncSession, project_id: str, kind: str) -> Optional[str]:
+    """Content of a single-document artifact (outline, worldbuilding, concept)."""
+    result = await session.execute(
+        select(Artifact.content).where(Artifact.project_id == project_id, Artifact.kind == kind).limit(1)
+    )
+    return result.scalar_one_or_none()
+
+
+async def get_latest_before(
+    session: AsyncSession, project_id: str, kind: str, chapter_index: int, scene_index: int
+) -> Optional[str]:
+    """Content of the last `kind` artifact positioned strictly before (chapter_index, scene_index)."""
+    result = await session.execute(
+        select(Artifact.content)
+        .where(
+            Artifact.project_id == project_id,
+            Artifact.kind == kind,
+            or_(
+                Artifact.chapter_index < chapter_index,
+                and_(Artifact.chapter_index == chapter_index, Artifact.scene_index < scene_index),
+            ),
+        )
+        .order_by(Artifact.chapter_index.desc(), Artifact.scene_index.desc())
+        .limit(1)
+    )
+    return result.scalar_one_or_none()
+
+
+async def iter_scene_texts(session: AsyncSession, project_id: str) -> AsyncIterator[SceneText]:
+    """
+    Streams scene narratives in chapter/scene order using a server-side cursor,
+    so only EXPORT_FETCH_SIZE scenes are held in memory at a time.
+    """
+    stmt = (
+        select(Artifact.chapter_index, Artifact.chapter_title, Artifact.scene_index, Artifact.content)
+        .where(Artifact.project_id == project_id, Artifact.kind == "scene_narrative")
+        .order_by(Artifact.chapter_index, Artifact.scene_index)
+        .execution_options(yield_per=EXPORT_FETCH_SIZE)
+    )
+    result = await session.stream(stmt)
+    async for row in result:
+        yield SceneText(
+            chapter_index=row.chapter_index or 0,
+            chapter_title=row.chapter_title or f"Chapter {(row.chapter_index or 0) + 1}",
+            scene_index=row.scene_index or 0,
+            content=row.content,
+        )
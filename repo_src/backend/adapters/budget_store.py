@@ -0,0 +1,83 @@
+"""
+Async persistence for usage budgets (see models.UsageBudget).
+
+Usage is added with a single relative UPDATE (tokens_used = tokens_used + n),
+so concurrent calls and several workers never lose increments; the row is
+inserted on first use.
+"""
+from typing import Iterable, Optional
+
+from sqlalchemy import or_, select, tuple_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from repo_src.backend.database.models import UsageBudget
+
+
+async def get_budgets(session: AsyncSession, keys: Iterable[tuple[str, str]]) -> dict[tuple[str, str], UsageBudget]:
+    """Existing budget rows for the given (scope, scope_id) keys, in one query."""
+    keys = list(keys)
+    if not keys:
+        return {}
+    result = await session.execute(select(UsageBudget).where(tuple_(UsageBudget.scope, UsageBudget.scope_id).in_(keys)))
+    return {(b.scope, b.scope_id): b for b in result.scalars()}
+
+
+async def any_limits(session: AsyncSession) -> bool:
+    """Whether any scope has a token or cost limit (then unscoped calls are refused)."""
+    statement = select(UsageBudget.id).where(
+        or_(UsageBudget.token_limit.is_not(None), UsageBudget.cost_limit_usd.is_not(None))
+    ).limit(1)
+    return (await session.execute(statement)).first() is not None
+
+
+async def get_budget(session: AsyncSession, scope: str, scope_id: str) -> Optional[UsageBudget]:
+    return (await get_budgets(session, [(scope, scope_id)])).get((scope, scope_id))
+
+
+async def _get_or_create(session: AsyncSession, scope: str, scope_id: str) -> UsageBudget:
+    budget = await get_budget(session, scope, scope_id)
+    if budget is not None:
+        return budget
+    budget = UsageBudget(scope=scope, scope_id=scope_id, tokens_used=0, cost_used_usd=0.0)
+    session.add(budget)
+    try:
+        await session.commit()
+    except IntegrityError:  # Created concurrently by another request or worker
+        await session.rollback()
+        budget = await get_budget(session, scope, scope_id)
+    return budget
+
+
+async def set_limits(
+    session: AsyncSession,
+    scope: str,
+    scope_id: str,
+    token_limit: Optional[int],
+    cost_limit_usd: Optional[float],
+    reset_usage: bool = False,
+) -> UsageBudget:
+    budget = await _get_or_create(session, scope, scope_id)
+    budget.token_limit = token_limit
+    budget.cost_limit_usd = cost_limit_usd
+    if reset_usage:
+        budget.tokens_used = 0
+        budget.cost_used_usd = 0.0
+    await session.commit()
+    await session.refresh(budget)
+    return budget
+
+
+async def add_usage(session: AsyncSession, keys: Iterable[tuple[str, str]], tokens: int, cost_usd: float) -> None:
+    """Adds one call's usage to every given scope, creating rows as needed."""
+    for scope, scope_id in keys:
+        statement = (
+            update(UsageBudget)
+            .where(UsageBudget.scope == scope, UsageBudget.scope_id == scope_id)
+            .values(tokens_used=UsageBudget.tokens_used + tokens, cost_used_usd=UsageBudget.cost_used_usd + cost_usd)
+        )
+        if (await session.execute(statement)).rowcount == 0:
+            await session.commit()
+            await _get_or_create(session, scope, scope_id)
+            await session.execute(statement)
+    await session.commit()
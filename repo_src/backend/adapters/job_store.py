@@ -0,0 +1,62 @@
+"""
+Generation jobs (models.GenerationJob), written through the batched write queue.
+
+A streamed generation reports its progress with every token. Each report is a
+write keyed by the job, so a flush sends only the latest progress per job;
+creating a job and recording its final status are queued writes too, and
+nothing here waits for a transaction. The queue is started by the app's
+lifespan; without it (scripts, unit tests) jobs are not recorded and
+start_job() returns None, which the other functions accept.
+"""
+import uuid
+from typing import Optional
+
+from sqlalchemy import bindparam, insert, select, update
+
+from repo_src.backend.database.models import GenerationJob, Project
+from repo_src.backend.database.write_queue import get_write_queue
+
+# One statement object each, so queued writes of the same kind are flushed as one executemany.
+# A job for a project that is not stored gets project_id NULL rather than failing the foreign key.
+_INSERT_JOB = insert(GenerationJob).values(
+    id=bindparam("job_id"),
+    project_id=select(Project.id).where(Project.id == bindparam("project_id")).scalar_subquery(),
+    stage=bindparam("stage"),
+    status="running",
+    input_hash=bindparam("input_hash"),
+    progress_tokens=0,
+)
+_SET_PROGRESS = (
+    update(GenerationJob)
+    .where(GenerationJob.id == bindparam("job_id"))
+    .values(progress_tokens=bindparam("tokens"))
+)
+_SET_STATUS = (
+    update(GenerationJob)
+    .where(GenerationJob.id == bindparam("job_id"))
+    .values(status=bindparam("new_status"), error=bindparam("new_error"))
+)
+
+
+async def start_job(project_id: Optional[str], stage: str, input_hash: Optional[str] = None) -> Optional[str]:
+    """Records a running job and returns its id, or None when the write queue is not running."""
+    queue = get_write_queue()
+    if not queue.running:
+        return None
+    job_id = str(uuid.uuid4())
+    await queue.put(_INSERT_JOB, {"job_id": job_id, "project_id": project_id, "stage": stage, "input_hash": input_hash})
+    return job_id
+
+
+async def record_progress(job_id: Optional[str], tokens: int) -> None:
+    """Sets the job's generated token count; pending updates for the same job are coalesced."""
+    if job_id is not None:
+        await get_write_queue().put(_SET_PROGRESS, {"job_id": job_id, "tokens": tokens}, key=("job-progress", job_id))
+
+
+async def finish_job(job_id: Optional[str], status: str, error: Optional[str] = None) -> None:
+    """Records the job's final status: succeeded | failed | cancelled."""
+    if job_id is not None:
+        await get_write_queue().put(
+            _SET_STATUS, {"job_id": job_id, "new_status": status, "new_error": error}, key=("job-status", job_id)
+        )
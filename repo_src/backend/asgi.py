@@ -0,0 +1,10 @@
+"""Small helpers shared by the raw ASGI middleware (middleware.py, diagnostics.py)."""
+from typing import Optional
+
+
+def asgi_header(scope_or_message: dict, name: bytes) -> Optional[str]:
+    """The first value of header `name` (lowercase bytes) in an ASGI scope or response start message."""
+    for key, value in scope_or_message.get("headers", []):
+        if key.lower() == name:
+            return value.decode("latin-1")
+    return None
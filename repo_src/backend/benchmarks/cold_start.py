@@ -0,0 +1,111 @@
+"""
+Cold-start benchmark: how long a fresh interpreter takes to import the app.
+
+Each run starts a new `python -X importtime -c "import <module>"` subprocess
+(the same work a worker or a test session does before serving anything),
+parses the importtime report from stderr and records the module's cumulative
+import time. Prints the median over the runs and the slowest imports of the
+last run, and exits non-zero when the median exceeds the budget.
+
+Run from the project root:
+    python -m repo_src.backend.benchmarks.cold_start --runs 5 --budget-ms 1500
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from dataclasses import dataclass
+
+DEFAULT_MODULE = "repo_src.backend.main"
+COLD_START_BUDGET_MS = float(os.getenv("COLD_START_BUDGET_MS", "1500"))
+# Must stay off the startup path (imported lazily on first use).
+LAZY_MODULES = ("alembic", "httpx", "repo_src.backend.systemawriter_logic.manuscript_export")
+
+
+@dataclass
+class ImportTiming:
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int  # Nesting level in the import tree (0 = imported directly)
+
+
+def parse_importtime(stderr: str) -> list[ImportTiming]:
+    """Parses `-X importtime` lines ("import time: self [us] | cumulative | imported package")."""
+    timings = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # The header line
+        name = fields[2].rstrip()
+        stripped = name.lstrip(" ")
+        timings.append(ImportTiming(
+            module=stripped,
+            self_us=int(fields[0]),
+            cumulative_us=int(fields[1]),
+            depth=(len(name) - len(stripped) - 1) // 2,
+        ))
+    return timings
+
+
+def run_once(module: str = DEFAULT_MODULE) -> list[ImportTiming]:
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, check=True,
+    )
+    return parse_importtime(completed.stderr)
+
+
+def cumulative_ms(timings: list[ImportTiming], module: str) -> float:
+    """Cumulative import time of `module` in milliseconds (its last top-level entry)."""
+    for timing in reversed(timings):
+        if timing.module == module:
+            return timing.cumulative_us / 1000
+    raise ValueError(f"{module} not found in importtime output")
+
+
+def lazily_imported_violations(module: str = DEFAULT_MODULE) -> list[str]:
+    """Modules from LAZY_MODULES that importing `module` pulled in anyway."""
+    check = f"import sys, {module}; print('LOADED:' + ','.join(m for m in {LAZY_MODULES!r} if m in sys.modules))"
+    completed = subprocess.run([sys.executable, "-c", check], capture_output=True, text=True, check=True)
+    # The app prints its own startup messages; only the marker line is ours.
+    loaded = next(line for line in completed.stdout.splitlines() if line.startswith("LOADED:"))
+    return [m for m in loaded[len("LOADED:"):].split(",") if m]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default=DEFAULT_MODULE)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=COLD_START_BUDGET_MS)
+    parser.add_argument("--top", type=int, default=15, help="How many of the slowest imports to list")
+    args = parser.parse_args()
+
+    samples, timings = [], []
+    for _ in range(args.runs):
+        timings = run_once(args.module)
+        samples.append(cumulative_ms(timings, args.module))
+    median = statistics.median(samples)
+
+    print(f"Slowest imports (self time) in the last run of `import {args.module}`:")
+    for timing in sorted(timings, key=lambda t: t.self_us, reverse=True)[:args.top]:
+        print(f"  {timing.self_us / 1000:8.1f} ms self  {timing.cumulative_us / 1000:8.1f} ms cumulative  {timing.module}")
+    print(f"\nCold start over {args.runs} runs: median {median:.1f} ms, "
+          f"min {min(samples):.1f} ms, max {max(samples):.1f} ms (budget {args.budget_ms:.0f} ms)")
+
+    failed = False
+    violations = lazily_imported_violations(args.module)
+    if violations:
+        print(f"FAIL: imported at startup but should be lazy: {', '.join(violations)}")
+        failed = True
+    if median > args.budget_ms:
+        print(f"FAIL: median cold start {median:.1f} ms exceeds the {args.budget_ms:.0f} ms budget")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+"""
+Serialization benchmark for large systemawriter payloads.
+
+Builds a synthetic scene-breakdowns response and request with --chapters
+chapters, then compares the time and peak traced memory of:
+
+  response  fastapi-default     jsonable_encoder + json.dumps (routes without a
+                                response_model, or with a custom response class)
+            fastapi-model       response_model path: re-validate, then Pydantic dump_json
+            fast-json           FastJSONResponse.render (what the router returns)
+  request   stdlib              json.loads + model_validate (FastAPI's default)
+            fast-json           fast_json.loads + model_validate (FastJSONRoute)
+            pydantic-json       model_validate_json, for reference
+
+Run from the project root:
+    python -m repo_src.backend.benchmarks.json_payloads --chapters 500
+"""
+import argparse
+import json
+import time
+import tracemalloc
+from dataclasses import dataclass
+from typing import Callable
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from repo_src.backend import fast_json
+from repo_src.backend.data import systemawriter_schemas as schemas
+from repo_src.backend.fast_json import FastJSONResponse
+
+# ~2.3 KB per chapter, with the non-ASCII punctuation real prose has.
+SCENE_TEXT = "- **Goal:** Maya reroutes power to deck 3 — “not yet,” the AI warns.\n" * 30
+
+
+@dataclass
+class Result:
+    payload: str
+    path: str
+    ms: float
+    peak_mb: float
+
+
+def synthetic_response(chapters: int) -> schemas.SceneBreakdownsResponseSchema:
+    return schemas.SceneBreakdownsResponseSchema(
+        scene_breakdowns_by_chapter={f"Chapter {i + 1}: The Long Watch": SCENE_TEXT for i in range(chapters)}
+    )
+
+
+def synthetic_request_body(chapters: int) -> bytes:
+    outline = "".join(f"## Chapter {i + 1}: The Long Watch\n{SCENE_TEXT[:400]}\n" for i in range(chapters))
+    return json.dumps({"approved_outline_md": outline, "approved_worldbuilding_md": SCENE_TEXT * chapters}).encode()
+
+
+def measure(call: Callable[[], object], repeat: int) -> tuple[float, float]:
+    """Mean milliseconds per call, and peak traced memory of one call in MB."""
+    call()  # Warm-up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        call()
+    elapsed_ms = (time.perf_counter() - start) * 1000 / repeat
+    tracemalloc.start()
+    call()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed_ms, peak / 1_000_000
+
+
+def run(chapters: int, repeat: int) -> list[Result]:
+    response = synthetic_response(chapters)
+    adapter = TypeAdapter(schemas.SceneBreakdownsResponseSchema)
+    body = synthetic_request_body(chapters)
+    model = schemas.GenerateSceneBreakdownsSchema
+    cases = [
+        ("response", "fastapi-default", lambda: json.dumps(
+            jsonable_encoder(response), ensure_ascii=False, separators=(",", ":")).encode("utf-8")),
+        ("response", "fastapi-model", lambda: adapter.dump_json(adapter.validate_python(response))),
+        ("response", "fast-json", lambda: FastJSONResponse(response).body),
+        ("request", "stdlib", lambda: model.model_validate(json.loads(body))),
+        ("request", "fast-json", lambda: model.model_validate(fast_json.loads(body))),
+        ("request", "pydantic-json", lambda: model.model_validate_json(body)),
+    ]
+    return [Result(payload, path, *measure(call, repeat)) for payload, path, call in cases]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chapters", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    size_kb = len(FastJSONResponse(synthetic_response(args.chapters)).body) / 1024
+    print(f"{args.chapters} chapters: {size_kb:.0f} KB response, "
+          f"{len(synthetic_request_body(args.chapters)) / 1024:.0f} KB request "
+          f"(orjson {'available' if fast_json.orjson is not None else 'not installed; stdlib json'})\n")
+    print(f"{'payload':<10}{'path':<18}{'ms':>10}{'peak MB':>10}")
+    for r in run(args.chapters, args.repeat):
+        print(f"{r.payload:<10}{r.path:<18}{r.ms:>10.2f}{r.peak_mb:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Write-throughput benchmark for the SQLite production profile and the batched write queue.
+
+Simulates several concurrent generations reporting streaming progress and
+compares four configurations: default pragmas vs the production profile,
+each with one transaction per update vs the BatchedWriteQueue.
+
+Run from the project root:
+    python -m repo_src.backend.benchmarks.sqlite_writes --updates 2000 --producers 8
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from repo_src.backend.database.sqlite_tuning import sqlite_pragmas
+from repo_src.backend.database.write_queue import BatchedWriteQueue
+
+CREATE_TABLE = text("CREATE TABLE progress (job_id TEXT PRIMARY KEY, tokens INTEGER NOT NULL)")
+UPSERT = text(
+    "INSERT INTO progress (job_id, tokens) VALUES (:job_id, :tokens) "
+    "ON CONFLICT(job_id) DO UPDATE SET tokens = excluded.tokens"
+)
+
+
+async def _make_engine(path: str, tuned: bool):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    pragmas = sqlite_pragmas() if tuned else ["PRAGMA busy_timeout=5000"]
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def _apply(dbapi_connection, connection_record):  # noqa: ARG001
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+    async with engine.begin() as conn:
+        await conn.execute(CREATE_TABLE)
+    return engine
+
+
+async def _run_direct(engine, updates: int, producers: int) -> None:
+    async def producer(p: int) -> None:
+        for i in range(updates // producers):
+            async with engine.begin() as conn:
+                await conn.execute(UPSERT, {"job_id": f"job-{p}", "tokens": i})
+
+    await asyncio.gather(*(producer(p) for p in range(producers)))
+
+
+async def _run_batched(engine, updates: int, producers: int) -> None:
+    queue = BatchedWriteQueue(engine)
+    await queue.start()
+
+    async def producer(p: int) -> None:
+        for i in range(updates // producers):
+            await queue.put(UPSERT, {"job_id": f"job-{p}", "tokens": i}, key=f"job-{p}")
+            if i % 16 == 0:
+                await asyncio.sleep(0)  # Tokens arrive interleaved, not in one burst
+
+    await asyncio.gather(*(producer(p) for p in range(producers)))
+    await queue.stop()
+
+
+async def bench(updates: int, producers: int) -> None:
+    print(f"{updates} progress updates from {producers} concurrent producers\n")
+    print(f"{'profile':<12}{'mode':<10}{'seconds':>10}{'updates/s':>14}")
+    for tuned in (False, True):
+        for mode, runner in (("direct", _run_direct), ("batched", _run_batched)):
+            with tempfile.TemporaryDirectory() as tmp:
+                engine = await _make_engine(os.path.join(tmp, "bench.db"), tuned)
+                start = time.perf_counter()
+                await runner(engine, updates, producers)
+                elapsed = time.perf_counter() - start
+                await engine.dispose()
+            profile = "production" if tuned else "default"
+            print(f"{profile:<12}{mode:<10}{elapsed:>10.3f}{updates / elapsed:>14.0f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--producers", type=int, default=8)
+    args = parser.parse_args()
+    asyncio.run(bench(args.updates, args.producers))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,46 +1,204 @@
-from pydantic import BaseModel
-from typing import Optional, List, Dict
+from pydantic import BaseModel, Field, model_validator
+from typing import Optional, List, Dict, Literal
+from datetime import datetime
+
+from repo_src.backend.settings import get_settings
 
 # --- Request Schemas ---
 
-class ConceptInputSchema(BaseModel):
+class SpeculationOptionsMixin(BaseModel):
+    # Opt-in: start generating the next stage in the background once this one returns.
+    speculate: bool = False
+    # Scopes speculations so an edited artifact cancels the stale one for the same project.
+    project_id: Optional[str] = None
+
+class CandidateOptionsMixin(BaseModel):
+    # Alternatives generated concurrently in one round trip; more than MAX_CANDIDATES is a 422.
+    candidates: int = Field(default=1, ge=1, le=get_settings().max_candidates)
+    # Order alternatives by the local heuristics in systemawriter_logic/ranking.py.
+    rank_candidates: bool = True
+
+class ConceptInputSchema(SpeculationOptionsMixin, CandidateOptionsMixin):
     concept_document: str
     # context_files_content: Optional[List[str]] = None # For v0.1, keep it simple. Can add later if FE uploads text.
 
-class GenerateWorldbuildingSchema(BaseModel):
+class GenerateWorldbuildingSchema(SpeculationOptionsMixin):
     concept_document: str
     approved_outline_md: str
     # context_files_content: Optional[List[str]] = None
 
-class GenerateSceneBreakdownsSchema(BaseModel):
+class GenerateSceneBreakdownsSchema(SpeculationOptionsMixin):
     # concept_document: str # Implicitly part of outline & worldbuilding
     approved_outline_md: str
     approved_worldbuilding_md: str
     # context_files_content: Optional[List[str]] = None
+    # JSON scene plans validated per scene (see systemawriter_logic/scene_plans.py); with a
+    # project_id they are stored so scene requests can reference a scene by position.
+    structured: bool = False
+
+def _check_scene_source(scene, has_project: bool) -> None:
+    """A scene is given either inline (plan, chapter title and breakdown) or by its stored position."""
+    if scene.scene_plan_from_breakdown is not None:
+        if scene.chapter_title is None or scene.full_chapter_scene_breakdown is None:
+            raise ValueError("chapter_title and full_chapter_scene_breakdown are required with scene_plan_from_breakdown")
+    elif not has_project or scene.chapter_index is None or scene.scene_index is None:
+        raise ValueError(
+            "Give scene_plan_from_breakdown, or project_id, chapter_index and scene_index of a stored scene plan"
+        )
 
-class GenerateSceneNarrativeSchema(BaseModel):
-    scene_plan_from_breakdown: str # Markdown for the specific scene's plan
-    chapter_title: str
-    full_chapter_scene_breakdown: str # Markdown for the entire chapter's scene breakdown
+class GenerateSceneNarrativeSchema(CandidateOptionsMixin):
+    # Omit these three to use the project's stored scene plan at (chapter_index, scene_index).
+    scene_plan_from_breakdown: Optional[str] = None # Markdown for the specific scene's plan
+    chapter_title: Optional[str] = None
+    full_chapter_scene_breakdown: Optional[str] = None # Markdown for the entire chapter's scene breakdown
     approved_worldbuilding_md: str
     full_approved_outline_md: str
     writing_style_notes: Optional[str] = None
     # context_files_content: Optional[List[str]] = None
+    # With all three set, the prompt carries the project's rolling continuity notes for this
+    # position and the generated scene is folded into them (see systemawriter_logic/continuity.py).
+    project_id: Optional[str] = None
+    chapter_index: Optional[int] = Field(default=None, ge=0)
+    scene_index: Optional[int] = Field(default=None, ge=0)
+
+    @model_validator(mode="after")
+    def _scene_source(self):
+        _check_scene_source(self, self.project_id is not None)
+        return self
+
+class BatchSceneItemSchema(BaseModel):
+    id: Optional[str] = None # Echoed back so clients can match out-of-order results
+    scene_plan_from_breakdown: Optional[str] = None # Omit the three to use the stored scene plan
+    chapter_title: Optional[str] = None
+    full_chapter_scene_breakdown: Optional[str] = None
+    chapter_index: Optional[int] = Field(default=None, ge=0)
+    scene_index: Optional[int] = Field(default=None, ge=0)
+
+class GenerateSceneNarrativesBatchSchema(BaseModel):
+    # Shared context is sent (and validated) once for every scene in the batch.
+    approved_worldbuilding_md: str
+    full_approved_outline_md: str
+    writing_style_notes: Optional[str] = None
+    project_id: Optional[str] = None
+    scenes: List[BatchSceneItemSchema] = Field(min_length=1, max_length=200)
+    max_concurrency: Optional[int] = Field(default=None, ge=1) # Capped at SCENE_BATCH_CONCURRENCY
+
+    @model_validator(mode="after")
+    def _scene_sources(self):
+        for scene in self.scenes:
+            _check_scene_source(scene, self.project_id is not None)
+        return self
+
+ArtifactKind = Literal["concept", "outline", "worldbuilding", "scene_breakdown", "scene_narrative"]
+
+class ProjectCreateSchema(BaseModel):
+    title: str = "Untitled Project"
+    owner_id: Optional[str] = None
+
+class ArtifactUpsertSchema(BaseModel):
+    kind: ArtifactKind
+    content: str
+    chapter_index: Optional[int] = Field(default=None, ge=0) # Manuscript order for breakdowns/scenes
+    chapter_title: Optional[str] = None
+    scene_index: Optional[int] = Field(default=None, ge=0)
+    approved: bool = False
+
+BudgetScopeKind = Literal["project", "user"]
+
+class BudgetLimitsSchema(BaseModel):
+    token_limit: Optional[int] = Field(default=None, ge=0) # None: unlimited
+    cost_limit_usd: Optional[float] = Field(default=None, ge=0)
+    reset_usage: bool = False # Start a new budget period from zero
+
+class DiagnosticsUpdateSchema(BaseModel):
+    # Omitted fields are left as they are.
+    request_profiling: Optional[bool] = None
+    tracemalloc: Optional[bool] = None
+    tracemalloc_frames: int = Field(default=10, ge=1, le=100) # Stack depth recorded per allocation
 
 
 # --- Response Schemas ---
 
+class CandidateSchema(BaseModel):
+    index: int # Generation order
+    text: str
+    score: float
+    signals: Dict[str, float] = {}
+
 class OutlineResponseSchema(BaseModel):
-    outline_md: str
+    outline_md: str # Best candidate when several were requested
+    candidates: Optional[List[CandidateSchema]] = None
 
 class WorldbuildingResponseSchema(BaseModel):
     worldbuilding_md: str
 
+class ScenePlanSchema(BaseModel):
+    chapter_index: int
+    scene_index: int
+    title: str
+    goal: str
+    characters: List[str]
+    key_events: List[str]
+    setting: str
+    information_revealed: str
+    tone: str
+
 class SceneBreakdownsResponseSchema(BaseModel):
     scene_breakdowns_by_chapter: Dict[str, str] # Key: Chapter Title, Value: Markdown of scene breakdowns
+    # Structured mode only: validated scene plans per chapter (chapters whose plan failed are absent).
+    scenes_by_chapter: Optional[Dict[str, List[ScenePlanSchema]]] = None
 
 class SceneNarrativeResponseSchema(BaseModel):
-    scene_narrative_md: str
+    scene_narrative_md: str # Best candidate when several were requested
+    candidates: Optional[List[CandidateSchema]] = None
+
+class ProjectResponseSchema(BaseModel):
+    id: str
+    title: str
+    owner_id: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+    model_config = {"from_attributes": True}
+
+class ArtifactResponseSchema(BaseModel):
+    id: int
+    project_id: str
+    kind: str
+    chapter_index: Optional[int] = None
+    chapter_title: Optional[str] = None
+    scene_index: Optional[int] = None
+    content_hash: str
+    approved: bool
+    updated_at: Optional[datetime] = None
+
+    model_config = {"from_attributes": True}
+
+class BudgetResponseSchema(BaseModel):
+    scope: BudgetScopeKind
+    scope_id: str
+    token_limit: Optional[int] = None
+    cost_limit_usd: Optional[float] = None
+    tokens_used: int = 0
+    cost_used_usd: float = 0.0
+    tokens_reserved: int = 0 # Admitted by in-flight calls, not yet settled
+    cost_reserved_usd: float = 0.0
+
+class DiagnosticsStateSchema(BaseModel):
+    pid: int
+    request_profiling: bool
+    tracemalloc: bool
+    stored_request_profiles: int
+
+class RequestProfileSchema(BaseModel):
+    id: str
+    method: str
+    path: str
+    status: Optional[int] = None
+    duration_ms: float
+    samples: int
+
+    model_config = {"from_attributes": True}
 
 class ErrorResponseSchema(BaseModel):
     detail: str 
\ No newline at end of file
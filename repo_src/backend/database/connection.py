@@ -1,23 +1,71 @@
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 from sqlalchemy.pool import StaticPool
-import os
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from typing import AsyncGenerator
+
+from repo_src.backend.database.sqlite_tuning import install_sqlite_profile
+from repo_src.backend.settings import get_settings
+
+_settings = get_settings()
 
 # Default to an in-memory SQLite database if DATABASE_URL is not set,
 # good for quick starts or some test scenarios outside of full test suite.
-DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./app_default.db")
-
-connect_args = {}
-if DATABASE_URL.startswith("sqlite"):
-    connect_args["check_same_thread"] = False
-    if ":memory:" in DATABASE_URL: # Specific setup for in-memory SQLite for testing outside of TestClient
-        # This StaticPool is more for when you want a single in-memory DB shared across direct test calls.
-        # For TestClient, overriding dependencies with a fresh in-memory DB per test is often preferred.
-        # engine = create_engine(DATABASE_URL, connect_args=connect_args, poolclass=StaticPool)
-        pass # Handled by test_database.py for specific test engine config
-
-engine = create_engine(DATABASE_URL, connect_args=connect_args)
+DATABASE_URL = _settings.database_url
+
+# Pool tuning for server databases (ignored for SQLite, which uses its own pools).
+DB_POOL_SIZE = _settings.db_pool_size
+DB_MAX_OVERFLOW = _settings.db_max_overflow
+DB_POOL_TIMEOUT = _settings.db_pool_timeout
+DB_POOL_RECYCLE = _settings.db_pool_recycle
+
+
+def to_async_url(url: str) -> str:
+    """
+    Maps a sync SQLAlchemy URL onto its async driver equivalent:
+    sqlite -> sqlite+aiosqlite, postgresql/psycopg2 -> postgresql+asyncpg.
+    URLs that already name an async driver are returned unchanged.
+    """
+    if url.startswith("sqlite+aiosqlite") or url.startswith("postgresql+asyncpg"):
+        return url
+    if url.startswith("sqlite"):
+        return "sqlite+aiosqlite" + url[len(url.split(":", 1)[0]):]
+    if url.startswith("postgresql") or url.startswith("postgres"):
+        return "postgresql+asyncpg" + url[len(url.split(":", 1)[0]):]
+    return url
+
+
+def _engine_kwargs(url: str) -> dict:
+    """Shared engine options for the sync and async engines."""
+    kwargs: dict = {"pool_pre_ping": True}
+    if url.startswith("sqlite"):
+        kwargs["connect_args"] = {"check_same_thread": False}
+        if ":memory:" in url:
+            # A single shared connection so every session sees the same in-memory database.
+            kwargs["poolclass"] = StaticPool
+    else:
+        kwargs.update(
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+        )
+    return kwargs
+
+
+ASYNC_DATABASE_URL = _settings.async_database_url or to_async_url(DATABASE_URL)
+
+engine = create_engine(DATABASE_URL, **_engine_kwargs(DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Async engine used by the routers so DB access never blocks the event loop.
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **_engine_kwargs(ASYNC_DATABASE_URL))
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+# WAL, synchronous=NORMAL, mmap/cache sizing and busy_timeout on every new SQLite connection.
+install_sqlite_profile(engine, DATABASE_URL)
+install_sqlite_profile(async_engine.sync_engine, ASYNC_DATABASE_URL)
+
 Base = declarative_base()
 
 def get_db():
@@ -25,4 +73,16 @@ def get_db():
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
+
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    """FastAPI dependency yielding an AsyncSession bound to the async engine."""
+    async with AsyncSessionLocal() as session:
+        yield session
+
+def get_async_session_factory() -> async_sessionmaker:
+    """
+    FastAPI dependency returning the session factory itself, for handlers whose
+    streaming response outlives the request-scoped session from get_async_db().
+    """
+    return AsyncSessionLocal
@@ -0,0 +1,71 @@
+"""Initial schema: projects, artifacts, generation jobs
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19 00:00:00
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "0001"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "projects",
+        sa.Column("id", sa.String(length=36), primary_key=True),
+        sa.Column("owner_id", sa.String(length=64), nullable=True),
+        sa.Column("title", sa.String(length=255), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    )
+    op.create_index("ix_projects_owner_id", "projects", ["owner_id"])
+    op.create_index("ix_projects_updated_at", "projects", ["updated_at"])
+
+    op.create_table(
+        "artifacts",
+        sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column("project_id", sa.String(length=36), sa.ForeignKey("projects.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("kind", sa.String(length=32), nullable=False),
+        sa.Column("chapter_index", sa.Integer(), nullable=True),
+        sa.Column("chapter_title", sa.String(length=255), nullable=True),
+        sa.Column("scene_index", sa.Integer(), nullable=True),
+        sa.Column("content", sa.Text(), nullable=False),
+        sa.Column("content_hash", sa.String(length=64), nullable=False),
+        sa.Column("approved", sa.Boolean(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    )
+    op.create_index("ix_artifacts_project_id", "artifacts", ["project_id"])
+    op.create_index("ix_artifacts_content_hash", "artifacts", ["content_hash"])
+    op.create_index("ix_artifacts_updated_at", "artifacts", ["updated_at"])
+    op.create_index("ix_artifacts_project_kind_order", "artifacts", ["project_id", "kind", "chapter_index", "scene_index"])
+
+    op.create_table(
+        "generation_jobs",
+        sa.Column("id", sa.String(length=36), primary_key=True),
+        sa.Column("project_id", sa.String(length=36), sa.ForeignKey("projects.id", ondelete="CASCADE"), nullable=True),
+        sa.Column("stage", sa.String(length=32), nullable=False),
+        sa.Column("status", sa.String(length=16), nullable=False),
+        sa.Column("input_hash", sa.String(length=64), nullable=True),
+        sa.Column("progress_tokens", sa.Integer(), nullable=False),
+        sa.Column("error", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    )
+    op.create_index("ix_generation_jobs_project_id", "generation_jobs", ["project_id"])
+    op.create_index("ix_generation_jobs_input_hash", "generation_jobs", ["input_hash"])
+    op.create_index("ix_generation_jobs_updated_at", "generation_jobs", ["updated_at"])
+    op.create_index("ix_generation_jobs_project_status", "generation_jobs", ["project_id", "status"])
+
+
+def downgrade() -> None:
+    op.drop_table("generation_jobs")
+    op.drop_table("artifacts")
+    op.drop_table("projects")
@@ -0,0 +1,36 @@
+"""Usage budgets: cumulative LLM tokens/cost and limits per project or user
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19 00:00:00
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "0002"
+down_revision: Union[str, None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "usage_budgets",
+        sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column("scope", sa.String(length=16), nullable=False),
+        sa.Column("scope_id", sa.String(length=64), nullable=False),
+        sa.Column("token_limit", sa.Integer(), nullable=True),
+        sa.Column("cost_limit_usd", sa.Float(), nullable=True),
+        sa.Column("tokens_used", sa.Integer(), nullable=False),
+        sa.Column("cost_used_usd", sa.Float(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    )
+    op.create_index("ix_usage_budgets_scope", "usage_budgets", ["scope", "scope_id"], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_table("usage_budgets")
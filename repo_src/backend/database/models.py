@@ -1,5 +1,78 @@
-from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, Float, ForeignKey, Index
 from sqlalchemy.sql import func # for server_default=func.now()
 from repo_src.backend.database.connection import Base
 
-# Item model removed as part of v2 clean UI refactor 
\ No newline at end of file
+# Item model removed as part of v2 clean UI refactor
+
+# Schema changes to these models need a matching Alembic revision in database/migrations/versions/.
+
+class Project(Base):
+    __tablename__ = "projects"
+
+    id = Column(String(36), primary_key=True)  # UUID4 string
+    owner_id = Column(String(64), nullable=True, index=True)
+    title = Column(String(255), nullable=False, default="Untitled Project")
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False, index=True)
+
+class Artifact(Base):
+    """
+    A stored piece of generated or user-approved content: concept, outline,
+    worldbuilding, a chapter's scene breakdown, or a scene narrative.
+    Chapter/scene indexes give manuscript order for scene artifacts.
+    """
+    __tablename__ = "artifacts"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    project_id = Column(String(36), ForeignKey("projects.id", ondelete="CASCADE"), nullable=False, index=True)
+    kind = Column(String(32), nullable=False)  # concept | outline | worldbuilding | scene_breakdown | scene_narrative
+    chapter_index = Column(Integer, nullable=True)
+    chapter_title = Column(String(255), nullable=True)
+    scene_index = Column(Integer, nullable=True)
+    content = Column(Text, nullable=False, default="")
+    content_hash = Column(String(64), nullable=False, index=True)  # sha256 hex of content
+    approved = Column(Boolean, nullable=False, default=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False, index=True)
+
+    __table_args__ = (
+        Index("ix_artifacts_project_kind_order", "project_id", "kind", "chapter_index", "scene_index"),
+    )
+
+class GenerationJob(Base):
+    __tablename__ = "generation_jobs"
+
+    id = Column(String(36), primary_key=True)  # UUID4 string
+    project_id = Column(String(36), ForeignKey("projects.id", ondelete="CASCADE"), nullable=True, index=True)
+    stage = Column(String(32), nullable=False)  # outline | worldbuilding | scene_breakdowns | scene_narrative
+    status = Column(String(16), nullable=False, default="queued")  # queued | running | succeeded | failed | cancelled
+    input_hash = Column(String(64), nullable=True, index=True)
+    progress_tokens = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False, index=True)
+
+    __table_args__ = (
+        Index("ix_generation_jobs_project_status", "project_id", "status"),
+    )
+
+class UsageBudget(Base):
+    """
+    Cumulative LLM usage and optional limits for one budget scope: a project or a
+    user. Rows are created on first use; a NULL limit means unlimited.
+    """
+    __tablename__ = "usage_budgets"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    scope = Column(String(16), nullable=False)  # project | user
+    scope_id = Column(String(64), nullable=False)
+    token_limit = Column(Integer, nullable=True)
+    cost_limit_usd = Column(Float, nullable=True)
+    tokens_used = Column(Integer, nullable=False, default=0)
+    cost_used_usd = Column(Float, nullable=False, default=0.0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+
+    __table_args__ = (
+        Index("ix_usage_budgets_scope", "scope", "scope_id", unique=True),
+    )
@@ -1,17 +1,123 @@
-from repo_src.backend.database.connection import engine, Base
+import asyncio
+import hashlib
+import os
+import sys
+import tempfile
+
+from sqlalchemy import text
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows: no inter-process lock, one worker only
+    fcntl = None
+
+from repo_src.backend.database.connection import engine, async_engine, Base, DATABASE_URL
 # Import all models here so Base has them registered
-from repo_src.backend.database import models # noqa Ensures models.py is loaded and Item model is registered with Base
+from repo_src.backend.database import models # noqa Ensures models.py is loaded and its models are registered with Base
+from repo_src.backend.settings import get_settings
+
+# Alembic is imported inside the functions below: it is only needed for the startup
+# revision check, not by request handlers, and is the heaviest import on the startup path.
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+
+# When false, startup refuses to run against a database that is behind the latest
+# revision instead of upgrading it (run `alembic upgrade head` as a deploy step).
+DB_AUTO_MIGRATE = get_settings().db_auto_migrate
+
+# Set by the multi-worker launcher (server.prepare_workers) once it has initialised this
+# database, so worker lifespans skip the check.
+DB_READY_ENV = "STORYMAKER_DB_READY"
+
+def database_fingerprint() -> str:
+    """Identifies DATABASE_URL without exposing its credentials (in env vars and file names)."""
+    return hashlib.sha256(DATABASE_URL.encode("utf-8")).hexdigest()[:16]
+
+def init_lock_path() -> str:
+    """Per-database lock file serialising initialisation across processes on this host."""
+    return os.path.join(tempfile.gettempdir(), f"storymaker-db-init-{database_fingerprint()}.lock")
+
+def get_alembic_config():
+    """Builds an Alembic config pointing at database/migrations, independent of the working directory."""
+    from alembic.config import Config
+    config = Config()
+    config.set_main_option("script_location", MIGRATIONS_DIR)
+    config.set_main_option("sqlalchemy.url", DATABASE_URL.replace("%", "%%"))
+    return config
+
+def get_head_revision() -> str | None:
+    from alembic.script import ScriptDirectory
+    return ScriptDirectory.from_config(get_alembic_config()).get_current_head()
+
+def _current_revision(connection) -> str | None:
+    from alembic.runtime.migration import MigrationContext
+    return MigrationContext.configure(connection).get_current_revision()
+
+def _upgrade_to_head(connection) -> None:
+    from alembic import command
+    config = get_alembic_config()
+    config.attributes["connection"] = connection
+    command.upgrade(config, "head")
+
+def _check_and_migrate(connection) -> None:
+    """
+    Compares the stored revision against the migration head with a single
+    alembic_version lookup, and upgrades only when they differ.
+    """
+    current, head = _current_revision(connection), get_head_revision()
+    if current == head:
+        print(f"Database schema is up to date (revision {current}).")
+        return
+    if not DB_AUTO_MIGRATE:
+        raise RuntimeError(
+            f"Database schema is at revision {current}, expected {head}. "
+            "Run `alembic upgrade head` from repo_src/backend or set DB_AUTO_MIGRATE=true."
+        )
+    print(f"Migrating database schema from revision {current} to {head}...")
+    _upgrade_to_head(connection)
+    print("Database migrations applied.")
 
 def init_db():
     """
-    Initializes the database by creating all tables defined in the models
-    that inherit from Base. This is typically called on application startup.
-    In a production environment with an existing database, migrations (e.g., Alembic)
-    would be used instead of directly calling create_all().
+    Initializes the database by bringing it to the latest Alembic revision.
+    Only the alembic_version table is consulted when the schema is already current.
+    """
+    print(f"Initializing database at {engine.url}...")
+    with engine.begin() as conn:
+        _check_and_migrate(conn)
+
+async def init_db_async():
     """
-    print(f"Initializing database at {engine.url} and creating tables if they don't exist...")
-    Base.metadata.create_all(bind=engine)
-    print("Database tables checked/created.")
+    Async counterpart of init_db() for use inside the FastAPI lifespan.
+    Runs the revision check (and any migrations) over the async engine so
+    startup never blocks the event loop.
+    """
+    print(f"Initializing database at {async_engine.url}...")
+    async with async_engine.begin() as conn:
+        await conn.run_sync(_check_and_migrate)
+
+async def init_db_once():
+    """
+    init_db_async() for server workers. Skipped when the launcher already initialised
+    the database; otherwise run under an exclusive file lock, so workers starting
+    together check (and migrate) one at a time instead of racing on alembic_version.
+    """
+    if os.environ.get(DB_READY_ENV) == database_fingerprint():
+        print("Database initialised by the server launcher; skipping the revision check.")
+        return
+    if fcntl is None:
+        await init_db_async()
+        return
+    with open(init_lock_path(), "a") as lock_file:
+        await asyncio.to_thread(fcntl.flock, lock_file.fileno(), fcntl.LOCK_EX)  # Waits without blocking the loop
+        try:
+            await init_db_async()
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+async def dispose_engines():
+    """Closes pooled connections of both engines on application shutdown."""
+    await async_engine.dispose()
+    engine.dispose()
 
 def drop_db():
     """
@@ -20,11 +126,22 @@ def drop_db():
     """
     print(f"Dropping all tables from the database at {engine.url}...")
     Base.metadata.drop_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS alembic_version"))
     print("Database tables dropped.")
 
 if __name__ == "__main__":
-    # This allows running `python -m repo_src.backend.database.setup` (from project root)
+    # This allows running `python -m repo_src.backend.database.setup [init|drop|current]` (from project root)
     # or `python -m backend.database.setup` (from repo_src)
-    # Consider adding command line arguments for init/drop actions.
-    print("Running database setup script...")
-    init_db() # Example: Initialize DB by default if script is run directly. 
\ No newline at end of file
+    action = sys.argv[1] if len(sys.argv) > 1 else "init"
+    print(f"Running database setup script ({action})...")
+    if action == "init":
+        init_db()
+    elif action == "drop":
+        drop_db()
+    elif action == "current":
+        with engine.connect() as conn:
+            print(f"Current revision: {_current_revision(conn)} (head: {get_head_revision()})")
+    else:
+        print("Usage: python -m repo_src.backend.database.setup [init|drop|current]")
+        sys.exit(1)
@@ -0,0 +1,58 @@
+"""
+SQLite production profile.
+
+Applies connection-level PRAGMAs every time the pool opens a new SQLite
+connection, so several workers can write job progress and artifacts without
+serialising on the default rollback-journal lock.
+"""
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from repo_src.backend.settings import get_settings
+
+# "production" applies the full profile, "off" leaves SQLite defaults untouched.
+_settings = get_settings()
+SQLITE_PROFILE = _settings.sqlite_profile
+SQLITE_MMAP_SIZE = _settings.sqlite_mmap_size  # bytes
+SQLITE_CACHE_SIZE = _settings.sqlite_cache_size  # negative = KiB, so 64 MiB
+SQLITE_BUSY_TIMEOUT_MS = _settings.sqlite_busy_timeout_ms
+
+
+def sqlite_pragmas(in_memory: bool = False) -> list[str]:
+    """
+    Returns the PRAGMA statements of the production profile.
+    WAL and mmap do not apply to in-memory databases and are skipped there.
+    """
+    pragmas = []
+    if not in_memory:
+        pragmas += [
+            "PRAGMA journal_mode=WAL",
+            f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}",
+        ]
+    pragmas += [
+        "PRAGMA synchronous=NORMAL",
+        f"PRAGMA cache_size={SQLITE_CACHE_SIZE}",
+        f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}",
+        "PRAGMA temp_store=MEMORY",
+        "PRAGMA foreign_keys=ON",
+    ]
+    return pragmas
+
+
+def install_sqlite_profile(engine: Engine, url: str) -> None:
+    """
+    Registers a connect listener on `engine` (pass `async_engine.sync_engine`
+    for async engines) that applies the profile to each new connection.
+    No-op for non-SQLite URLs or when SQLITE_PROFILE=off.
+    """
+    if not url.startswith("sqlite") or SQLITE_PROFILE == "off":
+        return
+    pragmas = sqlite_pragmas(in_memory=":memory:" in url or url.rstrip("/").endswith(":"))
+
+    @event.listens_for(engine, "connect")
+    def _apply_pragmas(dbapi_connection, connection_record):  # noqa: ARG001
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
@@ -0,0 +1,194 @@
+"""
+Batched write queue for high-frequency updates (e.g. streaming job progress).
+
+Instead of one transaction per update, writes are buffered and flushed in a
+single transaction every `flush_interval` seconds or once `max_batch` writes
+are pending. Identical statements in a batch are sent as one executemany, and
+writes submitted with a `key` are coalesced so only the latest value per key
+reaches the database.
+
+If a flush fails, its writes are put back in front of the queue (unless a
+newer write for the same key arrived meanwhile) and retried on the next flush.
+The background flusher backs off exponentially while flushes keep failing
+(up to WRITE_QUEUE_MAX_BACKOFF seconds) and drops a batch that has failed
+WRITE_QUEUE_MAX_RETRIES times, so one bad write cannot wedge the queue.
+
+Producers: adapters/job_store.py records generation jobs and their streaming
+progress through the queue.
+"""
+import asyncio
+import logging
+from typing import Any, Optional
+
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.sql import Executable
+
+from repo_src.backend.settings import get_settings
+_settings = get_settings()
+WRITE_QUEUE_MAX_BATCH = _settings.write_queue_max_batch
+WRITE_QUEUE_FLUSH_INTERVAL = _settings.write_queue_flush_interval  # seconds
+WRITE_QUEUE_MAX_PENDING = _settings.write_queue_max_pending
+WRITE_QUEUE_MAX_RETRIES = _settings.write_queue_max_retries
+WRITE_QUEUE_MAX_BACKOFF = _settings.write_queue_max_backoff  # seconds
+
+logger = logging.getLogger(__name__)
+
+
+class BatchedWriteQueue:
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        max_batch: int = WRITE_QUEUE_MAX_BATCH,
+        flush_interval: float = WRITE_QUEUE_FLUSH_INTERVAL,
+        max_pending: int = WRITE_QUEUE_MAX_PENDING,
+        max_retries: int = WRITE_QUEUE_MAX_RETRIES,
+        max_backoff: float = WRITE_QUEUE_MAX_BACKOFF,
+    ):
+        self.engine = engine
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self.max_backoff = max_backoff
+        # Insertion-ordered: key -> (statement, params). Unkeyed writes get a unique key.
+        self._pending: dict[Any, tuple[Executable, dict]] = {}
+        self._seq = 0
+        self._wakeup = asyncio.Event()
+        self._space = asyncio.Condition()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._failed_batch: dict = {}  # The last batch whose flush failed
+        self.batches_flushed = 0
+        self.writes_flushed = 0
+        self.writes_coalesced = 0
+        self.flush_failures = 0
+        self.writes_dropped = 0
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    @property
+    def running(self) -> bool:
+        """Whether the background flusher is running (started by the app's lifespan)."""
+        return self._task is not None
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="batched-write-queue")
+
+    async def stop(self) -> None:
+        """Stops the background flusher and writes out anything still pending."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def put(self, statement: Executable, params: Optional[dict] = None, key: Any = None) -> None:
+        """
+        Queues a write. If `key` is given, a still-pending write with the same key
+        is replaced (last writer wins). Waits when the queue is full so producers
+        cannot grow the buffer without bound.
+        """
+        async with self._space:
+            await self._space.wait_for(lambda: len(self._pending) < self.max_pending or key in self._pending)
+            # Insert while still holding the condition, so the space just waited for is ours.
+            if key is None:
+                self._seq += 1
+                key = ("__seq__", self._seq)
+            elif key in self._pending:
+                self.writes_coalesced += 1
+                # Re-insert so the coalesced write keeps its latest position in the order.
+                del self._pending[key]
+            self._pending[key] = (statement, params or {})
+            if len(self._pending) >= self.max_batch:
+                self._wakeup.set()
+
+    async def flush(self) -> int:
+        """Writes all pending entries in one transaction. Returns the number of writes."""
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            batch, self._pending = self._pending, {}
+            async with self._space:
+                self._space.notify_all()
+
+            # Group consecutive writes of the same statement into executemany calls.
+            groups: list[tuple[Executable, list[dict]]] = []
+            for statement, params in batch.values():
+                if groups and groups[-1][0] is statement:
+                    groups[-1][1].append(params)
+                else:
+                    groups.append((statement, [params]))
+
+            try:
+                async with self.engine.begin() as conn:
+                    for statement, params_list in groups:
+                        await conn.execute(statement, params_list if len(params_list) > 1 else params_list[0])
+            except BaseException:
+                self.flush_failures += 1
+                self._failed_batch = batch
+                self._restore(batch)
+                raise
+
+            self.batches_flushed += 1
+            self.writes_flushed += len(batch)
+            return len(batch)
+
+    def _restore(self, batch: dict) -> None:
+        """Puts a failed batch back ahead of newer writes; a newer write for the same key wins."""
+        restored = {key: write for key, write in batch.items() if key not in self._pending}
+        restored.update(self._pending)
+        self._pending = restored
+
+    async def _drop(self, batch: dict) -> int:
+        """Discards the writes of a failed batch that are still pending (not superseded by newer ones)."""
+        dropped = [key for key, write in batch.items() if self._pending.get(key) is write]
+        for key in dropped:
+            del self._pending[key]
+        self.writes_dropped += len(dropped)
+        async with self._space:
+            self._space.notify_all()
+        return len(dropped)
+
+    async def _run(self) -> None:
+        failures = 0  # Consecutive failed flushes
+        while True:
+            if failures:
+                # Retrying sooner (on wakeups) would only fail again while the database is unavailable.
+                await asyncio.sleep(min(self.flush_interval * 2 ** failures, self.max_backoff))
+            else:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+                failures = 0
+            except Exception as e:
+                failures += 1
+                if failures == 1:
+                    logger.exception("Batched write queue flush failed; %d writes will be retried", len(self._pending))
+                elif failures <= self.max_retries:
+                    logger.warning("Batched write queue flush failed again (%d/%d): %s", failures, self.max_retries, e)
+                else:
+                    dropped = await self._drop(self._failed_batch)
+                    logger.error("Batched write queue: dropped %d writes after %d failed flushes", dropped, failures)
+                    failures = 0
+
+
+_write_queue: Optional[BatchedWriteQueue] = None
+
+
+def get_write_queue() -> BatchedWriteQueue:
+    """Returns the process-wide write queue bound to the async engine."""
+    global _write_queue
+    if _write_queue is None:
+        from repo_src.backend.database.connection import async_engine
+        _write_queue = BatchedWriteQueue(async_engine)
+    return _write_queue
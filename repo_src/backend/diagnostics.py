@@ -0,0 +1,268 @@
+"""
+Runtime diagnostics for a running server: CPU profiles and memory snapshots,
+without a restart or external tooling.
+
+- StackSampler is a pure-Python sampling profiler. A daemon thread reads the
+  current stack of the sampled threads (sys._current_frames) every few
+  milliseconds and counts identical stacks. collapsed() renders them as
+  collapsed stacks ("root;caller;leaf count" per line), the input format of
+  flamegraph.pl, speedscope and inferno.
+- Diagnostics.profile_cpu() samples (or cProfiles) the whole process for N seconds.
+- ProfilingMiddleware profiles single requests. While request profiling is
+  switched on, a request carrying "X-Profile: 1" and the diagnostics token is
+  sampled on the event loop thread for its whole lifetime, streamed bodies
+  included. The response gets an X-Profile-Id header to fetch the stacks by.
+  Other requests served concurrently on the same loop show up in its samples.
+- MemoryTracer wraps tracemalloc; each snapshot is compared with the previous one.
+
+Everything is reached through the /api/diagnostics routes, which are disabled
+unless DIAGNOSTICS_TOKEN is set. With several workers each process profiles itself.
+"""
+import asyncio
+import cProfile
+import hmac
+import io
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from repo_src.backend.asgi import asgi_header
+from repo_src.backend.settings import get_settings
+
+SAMPLE_INTERVAL_MS = get_settings().diagnostics_sample_interval_ms
+MAX_PROFILE_SECONDS = 300
+MAX_STACK_DEPTH = 200
+MAX_STORED_REQUEST_PROFILES = 50
+MAX_CONCURRENT_REQUEST_PROFILES = 4  # One sampler thread each
+
+PROFILE_HEADER = b"x-profile"
+TOKEN_HEADER = b"x-diagnostics-token"
+
+
+def _frame_label(frame) -> str:
+    # No spaces or semicolons, which separate frames and counts in the collapsed format.
+    code = frame.f_code
+    module = frame.f_globals.get("__name__", "?")
+    return f"{module}:{getattr(code, 'co_qualname', code.co_name)}:{code.co_firstlineno}".replace(" ", "_")
+
+
+def collapse_stack(frame, limit: int = MAX_STACK_DEPTH) -> str:
+    labels = []
+    while frame is not None and len(labels) < limit:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class StackSampler:
+    def __init__(self, interval: float = SAMPLE_INTERVAL_MS / 1000, thread_ids: Optional[set[int]] = None):
+        self.interval = interval
+        self.thread_ids = thread_ids  # None: every thread except the sampler, each stack rooted at its thread name
+        self.samples: Counter[str] = Counter()
+        self.ticks = 0
+        self.started_at = 0.0
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "StackSampler":
+        self.started_at = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="diagnostics-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> "StackSampler":
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.duration = time.monotonic() - self.started_at
+        return self
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        names: dict[int, str] = {}
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own or (self.thread_ids is not None and thread_id not in self.thread_ids):
+                    continue
+                stack = collapse_stack(frame)
+                if self.thread_ids is None:
+                    if thread_id not in names:
+                        names = {t.ident: t.name.replace(" ", "_") for t in threading.enumerate()}
+                    stack = f"thread:{names.get(thread_id, thread_id)};{stack}"
+                self.samples[stack] += 1
+            self.ticks += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+class ProfilerBusyError(Exception):
+    """A process-wide profile is already running."""
+
+
+@dataclass
+class RequestProfile:
+    id: str
+    method: str
+    path: str
+    status: Optional[int]
+    duration_ms: float
+    samples: int
+    collapsed: str
+
+
+class MemoryTracer:
+    """tracemalloc snapshots, each with the growth since the previous one."""
+
+    def __init__(self):
+        self._previous: Optional[tracemalloc.Snapshot] = None
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self, frames: int = 10) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self._previous = self._take()
+
+    def stop(self) -> None:
+        tracemalloc.stop()
+        self._previous = None
+
+    def _take(self) -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        ))
+
+    def snapshot(self, limit: int = 25, group_by: str = "lineno") -> dict:
+        """Top allocation sites and growth since the last snapshot. Raises RuntimeError when not tracing."""
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc is not tracing; start it first")
+        snapshot = self._take()
+        current, peak = tracemalloc.get_traced_memory()
+
+        def site(stat) -> dict:
+            if group_by == "traceback":
+                return {"traceback": stat.traceback.format()}
+            return {"location": str(stat.traceback[0])}
+
+        top = [{**site(s), "size_bytes": s.size, "count": s.count} for s in snapshot.statistics(group_by)[:limit]]
+        growth = []
+        if self._previous is not None:
+            growth = [
+                {**site(s), "size_diff_bytes": s.size_diff, "count_diff": s.count_diff, "size_bytes": s.size}
+                for s in snapshot.compare_to(self._previous, group_by)[:limit] if s.size_diff
+            ]
+        self._previous = snapshot
+        return {"traced_bytes": current, "peak_bytes": peak, "top": top, "growth_since_previous": growth}
+
+
+class Diagnostics:
+    def __init__(self, token: Optional[str], request_profiling: bool = False):
+        self.token = token
+        self.request_profiling = request_profiling
+        self.memory = MemoryTracer()
+        self.request_profiles: "OrderedDict[str, RequestProfile]" = OrderedDict()
+        self.active_request_profiles = 0
+        self._cpu_profile_running = False
+
+    def authorized(self, supplied: Optional[str]) -> bool:
+        if not self.token or not supplied:
+            return False
+        return hmac.compare_digest(supplied.encode("utf-8"), self.token.encode("utf-8"))
+
+    def store_request_profile(self, profile: RequestProfile) -> None:
+        self.request_profiles[profile.id] = profile
+        while len(self.request_profiles) > MAX_STORED_REQUEST_PROFILES:
+            self.request_profiles.popitem(last=False)
+
+    async def profile_cpu(self, seconds: float, mode: str = "sample", interval: float = SAMPLE_INTERVAL_MS / 1000) -> str:
+        """
+        Profiles the process for `seconds`. "sample" returns collapsed stacks of every
+        thread; "cprofile" returns pstats text for the event loop thread (deterministic,
+        with higher overhead). Raises ProfilerBusyError if a profile is already running.
+        """
+        if self._cpu_profile_running:
+            raise ProfilerBusyError("A CPU profile is already running")
+        self._cpu_profile_running = True
+        try:
+            if mode == "cprofile":
+                profiler = cProfile.Profile()
+                profiler.enable()  # Coroutines resumed on this thread are profiled while it sleeps
+                try:
+                    await asyncio.sleep(seconds)
+                finally:
+                    profiler.disable()
+                out = io.StringIO()
+                pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(80)
+                return out.getvalue()
+            sampler = StackSampler(interval).start()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                sampler.stop()
+            return sampler.collapsed()
+        finally:
+            self._cpu_profile_running = False
+
+
+def _new_diagnostics() -> Diagnostics:
+    settings = get_settings()
+    return Diagnostics(settings.diagnostics_token, settings.diagnostics_request_profiling)
+
+
+diagnostics = _new_diagnostics()
+
+
+def _bearer(scope: dict) -> Optional[str]:
+    authorization = asgi_header(scope, b"authorization") or ""
+    return authorization[7:].strip() if authorization.lower().startswith("bearer ") else None
+
+
+class ProfilingMiddleware:
+    def __init__(self, app, state: Optional[Diagnostics] = None):
+        self.app = app
+        self.state = state
+
+    async def __call__(self, scope, receive, send):
+        state = self.state or diagnostics
+        if (
+            scope["type"] != "http"
+            or not state.request_profiling
+            or (asgi_header(scope, PROFILE_HEADER) or "").lower() not in ("1", "true")
+            or not state.authorized(asgi_header(scope, TOKEN_HEADER) or _bearer(scope))
+            or state.active_request_profiles >= MAX_CONCURRENT_REQUEST_PROFILES
+        ):
+            return await self.app(scope, receive, send)
+
+        profile_id = uuid.uuid4().hex[:16]
+        status: Optional[int] = None
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message = {**message, "headers": [*message.get("headers", []), (b"x-profile-id", profile_id.encode("latin-1"))]}
+            await send(message)
+
+        state.active_request_profiles += 1
+        sampler = StackSampler(thread_ids={threading.get_ident()}).start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            sampler.stop()
+            state.active_request_profiles -= 1
+            state.store_request_profile(RequestProfile(
+                id=profile_id, method=scope["method"], path=scope["path"], status=status,
+                duration_ms=round(sampler.duration * 1000, 2), samples=sampler.ticks, collapsed=sampler.collapsed(),
+            ))
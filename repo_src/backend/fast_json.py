@@ -0,0 +1,72 @@
+"""
+Fast JSON encoding and decoding for large API payloads.
+
+- FastJSONResponse renders Pydantic models with their compiled serializer
+  straight to bytes, and anything else (dicts, lists) with orjson. It skips
+  jsonable_encoder's recursive Python walk. Endpoints return it explicitly,
+  which also skips FastAPI re-validating a model they just built.
+- FastJSONRoute decodes request bodies with orjson before Pydantic validation.
+- dumps()/loads() are the same codecs for hand-built payloads such as NDJSON lines.
+
+orjson is optional; without it the stdlib json module is used with the same
+output format (compact, UTF-8, non-ASCII unescaped). See
+benchmarks/json_payloads.py for the measurements behind this.
+"""
+import json
+from datetime import date, datetime
+from typing import Any, Callable
+
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from pydantic import BaseModel
+
+try:
+    import orjson  # type: ignore
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if isinstance(value, (date, datetime)):  # orjson handles these natively; this is the stdlib fallback
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    if isinstance(content, BaseModel):
+        return content.__pydantic_serializer__.to_json(content)
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads(data: bytes) -> Any:
+    # orjson.JSONDecodeError subclasses json.JSONDecodeError, so FastAPI still answers 422.
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class FastJSONRequest(Request):
+    async def json(self) -> Any:
+        if not hasattr(self, "_json"):
+            self._json = loads(await self.body())
+        return self._json
+
+
+class FastJSONRoute(APIRoute):
+    """APIRoute whose JSON request bodies are decoded with loads()."""
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def fast_json_handler(request: Request) -> Response:
+            return await handler(FastJSONRequest(request.scope, request.receive))
+
+        return fast_json_handler
@@ -1,56 +1,55 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from dotenv import load_dotenv
-import os
 from contextlib import asynccontextmanager
 
-# Load environment variables from .env file if it exists
-# This is particularly useful for local development.
-# In production, environment variables should be set through the deployment environment.
-
-# Determine the directory of the current file (main.py)
-current_dir = os.path.dirname(os.path.abspath(__file__))
-
-# Construct the path to the .env file relative to main.py
-env_path_backend = os.path.join(current_dir, '.env')
+from repo_src.backend.settings import get_settings
 
-# Construct the path to the .env file in the project root (if applicable)
-project_root_env = os.path.join(current_dir, '..', '..', '.env') # Assuming repo_src/backend/main.py
-
-if os.path.exists(env_path_backend):
-    print(f"Loading environment variables from: {env_path_backend}")
-    load_dotenv(dotenv_path=env_path_backend)
-elif os.path.exists(project_root_env) and os.path.basename(os.getcwd()) != "backend":
-    # Only load project root .env if not already in backend (where local .env takes precedence)
-    print(f"Loading environment variables from project root: {project_root_env}")
-    load_dotenv(dotenv_path=project_root_env)
-else:
-    print("No .env file found in backend directory or project root, or backend/.env takes precedence. Relying on system environment variables.")
+# Load the .env file (if any) once, before the modules below read their configuration.
+# In production, environment variables should be set through the deployment environment.
+settings = get_settings()
 
 # Import database setup function AFTER loading env vars,
 # as db connection might depend on them.
-from repo_src.backend.database.setup import init_db
+from repo_src.backend.database.setup import init_db_once, dispose_engines
+from repo_src.backend.database.write_queue import get_write_queue
 from repo_src.backend.database import models, connection # For example endpoints
 from repo_src.backend.routers.systemawriter_router import router as systemawriter_router # Import the SystemaWriter router
+from repo_src.backend.routers.projects_router import router as projects_router
+from repo_src.backend.routers.diagnostics_router import router as diagnostics_router
+from repo_src.backend.middleware import CompressionMiddleware, RequestBodyMiddleware
+from repo_src.backend.diagnostics import ProfilingMiddleware
+from repo_src.backend.server import APP_IMPORT_STRING, drain_background_work, prepare_workers, uvicorn_options
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup: Initialize database
     print("Application startup: Initializing database...")
-    init_db() # Initialize database and create tables
+    await init_db_once() # Check/migrate the schema without blocking the event loop, one worker at a time
+    await get_write_queue().start() # Background flusher for batched high-frequency writes
     print("Application startup complete.")
     yield
     # Shutdown: Clean up resources if needed
-    print("Application shutdown: Cleaning up resources...")
-    # Any cleanup code would go here
+    # Runs after uvicorn has let in-flight requests finish (SERVER_GRACEFUL_SHUTDOWN_TIMEOUT)
+    print("Application shutdown: Draining background work and cleaning up resources...")
+    await drain_background_work(settings.graceful_shutdown_timeout)
+    await get_write_queue().stop() # Flush pending batched writes before closing connections
+    await dispose_engines()
     print("Application shutdown complete.")
 
 app = FastAPI(title="AI-Friendly Repository Backend", version="1.0.0", lifespan=lifespan)
 
+# Decompress gzip/br request bodies and reject oversized payloads with 413 (limits per endpoint)
+app.add_middleware(RequestBodyMiddleware)
+# Negotiated brotli/gzip compression of responses, including streamed ones
+app.add_middleware(CompressionMiddleware)
+# Samples requests sent with X-Profile: 1 and the diagnostics token (wraps the other middleware, so the whole request is covered)
+app.add_middleware(ProfilingMiddleware)
+
 # Configure CORS middleware
+# Added last, so it is outermost: responses from the middleware above (413/415) carry CORS headers too
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["http://localhost:5173"],  # Frontend origin
+    allow_origins=list(settings.cors_origins),  # Frontend origin(s), CORS_ORIGINS
     allow_credentials=True,
     allow_methods=["*"],  # Allow all methods
     allow_headers=["*"],  # Allow all headers
@@ -58,6 +57,10 @@ app.add_middleware(
 
 # Include the SystemaWriter router
 app.include_router(systemawriter_router, prefix="/api/systemawriter", tags=["systemawriter"])
+# Stored projects/artifacts and server-side manuscript export
+app.include_router(projects_router, prefix="/api/systemawriter/projects", tags=["projects"])
+# Runtime CPU/memory profiling, enabled by DIAGNOSTICS_TOKEN
+app.include_router(diagnostics_router, prefix="/api/diagnostics", tags=["diagnostics"])
 
 @app.get("/")
 async def read_root():
@@ -74,9 +77,14 @@ async def read_hello():
 # and include them in the main app.
 
 def main():
-    """Entry point for the storymaker-server script."""
+    """Entry point for the storymaker-server script. See server.py for the SERVER_* settings."""
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("PORT", "8000")), log_level=os.getenv("LOG_LEVEL", "info").lower())
+    options = uvicorn_options(settings)
+    if settings.workers > 1:
+        prepare_workers()
+        uvicorn.run(APP_IMPORT_STRING, **options)  # Each worker process imports the app itself
+    else:
+        uvicorn.run(app, **options)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,285 @@
+"""
+ASGI middleware for payload efficiency and safety.
+
+- CompressionMiddleware: negotiates brotli/gzip from Accept-Encoding and
+  compresses responses. Buffered responses below COMPRESSION_MIN_BYTES are
+  left alone; streamed responses (NDJSON, SSE, exports) are compressed chunk
+  by chunk with a sync flush so clients still receive each chunk promptly.
+- RequestBodyMiddleware: transparently decompresses gzip/deflate/br request
+  bodies and enforces per-endpoint maximum body sizes (measured after
+  decompression), answering 413 before an oversized payload is buffered.
+
+brotli is optional; without it only gzip/deflate are negotiated. br request
+bodies also need a brotli whose Decompressor accepts output_buffer_limit
+(1.2+); otherwise they are answered with 415 rather than inflated unbounded.
+"""
+import json
+import zlib
+from typing import Optional
+
+from fastapi import HTTPException
+from repo_src.backend.asgi import asgi_header
+from repo_src.backend.settings import get_settings
+
+try:
+    import brotli  # type: ignore
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+
+def _brotli_output_is_bounded() -> bool:
+    if brotli is None:
+        return False
+    try:
+        brotli.Decompressor().process(b"", output_buffer_limit=1)
+    except TypeError:  # brotli < 1.2
+        return False
+    return True
+
+
+BROTLI_REQUESTS = _brotli_output_is_bounded()  # br request bodies can be inflated within the size limit
+
+_settings = get_settings()
+COMPRESSION_MIN_BYTES = _settings.compression_min_bytes
+GZIP_LEVEL = _settings.gzip_level
+BROTLI_QUALITY = _settings.brotli_quality  # 4 is a good speed/ratio trade-off for dynamic text
+
+MAX_REQUEST_BODY_BYTES = _settings.max_request_body_bytes
+
+# Longest matching path prefix wins; anything unmatched gets MAX_REQUEST_BODY_BYTES.
+DEFAULT_BODY_LIMITS = {
+    "/api/systemawriter/generate-outline": 256 * 1024,
+    "/api/systemawriter/generate-worldbuilding": 1024 * 1024,
+    "/api/systemawriter/generate-scene-breakdowns": 2 * 1024 * 1024,
+    "/api/systemawriter/generate-scene-narrative": 4 * 1024 * 1024,
+    "/api/systemawriter/generate-scene-narratives": 8 * 1024 * 1024,  # Batch: shared context + many plans
+}
+
+# Already-compressed payloads gain nothing from another pass.
+_INCOMPRESSIBLE_TYPES = (
+    "image/", "video/", "audio/", "application/zip", "application/gzip",
+    "application/epub+zip", "application/vnd.openxmlformats-officedocument",
+)
+
+
+def parse_body_limits(spec: Optional[str]) -> dict[str, int]:
+    """
+    Parses REQUEST_BODY_LIMITS, e.g. "/api/systemawriter/generate-outline=65536,/api/x=1048576",
+    on top of DEFAULT_BODY_LIMITS.
+    """
+    limits = dict(DEFAULT_BODY_LIMITS)
+    for item in (spec or "").split(","):
+        if "=" in item:
+            path, value = item.rsplit("=", 1)
+            limits[path.strip()] = int(value.strip())
+    return limits
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Picks 'br' or 'gzip' from an Accept-Encoding header, honouring q-values."""
+    if not accept_encoding:
+        return None
+    offered: dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        offered[token.strip().lower()] = q
+    candidates = (["br"] if brotli is not None else []) + ["gzip"]
+    wildcard = offered.get("*", 0.0)
+    ranked = [(offered.get(enc, wildcard), -i, enc) for i, enc in enumerate(candidates)]
+    q, _, best = max(ranked)
+    return best if q > 0 else None
+
+
+class _Compressor:
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._br = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._gz = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes, flush: bool) -> bytes:
+        if self.encoding == "br":
+            return self._br.process(data) + (self._br.flush() if flush else b"")
+        return self._gz.compress(data) + (self._gz.flush(zlib.Z_SYNC_FLUSH) if flush else b"")
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._br.finish()
+        return self._gz.flush(zlib.Z_FINISH)
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        encoding = negotiate_encoding(asgi_header(scope, b"accept-encoding"))
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        start_message: Optional[dict] = None
+        compressor: Optional[_Compressor] = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, compressor, passthrough
+            if message["type"] == "http.response.start":
+                content_type = (asgi_header(message, b"content-type") or "").lower()
+                if asgi_header(message, b"content-encoding") or content_type.startswith(_INCOMPRESSIBLE_TYPES):
+                    passthrough = True
+                    await send(message)
+                else:
+                    start_message = message  # Held until we know whether the body is worth compressing
+                return
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                if not more_body and len(body) < self.minimum_size:
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+                compressor = _Compressor(encoding)
+                headers = [
+                    (k, v) for k, v in start_message.get("headers", [])
+                    if k.lower() not in (b"content-length", b"content-encoding")
+                ]
+                headers.append((b"content-encoding", encoding.encode("latin-1")))
+                vary = asgi_header(start_message, b"vary")
+                headers = [(k, v) for k, v in headers if k.lower() != b"vary"]
+                headers.append((b"vary", f"{vary}, Accept-Encoding".encode("latin-1") if vary else b"Accept-Encoding"))
+                if not more_body:
+                    compressed = compressor.compress(body, flush=False) + compressor.finish()
+                    headers.append((b"content-length", str(len(compressed)).encode("latin-1")))
+                    await send({**start_message, "headers": headers})
+                    await send({"type": "http.response.body", "body": compressed})
+                    return
+                await send({**start_message, "headers": headers})
+
+            if more_body:
+                chunk = compressor.compress(body, flush=True)
+                if chunk:
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            else:
+                await send({"type": "http.response.body", "body": compressor.compress(body, flush=False) + compressor.finish()})
+
+        await self.app(scope, receive, send_wrapper)
+
+
+class _Decompressor:
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        self._started = False
+        if encoding == "br":
+            self._br = brotli.Decompressor()
+        else:
+            # wbits=47 auto-detects gzip or zlib headers. "deflate" should be zlib-wrapped,
+            # but some clients send raw deflate; decompress() falls back to it.
+            self._z = zlib.decompressobj(47 if encoding == "gzip" else zlib.MAX_WBITS)
+
+    def decompress(self, data: bytes, limit: int) -> bytes:
+        """Returns at most `limit + 1` bytes so callers can detect overflow without inflating a bomb."""
+        if self.encoding == "br":
+            return self._br.process(data, output_buffer_limit=limit + 1)
+        started, self._started = self._started, True
+        try:
+            return self._z.decompress(data, limit + 1)
+        except zlib.error:
+            if self.encoding != "deflate" or started:
+                raise
+            self._z = zlib.decompressobj(-zlib.MAX_WBITS)  # No zlib header: raw deflate
+            return self._z.decompress(data, limit + 1)
+
+
+class RequestBodyMiddleware:
+    def __init__(self, app, limits: Optional[dict[str, int]] = None, default_limit: int = MAX_REQUEST_BODY_BYTES):
+        self.app = app
+        self.limits = limits if limits is not None else parse_body_limits(_settings.request_body_limits)
+        self.default_limit = default_limit
+        # Longest prefix first so specific endpoints override broader ones.
+        self._prefixes = sorted(self.limits, key=len, reverse=True)
+
+    def limit_for(self, path: str) -> int:
+        for prefix in self._prefixes:
+            if path.startswith(prefix):
+                return self.limits[prefix]
+        return self.default_limit
+
+    async def _reject(self, send, status: int, detail: str) -> None:
+        body = json.dumps({"detail": detail}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        limit = self.limit_for(scope["path"])
+        too_large = f"Request body exceeds the {limit} byte limit for {scope['path']}"
+        content_length = asgi_header(scope, b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > limit:
+            return await self._reject(send, 413, too_large)
+
+        encoding = (asgi_header(scope, b"content-encoding") or "identity").strip().lower()
+        decompressor = None
+        if encoding not in ("identity", ""):
+            if encoding not in ("gzip", "deflate") and not (encoding == "br" and BROTLI_REQUESTS):
+                return await self._reject(send, 415, f"Unsupported Content-Encoding: {encoding}")
+            decompressor = _Decompressor(encoding)
+            # Downstream sees a plain body of unknown length.
+            scope = dict(scope)
+            scope["headers"] = [
+                (k, v) for k, v in scope["headers"] if k.lower() not in (b"content-encoding", b"content-length")
+            ]
+
+        received = 0
+        response_started = False
+
+        async def receive_wrapper():
+            nonlocal received
+            message = await receive()
+            if message["type"] != "http.request":
+                return message
+            body = message.get("body", b"")
+            if decompressor is not None:
+                try:
+                    body = decompressor.decompress(body, limit - received)
+                except Exception:
+                    raise HTTPException(status_code=400, detail=f"Malformed {encoding} request body")
+            received += len(body)
+            if received > limit:
+                raise HTTPException(status_code=413, detail=too_large)
+            return {**message, "body": body}
+
+        async def send_wrapper(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        except HTTPException as e:
+            # Raised from receive() outside a FastAPI route (which would otherwise turn it into a response).
+            if response_started or e.status_code not in (400, 413):
+                raise
+            await self._reject(send, e.status_code, e.detail)
@@ -0,0 +1,90 @@
+import os
+from typing import List, Literal, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+
+from repo_src.backend import diagnostics as diagnostics_module
+from repo_src.backend.diagnostics import MAX_PROFILE_SECONDS, SAMPLE_INTERVAL_MS, ProfilerBusyError
+from repo_src.backend.data import systemawriter_schemas as schemas
+
+async def _require_token(
+    x_diagnostics_token: Optional[str] = Header(default=None),
+    authorization: Optional[str] = Header(default=None),
+):
+    """Accepts the DIAGNOSTICS_TOKEN as X-Diagnostics-Token or a Bearer token; without one configured the routes 404."""
+    state = diagnostics_module.diagnostics
+    if not state.token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    supplied = x_diagnostics_token
+    if supplied is None and authorization and authorization.lower().startswith("bearer "):
+        supplied = authorization[7:].strip()
+    if not state.authorized(supplied):
+        raise HTTPException(status_code=401, detail="Invalid or missing diagnostics token")
+    return state
+
+router = APIRouter(dependencies=[Depends(_require_token)])
+
+def _state_response(state) -> schemas.DiagnosticsStateSchema:
+    return schemas.DiagnosticsStateSchema(
+        pid=os.getpid(),
+        request_profiling=state.request_profiling,
+        tracemalloc=state.memory.tracing,
+        stored_request_profiles=len(state.request_profiles),
+    )
+
+@router.get("", response_model=schemas.DiagnosticsStateSchema)
+async def get_diagnostics_state(state=Depends(_require_token)):
+    return _state_response(state)
+
+@router.put("", response_model=schemas.DiagnosticsStateSchema)
+async def update_diagnostics_state(payload: schemas.DiagnosticsUpdateSchema, state=Depends(_require_token)):
+    """Switches per-request profiling and tracemalloc on or off in this worker."""
+    if payload.request_profiling is not None:
+        state.request_profiling = payload.request_profiling
+    if payload.tracemalloc is True:
+        state.memory.start(payload.tracemalloc_frames)
+    elif payload.tracemalloc is False and state.memory.tracing:
+        state.memory.stop()
+    return _state_response(state)
+
+@router.get("/profile", response_class=PlainTextResponse)
+async def profile_cpu(
+    seconds: float = Query(default=10.0, gt=0, le=MAX_PROFILE_SECONDS),
+    mode: Literal["sample", "cprofile"] = "sample",
+    interval_ms: float = Query(default=SAMPLE_INTERVAL_MS, ge=1, le=1000),
+    state=Depends(_require_token),
+):
+    """
+    Profiles this worker for `seconds` and returns collapsed stacks (mode=sample, for
+    flamegraph.pl/speedscope) or cProfile statistics of the event loop thread (mode=cprofile).
+    """
+    try:
+        return await state.profile_cpu(seconds, mode, interval_ms / 1000)
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@router.get("/profiles", response_model=List[schemas.RequestProfileSchema])
+async def list_request_profiles(state=Depends(_require_token)):
+    """Profiles of requests sent with X-Profile: 1, newest first."""
+    return list(reversed(state.request_profiles.values()))
+
+@router.get("/profiles/{profile_id}", response_class=PlainTextResponse)
+async def get_request_profile(profile_id: str, state=Depends(_require_token)):
+    """Collapsed stacks sampled while the request with this X-Profile-Id was being served."""
+    profile = state.request_profiles.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail=f"Request profile {profile_id} not found")
+    return profile.collapsed
+
+@router.get("/memory")
+async def memory_snapshot(
+    limit: int = Query(default=25, ge=1, le=500),
+    group_by: Literal["lineno", "filename", "traceback"] = "lineno",
+    state=Depends(_require_token),
+):
+    """Top tracemalloc allocation sites and their growth since the previous snapshot."""
+    try:
+        return state.memory.snapshot(limit, group_by)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
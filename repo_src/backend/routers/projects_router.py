@@ -0,0 +1,111 @@
+from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from typing import List, Literal
+
+from repo_src.backend.adapters import artifact_store
+from repo_src.backend.systemawriter_logic import scene_plans
+from repo_src.backend.data import systemawriter_schemas as schemas
+from repo_src.backend.database.connection import get_async_db, get_async_session_factory
+
+router = APIRouter()
+
+async def _require_project(db: AsyncSession, project_id: str):
+    project = await artifact_store.get_project(db, project_id)
+    if project is None:
+        raise HTTPException(status_code=404, detail=f"Project {project_id} not found")
+    return project
+
+@router.post("", response_model=schemas.ProjectResponseSchema, status_code=201)
+async def create_project(payload: schemas.ProjectCreateSchema, db: AsyncSession = Depends(get_async_db)):
+    return await artifact_store.create_project(db, title=payload.title, owner_id=payload.owner_id)
+
+@router.get("/{project_id}", response_model=schemas.ProjectResponseSchema)
+async def get_project(project_id: str, db: AsyncSession = Depends(get_async_db)):
+    return await _require_project(db, project_id)
+
+@router.put("/{project_id}/artifacts", response_model=schemas.ArtifactResponseSchema)
+async def upsert_artifact(project_id: str, payload: schemas.ArtifactUpsertSchema, db: AsyncSession = Depends(get_async_db)):
+    await _require_project(db, project_id)
+    if payload.kind in ("scene_breakdown", "scene_narrative") and payload.chapter_index is None:
+        raise HTTPException(status_code=422, detail=f"chapter_index is required for {payload.kind} artifacts")
+    return await artifact_store.upsert_artifact(
+        db,
+        project_id=project_id,
+        kind=payload.kind,
+        content=payload.content,
+        chapter_index=payload.chapter_index,
+        chapter_title=payload.chapter_title,
+        scene_index=payload.scene_index,
+        approved=payload.approved,
+    )
+
+@router.get("/{project_id}/scene-plans/{chapter_index}", response_model=List[schemas.ScenePlanSchema])
+async def get_chapter_scene_plans(project_id: str, chapter_index: int, db: AsyncSession = Depends(get_async_db)):
+    """A chapter's stored scene plans (from structured scene breakdowns), in scene order."""
+    await _require_project(db, project_id)
+    _, plans = await scene_plans.get_chapter_plans(db, project_id, chapter_index)
+    return [
+        schemas.ScenePlanSchema(chapter_index=chapter_index, scene_index=i, **plan.model_dump())
+        for i, plan in enumerate(plans)
+    ]
+
+@router.get("/{project_id}/scene-plans/{chapter_index}/{scene_index}", response_model=schemas.ScenePlanSchema)
+async def get_scene_plan(project_id: str, chapter_index: int, scene_index: int, db: AsyncSession = Depends(get_async_db)):
+    await _require_project(db, project_id)
+    _, plans = await scene_plans.get_chapter_plans(db, project_id, chapter_index)
+    if scene_index >= len(plans):
+        raise HTTPException(status_code=404, detail=f"No stored scene plan for chapter {chapter_index}, scene {scene_index}")
+    return schemas.ScenePlanSchema(chapter_index=chapter_index, scene_index=scene_index, **plans[scene_index].model_dump())
+
+@router.get("/{project_id}/export")
+async def export_manuscript(
+    project_id: str,
+    format: Literal["md", "epub", "docx"] = Query("md"),
+    include_notes: bool = Query(False, description="Prepend the outline and worldbuilding (Markdown only)"),
+    db: AsyncSession = Depends(get_async_db),
+    session_factory: async_sessionmaker = Depends(get_async_session_factory),
+):
+    """
+    Streams the manuscript assembled from stored scene narratives in chapter order.
+    Markdown is streamed as it is read from the database; EPUB/DOCX are built
+    incrementally into a spooled temp file and then streamed.
+    """
+    # Imported per call: the exporters (zipfile, spooling) are only needed by this endpoint.
+    from repo_src.backend.systemawriter_logic import manuscript_export
+
+    project = await _require_project(db, project_id)
+    title = project.title
+    headers = {"Content-Disposition": f'attachment; filename="{manuscript_export.export_filename(title, format)}"'}
+
+    if format == "md":
+        outline = worldbuilding = None
+        if include_notes:
+            outline = await artifact_store.get_artifact_content(db, project_id, "outline")
+            worldbuilding = await artifact_store.get_artifact_content(db, project_id, "worldbuilding")
+
+        async def markdown_body():
+            # Own session: the request-scoped one may be closed before streaming finishes.
+            async with session_factory() as stream_session:
+                scenes = artifact_store.iter_scene_texts(stream_session, project_id)
+                async for chunk in manuscript_export.markdown_chunks(title, scenes, outline, worldbuilding):
+                    yield chunk.encode("utf-8")
+
+        return StreamingResponse(markdown_body(), media_type=manuscript_export.MEDIA_TYPES["md"], headers=headers)
+
+    spool = manuscript_export.new_spool_file()
+    try:
+        scenes = artifact_store.iter_scene_texts(db, project_id)
+        if format == "epub":
+            await manuscript_export.build_epub(title, scenes, spool, project_id=project_id)
+        else:
+            await manuscript_export.build_docx(title, scenes, spool)
+    except Exception as e:
+        spool.close()
+        raise HTTPException(status_code=500, detail=f"Error exporting manuscript: {str(e)}")
+    headers["Content-Length"] = str(spool.tell())
+    return StreamingResponse(
+        manuscript_export.iter_spooled_file(spool),
+        media_type=manuscript_export.MEDIA_TYPES[format],
+        headers=headers,
+    )
@@ -1,57 +1,263 @@
-from fastapi import APIRouter, HTTPException, Body # Removed UploadFile for simplicity in v0.1
-from typing import List
+from fastapi import APIRouter, HTTPException, Body, WebSocket, Request, Depends, Header # Removed UploadFile for simplicity in v0.1
+from fastapi.responses import StreamingResponse
+from starlette.requests import HTTPConnection
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from typing import List, Optional
+import asyncio
+import hmac
+import time
 
-from repo_src.backend.systemawriter_logic import core_logic
+from repo_src.backend.systemawriter_logic import core_logic, ranking, scene_plans, shared_cache, ws_session
+from repo_src.backend.systemawriter_logic.speculative import prefetcher
+from repo_src.backend.systemawriter_logic.cancellation import (
+    RequestCancelled, run_cancellable, cancel_request, cancellation_stats, in_flight_request_ids, iter_completed,
+)
+from repo_src.backend.systemawriter_logic.continuity import continuity_store
+from repo_src.backend.systemawriter_logic.llm_interface import estimate_tokens
+from repo_src.backend.systemawriter_logic.scheduler import PRIORITIES, llm_context, llm_scheduler, set_llm_context
+from repo_src.backend.systemawriter_logic import budgets
+from repo_src.backend.systemawriter_logic.budgets import budget_ledger, set_budget_scope
+from repo_src.backend.adapters import artifact_store, budget_store, job_store
+from repo_src.backend.database.connection import get_async_session_factory
+from repo_src.backend import fast_json
+from repo_src.backend.fast_json import FastJSONResponse, FastJSONRoute
 from repo_src.backend.data import systemawriter_schemas as schemas
 
-router = APIRouter()
+async def _llm_scheduling_context(
+    connection: HTTPConnection,
+    session_factory: async_sessionmaker = Depends(get_async_session_factory),
+):
+    """
+    Tags every LLM call made while serving this request with the caller's scheduling class:
+    user from X-User-ID (or ?user_id= for WebSockets), optional X-LLM-Priority to opt into a
+    lower class, and optional X-LLM-Deadline-Ms after which queued calls are dropped.
+    The user, and the project from X-Project-ID (or the payload, see below), are also the
+    budget scopes the calls are charged to.
+    """
+    user_id = connection.headers.get("x-user-id") or connection.query_params.get("user_id")
+    priority = connection.headers.get("x-llm-priority")
+    if priority is not None and priority not in PRIORITIES:
+        raise HTTPException(status_code=400, detail=f"X-LLM-Priority must be one of {', '.join(PRIORITIES)}")
+    deadline_ms = connection.headers.get("x-llm-deadline-ms")
+    if deadline_ms is not None and not deadline_ms.isdigit():
+        raise HTTPException(status_code=400, detail="X-LLM-Deadline-Ms must be a whole number of milliseconds")
+    set_llm_context(
+        priority=priority,
+        user_id=user_id,
+        deadline=time.monotonic() + int(deadline_ms) / 1000 if deadline_ms is not None else None,
+    )
+    set_budget_scope(
+        user_id=user_id,
+        project_id=(connection.headers.get("x-project-id") or connection.query_params.get("project_id")
+                    or connection.path_params.get("project_id")),
+        session_factory=session_factory,
+    )
+
+# Large text payloads: bodies are decoded, and model responses encoded, by fast_json (see there).
+router = APIRouter(dependencies=[Depends(_llm_scheduling_context)], route_class=FastJSONRoute)
+
+# Non-standard "Client Closed Request" status (as used by nginx) for cancelled generations.
+CLIENT_CLOSED_REQUEST = 499
+
+def _cancelled(e: RequestCancelled) -> HTTPException:
+    return HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail=f"Generation cancelled ({e.reason})")
+
+def _candidate_schemas(candidates: Optional[list[ranking.Candidate]]) -> Optional[list[schemas.CandidateSchema]]:
+    if not candidates:
+        return None
+    return [schemas.CandidateSchema(index=c.index, text=c.text, score=c.score, signals=c.signals) for c in candidates]
+
+async def _speculative_or(project_id, stage: str, inputs: dict, compute):
+    """Serves a matching speculative result if one exists, otherwise runs `compute()`."""
+    result = await prefetcher.take(project_id, stage, inputs)
+    return result if result is not None else await compute()
 
 @router.post("/generate-outline", response_model=schemas.OutlineResponseSchema)
-async def generate_outline(payload: schemas.ConceptInputSchema):
+async def generate_outline(request: Request, payload: schemas.ConceptInputSchema):
+    set_budget_scope(project_id=payload.project_id)
     # For v0.1, context_files_content is not handled via direct upload in this simplified API.
     # If context were to be included, it would need to be passed in the payload.concept_document
     # or handled via a separate mechanism (e.g., pre-loaded server-side files).
     try:
-        outline = await core_logic.generate_outline_logic(
-            concept_document=payload.concept_document
-            # context_files_content=payload.context_files_content or []
-        )
-        return schemas.OutlineResponseSchema(outline_md=outline)
+        candidates = None
+        if payload.candidates > 1:
+            texts = await run_cancellable(request, core_logic.generate_outline_candidates_logic(
+                concept_document=payload.concept_document, n=payload.candidates
+            ))
+            candidates = ranking.rank_candidates(texts, reference=payload.concept_document, rank=payload.rank_candidates)
+            outline = ranking.best_candidate(candidates).text
+        else:
+            outline = await run_cancellable(request, core_logic.generate_outline_logic(
+                concept_document=payload.concept_document
+                # context_files_content=payload.context_files_content or []
+            ))
+        if payload.speculate and not outline.startswith("Error:"):
+            prefetcher.schedule_next(payload.project_id, "outline", {
+                "concept_document": payload.concept_document, "approved_outline": outline,
+            })
+        return FastJSONResponse(schemas.OutlineResponseSchema(
+            outline_md=outline, candidates=_candidate_schemas(candidates),
+        ))
+    except RequestCancelled as e:
+        raise _cancelled(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating outline: {str(e)}")
 
 @router.post("/generate-worldbuilding", response_model=schemas.WorldbuildingResponseSchema)
-async def generate_worldbuilding(payload: schemas.GenerateWorldbuildingSchema):
+async def generate_worldbuilding(request: Request, payload: schemas.GenerateWorldbuildingSchema):
+    set_budget_scope(project_id=payload.project_id)
     try:
-        worldbuilding = await core_logic.generate_worldbuilding_logic(
-            concept_document=payload.concept_document,
-            approved_outline=payload.approved_outline_md
-            # context_files_content=payload.context_files_content or []
-        )
-        return schemas.WorldbuildingResponseSchema(worldbuilding_md=worldbuilding)
+        inputs = {"concept_document": payload.concept_document, "approved_outline": payload.approved_outline_md}
+        worldbuilding = await run_cancellable(request, _speculative_or(
+            payload.project_id, "worldbuilding", inputs,
+            lambda: core_logic.generate_worldbuilding_logic(
+                concept_document=payload.concept_document,
+                approved_outline=payload.approved_outline_md
+                # context_files_content=payload.context_files_content or []
+            ),
+        ))
+        if payload.speculate and not worldbuilding.startswith("Error:"):
+            prefetcher.schedule_next(payload.project_id, "worldbuilding", {
+                "approved_outline": payload.approved_outline_md, "approved_worldbuilding": worldbuilding,
+            })
+        return FastJSONResponse(schemas.WorldbuildingResponseSchema(worldbuilding_md=worldbuilding))
+    except RequestCancelled as e:
+        raise _cancelled(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating worldbuilding: {str(e)}")
 
 @router.post("/generate-scene-breakdowns", response_model=schemas.SceneBreakdownsResponseSchema)
-async def generate_scene_breakdowns(payload: schemas.GenerateSceneBreakdownsSchema):
+async def generate_scene_breakdowns(
+    request: Request,
+    payload: schemas.GenerateSceneBreakdownsSchema,
+    session_factory: async_sessionmaker = Depends(get_async_session_factory),
+):
+    set_budget_scope(project_id=payload.project_id)
     try:
-        breakdowns = await core_logic.generate_all_scene_breakdowns_logic(
-            approved_outline=payload.approved_outline_md,
-            approved_worldbuilding=payload.approved_worldbuilding_md
-            # context_files_content=payload.context_files_content or []
-        )
+        if payload.structured:
+            return await _generate_scene_plans(request, payload, session_factory)
+        inputs = {"approved_outline": payload.approved_outline_md, "approved_worldbuilding": payload.approved_worldbuilding_md}
+        breakdowns = await run_cancellable(request, _speculative_or(
+            payload.project_id, "scene_breakdowns", inputs,
+            lambda: core_logic.generate_all_scene_breakdowns_logic(
+                approved_outline=payload.approved_outline_md,
+                approved_worldbuilding=payload.approved_worldbuilding_md
+                # context_files_content=payload.context_files_content or []
+            ),
+        ))
         if "Error" in breakdowns: # Check for specific error from logic
              raise HTTPException(status_code=400, detail=breakdowns["Error"])
-        return schemas.SceneBreakdownsResponseSchema(scene_breakdowns_by_chapter=breakdowns)
+        return FastJSONResponse(schemas.SceneBreakdownsResponseSchema(scene_breakdowns_by_chapter=breakdowns))
     except HTTPException as e: # Re-raise known HTTP exceptions
         raise e
+    except RequestCancelled as e:
+        raise _cancelled(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating scene breakdowns: {str(e)}")
 
+async def _generate_scene_plans(
+    request: Request, payload: schemas.GenerateSceneBreakdownsSchema, session_factory: async_sessionmaker
+) -> FastJSONResponse:
+    """Structured mode: validated scene plans, stored per scene when the request names a project."""
+    plans_by_chapter = await run_cancellable(request, core_logic.generate_all_scene_plans_logic(
+        approved_outline=payload.approved_outline_md,
+        approved_worldbuilding=payload.approved_worldbuilding_md,
+    ))
+    if "Error" in plans_by_chapter:
+        raise HTTPException(status_code=400, detail=plans_by_chapter["Error"])
+    breakdowns, scenes = {}, {}
+    for chapter_index, (chapter_title, plans) in enumerate(plans_by_chapter.items()):
+        if isinstance(plans, str):  # This chapter's "Error: ..." message
+            breakdowns[chapter_title] = plans
+            continue
+        breakdowns[chapter_title] = scene_plans.render_chapter_plans(plans, chapter_index)
+        scenes[chapter_title] = [
+            schemas.ScenePlanSchema(chapter_index=chapter_index, scene_index=scene_index, **plan.model_dump())
+            for scene_index, plan in enumerate(plans)
+        ]
+        if payload.project_id is not None:
+            await scene_plans.store_chapter_plans(session_factory, payload.project_id, chapter_index, chapter_title, plans)
+    return FastJSONResponse(schemas.SceneBreakdownsResponseSchema(
+        scene_breakdowns_by_chapter=breakdowns, scenes_by_chapter=scenes,
+    ))
+
+async def _store_narrative(
+    session_factory: async_sessionmaker, project_id: str, chapter_index: int, scene_index: int,
+    chapter_title: Optional[str], narrative: str,
+) -> None:
+    """Keeps a generated scene as the project's scene_narrative artifact, which the manuscript export reads."""
+    async with session_factory() as session:
+        if await artifact_store.get_project(session, project_id) is None:
+            return  # Continuity is tracked by id alone; artifacts need a stored project
+        await artifact_store.upsert_artifact(
+            session, project_id, "scene_narrative", narrative,
+            chapter_index=chapter_index, chapter_title=chapter_title, scene_index=scene_index,
+        )
+
+async def _narrate_scene(
+    session_factory: async_sessionmaker,
+    project_id: Optional[str],
+    chapter_index: Optional[int],
+    scene_index: Optional[int],
+    candidates: int = 1,
+    rank_candidates: bool = True,
+    **scene_kwargs,
+) -> tuple[str, Optional[list[ranking.Candidate]]]:
+    """
+    generate_scene_narrative_logic plus continuity: when the scene's project and position are
+    known, the prompt gets the continuity notes for that position, the result is folded in and
+    it is stored as the scene's narrative for the manuscript export.
+    With candidates > 1, alternatives are generated concurrently and the best one is used.
+    """
+    track_continuity = project_id is not None and chapter_index is not None and scene_index is not None
+    if scene_kwargs["scene_plan_from_breakdown"] is None:
+        # Referenced by position (validated by the schemas): only this scene's plan goes into the prompt.
+        stored = await scene_plans.load_scene(session_factory, project_id, chapter_index, scene_index)
+        if stored is None:
+            raise HTTPException(
+                status_code=404,
+                detail=f"No stored scene plan for chapter {chapter_index}, scene {scene_index} of project {project_id}",
+            )
+        scene_kwargs.update(
+            scene_plan_from_breakdown=stored.scene_plan_md,
+            chapter_title=scene_kwargs["chapter_title"] or stored.chapter_title,
+            full_chapter_scene_breakdown=stored.chapter_overview_md,
+        )
+    continuity_notes = ""
+    if track_continuity:
+        continuity_notes = await continuity_store.state_before(session_factory, project_id, chapter_index, scene_index)
+    ranked = None
+    if candidates > 1:
+        texts = await core_logic.generate_scene_narrative_candidates_logic(
+            n=candidates, continuity_notes=continuity_notes, **scene_kwargs
+        )
+        ranked = ranking.rank_candidates(
+            texts, reference=scene_kwargs["scene_plan_from_breakdown"],
+            target_chars=ranking.SCENE_TARGET_CHARS, rank=rank_candidates,
+        )
+        narrative = ranking.best_candidate(ranked).text
+    else:
+        narrative = await core_logic.generate_scene_narrative_logic(continuity_notes=continuity_notes, **scene_kwargs)
+    if track_continuity and not narrative.startswith("Error:"):
+        await _store_narrative(
+            session_factory, project_id, chapter_index, scene_index, scene_kwargs["chapter_title"], narrative,
+        )
+        continuity_store.record_scene(
+            session_factory, project_id, chapter_index, scene_index, scene_kwargs["chapter_title"], narrative,
+        )
+    return narrative, ranked
+
 @router.post("/generate-scene-narrative", response_model=schemas.SceneNarrativeResponseSchema)
-async def generate_scene_narrative(payload: schemas.GenerateSceneNarrativeSchema):
+async def generate_scene_narrative(
+    request: Request,
+    payload: schemas.GenerateSceneNarrativeSchema,
+    session_factory: async_sessionmaker = Depends(get_async_session_factory),
+):
+    set_budget_scope(project_id=payload.project_id)
     try:
-        narrative = await core_logic.generate_scene_narrative_logic(
+        narrative, candidates = await run_cancellable(request, _narrate_scene(
+            session_factory, payload.project_id, payload.chapter_index, payload.scene_index,
+            candidates=payload.candidates, rank_candidates=payload.rank_candidates,
             scene_plan_from_breakdown=payload.scene_plan_from_breakdown,
             chapter_title=payload.chapter_title,
             full_chapter_scene_breakdown=payload.full_chapter_scene_breakdown,
@@ -59,7 +265,167 @@ async def generate_scene_narrative(payload: schemas.GenerateSceneNarrativeSchema
             full_approved_outline=payload.full_approved_outline_md,
             writing_style_notes=payload.writing_style_notes
             # context_files_content=payload.context_files_content or []
-        )
-        return schemas.SceneNarrativeResponseSchema(scene_narrative_md=narrative)
+        ))
+        return FastJSONResponse(schemas.SceneNarrativeResponseSchema(
+            scene_narrative_md=narrative, candidates=_candidate_schemas(candidates),
+        ))
+    except HTTPException as e:
+        raise e
+    except RequestCancelled as e:
+        raise _cancelled(e)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error generating scene narrative: {str(e)}") 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error generating scene narrative: {str(e)}") 
+
+@router.post("/generate-scene-narratives")
+async def generate_scene_narratives(
+    payload: schemas.GenerateSceneNarrativesBatchSchema,
+    session_factory: async_sessionmaker = Depends(get_async_session_factory),
+):
+    """
+    Generates many scenes from one copy of the shared context. Responds with NDJSON: one
+    line per scene as soon as it finishes ({"index", "id", "scene_narrative_md"} or
+    {"index", "id", "error"}), then {"done": true, "completed", "failed"}. Scenes run at batch
+    priority with bounded concurrency; disconnecting cancels the scenes still running.
+    Each scene is recorded as a generation job (adapters/job_store.py).
+    """
+    set_budget_scope(project_id=payload.project_id)
+    limit = min(payload.max_concurrency or core_logic.SCENE_BATCH_CONCURRENCY, core_logic.SCENE_BATCH_CONCURRENCY)
+
+    def scene_job(scene: schemas.BatchSceneItemSchema):
+        async def run() -> str:
+            job_id = await job_store.start_job(payload.project_id, "scene_narrative")
+            try:
+                with llm_context(priority="batch", lower_only=True):
+                    narrative, _ = await _narrate_scene(
+                        session_factory, payload.project_id, scene.chapter_index, scene.scene_index,
+                        scene_plan_from_breakdown=scene.scene_plan_from_breakdown,
+                        chapter_title=scene.chapter_title,
+                        full_chapter_scene_breakdown=scene.full_chapter_scene_breakdown,
+                        approved_worldbuilding=payload.approved_worldbuilding_md,
+                        full_approved_outline=payload.full_approved_outline_md,
+                        writing_style_notes=payload.writing_style_notes,
+                    )
+            except asyncio.CancelledError:
+                await job_store.finish_job(job_id, "cancelled")
+                raise
+            except Exception as e:
+                await job_store.finish_job(job_id, "failed", getattr(e, "detail", None) or str(e))
+                raise
+            if narrative.startswith("Error:"):
+                await job_store.finish_job(job_id, "failed", narrative)
+            else:
+                await job_store.record_progress(job_id, estimate_tokens(narrative))
+                await job_store.finish_job(job_id, "succeeded")
+            return narrative
+        return run
+
+    async def ndjson_lines():
+        completed = failed = 0
+        async for index, result in iter_completed([scene_job(scene) for scene in payload.scenes], limit):
+            line = {"index": index, "id": payload.scenes[index].id}
+            if isinstance(result, HTTPException):
+                line["error"] = f"Error generating scene narrative: {result.detail}"
+            elif isinstance(result, Exception):
+                line["error"] = f"Error generating scene narrative: {str(result)}"
+            elif result.startswith("Error:"):
+                line["error"] = result
+            else:
+                line["scene_narrative_md"] = result
+            if "error" in line:
+                failed += 1
+            else:
+                completed += 1
+            yield fast_json.dumps(line) + b"\n"
+        yield fast_json.dumps({"done": True, "completed": completed, "failed": failed}) + b"\n"
+
+    return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+
+@router.post("/requests/{request_id}/cancel")
+async def cancel_generation(request_id: str):
+    """Cancels a generation started with the same X-Request-ID header."""
+    if not cancel_request(request_id):
+        raise HTTPException(status_code=404, detail=f"No in-flight request with id {request_id}")
+    return {"request_id": request_id, "cancelled": True}
+
+@router.get("/cancellation-stats", response_class=FastJSONResponse)
+async def get_cancellation_stats():
+    """Counts of aborted and never-sent LLM calls, and the estimated tokens saved."""
+    return {**cancellation_stats.snapshot(), "in_flight_requests": len(in_flight_request_ids())}
+
+@router.delete("/speculations/{project_id}")
+async def discard_speculations(project_id: str):
+    """Cancels background next-stage generations for a project, e.g. when the user starts editing."""
+    return {"project_id": project_id, "discarded": prefetcher.discard_project(project_id)}
+
+@router.get("/speculation-stats", response_class=FastJSONResponse)
+async def get_speculation_stats():
+    """Hit/miss counts and speculative token spend against the budget."""
+    return prefetcher.snapshot()
+
+@router.get("/cache-stats", response_class=FastJSONResponse)
+async def get_cache_stats():
+    """Backend, size and hit/miss counts of the shared cache (counts are per worker)."""
+    return shared_cache.cache.snapshot()
+
+@router.get("/scheduler-stats", response_class=FastJSONResponse)
+async def get_scheduler_stats():
+    """LLM queue depth, in-flight calls and queue wait times per priority class."""
+    return llm_scheduler.snapshot()
+
+def _budget_response(scope: str, scope_id: str, budget) -> schemas.BudgetResponseSchema:
+    tokens_reserved, cost_reserved = budget_ledger.reserved((scope, scope_id))
+    response = schemas.BudgetResponseSchema(
+        scope=scope, scope_id=scope_id, tokens_reserved=tokens_reserved, cost_reserved_usd=cost_reserved,
+    )
+    if budget is not None:
+        response.token_limit, response.cost_limit_usd = budget.token_limit, budget.cost_limit_usd
+        response.tokens_used, response.cost_used_usd = budget.tokens_used, budget.cost_used_usd
+    return response
+
+async def _require_budget_admin(
+    x_admin_token: Optional[str] = Header(default=None),
+    authorization: Optional[str] = Header(default=None),
+):
+    """Budget limits are set by operators: BUDGET_ADMIN_TOKEN as X-Admin-Token or a Bearer token."""
+    if not budgets.BUDGET_ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Budget limits cannot be changed: BUDGET_ADMIN_TOKEN is not set")
+    supplied = x_admin_token
+    if supplied is None and authorization and authorization.lower().startswith("bearer "):
+        supplied = authorization[7:].strip()
+    if not supplied or not hmac.compare_digest(supplied.encode("utf-8"), budgets.BUDGET_ADMIN_TOKEN.encode("utf-8")):
+        raise HTTPException(status_code=401, detail="Invalid or missing admin token")
+
+@router.get("/budgets/{scope}/{scope_id}", response_model=schemas.BudgetResponseSchema)
+async def get_budget(
+    scope: schemas.BudgetScopeKind,
+    scope_id: str,
+    session_factory: async_sessionmaker = Depends(get_async_session_factory),
+):
+    """Limits and usage of a project or user budget (unlimited and unused if never set)."""
+    async with session_factory() as session:
+        budget = await budget_store.get_budget(session, scope, scope_id)
+    return _budget_response(scope, scope_id, budget)
+
+@router.put("/budgets/{scope}/{scope_id}", response_model=schemas.BudgetResponseSchema,
+            dependencies=[Depends(_require_budget_admin)])
+async def set_budget(
+    scope: schemas.BudgetScopeKind,
+    scope_id: str,
+    payload: schemas.BudgetLimitsSchema,
+    session_factory: async_sessionmaker = Depends(get_async_session_factory),
+):
+    """Sets the token and cost limits for a project or user; null removes a limit."""
+    async with session_factory() as session:
+        budget = await budget_store.set_limits(
+            session, scope, scope_id, payload.token_limit, payload.cost_limit_usd, reset_usage=payload.reset_usage,
+        )
+    return _budget_response(scope, scope_id, budget)
+
+@router.websocket("/session/{project_id}")
+async def project_session(websocket: WebSocket, project_id: str):
+    """
+    One long-lived connection per open project: shared context is uploaded once and
+    generate/regenerate/cancel commands stream tokens and progress for many scenes
+    concurrently. See systemawriter_logic/ws_session.py for the message protocol.
+    """
+    await ws_session.serve_project_session(websocket, project_id)
@@ -0,0 +1,92 @@
+"""
+Production launch of the API server (`storymaker-server`, i.e. main.main()).
+
+uvicorn is configured from Settings:
+
+    SERVER_WORKERS (or WEB_CONCURRENCY)  worker processes; 1 serves in-process
+    SERVER_LOOP          auto | uvloop | asyncio   (auto: uvloop when installed)
+    SERVER_HTTP          auto | httptools | h11    (auto: httptools when installed)
+    SERVER_KEEP_ALIVE    idle keep-alive timeout, seconds
+    SERVER_LIMIT_CONCURRENCY  per-worker connection/task cap, beyond which it answers 503
+    SERVER_BACKLOG       listen backlog
+    SERVER_MAX_REQUESTS  recycle a worker after this many requests (multi-worker only)
+    SERVER_GRACEFUL_SHUTDOWN_TIMEOUT  seconds to drain on SIGTERM
+
+With several workers the app is passed to uvicorn as an import string, so
+each worker process imports it fresh. Before they start, prepare_workers()
+initialises the database once in the launcher and tells the workers so
+(database.setup.DB_READY_ENV). It also points the shared cache at its SQLite
+backend unless SHARED_CACHE_BACKEND says otherwise. Workers started some
+other way still serialise their database check with a file lock
+(database.setup.init_db_once).
+
+Shutdown has two phases. uvicorn stops accepting connections and lets
+in-flight requests, streamed generations included, finish for up to
+SERVER_GRACEFUL_SHUTDOWN_TIMEOUT seconds. The lifespan then runs
+drain_background_work(): pending continuity updates and budget settlements
+get the same timeout, speculative prefetches are cancelled, and batched
+writes are flushed.
+"""
+import asyncio
+import os
+
+from repo_src.backend.settings import Settings
+
+LOOPS = ("auto", "uvloop", "asyncio")
+HTTP_IMPLEMENTATIONS = ("auto", "httptools", "h11")
+APP_IMPORT_STRING = "repo_src.backend.main:app"
+
+
+def uvicorn_options(settings: Settings) -> dict:
+    """Keyword arguments for uvicorn.run(). Raises ValueError for unknown loop/http choices."""
+    if settings.server_loop not in LOOPS:
+        raise ValueError(f"SERVER_LOOP must be one of {', '.join(LOOPS)}, not {settings.server_loop!r}")
+    if settings.server_http not in HTTP_IMPLEMENTATIONS:
+        raise ValueError(f"SERVER_HTTP must be one of {', '.join(HTTP_IMPLEMENTATIONS)}, not {settings.server_http!r}")
+    options = {
+        "host": settings.host,
+        "port": settings.port,
+        "log_level": settings.log_level,
+        "loop": settings.server_loop,
+        "http": settings.server_http,
+        "timeout_keep_alive": settings.keep_alive_timeout,
+        "limit_concurrency": settings.limit_concurrency,
+        "backlog": settings.backlog,
+        "timeout_graceful_shutdown": max(1, round(settings.graceful_shutdown_timeout)),
+    }
+    if settings.workers > 1:
+        options["workers"] = settings.workers
+        options["limit_max_requests"] = settings.max_requests
+    return options
+
+
+def prepare_workers(environ=os.environ) -> None:
+    """
+    Runs in the launcher before worker processes are spawned; they inherit `environ`.
+    Initialises the database once, so workers skip the revision check, and shares the
+    cache between workers.
+    """
+    from repo_src.backend.database.setup import DB_READY_ENV, database_fingerprint, init_db
+    from repo_src.backend.database.connection import engine
+
+    init_db()
+    engine.dispose()  # The launcher serves nothing; don't hold connections for its lifetime
+    environ[DB_READY_ENV] = database_fingerprint()
+    if "SHARED_CACHE_BACKEND" not in environ:
+        environ["SHARED_CACHE_BACKEND"] = "sqlite"
+        print("Multiple workers: using the SQLite shared cache (set SHARED_CACHE_BACKEND to override).")
+
+
+async def drain_background_work(timeout: float) -> None:
+    """Lets background work started by requests finish (up to `timeout` seconds) before shutdown."""
+    from repo_src.backend.systemawriter_logic.budgets import budget_ledger
+    from repo_src.backend.systemawriter_logic.continuity import continuity_store
+    from repo_src.backend.systemawriter_logic.speculative import prefetcher
+
+    cancelled = prefetcher.discard_all()  # Nobody will claim them from this worker
+    if cancelled:
+        print(f"Shutdown: cancelled {cancelled} speculative generation(s).")
+    try:
+        await asyncio.wait_for(asyncio.gather(continuity_store.drain(), budget_ledger.wait_settled()), timeout)
+    except asyncio.TimeoutError:
+        print(f"Shutdown: background work still running after {timeout:.0f}s; abandoning it.")
@@ -0,0 +1,270 @@
+"""
+Application settings, loaded once per process.
+
+`get_settings()` reads the `.env` file (if any) a single time and returns a
+frozen, typed `Settings` object. Modules that need configuration at import
+time call it instead of loading dotenv themselves, so the environment is
+parsed once no matter which module is imported first.
+
+Precedence for the `.env` file: `repo_src/backend/.env`, then the project
+root `.env`. Variables already present in the process environment always win.
+
+Tuning knobs live here too. Modules copy the ones they need into module-level
+constants at import (`_settings = get_settings()`), which tests monkeypatch.
+"""
+import json
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Mapping, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_ENV_FILE = os.path.join(BACKEND_DIR, ".env")
+PROJECT_ROOT_ENV_FILE = os.path.join(BACKEND_DIR, "..", "..", ".env")
+CACHE_DIR = os.path.join(BACKEND_DIR, ".cache")  # Default home of on-disk caches
+SHARED_CACHE_BACKENDS = ("memory", "sqlite", "none")  # Keys of shared_cache.BACKENDS
+SHARED_CACHE_BACKEND_ALIASES = {"off": "none"}
+
+_loaded_env_file: Optional[str] = None
+_env_loaded = False
+
+
+def load_env_file() -> Optional[str]:
+    """Loads the first `.env` file found (see module docstring); returns its path. Idempotent."""
+    global _env_loaded, _loaded_env_file
+    if _env_loaded:
+        return _loaded_env_file
+    _env_loaded = True
+    for path in (BACKEND_ENV_FILE, PROJECT_ROOT_ENV_FILE):
+        if os.path.exists(path):
+            from dotenv import load_dotenv
+            load_dotenv(dotenv_path=path)
+            _loaded_env_file = os.path.normpath(path)
+            print(f"Loading environment variables from: {_loaded_env_file}")
+            break
+    else:
+        print("No .env file found in backend directory or project root. Relying on system environment variables.")
+    return _loaded_env_file
+
+
+def _split_csv(value: str) -> tuple[str, ...]:
+    return tuple(item.strip() for item in value.split(",") if item.strip())
+
+
+def _flag(value: Optional[str], default: bool = False) -> bool:
+    if value is None or not value.strip():
+        return default
+    return value.strip().lower() in ("1", "true", "yes")
+
+
+def _optional_int(value: Optional[str]) -> Optional[int]:
+    return int(value) if value else None
+
+
+def _choice(name: str, value: str, choices: tuple[str, ...], aliases: Mapping[str, str] = {}) -> str:
+    value = value.strip().lower()
+    value = aliases.get(value, value)
+    if value not in choices:
+        raise ValueError(f"{name} must be one of {', '.join(choices)}, not {value!r}")
+    return value
+
+
+@dataclass(frozen=True)
+class Settings:
+    database_url: str
+    async_database_url: Optional[str]  # None: derived from database_url
+    db_pool_size: int
+    db_max_overflow: int
+    db_pool_timeout: float
+    db_pool_recycle: int
+    db_auto_migrate: bool  # False: startup fails when the schema is behind instead of upgrading it
+
+    # SQLite connection profile (database/sqlite_tuning.py)
+    sqlite_profile: str  # production | off
+    sqlite_mmap_size: int  # bytes
+    sqlite_cache_size: int  # negative = KiB
+    sqlite_busy_timeout_ms: int
+
+    # Batched writes (database/write_queue.py)
+    write_queue_max_batch: int
+    write_queue_flush_interval: float  # seconds
+    write_queue_max_pending: int
+    write_queue_max_retries: int  # Failed flushes of a batch before it is dropped
+    write_queue_max_backoff: float  # seconds between retries, at most
+
+    openrouter_api_key: Optional[str]
+    openrouter_model: str
+    openrouter_base_url: str
+    site_url: str
+    app_name: str
+    llm_max_tokens: int
+    continuation_max_total_tokens: int  # Long-form mode cap across continuations
+    continuation_tail_chars: int
+    llm_supports_n: bool  # Whether the model honours `n`; otherwise candidates are concurrent calls
+    max_candidates: int
+    llm_prices: dict  # model -> (USD per 1M prompt tokens, per 1M completion tokens); merged over the defaults
+    llm_budget_fallback_model: str
+    llm_cassette_mode: str  # off | record | replay | auto (validated by cassettes.CassetteTransport)
+    llm_cassette_dir: str
+    llm_replay_speed: float
+
+    # LLM scheduling (systemawriter_logic/scheduler.py) and fan-out
+    llm_max_concurrency: int
+    llm_interactive_reserved: int
+    speculative_max_concurrent: int
+    llm_deadline_urgency: float  # seconds
+    llm_batch_aging: float  # seconds
+    breakdown_concurrency: int
+    scene_batch_concurrency: int
+    structured_retries: int
+    disconnect_poll_interval: float  # seconds
+
+    # Story state and prompt context
+    continuity_max_chars: int
+    scene_target_chars: int
+    retrieval_index_dir: str
+    retrieval_top_k: int
+    retrieval_min_chars: int  # Shorter documents are used whole
+    retrieval_chunk_chars: int
+    retrieval_cache_size: int  # Open indexes kept per process
+    retrieval_index_max_bytes: int  # On disk
+
+    # Speculative prefetch and the shared cache
+    speculative_token_budget: int
+    speculative_budget_window: float  # seconds
+    speculative_ttl: float  # seconds an unclaimed result is kept
+    shared_cache_backend: str  # memory | sqlite | none ("off" is accepted for none)
+    shared_cache_path: str
+    shared_cache_max_bytes: int
+    shared_cache_lease_seconds: float
+    shared_cache_poll_seconds: float
+
+    # WebSocket sessions (systemawriter_logic/ws_session.py)
+    ws_send_queue_size: int
+    ws_max_concurrent_tasks: int
+    ws_max_tasks: int  # Running + waiting tasks per session
+
+    export_spool_max_bytes: int
+
+    port: int
+    log_level: str
+    cors_origins: tuple[str, ...]
+
+    # HTTP middleware (middleware.py)
+    compression_min_bytes: int
+    gzip_level: int
+    brotli_quality: int
+    max_request_body_bytes: int
+    request_body_limits: Optional[str]  # "prefix=bytes,..." (parsed by middleware.parse_body_limits)
+
+    # Server launch (see server.py)
+    host: str
+    workers: int
+    server_loop: str  # auto | uvloop | asyncio
+    server_http: str  # auto | httptools | h11
+    keep_alive_timeout: int
+    limit_concurrency: Optional[int]  # None: unlimited; beyond it a worker answers 503
+    backlog: int
+    max_requests: Optional[int]  # Recycle a worker after this many requests (multi-worker mode only)
+    graceful_shutdown_timeout: float
+
+    budget_admin_token: Optional[str]  # Required to change budget limits; None: limits cannot be changed over HTTP
+    diagnostics_token: Optional[str]  # None: the diagnostics routes are disabled
+    diagnostics_request_profiling: bool  # Initial state; toggled at runtime via the diagnostics routes
+    diagnostics_sample_interval_ms: float
+
+    @classmethod
+    def from_env(cls, environ: Mapping[str, str] = os.environ) -> "Settings":
+        return cls(
+            database_url=environ.get("DATABASE_URL", "sqlite:///./app_default.db"),
+            async_database_url=environ.get("ASYNC_DATABASE_URL") or None,
+            db_pool_size=int(environ.get("DB_POOL_SIZE", "10")),
+            db_max_overflow=int(environ.get("DB_MAX_OVERFLOW", "20")),
+            db_pool_timeout=float(environ.get("DB_POOL_TIMEOUT", "30")),
+            db_pool_recycle=int(environ.get("DB_POOL_RECYCLE", "1800")),
+            db_auto_migrate=_flag(environ.get("DB_AUTO_MIGRATE"), default=True),
+            sqlite_profile=environ.get("SQLITE_PROFILE", "production").lower(),
+            sqlite_mmap_size=int(environ.get("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+            sqlite_cache_size=int(environ.get("SQLITE_CACHE_SIZE", "-65536")),
+            sqlite_busy_timeout_ms=int(environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+            write_queue_max_batch=int(environ.get("WRITE_QUEUE_MAX_BATCH", "500")),
+            write_queue_flush_interval=float(environ.get("WRITE_QUEUE_FLUSH_INTERVAL", "0.05")),
+            write_queue_max_pending=int(environ.get("WRITE_QUEUE_MAX_PENDING", "10000")),
+            write_queue_max_retries=int(environ.get("WRITE_QUEUE_MAX_RETRIES", "5")),
+            write_queue_max_backoff=float(environ.get("WRITE_QUEUE_MAX_BACKOFF", "5")),
+            openrouter_api_key=environ.get("OPENROUTER_API_KEY") or None,
+            openrouter_model=environ.get("OPENROUTER_MODEL", "anthropic/claude-sonnet-4"),
+            openrouter_base_url=environ.get("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1"),
+            site_url=environ.get("YOUR_SITE_URL", "http://localhost:5173"),
+            app_name=environ.get("YOUR_APP_NAME", "SystemaWriter"),
+            llm_max_tokens=int(environ.get("LLM_MAX_TOKENS", "2048")),
+            continuation_max_total_tokens=int(environ.get("CONTINUATION_MAX_TOTAL_TOKENS", "8192")),
+            continuation_tail_chars=int(environ.get("CONTINUATION_TAIL_CHARS", "2000")),
+            llm_supports_n=_flag(environ.get("LLM_SUPPORTS_N")),
+            max_candidates=int(environ.get("MAX_CANDIDATES", "4")),
+            llm_prices={k: tuple(v) for k, v in json.loads(environ.get("LLM_PRICES") or "{}").items()},
+            llm_budget_fallback_model=environ.get("LLM_BUDGET_FALLBACK_MODEL", "anthropic/claude-3.5-haiku"),
+            llm_cassette_mode=environ.get("LLM_CASSETTE_MODE", "off").lower(),
+            llm_cassette_dir=environ.get("LLM_CASSETTE_DIR", os.path.join(CACHE_DIR, "cassettes")),
+            llm_replay_speed=float(environ.get("LLM_REPLAY_SPEED", "0")),
+            llm_max_concurrency=int(environ.get("LLM_MAX_CONCURRENCY", "16")),
+            llm_interactive_reserved=int(environ.get("LLM_INTERACTIVE_RESERVED", "2")),
+            speculative_max_concurrent=int(environ.get("SPECULATIVE_MAX_CONCURRENT", "2")),
+            llm_deadline_urgency=float(environ.get("LLM_DEADLINE_URGENCY", "5")),
+            llm_batch_aging=float(environ.get("LLM_BATCH_AGING", "30")),
+            breakdown_concurrency=int(environ.get("BREAKDOWN_CONCURRENCY", "4")),
+            scene_batch_concurrency=int(environ.get("SCENE_BATCH_CONCURRENCY", "4")),
+            structured_retries=int(environ.get("STRUCTURED_RETRIES", "1")),
+            disconnect_poll_interval=float(environ.get("DISCONNECT_POLL_INTERVAL", "0.25")),
+            continuity_max_chars=int(environ.get("CONTINUITY_MAX_CHARS", "3000")),
+            scene_target_chars=int(environ.get("SCENE_TARGET_CHARS", "6000")),
+            retrieval_index_dir=environ.get("RETRIEVAL_INDEX_DIR", os.path.join(CACHE_DIR, "retrieval")),
+            retrieval_top_k=int(environ.get("RETRIEVAL_TOP_K", "6")),
+            retrieval_min_chars=int(environ.get("RETRIEVAL_MIN_CHARS", "6000")),
+            retrieval_chunk_chars=int(environ.get("RETRIEVAL_CHUNK_CHARS", "800")),
+            retrieval_cache_size=int(environ.get("RETRIEVAL_CACHE_SIZE", "32")),
+            retrieval_index_max_bytes=int(environ.get("RETRIEVAL_INDEX_MAX_BYTES", str(256 * 1024 * 1024))),
+            speculative_token_budget=int(environ.get("SPECULATIVE_TOKEN_BUDGET", "200000")),
+            speculative_budget_window=float(environ.get("SPECULATIVE_BUDGET_WINDOW", "3600")),
+            speculative_ttl=float(environ.get("SPECULATIVE_TTL", "1800")),
+            shared_cache_backend=_choice(
+                "SHARED_CACHE_BACKEND", environ.get("SHARED_CACHE_BACKEND", "memory"),
+                SHARED_CACHE_BACKENDS, SHARED_CACHE_BACKEND_ALIASES,
+            ),
+            shared_cache_path=environ.get("SHARED_CACHE_PATH", os.path.join(CACHE_DIR, "shared_cache.sqlite3")),
+            shared_cache_max_bytes=int(environ.get("SHARED_CACHE_MAX_BYTES", str(256 * 1024 * 1024))),
+            shared_cache_lease_seconds=float(environ.get("SHARED_CACHE_LEASE_SECONDS", "300")),
+            shared_cache_poll_seconds=float(environ.get("SHARED_CACHE_POLL_SECONDS", "0.1")),
+            ws_send_queue_size=int(environ.get("WS_SEND_QUEUE_SIZE", "256")),
+            ws_max_concurrent_tasks=int(environ.get("WS_MAX_CONCURRENT_TASKS", "8")),
+            ws_max_tasks=int(environ.get("WS_MAX_TASKS", "64")),
+            export_spool_max_bytes=int(environ.get("EXPORT_SPOOL_MAX_BYTES", str(8 * 1024 * 1024))),
+            port=int(environ.get("PORT", "8000")),
+            log_level=environ.get("LOG_LEVEL", "info").lower(),
+            cors_origins=_split_csv(environ.get("CORS_ORIGINS", "http://localhost:5173")),
+            compression_min_bytes=int(environ.get("COMPRESSION_MIN_BYTES", "1024")),
+            gzip_level=int(environ.get("GZIP_LEVEL", "6")),
+            brotli_quality=int(environ.get("BROTLI_QUALITY", "4")),
+            max_request_body_bytes=int(environ.get("MAX_REQUEST_BODY_BYTES", str(5 * 1024 * 1024))),
+            request_body_limits=environ.get("REQUEST_BODY_LIMITS") or None,
+            host=environ.get("HOST", "0.0.0.0"),
+            workers=int(environ.get("SERVER_WORKERS") or environ.get("WEB_CONCURRENCY") or "1"),
+            server_loop=environ.get("SERVER_LOOP", "auto").lower(),
+            server_http=environ.get("SERVER_HTTP", "auto").lower(),
+            keep_alive_timeout=int(environ.get("SERVER_KEEP_ALIVE", "5")),
+            limit_concurrency=_optional_int(environ.get("SERVER_LIMIT_CONCURRENCY")),
+            backlog=int(environ.get("SERVER_BACKLOG", "2048")),
+            max_requests=_optional_int(environ.get("SERVER_MAX_REQUESTS")),
+            graceful_shutdown_timeout=float(environ.get("SERVER_GRACEFUL_SHUTDOWN_TIMEOUT", "30")),
+            budget_admin_token=environ.get("BUDGET_ADMIN_TOKEN") or None,
+            diagnostics_token=environ.get("DIAGNOSTICS_TOKEN") or None,
+            diagnostics_request_profiling=_flag(environ.get("DIAGNOSTICS_REQUEST_PROFILING")),
+            diagnostics_sample_interval_ms=float(environ.get("DIAGNOSTICS_SAMPLE_INTERVAL_MS", "5")),
+        )
+
+
+@lru_cache(maxsize=None)
+def get_settings() -> Settings:
+    """The process-wide settings; the `.env` file is read on the first call only."""
+    load_env_file()
+    return Settings.from_env()
@@ -0,0 +1,241 @@
+"""
+Per-project and per-user token/cost budgets for LLM calls.
+
+The router tags each request with its budget scope (X-User-ID, and the
+project from X-Project-ID or the payload), the same way it tags scheduling
+context. Once any budget has a limit, a request without either ID is
+rejected rather than let through unaccounted; before that, unscoped calls
+are simply not recorded.
+
+Before dispatch, `budget_ledger.admit()` estimates the call's worst case
+(prompt tokens + max_tokens per choice) and its cost from the model's price.
+If that would take any scope past its token or cost limit, the call is routed
+to LLM_BUDGET_FALLBACK_MODEL when that model fits, and otherwise rejected with
+BudgetExceeded. Admitted estimates stay reserved until `settle()` records the
+actual usage reported by OpenRouter, so concurrent calls cannot overshoot
+together.
+
+Reservations live in each worker's memory; recorded usage lives in the
+database and is shared. With SERVER_WORKERS > 1, calls admitted at the same
+time by different workers do not see each other's reservations, so a limit
+can be overshot by up to one in-flight worst case per other worker. Treat
+limits as exact for a single worker and approximate otherwise.
+
+Limits are changed through PUT /budgets/..., which requires BUDGET_ADMIN_TOKEN.
+
+Prices are USD per million prompt/completion tokens, overridable with
+LLM_PRICES='{"model": [prompt, completion], ...}'. OpenRouter's own `usage.cost`
+is used for the recorded cost when the response includes it.
+"""
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field, replace
+from typing import Optional
+
+from repo_src.backend.settings import get_settings
+
+_settings = get_settings()
+
+DEFAULT_PRICES = {
+    "anthropic/claude-sonnet-4": (3.0, 15.0),
+    "anthropic/claude-3.5-haiku": (0.8, 4.0),
+    "openai/gpt-4o": (2.5, 10.0),
+    "openai/gpt-4o-mini": (0.15, 0.6),
+}
+LLM_PRICES = {**DEFAULT_PRICES, **_settings.llm_prices}
+UNKNOWN_MODEL_PRICE = (3.0, 15.0)  # Assume a mid-range model rather than a free one
+# Cheaper model that calls are routed to when the configured one would exceed a budget ("" disables).
+LLM_BUDGET_FALLBACK_MODEL = _settings.llm_budget_fallback_model
+BUDGET_ADMIN_TOKEN = _settings.budget_admin_token
+
+
+class BudgetExceeded(Exception):
+    """The call would take a project or user past its token or cost limit."""
+
+
+@dataclass(frozen=True)
+class BudgetScope:
+    project_id: Optional[str] = None
+    user_id: Optional[str] = None
+    session_factory: object = None  # async_sessionmaker used for budget reads/writes
+
+    def keys(self) -> list[tuple[str, str]]:
+        keys = []
+        if self.project_id:
+            keys.append(("project", self.project_id))
+        if self.user_id:
+            keys.append(("user", self.user_id))
+        return keys
+
+
+_scope_var: ContextVar[BudgetScope] = ContextVar("llm_budget_scope", default=BudgetScope())
+
+
+def set_budget_scope(**fields) -> None:
+    """Updates the given fields of the current budget scope (for the rest of this task and its children)."""
+    _scope_var.set(replace(_scope_var.get(), **{k: v for k, v in fields.items() if v is not None}))
+
+
+@contextmanager
+def budget_scope(project_id: Optional[str] = None, user_id: Optional[str] = None, session_factory=None):
+    token = _scope_var.set(replace(
+        _scope_var.get(), **{k: v for k, v in
+                             {"project_id": project_id, "user_id": user_id, "session_factory": session_factory}.items()
+                             if v is not None}
+    ))
+    try:
+        yield
+    finally:
+        _scope_var.reset(token)
+
+
+def current_budget_scope() -> BudgetScope:
+    return _scope_var.get()
+
+
+def price_for(model: str) -> tuple[float, float]:
+    return LLM_PRICES.get(model, UNKNOWN_MODEL_PRICE)
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    prompt_price, completion_price = price_for(model)
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+
+@dataclass
+class Reservation:
+    """An admitted call: the model to use and what is held against each scope until settled."""
+    model: str
+    keys: list = field(default_factory=list)
+    tokens: int = 0
+    cost: float = 0.0
+    session_factory: object = None
+    settled: bool = False
+
+
+class BudgetLedger:
+    def __init__(self):
+        self._reserved: dict[tuple[str, str], list] = {}  # key -> [tokens, cost] admitted but not settled
+        self._settling: set[asyncio.Task] = set()
+
+    def reserved(self, key: tuple[str, str]) -> tuple[int, float]:
+        tokens, cost = self._reserved.get(key, (0, 0.0))
+        return tokens, cost
+
+    async def _limits(self, scope: BudgetScope) -> dict:
+        from repo_src.backend.adapters import budget_store
+        async with scope.session_factory() as session:
+            return {
+                key: (b.token_limit, b.cost_limit_usd, b.tokens_used, b.cost_used_usd)
+                for key, b in (await budget_store.get_budgets(session, scope.keys())).items()
+            }
+
+    def _over(self, limits: dict, model: str, tokens: int, cost: float) -> Optional[str]:
+        """Why a call of this size would exceed a budget, or None if it fits everywhere."""
+        for (scope, scope_id), (token_limit, cost_limit, tokens_used, cost_used) in limits.items():
+            reserved_tokens, reserved_cost = self.reserved((scope, scope_id))
+            if token_limit is not None and tokens_used + reserved_tokens + tokens > token_limit:
+                return (f"{scope} {scope_id} has {max(0, token_limit - tokens_used - reserved_tokens)} of "
+                        f"{token_limit} tokens left; this call may use up to {tokens}")
+            if cost_limit is not None and cost_used + reserved_cost + cost > cost_limit:
+                return (f"{scope} {scope_id} has ${max(0.0, cost_limit - cost_used - reserved_cost):.4f} of "
+                        f"${cost_limit:.2f} left; this call may cost up to ${cost:.4f} with {model}")
+        return None
+
+    async def _any_limits(self, scope: BudgetScope) -> bool:
+        from repo_src.backend.adapters import budget_store
+        async with scope.session_factory() as session:
+            return await budget_store.any_limits(session)
+
+    async def admit(self, model: str, prompt_tokens: int, max_completion_tokens: int) -> Reservation:
+        """
+        Checks the call against the current scope's budgets and reserves its estimate.
+        Returns the reservation (whose model may be the fallback); raises BudgetExceeded.
+        """
+        scope = current_budget_scope()
+        keys = scope.keys()
+        if scope.session_factory is None:  # Not serving a request (scripts, tests): nothing to enforce
+            return Reservation(model=model)
+        try:
+            if not keys:
+                if await self._any_limits(scope):
+                    raise BudgetExceeded("budgets are enforced, so requests must send X-User-ID or X-Project-ID")
+                return Reservation(model=model)
+            limits = await self._limits(scope)
+        except BudgetExceeded:
+            raise
+        except Exception as e:  # Accounting must not take generation down with it
+            print(f"Budget check skipped ({e})")
+            return Reservation(model=model)
+
+        tokens = prompt_tokens + max_completion_tokens
+        reason = self._over(limits, model, tokens, estimate_cost(model, prompt_tokens, max_completion_tokens))
+        if reason is not None:
+            fallback = LLM_BUDGET_FALLBACK_MODEL
+            if not fallback or fallback == model or self._over(
+                limits, fallback, tokens, estimate_cost(fallback, prompt_tokens, max_completion_tokens)
+            ):
+                raise BudgetExceeded(reason)
+            print(f"Budget: routing call to {fallback} ({reason})")
+            model = fallback
+
+        cost = estimate_cost(model, prompt_tokens, max_completion_tokens)
+        for key in keys:
+            held = self._reserved.setdefault(key, [0, 0.0])
+            held[0] += tokens
+            held[1] += cost
+        return Reservation(model=model, keys=keys, tokens=tokens, cost=cost, session_factory=scope.session_factory)
+
+    def release(self, reservation: Reservation) -> None:
+        """Drops the reservation without recording usage (the call never reached the model)."""
+        if reservation.settled:
+            return
+        reservation.settled = True
+        for key in reservation.keys:
+            held = self._reserved.get(key)
+            if held is None:
+                continue
+            held[0] -= reservation.tokens
+            held[1] -= reservation.cost
+            if held[0] <= 0:
+                del self._reserved[key]
+
+    async def settle(
+        self, reservation: Reservation, prompt_tokens: int, completion_tokens: int, cost: Optional[float] = None
+    ) -> None:
+        """Releases the reservation and adds the call's actual usage to every scope."""
+        if reservation.settled:
+            return
+        self.release(reservation)
+        if not reservation.keys:
+            return
+        if cost is None:
+            cost = estimate_cost(reservation.model, prompt_tokens, completion_tokens)
+        from repo_src.backend.adapters import budget_store
+        try:
+            async with reservation.session_factory() as session:
+                await budget_store.add_usage(session, reservation.keys, prompt_tokens + completion_tokens, cost)
+        except Exception as e:
+            print(f"Could not record LLM usage for {reservation.keys}: {e}")
+
+    def settle_soon(self, reservation: Reservation, prompt_tokens: int, completion_tokens: int,
+                    cost: Optional[float] = None) -> None:
+        """settle() in a background task, for callers that cannot await (closing generators)."""
+        if reservation.settled:
+            return
+        if not reservation.keys:
+            self.release(reservation)
+            return
+        task = asyncio.get_running_loop().create_task(self.settle(reservation, prompt_tokens, completion_tokens, cost))
+        self._settling.add(task)
+        task.add_done_callback(self._settling.discard)
+
+    async def wait_settled(self) -> None:
+        """Waits for usage still being recorded in the background."""
+        while self._settling:
+            await asyncio.gather(*list(self._settling), return_exceptions=True)
+
+
+budget_ledger = BudgetLedger()
+
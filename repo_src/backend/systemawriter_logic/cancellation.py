@@ -0,0 +1,158 @@
+"""
+Cancellation of in-flight generations.
+
+Router handlers run their core_logic call through `run_cancellable`, which
+cancels the work as soon as the HTTP client disconnects or someone calls
+`cancel_request(request_id)` (exposed as POST /requests/{id}/cancel).
+Cancellation is plain asyncio task cancellation: it propagates through the
+core_logic fan-outs (see `gather_cancelling`) down to the httpx call in
+llm_interface, which aborts the upstream request. The counters in
+`cancellation_stats` record how many LLM calls were aborted or never sent,
+and an estimate of the tokens that were not paid for. A non-streamed call
+gives no sign of how far the model got, so the most it could have saved
+(its max_tokens) is counted separately as `tokens_saved_upper_bound`.
+"""
+import asyncio
+from dataclasses import dataclass, asdict
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional, Sequence, TypeVar
+
+from starlette.requests import Request
+from repo_src.backend.settings import get_settings
+
+DISCONNECT_POLL_INTERVAL = get_settings().disconnect_poll_interval  # seconds
+
+T = TypeVar("T")
+
+
+@dataclass
+class CancellationStats:
+    cancelled_calls: int = 0  # LLM calls aborted while in flight
+    skipped_calls: int = 0  # Fan-out calls never dispatched because their request was cancelled
+    estimated_tokens_saved: int = 0
+    tokens_saved_upper_bound: int = 0  # Unstreamed calls aborted at an unknown point: max_tokens each
+    cancelled_requests: int = 0  # HTTP requests cancelled by disconnect or explicit cancel
+
+    def record_cancelled_call(self, tokens_saved: int = 0, upper_bound: int = 0) -> None:
+        """`tokens_saved` when the call's progress is known (streaming); otherwise only `upper_bound`."""
+        self.cancelled_calls += 1
+        self.estimated_tokens_saved += max(0, tokens_saved)
+        self.tokens_saved_upper_bound += max(0, upper_bound)
+
+    def record_skipped_call(self, tokens_saved: int) -> None:
+        self.skipped_calls += 1
+        self.estimated_tokens_saved += max(0, tokens_saved)
+
+    def snapshot(self) -> dict:
+        return asdict(self)
+
+
+cancellation_stats = CancellationStats()
+
+
+class RequestCancelled(Exception):
+    """Raised by run_cancellable when the work was cancelled; `reason` is 'disconnect' or 'cancel'."""
+
+    def __init__(self, reason: str):
+        super().__init__(f"Request cancelled ({reason})")
+        self.reason = reason
+
+
+_in_flight: dict[str, asyncio.Task] = {}
+
+
+def cancel_request(request_id: str) -> bool:
+    """Cancels the in-flight request registered under `request_id`. Returns False if none is running."""
+    task = _in_flight.get(request_id)
+    if task is None or task.done():
+        return False
+    task.cancel("cancel")
+    return True
+
+
+def in_flight_request_ids() -> list[str]:
+    return [request_id for request_id, task in _in_flight.items() if not task.done()]
+
+
+async def _wait_for_disconnect(request: Request) -> None:
+    while not await request.is_disconnected():
+        await asyncio.sleep(DISCONNECT_POLL_INTERVAL)
+
+
+async def run_cancellable(request: Request, work: Awaitable[T], request_id: Optional[str] = None) -> T:
+    """
+    Awaits `work` while watching for a client disconnect. If the client goes away,
+    or cancel_request(request_id) is called, the work is cancelled and
+    RequestCancelled is raised.
+    """
+    request_id = request_id or request.headers.get("x-request-id")
+    task = asyncio.ensure_future(work)
+    watcher = asyncio.ensure_future(_wait_for_disconnect(request))
+    if request_id:
+        _in_flight[request_id] = task
+    try:
+        try:
+            await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            task.cancel()  # The handler itself is being cancelled (e.g. shutdown): take the work with it
+            raise
+        if task.done() and not task.cancelled():
+            return task.result()
+        reason = "cancel" if task.cancelled() else "disconnect"
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        cancellation_stats.cancelled_requests += 1
+        print(f"Generation request {request_id or '<unnamed>'} cancelled ({reason}). Totals: {cancellation_stats.snapshot()}")
+        raise RequestCancelled(reason)
+    finally:
+        watcher.cancel()
+        if request_id and _in_flight.get(request_id) is task:
+            del _in_flight[request_id]
+
+
+async def gather_cancelling(*aws: Awaitable[Any]) -> list[Any]:
+    """
+    Like asyncio.gather, but if one awaitable fails the others are cancelled
+    instead of being left running (and billing) in the background.
+    """
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+async def iter_completed(factories: Sequence[Callable[[], Awaitable[T]]], limit: int) -> AsyncIterator[tuple[int, T]]:
+    """
+    Runs the awaitables made by `factories` with at most `limit` in flight and yields
+    (index, result) pairs in completion order. Exceptions are yielded as results.
+    Closing the iterator early (e.g. the client disconnected) cancels the rest;
+    awaitables that never started are never created.
+    """
+    pending: dict[asyncio.Task, int] = {}
+    next_index = 0
+
+    def fill() -> None:
+        nonlocal next_index
+        while next_index < len(factories) and len(pending) < max(1, limit):
+            pending[asyncio.ensure_future(factories[next_index]())] = next_index
+            next_index += 1
+
+    try:
+        fill()
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                index = pending.pop(task)
+                yield index, (task.exception() or task.result())
+            fill()
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
@@ -0,0 +1,223 @@
+"""
+Record/replay of LLM HTTP traffic ("cassettes").
+
+Set LLM_CASSETTE_MODE to (an unknown mode fails LLM calls with a ValueError):
+
+    off      (default) talk to the API directly
+    record   call the API and save every exchange to a cassette
+    replay   answer only from cassettes, never touching the network or
+             needing an API key; unrecorded requests fail with CassetteMiss
+    auto     replay when a cassette exists, otherwise record
+
+Works at the httpx transport level, so plain and streamed (SSE) calls are
+both covered: a cassette stores the response status, headers and every raw
+body chunk with its offset from the start of the request. Replay reproduces
+the chunks in order; LLM_REPLAY_SPEED sets the pacing (1 = original timing,
+10 = ten times faster, 0 = no delays).
+
+Cassettes are gzipped JSON files named by a hash of the request (method, URL
+and JSON body; headers such as the API key are not part of it) under
+LLM_CASSETTE_DIR. Repeating an identical request records further responses
+to the same cassette, and replay returns them in turn.
+"""
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import time
+from collections import defaultdict
+from typing import AsyncIterator, Callable, Optional
+
+import httpx
+from repo_src.backend.settings import get_settings
+
+CASSETTE_MODES = ("off", "record", "replay", "auto")
+_settings = get_settings()
+LLM_CASSETTE_MODE = _settings.llm_cassette_mode
+LLM_CASSETTE_DIR = _settings.llm_cassette_dir
+LLM_REPLAY_SPEED = _settings.llm_replay_speed
+CASSETTE_VERSION = 1
+# Response headers worth keeping; anything else (cookies, request ids, dates) is dropped.
+RECORDED_HEADERS = ("content-type", "content-encoding", "retry-after")
+SSE_DONE = b"data: [DONE]"
+
+
+class CassetteMiss(httpx.TransportError):
+    """Replay mode received a request that was never recorded."""
+
+
+def cassette_key(method: str, url: str, body: bytes) -> str:
+    try:
+        canonical_body = json.dumps(json.loads(body), sort_keys=True, separators=(",", ":"))
+    except ValueError:
+        canonical_body = body.decode("latin-1")
+    canonical = json.dumps([method.upper(), url, canonical_body])
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:32]
+
+
+def cassette_path(key: str, directory: Optional[str] = None) -> str:
+    return os.path.join(directory or LLM_CASSETTE_DIR, f"{key}.json.gz")
+
+
+def load_cassette(path: str) -> Optional[dict]:
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as file:
+            cassette = json.load(file)
+    except FileNotFoundError:
+        return None
+    return cassette if cassette.get("version") == CASSETTE_VERSION else None
+
+
+def save_cassette(path: str, cassette: dict) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with gzip.open(tmp, "wt", encoding="utf-8") as file:
+        json.dump(cassette, file)
+    os.replace(tmp, path)  # Readers never see a half-written cassette
+
+
+class _RecordingStream(httpx.AsyncByteStream):
+    """Passes body chunks through while noting their timing; saves the exchange once fully read."""
+
+    def __init__(self, transport: "CassetteTransport", inner: httpx.AsyncBaseTransport, stream,
+                 key: str, request: dict, episode: dict, started: float):
+        self._transport, self._inner = transport, inner
+        self._stream = stream
+        self._key, self._request, self._episode, self._started = key, request, episode, started
+        self._complete = False
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            # latin-1 maps bytes 1:1 onto code points, so raw chunks survive JSON untouched.
+            self._episode["chunks"].append([round(time.monotonic() - self._started, 4), chunk.decode("latin-1")])
+            # SSE readers stop at the terminator without draining the body; that still counts as complete.
+            self._complete = SSE_DONE in chunk
+            yield chunk
+        self._complete = True
+
+    async def aclose(self) -> None:
+        await self._stream.aclose()
+        await self._inner.aclose()
+        if self._complete:  # A stream abandoned midway (cancellation) is not worth replaying
+            await self._transport._append_episode(self._key, self._request, self._episode)
+
+
+class _ReplayStream(httpx.AsyncByteStream):
+    def __init__(self, chunks: list, speed: float, started: float):
+        self._chunks, self._speed, self._started = chunks, speed, started
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        for offset, data in self._chunks:
+            if self._speed > 0:
+                delay = offset / self._speed - (time.monotonic() - self._started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            yield data.encode("latin-1")
+
+
+class CassetteTransport(httpx.AsyncBaseTransport):
+    """httpx transport that records to or replays from cassettes (see module docstring)."""
+
+    def __init__(
+        self,
+        mode: str,
+        directory: Optional[str] = None,
+        speed: Optional[float] = None,
+        upstream: Callable[[], httpx.AsyncBaseTransport] = httpx.AsyncHTTPTransport,
+    ):
+        if mode not in CASSETTE_MODES:
+            raise ValueError(f"LLM_CASSETTE_MODE must be one of {', '.join(CASSETTE_MODES)}, not {mode!r}")
+        self.mode = mode
+        self.upstream = upstream  # Factory for the transport that reaches the real API
+        self.directory = directory or LLM_CASSETTE_DIR
+        self.speed = LLM_REPLAY_SPEED if speed is None else speed
+        self._recorded: dict[str, dict] = {}  # Cassettes written by this process, keyed by request hash
+        self._replay_positions: dict[str, int] = defaultdict(int)
+        self._save_locks: dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        body = await request.aread()
+        key = cassette_key(request.method, str(request.url), body)
+        path = cassette_path(key, self.directory)
+        cassette = load_cassette(path) if self.mode in ("replay", "auto") else None
+        if cassette:
+            return await self._replay(request, key, cassette)
+        if self.mode == "replay":
+            raise CassetteMiss(f"No cassette recorded for this request ({path})", request=request)
+        return await self._record(request, key, body)
+
+    async def _replay(self, request: httpx.Request, key: str, cassette: dict) -> httpx.Response:
+        episodes = cassette["responses"]
+        episode = episodes[self._replay_positions[key] % len(episodes)]
+        self._replay_positions[key] += 1
+        started = time.monotonic()
+        if self.speed > 0 and episode["headers_after"] > 0:
+            await asyncio.sleep(episode["headers_after"] / self.speed)
+        return httpx.Response(
+            episode["status"],
+            headers=episode["headers"],
+            stream=_ReplayStream(episode["chunks"], self.speed, started),
+            request=request,
+        )
+
+    async def _record(self, request: httpx.Request, key: str, body: bytes) -> httpx.Response:
+        # A connection per call, as the LLM client itself does (a pool would be tied to one event loop).
+        inner = self.upstream()
+        started = time.monotonic()
+        try:
+            response = await inner.handle_async_request(request)
+        except BaseException:
+            await inner.aclose()
+            raise
+        episode = {
+            "status": response.status_code,
+            "headers": [[k, v] for k, v in response.headers.items() if k.lower() in RECORDED_HEADERS],
+            "headers_after": round(time.monotonic() - started, 4),
+            "chunks": [],
+        }
+        try:
+            request_info = {"method": request.method, "url": str(request.url), "body": json.loads(body)}
+        except ValueError:
+            request_info = {"method": request.method, "url": str(request.url), "body": body.decode("latin-1")}
+        return httpx.Response(
+            response.status_code,
+            headers=response.headers,
+            stream=_RecordingStream(self, inner, response.stream, key, request_info, episode, started),
+            request=request,
+            extensions=response.extensions,
+        )
+
+    async def _append_episode(self, key: str, request: dict, episode: dict) -> None:
+        path = cassette_path(key, self.directory)
+        # The first recording of a request in this process replaces whatever was on disk;
+        # repeats of it are appended, so replay returns the responses in the same order.
+        cassette = self._recorded.get(key) or {"version": CASSETTE_VERSION, "request": request, "responses": []}
+        cassette["responses"].append(episode)
+        self._recorded[key] = cassette
+        # gzip and JSON encoding run in a thread; one save per cassette at a time, so the
+        # last one written holds every episode.
+        async with self._save_locks[key]:
+            await asyncio.to_thread(save_cassette, path, {**cassette, "responses": list(cassette["responses"])})
+
+
+def replay_only() -> bool:
+    """True when calls are answered from cassettes alone (no API key needed)."""
+    return LLM_CASSETTE_MODE == "replay"
+
+
+_transport: Optional[CassetteTransport] = None
+
+
+def llm_transport() -> Optional[httpx.AsyncBaseTransport]:
+    """
+    The transport for LLM clients: None (httpx's default) when cassettes are off.
+    One cassette transport is shared by all clients so replay order holds across
+    calls; closing a client leaves it usable (it holds no connections itself).
+    """
+    global _transport
+    if LLM_CASSETTE_MODE == "off":
+        return None
+    if _transport is None or _transport.mode != LLM_CASSETTE_MODE:
+        _transport = CassetteTransport(LLM_CASSETTE_MODE)
+    return _transport
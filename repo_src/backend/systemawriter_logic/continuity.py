@@ -0,0 +1,148 @@
+"""
+Rolling continuity state for scene-to-scene consistency.
+
+Instead of resending earlier scenes, each project keeps a compact running
+state (where characters are, what they know, open threads, recent events).
+After a scene is generated, one LLM call folds that scene into the state
+that preceded it; the result is stored as a "continuity" artifact at the
+scene's (chapter_index, scene_index). A scene prompt then includes only the
+latest state positioned before the scene, capped at CONTINUITY_MAX_CHARS,
+so prompt size stays flat as the book grows.
+
+Updates run in the background at batch priority. A lookup for a later scene
+first waits for any pending update positioned before it, so consecutive
+scenes see each other's effects. Regenerating an earlier scene rewrites its
+state; states after it are refreshed as those scenes are regenerated.
+"""
+import asyncio
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from repo_src.backend.adapters import artifact_store
+from repo_src.backend.settings import get_settings
+from . import shared_cache
+from .llm_interface import ask_llm
+from .scheduler import llm_context
+
+CONTINUITY_KIND = "continuity"
+CONTINUITY_MAX_CHARS = get_settings().continuity_max_chars  # ~750 tokens per scene prompt
+
+CONTINUITY_SYSTEM_MESSAGE = "You are a meticulous continuity editor who keeps concise notes on a novel in progress."
+
+
+def get_continuity_update_prompt(previous_state: str, chapter_title: str, scene_text: str, max_chars: int) -> str:
+    return f"""
+Update the continuity notes for a novel in progress so they reflect the scene below.
+Keep only what a writer needs to stay consistent in later scenes. Use these Markdown sections:
+## Characters (where each is, condition, what they know)
+## Open Threads (unresolved questions, promises, dangers)
+## Recent Events (the last few developments, newest last)
+
+Drop details that no longer matter. The whole document must stay under {max_chars} characters.
+
+**Current Continuity Notes:**
+{previous_state or "(none yet - this is the first scene)"}
+
+**New Scene ({chapter_title}):**
+{scene_text}
+
+Write the updated continuity notes now:
+"""
+
+
+def bound_state(state: str, max_chars: int = CONTINUITY_MAX_CHARS) -> str:
+    """Hard cap on the state size, cut at a line boundary when possible."""
+    state = state.strip()
+    if len(state) <= max_chars:
+        return state
+    cut = state.rfind("\n", 0, max_chars)
+    return state[: cut if cut > max_chars // 2 else max_chars].rstrip()
+
+
+async def fold_scene_into_state(previous_state: str, chapter_title: str, scene_text: str) -> str:
+    """Returns the new bounded state, or the previous one if the LLM call failed."""
+    prompt_text = get_continuity_update_prompt(previous_state, chapter_title, scene_text, CONTINUITY_MAX_CHARS)
+    # The same fold requested again (a repeated record, or another worker) reuses the stored notes.
+    updated = await shared_cache.cache.get_or_compute(
+        shared_cache.cache_key(CONTINUITY_KIND, prompt_text),
+        lambda: ask_llm(prompt_text, system_message=CONTINUITY_SYSTEM_MESSAGE),
+        cacheable=lambda text: not text.startswith("Error:"),
+    )
+    if updated.startswith("Error:"):
+        print(f"Continuity update failed for {chapter_title}: {updated}")
+        return previous_state
+    return bound_state(updated)
+
+
+class ContinuityStore:
+    def __init__(self):
+        # project_id -> {(chapter_index, scene_index): update task}
+        self._pending: dict[str, dict[tuple[int, int], asyncio.Task]] = {}
+
+    async def _wait_for_earlier(self, project_id: str, position: tuple[int, int]) -> None:
+        earlier = [t for pos, t in self._pending.get(project_id, {}).items() if pos < position]
+        if earlier:
+            await asyncio.gather(*(asyncio.shield(t) for t in earlier), return_exceptions=True)
+
+    async def state_before(
+        self, session_factory: async_sessionmaker, project_id: str, chapter_index: int, scene_index: int
+    ) -> str:
+        """The continuity notes that hold just before this scene ("" for the first scene)."""
+        await self._wait_for_earlier(project_id, (chapter_index, scene_index))
+        async with session_factory() as session:
+            state = await artifact_store.get_latest_before(
+                session, project_id, CONTINUITY_KIND, chapter_index, scene_index
+            )
+        return bound_state(state or "")
+
+    def record_scene(
+        self,
+        session_factory: async_sessionmaker,
+        project_id: str,
+        chapter_index: int,
+        scene_index: int,
+        chapter_title: str,
+        scene_text: str,
+    ) -> asyncio.Task:
+        """Schedules folding a finished scene into the state; replaces a pending update for the same scene."""
+        position = (chapter_index, scene_index)
+        pending = self._pending.setdefault(project_id, {})
+        previous = pending.pop(position, None)
+        if previous is not None:
+            previous.cancel()
+
+        async def update() -> None:
+            with llm_context(priority="batch", lower_only=True):
+                before = await self.state_before(session_factory, project_id, chapter_index, scene_index)
+                state = await fold_scene_into_state(before, chapter_title, scene_text)
+            if not state:
+                return
+            async with session_factory() as session:
+                await artifact_store.upsert_artifact(
+                    session, project_id, CONTINUITY_KIND, state,
+                    chapter_index=chapter_index, chapter_title=chapter_title, scene_index=scene_index,
+                )
+
+        task = asyncio.create_task(update())
+        pending[position] = task
+
+        def _done(t: asyncio.Task) -> None:
+            if self._pending.get(project_id, {}).get(position) is t:
+                del self._pending[project_id][position]
+                if not self._pending[project_id]:
+                    del self._pending[project_id]
+            if not t.cancelled() and t.exception() is not None:
+                print(f"Continuity update for project {project_id} {position} failed: {t.exception()}")
+
+        task.add_done_callback(_done)
+        return task
+
+    async def drain(self) -> None:
+        """Waits for every pending update, e.g. before the server shuts down."""
+        while self._pending:
+            tasks = [t for pending in self._pending.values() for t in pending.values()]
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+continuity_store = ContinuityStore()
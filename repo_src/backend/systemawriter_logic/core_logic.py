@@ -1,7 +1,21 @@
-from .llm_interface import ask_llm
-from . import prompts
+from .llm_interface import (
+    ask_llm, ask_llm_candidates, ask_llm_long, stream_llm, stream_llm_long, estimate_tokens, DEFAULT_MAX_TOKENS,
+)
+from .cancellation import cancellation_stats, gather_cancelling
+from .scheduler import llm_context
+from typing import AsyncIterator, Awaitable, Callable, Optional, Union
+from . import prompts, scene_plans
+from repo_src.backend.settings import get_settings
+import asyncio
 import re  # For parsing chapter titles from outline
 
+_settings = get_settings()
+
+# How many chapter breakdowns are requested from the LLM at once.
+BREAKDOWN_CONCURRENCY = _settings.breakdown_concurrency
+# Upper bound on scenes generated at once by one batch request.
+SCENE_BATCH_CONCURRENCY = _settings.scene_batch_concurrency
+
 # Helper to simulate context processing if files were uploaded/referenced
 def _summarize_context_files(context_files_content: list[str]) -> str:
     if not context_files_content:
@@ -11,18 +25,44 @@ def _summarize_context_files(context_files_content: list[str]) -> str:
     # Return a snippet or summary
     return (full_context_text[:1000] + "...") if len(full_context_text) > 1000 else full_context_text
 
+OUTLINE_SYSTEM_MESSAGE = "You are an expert story outliner and structure planner."
+WORLDBUILDING_SYSTEM_MESSAGE = "You are a creative worldbuilding assistant."
+BREAKDOWN_SYSTEM_MESSAGE = "You are an expert scene planner and story structure analyst."
+NARRATIVE_SYSTEM_MESSAGE = "You are a master storyteller and creative writer."
+DEFAULT_WRITING_STYLE_NOTES = "Write in a clear, engaging narrative style. Show, don't just tell. Use vivid descriptions. Maintain consistent character voices."
+
 async def generate_outline_logic(concept_document: str, context_files_content: list[str] = None) -> str:
     context_summary = _summarize_context_files(context_files_content or [])
     prompt_text = prompts.get_outline_prompt(concept_document, context_summary)
-    outline_md = await ask_llm(prompt_text, system_message="You are an expert story outliner and structure planner.")
+    outline_md = await ask_llm(prompt_text, system_message=OUTLINE_SYSTEM_MESSAGE)
     return outline_md
 
+async def generate_outline_candidates_logic(concept_document: str, n: int, context_files_content: list[str] = None) -> list[str]:
+    """Up to n alternative outlines generated concurrently, in generation order."""
+    context_summary = _summarize_context_files(context_files_content or [])
+    prompt_text = prompts.get_outline_prompt(concept_document, context_summary)
+    return await ask_llm_candidates(prompt_text, system_message=OUTLINE_SYSTEM_MESSAGE, n=n)
+
+async def stream_outline_logic(concept_document: str, context_files_content: list[str] = None) -> AsyncIterator[str]:
+    """Streaming variant of generate_outline_logic; yields text deltas."""
+    context_summary = _summarize_context_files(context_files_content or [])
+    prompt_text = prompts.get_outline_prompt(concept_document, context_summary)
+    async for delta in stream_llm(prompt_text, system_message=OUTLINE_SYSTEM_MESSAGE):
+        yield delta
+
 async def generate_worldbuilding_logic(concept_document: str, approved_outline: str, context_files_content: list[str] = None) -> str:
     context_summary = _summarize_context_files(context_files_content or [])
     prompt_text = prompts.get_worldbuilding_prompt(concept_document, approved_outline, context_summary)
-    worldbuilding_md = await ask_llm(prompt_text, system_message="You are a creative worldbuilding assistant.")
+    worldbuilding_md = await ask_llm(prompt_text, system_message=WORLDBUILDING_SYSTEM_MESSAGE)
     return worldbuilding_md
 
+async def stream_worldbuilding_logic(concept_document: str, approved_outline: str, context_files_content: list[str] = None) -> AsyncIterator[str]:
+    """Streaming variant of generate_worldbuilding_logic; yields text deltas."""
+    context_summary = _summarize_context_files(context_files_content or [])
+    prompt_text = prompts.get_worldbuilding_prompt(concept_document, approved_outline, context_summary)
+    async for delta in stream_llm(prompt_text, system_message=WORLDBUILDING_SYSTEM_MESSAGE):
+        yield delta
+
 def _extract_chapters_from_outline(outline_md: str) -> list[dict]:
     chapters = []
     # Regex to find H2 headings (## Chapter Title) and capture their content
@@ -40,10 +80,43 @@ def _extract_chapters_from_outline(outline_md: str) -> list[dict]:
          chapters.append({"title": "Main Story Beats", "summary": outline_md.strip()})
     return chapters
 
+async def _for_each_chapter(
+    chapters: list[dict],
+    prompt_for: Callable[[dict], str],
+    call: Callable[[str], Awaitable],
+    on_chapter_done: Optional[Callable[[str, object, int, int], Awaitable[None]]] = None,
+) -> list:
+    """`call(prompt_for(chapter))` for every chapter, concurrently (bounded), in chapter order."""
+    # Cancelling the caller cancels in-flight calls and ensures queued chapters are never sent.
+    semaphore = asyncio.Semaphore(BREAKDOWN_CONCURRENCY)
+    completed = 0
+
+    async def run(chapter: dict):
+        nonlocal completed
+        prompt_text = await asyncio.to_thread(prompt_for, chapter)  # May build a retrieval index
+        dispatched = False
+        try:
+            async with semaphore:
+                dispatched = True
+                result = await call(prompt_text)
+        except asyncio.CancelledError:
+            if not dispatched:
+                cancellation_stats.record_skipped_call(estimate_tokens(prompt_text) + DEFAULT_MAX_TOKENS)
+            raise
+        completed += 1
+        if on_chapter_done is not None:
+            await on_chapter_done(chapter["title"], result, completed, len(chapters))
+        return result
+
+    # The fan-out queues as batch work so interactive requests (including other users') go first.
+    with llm_context(priority="batch", lower_only=True):
+        return await gather_cancelling(*(run(chapter) for chapter in chapters))
+
 async def generate_all_scene_breakdowns_logic(
     approved_outline: str,
     approved_worldbuilding: str,
-    context_files_content: list[str] = None  # context_summary not directly used in breakdown prompt but good to have
+    context_files_content: list[str] = None,  # context_summary not directly used in breakdown prompt but good to have
+    on_chapter_done: Optional[Callable[[str, str, int, int], Awaitable[None]]] = None  # (title, breakdown_md, completed, total)
 ) -> dict[str, str]:
     chapters = _extract_chapters_from_outline(approved_outline)
     all_breakdowns = {}
@@ -53,18 +126,53 @@ async def generate_all_scene_breakdowns_logic(
         all_breakdowns["Error"] = "Could not parse chapters from the outline. Please ensure the outline uses '## Chapter Title' format."
         return all_breakdowns
 
-    for chapter in chapters:
-        prompt_text = prompts.get_scene_breakdowns_prompt(
+    results = await _for_each_chapter(
+        chapters,
+        lambda chapter: prompts.get_scene_breakdowns_prompt(
             chapter_title=chapter["title"],
             chapter_summary_from_outline=chapter["summary"],
             approved_worldbuilding=approved_worldbuilding,
             full_approved_outline=approved_outline
-        )
-        breakdown_md = await ask_llm(prompt_text, system_message="You are an expert scene planner and story structure analyst.")
+        ),
+        lambda prompt_text: ask_llm(prompt_text, system_message=BREAKDOWN_SYSTEM_MESSAGE),
+        on_chapter_done,
+    )
+    for chapter, breakdown_md in zip(chapters, results):
         all_breakdowns[chapter["title"]] = breakdown_md
     
     return all_breakdowns
 
+async def generate_all_scene_plans_logic(
+    approved_outline: str,
+    approved_worldbuilding: str,
+) -> dict[str, Union[list[scene_plans.ScenePlan], str]]:
+    """
+    Structured variant of generate_all_scene_breakdowns_logic: each chapter's scenes as validated
+    ScenePlans (see scene_plans.py), in outline order, or an "Error: ..." string for that chapter.
+    """
+    chapters = _extract_chapters_from_outline(approved_outline)
+    if not chapters:
+        return {"Error": "Could not parse chapters from the outline. Please ensure the outline uses '## Chapter Title' format."}
+
+    async def plan_chapter(prompt_text: str) -> Union[list[scene_plans.ScenePlan], str]:
+        try:
+            return (await scene_plans.ask_for_chapter_plans(prompt_text, BREAKDOWN_SYSTEM_MESSAGE)).scenes
+        except scene_plans.StructuredOutputError as e:
+            return str(e)
+
+    results = await _for_each_chapter(
+        chapters,
+        lambda chapter: prompts.get_scene_breakdowns_prompt(
+            chapter_title=chapter["title"],
+            chapter_summary_from_outline=chapter["summary"],
+            approved_worldbuilding=approved_worldbuilding,
+            full_approved_outline=approved_outline,
+            structured=True,
+        ),
+        plan_chapter,
+    )
+    return {chapter["title"]: plans for chapter, plans in zip(chapters, results)}
+
 async def generate_scene_narrative_logic(
     scene_plan_from_breakdown: str,  # This is the specific plan for ONE scene
     chapter_title: str,
@@ -72,15 +180,66 @@ async def generate_scene_narrative_logic(
     approved_worldbuilding: str,
     full_approved_outline: str,
     # context_files_content: list[str] = None,  # Not directly used here, but could add writing style from context
-    writing_style_notes: str = ""  # User can provide style notes
+    writing_style_notes: str = "",  # User can provide style notes
+    continuity_notes: str = ""  # Rolling state from continuity.py; replaces resending earlier scenes
 ) -> str:
-    prompt_text = prompts.get_scene_narrative_prompt(
+    # Retrieval may have to build or load an index for the worldbuilding (blocking; see retrieval.py).
+    prompt_text = await asyncio.to_thread(
+        prompts.get_scene_narrative_prompt,
+        scene_plan_from_breakdown=scene_plan_from_breakdown,
+        chapter_title=chapter_title,
+        full_chapter_scene_breakdown=full_chapter_scene_breakdown,
+        approved_worldbuilding=approved_worldbuilding,
+        full_approved_outline=full_approved_outline,
+        writing_style_notes=writing_style_notes or DEFAULT_WRITING_STYLE_NOTES,
+        continuity_notes=continuity_notes
+    )
+    # Scenes can outgrow one completion; long-form mode continues them instead of truncating.
+    narrative_md = await ask_llm_long(prompt_text, system_message=NARRATIVE_SYSTEM_MESSAGE)
+    return narrative_md
+
+async def generate_scene_narrative_candidates_logic(
+    n: int,
+    scene_plan_from_breakdown: str,
+    chapter_title: str,
+    full_chapter_scene_breakdown: str,
+    approved_worldbuilding: str,
+    full_approved_outline: str,
+    writing_style_notes: str = "",
+    continuity_notes: str = ""
+) -> list[str]:
+    """Up to n alternative versions of one scene generated concurrently, in generation order."""
+    prompt_text = await asyncio.to_thread(
+        prompts.get_scene_narrative_prompt,
+        scene_plan_from_breakdown=scene_plan_from_breakdown,
+        chapter_title=chapter_title,
+        full_chapter_scene_breakdown=full_chapter_scene_breakdown,
+        approved_worldbuilding=approved_worldbuilding,
+        full_approved_outline=full_approved_outline,
+        writing_style_notes=writing_style_notes or DEFAULT_WRITING_STYLE_NOTES,
+        continuity_notes=continuity_notes
+    )
+    return await ask_llm_candidates(prompt_text, system_message=NARRATIVE_SYSTEM_MESSAGE, n=n, long_form=True)
+
+async def stream_scene_narrative_logic(
+    scene_plan_from_breakdown: str,
+    chapter_title: str,
+    full_chapter_scene_breakdown: str,
+    approved_worldbuilding: str,
+    full_approved_outline: str,
+    writing_style_notes: str = "",
+    continuity_notes: str = ""
+) -> AsyncIterator[str]:
+    """Streaming variant of generate_scene_narrative_logic; yields text deltas."""
+    prompt_text = await asyncio.to_thread(
+        prompts.get_scene_narrative_prompt,
         scene_plan_from_breakdown=scene_plan_from_breakdown,
         chapter_title=chapter_title,
         full_chapter_scene_breakdown=full_chapter_scene_breakdown,
         approved_worldbuilding=approved_worldbuilding,
         full_approved_outline=full_approved_outline,
-        writing_style_notes=writing_style_notes or "Write in a clear, engaging narrative style. Show, don't just tell. Use vivid descriptions. Maintain consistent character voices."
+        writing_style_notes=writing_style_notes or DEFAULT_WRITING_STYLE_NOTES,
+        continuity_notes=continuity_notes
     )
-    narrative_md = await ask_llm(prompt_text, system_message="You are a master storyteller and creative writer.")
-    return narrative_md 
\ No newline at end of file
+    async for delta in stream_llm_long(prompt_text, system_message=NARRATIVE_SYSTEM_MESSAGE):
+        yield delta
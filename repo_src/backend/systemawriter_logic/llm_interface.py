@@ -1,60 +1,220 @@
-import os
-import httpx
+import asyncio
 import json
-from dotenv import load_dotenv
-
-# Load environment variables from .env file which should be in the backend directory
-# For production, environment variables should be set through the deployment environment.
-current_dir = os.path.dirname(os.path.abspath(__file__))
-env_path = os.path.join(current_dir, '..', '.env')  # Assumes .env is in backend/
-
-if os.path.exists(env_path):
-    load_dotenv(dotenv_path=env_path)
-else:
-    # Fallback if .env is not in backend/ but in project root, though backend/.env is preferred.
-    project_root_env = os.path.join(current_dir, '..', '..', '..', '.env')
-    if os.path.exists(project_root_env):
-        load_dotenv(dotenv_path=project_root_env)
-
-OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
-DEFAULT_MODEL_NAME = os.getenv("OPENROUTER_MODEL", "anthropic/claude-sonnet-4")  # Default if not set
-OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
-YOUR_SITE_URL = os.getenv("YOUR_SITE_URL", "http://localhost:5173")  # Optional
-YOUR_APP_NAME = os.getenv("YOUR_APP_NAME", "SystemaWriter")  # Optional
+from dataclasses import dataclass
+from typing import AsyncIterator, Optional
+
+from .cancellation import cancellation_stats, gather_cancelling
+from .scheduler import llm_scheduler, DeadlineExceeded
+from .budgets import BudgetExceeded, budget_ledger
+from repo_src.backend.settings import get_settings
+
+# httpx (and certifi's CA bundle) is imported on first use, keeping it off the startup path.
+# LLM_CASSETTE_MODE=record|replay|auto routes calls through cassettes.py (offline record/replay).
+
+_settings = get_settings()
+OPENROUTER_API_KEY = _settings.openrouter_api_key
+DEFAULT_MODEL_NAME = _settings.openrouter_model
+OPENROUTER_BASE_URL = _settings.openrouter_base_url
+YOUR_SITE_URL = _settings.site_url  # Optional
+YOUR_APP_NAME = _settings.app_name  # Optional
 
 if not OPENROUTER_API_KEY:
     print("Warning: OPENROUTER_API_KEY not found. LLM calls will fail.")
 
-async def ask_llm(prompt_text: str, system_message: str = "You are a helpful assistant specializing in creative writing and story structuring.") -> str:
+DEFAULT_MAX_TOKENS = _settings.llm_max_tokens  # Per call
+# Long-form mode (ask_llm_long / stream_llm_long): a completion cut off at max_tokens
+# (finish_reason "length") is continued by follow-up calls that see only the last
+# CONTINUATION_TAIL_CHARS of the text, up to CONTINUATION_MAX_TOTAL_TOKENS in total.
+CONTINUATION_MAX_TOTAL_TOKENS = _settings.continuation_max_total_tokens
+CONTINUATION_TAIL_CHARS = _settings.continuation_tail_chars
+CONTINUATION_OVERLAP_CHARS = 200  # How far back to look for text a continuation repeated
+CONTINUE_INSTRUCTION = (
+    "Continue the text above from exactly where it stops. Do not repeat, summarise or restart it; "
+    "output only the continuation."
+)
+# Whether the configured model honours the `n` parameter (several choices from one call).
+# Otherwise ask_llm_candidates issues n concurrent calls.
+LLM_SUPPORTS_N = _settings.llm_supports_n
+MAX_CANDIDATES = _settings.max_candidates
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) used for accounting before or without real usage data."""
+    return max(1, len(text) // 4)
+
+DEFAULT_SYSTEM_MESSAGE = "You are a helpful assistant specializing in creative writing and story structuring."
+
+def _build_headers() -> dict:
+    headers = {
+        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
+        "Content-Type": "application/json",
+    }
+    # Add optional headers recommended by OpenRouter
+    if YOUR_SITE_URL:
+        headers["HTTP-Referer"] = YOUR_SITE_URL
+    if YOUR_APP_NAME:
+        headers["X-Title"] = YOUR_APP_NAME
+    return headers
+
+def _prompt_tokens(prompt_text: str, system_message: str, continue_from: Optional[str] = None) -> int:
+    """Estimated prompt size of a call, before dispatch (for budget checks)."""
+    tail = (continue_from[-CONTINUATION_TAIL_CHARS:] + CONTINUE_INSTRUCTION) if continue_from else ""
+    return estimate_tokens(system_message + prompt_text + tail)
+
+def _build_payload(
+    prompt_text: str,
+    system_message: str,
+    stream: bool = False,
+    n: int = 1,
+    max_tokens: Optional[int] = None,
+    continue_from: Optional[str] = None,
+    model: Optional[str] = None,
+    response_format: Optional[dict] = None,
+) -> dict:
+    messages = [
+        {"role": "system", "content": system_message},
+        {"role": "user", "content": prompt_text}
+    ]
+    if continue_from:
+        # Only a tail of the text so far is resent; the prompt carries the rest of the context.
+        messages += [
+            {"role": "assistant", "content": continue_from[-CONTINUATION_TAIL_CHARS:]},
+            {"role": "user", "content": CONTINUE_INSTRUCTION},
+        ]
+    payload = {
+        "model": model or DEFAULT_MODEL_NAME,
+        "messages": messages,
+        "temperature": 0.7,
+        "max_tokens": max_tokens or DEFAULT_MAX_TOKENS,
+        "usage": {"include": True},  # OpenRouter reports token counts and cost, used for budgets
+    }
+    if stream:
+        payload["stream"] = True
+    if n > 1:
+        payload["n"] = n
+    if response_format is not None:
+        payload["response_format"] = response_format
+    return payload
+
+async def ask_llm(prompt_text: str, system_message: str = DEFAULT_SYSTEM_MESSAGE) -> str:
     """
     Sends a prompt to the configured LLM via OpenRouter and returns the response.
     """
-    if not OPENROUTER_API_KEY:
-        return "Error: OPENROUTER_API_KEY not configured."
+    return (await _ask_llm_choices(prompt_text, system_message, n=1))[0].text.strip()
+
+async def ask_llm_json(
+    prompt_text: str, json_schema: dict, schema_name: str, system_message: str = DEFAULT_SYSTEM_MESSAGE
+) -> str:
+    """
+    Like ask_llm, but asks for a response matching `json_schema` (OpenRouter structured
+    outputs). Models without support ignore the request, so callers must still validate.
+    """
+    response_format = {"type": "json_schema", "json_schema": {"name": schema_name, "strict": True, "schema": json_schema}}
+    return (await _ask_llm_choices(prompt_text, system_message, n=1, response_format=response_format))[0].text.strip()
+
+async def ask_llm_candidates(
+    prompt_text: str, system_message: str = DEFAULT_SYSTEM_MESSAGE, n: int = 1, long_form: bool = False
+) -> list[str]:
+    """
+    Returns up to MAX_CANDIDATES independent completions for the same prompt, in generation order.
+    Uses a single `n` request when LLM_SUPPORTS_N is set (topping up with separate calls if the
+    provider returns fewer choices), otherwise concurrent ask_llm calls. With `long_form`, every
+    candidate is a concurrent ask_llm_long call, so a truncated one is continued like a single scene.
+    """
+    n = max(1, min(n, MAX_CANDIDATES))
+    if long_form:
+        return list(await gather_cancelling(*(ask_llm_long(prompt_text, system_message) for _ in range(n))))
+    candidates: list[str] = []
+    if LLM_SUPPORTS_N and n > 1:
+        candidates = [c.text.strip() for c in await _ask_llm_choices(prompt_text, system_message, n=n)]
+        if len(candidates) == 1 and candidates[0].startswith("Error:"):
+            return candidates * n
+    missing = n - len(candidates)
+    if missing > 0:
+        candidates += await gather_cancelling(*(ask_llm(prompt_text, system_message) for _ in range(missing)))
+    return candidates[:n]
+
+async def ask_llm_long(
+    prompt_text: str,
+    system_message: str = DEFAULT_SYSTEM_MESSAGE,
+    max_total_tokens: int = CONTINUATION_MAX_TOTAL_TOKENS,
+) -> str:
+    """
+    Like ask_llm, but a completion that stops at max_tokens is continued (and stitched)
+    until the model finishes or `max_total_tokens` completion tokens have been used.
+    If a continuation call fails, the text generated so far is returned.
+    """
+    text = ""
+    used = 0
+    while True:
+        completion = (await _ask_llm_choices(
+            prompt_text, system_message, n=1,
+            max_tokens=min(DEFAULT_MAX_TOKENS, max_total_tokens - used),
+            continue_from=text or None,
+        ))[0]
+        if completion.finish_reason == "error":
+            if not text:
+                return completion.text
+            print(f"Continuation stopped after {used} tokens: {completion.text}")
+            break
+        text = stitch(text, completion.text)
+        used += completion.completion_tokens
+        if completion.finish_reason != "length" or used >= max_total_tokens:
+            break
+    return text.strip()
+
+def stitch(previous: str, continuation: str) -> str:
+    """Joins a continuation onto the text it continues, dropping any repeated overlap."""
+    if not previous:
+        return continuation
+    window = previous[-CONTINUATION_OVERLAP_CHARS:]
+    stripped = continuation.lstrip()
+    # Models sometimes restart a few words back; only trust overlaps long enough to be deliberate.
+    for size in range(min(len(window), len(stripped)), 11, -1):
+        if window.endswith(stripped[:size]):
+            return previous + stripped[size:]
+    if continuation and not previous[-1].isspace() and not continuation[0].isspace() \
+            and continuation[0] not in ",.;:!?)]}\u2019\u201d":
+        return previous + " " + continuation
+    return previous + continuation
+
+@dataclass
+class _Completion:
+    text: str
+    finish_reason: Optional[str]  # "stop", "length", ... or "error" (text is then "Error: ...")
+    completion_tokens: int = 0
 
+async def _ask_llm_choices(
+    prompt_text: str,
+    system_message: str,
+    n: int,
+    max_tokens: Optional[int] = None,
+    continue_from: Optional[str] = None,
+    response_format: Optional[dict] = None,
+) -> list[_Completion]:
+    """One chat completion request; returns every choice, or a single "Error: ..." completion."""
+    import httpx
+    from .cassettes import llm_transport, replay_only
+    if not OPENROUTER_API_KEY and not replay_only():
+        return [_Completion("Error: OPENROUTER_API_KEY not configured.", "error")]
+
+    max_tokens = max_tokens or DEFAULT_MAX_TOKENS
+    prompt_estimate = _prompt_tokens(prompt_text, system_message, continue_from)
+    try:
+        reservation = await budget_ledger.admit(DEFAULT_MODEL_NAME, prompt_estimate, max_tokens * n)
+    except BudgetExceeded as e:
+        return [_Completion(f"Error: Budget exceeded: {e}.", "error")]
+
+    usage = None  # Set once the model has answered; the call is then charged to the budget scopes
+    completions = []
     try:
-        headers = {
-            "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-            "Content-Type": "application/json",
-        }
-        
-        # Add optional headers recommended by OpenRouter
-        if YOUR_SITE_URL:
-            headers["HTTP-Referer"] = YOUR_SITE_URL
-        if YOUR_APP_NAME:
-            headers["X-Title"] = YOUR_APP_NAME
-        
-        payload = {
-            "model": DEFAULT_MODEL_NAME,
-            "messages": [
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": prompt_text}
-            ],
-            "temperature": 0.7,
-            "max_tokens": 2048,
-        }
-
-        async with httpx.AsyncClient(timeout=60.0) as client:
+        headers = _build_headers()
+        payload = _build_payload(
+            prompt_text, system_message, n=n, max_tokens=max_tokens, continue_from=continue_from,
+            model=reservation.model, response_format=response_format,
+        )
+
+        # Waits for a scheduler slot (priority/user/deadline come from scheduler.llm_context).
+        async with llm_scheduler.slot(), httpx.AsyncClient(timeout=60.0, transport=llm_transport()) as client:
             response = await client.post(
                 f"{OPENROUTER_BASE_URL}/chat/completions",
                 headers=headers,
@@ -63,18 +223,193 @@ async def ask_llm(prompt_text: str, system_message: str = "You are a helpful ass
             response.raise_for_status()
             
             response_data = response.json()
+            usage = response_data.get("usage") or {}
             if "choices" in response_data and len(response_data["choices"]) > 0:
-                content = response_data["choices"][0]["message"]["content"]
-                return content.strip() if content else "Error: No content in LLM response."
+                choices = response_data["choices"]
+                usage_tokens = usage.get("completion_tokens")
+                for choice in choices:
+                    content = (choice.get("message") or {}).get("content")
+                    if not content or not content.strip():
+                        completions.append(_Completion("Error: No content in LLM response.", "error"))
+                        continue
+                    tokens = usage_tokens // len(choices) if usage_tokens else estimate_tokens(content)
+                    completions.append(_Completion(content, choice.get("finish_reason"), tokens))
+                return completions
             else:
-                return "Error: Invalid response format from LLM."
+                return [_Completion("Error: Invalid response format from LLM.", "error")]
                 
+    except asyncio.CancelledError:
+        # Leaving the `async with` above closes the connection, aborting the upstream generation.
+        # Nothing shows how much had been generated, so this is only the most that was saved.
+        cancellation_stats.record_cancelled_call(upper_bound=max_tokens * n)
+        raise
+    except DeadlineExceeded as e:
+        print(f"LLM call dropped before dispatch: {e}")
+        return [_Completion("Error: Request deadline exceeded while waiting for LLM capacity.", "error")]
     except httpx.HTTPStatusError as e:
         print(f"HTTP error calling OpenRouter API with model {DEFAULT_MODEL_NAME}: {e.response.status_code} - {e.response.text}")
-        return f"Error: HTTP {e.response.status_code} from LLM API. Check your API key and model permissions."
+        return [_Completion(f"Error: HTTP {e.response.status_code} from LLM API. Check your API key and model permissions.", "error")]
     except httpx.TimeoutException:
         print("Timeout error calling OpenRouter API")
-        return "Error: Request timed out. The model may be taking too long to respond."
+        return [_Completion("Error: Request timed out. The model may be taking too long to respond.", "error")]
     except Exception as e:
         print(f"Error calling OpenRouter API with model {DEFAULT_MODEL_NAME}: {e}")
-        return f"Error: Could not get response from LLM. Details: {str(e)}" 
\ No newline at end of file
+        return [_Completion(f"Error: Could not get response from LLM. Details: {str(e)}", "error")]
+    finally:
+        if usage is None:
+            budget_ledger.release(reservation)
+        else:
+            await budget_ledger.settle(
+                reservation,
+                prompt_tokens=usage.get("prompt_tokens") or prompt_estimate,
+                completion_tokens=usage.get("completion_tokens") or sum(c.completion_tokens for c in completions),
+                cost=usage.get("cost"),
+            )
+
+async def stream_llm(prompt_text: str, system_message: str = DEFAULT_SYSTEM_MESSAGE) -> AsyncIterator[str]:
+    """
+    Streams the completion as text deltas using OpenRouter's SSE mode.
+    Follows ask_llm's error convention: on failure a single chunk starting
+    with "Error:" is yielded (possibly after some partial text).
+    """
+    async for delta in _stream_completion(prompt_text, system_message, outcome={}):
+        yield delta
+
+async def stream_llm_long(
+    prompt_text: str,
+    system_message: str = DEFAULT_SYSTEM_MESSAGE,
+    max_total_tokens: int = CONTINUATION_MAX_TOTAL_TOKENS,
+) -> AsyncIterator[str]:
+    """
+    Streaming variant of ask_llm_long. Continuation deltas stream through as they arrive,
+    except the first CONTINUATION_OVERLAP_CHARS of each continuation, which are held back
+    until any text the model repeated can be trimmed.
+    """
+    text = ""
+    used = 0
+    while True:
+        outcome: dict = {}
+        held = ""  # Start of a continuation, not yet emitted
+        first_call = seam_done = not text
+        async for delta in _stream_completion(
+            prompt_text, system_message, outcome,
+            max_tokens=min(DEFAULT_MAX_TOKENS, max_total_tokens - used),
+            continue_from=text or None,
+        ):
+            if delta.startswith("Error:"):
+                if first_call:
+                    yield delta
+                    return
+                print(f"Continuation stopped after {used} tokens: {delta}")
+                outcome["finish_reason"] = "error"
+                break
+            if seam_done:
+                text += delta
+                yield delta
+                continue
+            held += delta
+            if len(held) >= CONTINUATION_OVERLAP_CHARS:
+                stitched = stitch(text, held)
+                yield stitched[len(text):]
+                text, held, seam_done = stitched, "", True
+        if held:
+            stitched = stitch(text, held)
+            yield stitched[len(text):]
+            text = stitched
+        used += outcome.get("completion_tokens", 0)
+        if outcome.get("finish_reason") != "length" or used >= max_total_tokens:
+            return
+
+async def _stream_completion(
+    prompt_text: str,
+    system_message: str,
+    outcome: dict,
+    max_tokens: Optional[int] = None,
+    continue_from: Optional[str] = None,
+) -> AsyncIterator[str]:
+    """Streams one completion; records "finish_reason" and "completion_tokens" in `outcome`."""
+    import httpx
+    from .cassettes import llm_transport, replay_only
+    if not OPENROUTER_API_KEY and not replay_only():
+        yield "Error: OPENROUTER_API_KEY not configured."
+        return
+
+    max_tokens = max_tokens or DEFAULT_MAX_TOKENS
+    prompt_estimate = _prompt_tokens(prompt_text, system_message, continue_from)
+    try:
+        reservation = await budget_ledger.admit(DEFAULT_MODEL_NAME, prompt_estimate, max_tokens)
+    except BudgetExceeded as e:
+        yield f"Error: Budget exceeded: {e}."
+        return
+
+    received_chars = 0
+    try:
+        async with llm_scheduler.slot(), httpx.AsyncClient(timeout=60.0, transport=llm_transport()) as client:
+            async with client.stream(
+                "POST",
+                f"{OPENROUTER_BASE_URL}/chat/completions",
+                headers=_build_headers(),
+                json=_build_payload(
+                    prompt_text, system_message, stream=True, max_tokens=max_tokens,
+                    continue_from=continue_from, model=reservation.model,
+                ),
+            ) as response:
+                if response.status_code >= 400:
+                    body = (await response.aread()).decode("utf-8", "replace")
+                    print(f"HTTP error streaming from OpenRouter API with model {DEFAULT_MODEL_NAME}: {response.status_code} - {body}")
+                    yield f"Error: HTTP {response.status_code} from LLM API. Check your API key and model permissions."
+                    return
+                async for line in response.aiter_lines():
+                    # OpenRouter interleaves ": OPENROUTER PROCESSING" keep-alive comments with data lines.
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+                    try:
+                        chunk = json.loads(data)
+                    except ValueError:
+                        chunk = None
+                    if not isinstance(chunk, dict):  # Truncated or garbled event: the rest cannot be trusted
+                        print(f"Malformed data line in OpenRouter stream: {data[:200]!r}")
+                        yield "Error: Malformed response from LLM API stream."
+                        return
+                    if "error" in chunk:
+                        yield f"Error: {chunk['error'].get('message', 'LLM stream error')}"
+                        return
+                    choices = chunk.get("choices") or []
+                    if choices and choices[0].get("finish_reason"):
+                        outcome["finish_reason"] = choices[0]["finish_reason"]
+                    if chunk.get("usage"):
+                        outcome["completion_tokens"] = chunk["usage"].get("completion_tokens", 0)
+                        outcome["prompt_tokens"] = chunk["usage"].get("prompt_tokens")
+                        outcome["cost"] = chunk["usage"].get("cost")
+                    delta = choices[0].get("delta", {}).get("content") if choices else None
+                    if delta:
+                        received_chars += len(delta)
+                        yield delta
+        outcome.setdefault("completion_tokens", received_chars // 4)
+    except (asyncio.CancelledError, GeneratorExit):
+        # Consumer cancelled or stopped iterating: the closed stream aborts the upstream generation.
+        cancellation_stats.record_cancelled_call(max_tokens - received_chars // 4)
+        raise
+    except DeadlineExceeded as e:
+        print(f"LLM stream dropped before dispatch: {e}")
+        yield "Error: Request deadline exceeded while waiting for LLM capacity."
+    except httpx.TimeoutException:
+        print("Timeout error streaming from OpenRouter API")
+        yield "Error: Request timed out. The model may be taking too long to respond."
+    except httpx.HTTPError as e:
+        print(f"Error streaming from OpenRouter API with model {DEFAULT_MODEL_NAME}: {e}")
+        yield f"Error: Could not get response from LLM. Details: {str(e)}"
+    finally:
+        if received_chars or outcome.get("completion_tokens"):
+            # In the background: this generator may be closing (cancelled) and cannot await reliably.
+            budget_ledger.settle_soon(
+                reservation,
+                prompt_tokens=outcome.get("prompt_tokens") or prompt_estimate,
+                completion_tokens=outcome.get("completion_tokens") or received_chars // 4,
+                cost=outcome.get("cost"),
+            )
+        else:
+            budget_ledger.release(reservation)
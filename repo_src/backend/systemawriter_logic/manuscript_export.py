@@ -0,0 +1,328 @@
+"""
+Server-side manuscript assembly.
+
+Every exporter consumes scenes as an async iterator already sorted in
+chapter/scene order and never materialises the whole book:
+- Markdown is yielded chunk by chunk, one scene at a time.
+- EPUB and DOCX are ZIP containers written entry by entry into a spooled
+  temporary file (memory up to EXPORT_SPOOL_MAX_BYTES, disk beyond), which
+  is then streamed back in fixed-size chunks.
+
+Markdown conversion, deflate and spool-file I/O are blocking, so the ZIP
+exporters hand each scene (and the container's opening and closing entries)
+to asyncio.to_thread. Only one of those calls runs at a time per archive, so
+the ZipFile is never touched by two threads at once.
+"""
+import asyncio
+import re
+import tempfile
+import zipfile
+from typing import AsyncIterator, BinaryIO, Iterator, Optional
+from xml.sax.saxutils import escape
+
+from repo_src.backend.adapters.artifact_store import SceneText
+from repo_src.backend.settings import get_settings
+
+EXPORT_SPOOL_MAX_BYTES = get_settings().export_spool_max_bytes
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+SCENE_SEPARATOR_MD = "\n\n---\n\n"
+
+MEDIA_TYPES = {
+    "md": "text/markdown; charset=utf-8",
+    "epub": "application/epub+zip",
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+}
+
+
+def export_filename(title: str, fmt: str) -> str:
+    """Same sanitising rule the frontend uses for its Markdown download."""
+    return f"{re.sub(r'[^a-zA-Z0-9]', '_', title) or 'Story'}_Story.{fmt}"
+
+
+# --- Markdown ---
+
+async def markdown_chunks(
+    title: str,
+    scenes: AsyncIterator[SceneText],
+    outline_md: Optional[str] = None,
+    worldbuilding_md: Optional[str] = None,
+) -> AsyncIterator[str]:
+    """
+    Yields the manuscript in the same layout as the FullStoryReviewTab export:
+    optional outline/worldbuilding notes, then one H2 per chapter followed by its scenes.
+    """
+    yield f"# {title}\n\n"
+    if outline_md and outline_md.strip():
+        yield f"# Story Outline\n\n{outline_md}{SCENE_SEPARATOR_MD}"
+    if worldbuilding_md and worldbuilding_md.strip():
+        yield f"# Worldbuilding Notes\n\n{worldbuilding_md}{SCENE_SEPARATOR_MD}"
+    yield "# Full Story Narrative\n\n"
+    current_chapter = None
+    async for scene in scenes:
+        if scene.chapter_index != current_chapter:
+            current_chapter = scene.chapter_index
+            yield f"## {scene.chapter_title}\n\n"
+        yield f"{scene.content}{SCENE_SEPARATOR_MD}"
+
+
+# --- EPUB ---
+
+_EPUB_CONTAINER = """<?xml version="1.0" encoding="UTF-8"?>
+<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+  <rootfiles><rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/></rootfiles>
+</container>"""
+
+_XHTML_HEAD = """<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE html>
+<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops">
+<head><meta charset="UTF-8"/><title>{title}</title></head>
+<body>
+"""
+
+
+def _abandon(zf: zipfile.ZipFile, entry: Optional[BinaryIO]) -> None:
+    """Closes a half-written archive after a failure; the caller discards the spool file."""
+    try:
+        if entry is not None:
+            entry.close()
+        zf.close()
+    except Exception as e:
+        print(f"Failed to close abandoned export archive: {e}")
+
+
+def _markdown_to_xhtml(text: str) -> str:
+    import markdown  # Only needed for EPUB export
+    return markdown.markdown(text, output_format="xhtml")
+
+
+def _open_epub(fileobj: BinaryIO) -> zipfile.ZipFile:
+    zf = zipfile.ZipFile(fileobj, "w")
+    # The mimetype entry must come first and be stored uncompressed.
+    zf.writestr(zipfile.ZipInfo("mimetype"), "application/epub+zip", compress_type=zipfile.ZIP_STORED)
+    zf.writestr("META-INF/container.xml", _EPUB_CONTAINER, compress_type=zipfile.ZIP_DEFLATED)
+    return zf
+
+
+def _close_epub_chapter(entry: Optional[BinaryIO]) -> None:
+    if entry is not None:
+        entry.write(b"</body>\n</html>\n")
+        entry.close()
+
+
+def _write_epub_scene(
+    zf: zipfile.ZipFile, entry: Optional[BinaryIO], new_chapter: bool, scene: SceneText, chapters: list[tuple[str, str]]
+) -> BinaryIO:
+    """Appends one scene, starting a new chapter document when needed. Returns the open chapter entry."""
+    if new_chapter:
+        _close_epub_chapter(entry)
+        name = f"chapter-{len(chapters) + 1:04d}.xhtml"
+        chapters.append((name, scene.chapter_title))
+        entry = zf.open(zipfile.ZipInfo(f"OEBPS/{name}"), "w", force_zip64=True)
+        entry.write(_XHTML_HEAD.format(title=escape(scene.chapter_title)).encode("utf-8"))
+        entry.write(f"<h2>{escape(scene.chapter_title)}</h2>\n".encode("utf-8"))
+    else:
+        entry.write(b'<hr class="scene-break"/>\n')
+    entry.write(_markdown_to_xhtml(scene.content).encode("utf-8"))
+    entry.write(b"\n")
+    return entry
+
+
+def _finish_epub(zf: zipfile.ZipFile, entry: Optional[BinaryIO], title: str, chapters: list[tuple[str, str]], project_id: str) -> None:
+    _close_epub_chapter(entry)
+    nav_items = "\n".join(
+        f'      <li><a href="{name}">{escape(chapter_title)}</a></li>' for name, chapter_title in chapters
+    )
+    zf.writestr(
+        "OEBPS/nav.xhtml",
+        _XHTML_HEAD.format(title=escape(title))
+        + f'<nav epub:type="toc" id="toc"><h1>{escape(title)}</h1>\n    <ol>\n{nav_items}\n    </ol>\n</nav>\n</body>\n</html>\n',
+        compress_type=zipfile.ZIP_DEFLATED,
+    )
+    manifest = "\n".join(
+        f'    <item id="ch{i}" href="{name}" media-type="application/xhtml+xml"/>'
+        for i, (name, _) in enumerate(chapters, start=1)
+    )
+    spine = "\n".join(f'    <itemref idref="ch{i}"/>' for i in range(1, len(chapters) + 1))
+    zf.writestr(
+        "OEBPS/content.opf",
+        f"""<?xml version="1.0" encoding="UTF-8"?>
+<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="book-id">
+  <metadata xmlns:dc="http://purl.org/dc/elements/1.1/">
+    <dc:identifier id="book-id">urn:storymaker:{escape(project_id or title)}</dc:identifier>
+    <dc:title>{escape(title)}</dc:title>
+    <dc:language>en</dc:language>
+  </metadata>
+  <manifest>
+    <item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>
+{manifest}
+  </manifest>
+  <spine>
+{spine}
+  </spine>
+</package>
+""",
+        compress_type=zipfile.ZIP_DEFLATED,
+    )
+    zf.close()
+
+
+async def build_epub(title: str, scenes: AsyncIterator[SceneText], fileobj: BinaryIO, project_id: str = "") -> int:
+    """Writes an EPUB 3 book to `fileobj`, one chapter document at a time. Returns the chapter count."""
+    chapters: list[tuple[str, str]] = []  # (file name, chapter title) for the manifest/nav
+    zf = await asyncio.to_thread(_open_epub, fileobj)
+    try:
+        entry = None
+        current_chapter = None
+        async for scene in scenes:
+            new_chapter = scene.chapter_index != current_chapter
+            current_chapter = scene.chapter_index
+            entry = await asyncio.to_thread(_write_epub_scene, zf, entry, new_chapter, scene, chapters)
+        await asyncio.to_thread(_finish_epub, zf, entry, title, chapters, project_id)
+    except BaseException:
+        _abandon(zf, entry)
+        raise
+    return len(chapters)
+
+
+# --- DOCX ---
+
+_DOCX_CONTENT_TYPES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+  <Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+  <Default Extension="xml" ContentType="application/xml"/>
+  <Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>
+  <Override PartName="/word/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.styles+xml"/>
+</Types>"""
+
+_DOCX_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+  <Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>
+</Relationships>"""
+
+_DOCX_DOCUMENT_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+  <Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>
+</Relationships>"""
+
+_DOCX_STYLES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<w:styles xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">
+  <w:style w:type="paragraph" w:default="1" w:styleId="Normal"><w:name w:val="Normal"/>
+    <w:pPr><w:spacing w:after="160" w:line="360" w:lineRule="auto"/></w:pPr></w:style>
+  <w:style w:type="paragraph" w:styleId="Title"><w:name w:val="Title"/><w:basedOn w:val="Normal"/>
+    <w:pPr><w:jc w:val="center"/></w:pPr><w:rPr><w:b/><w:sz w:val="56"/></w:rPr></w:style>
+  <w:style w:type="paragraph" w:styleId="Heading1"><w:name w:val="heading 1"/><w:basedOn w:val="Normal"/>
+    <w:pPr><w:keepNext/><w:pageBreakBefore/><w:outlineLvl w:val="0"/></w:pPr><w:rPr><w:b/><w:sz w:val="36"/></w:rPr></w:style>
+  <w:style w:type="paragraph" w:styleId="Heading2"><w:name w:val="heading 2"/><w:basedOn w:val="Normal"/>
+    <w:pPr><w:keepNext/><w:outlineLvl w:val="1"/></w:pPr><w:rPr><w:b/><w:sz w:val="28"/></w:rPr></w:style>
+  <w:style w:type="paragraph" w:styleId="SceneBreak"><w:name w:val="Scene Break"/><w:basedOn w:val="Normal"/>
+    <w:pPr><w:jc w:val="center"/></w:pPr></w:style>
+</w:styles>"""
+
+_DOCX_DOCUMENT_OPEN = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"><w:body>\n'
+)
+_DOCX_DOCUMENT_CLOSE = "<w:sectPr/></w:body></w:document>\n"
+
+_INLINE_EMPHASIS = re.compile(r"(\*\*[^*]+\*\*|\*[^*]+\*|_[^_]+_)")
+
+
+def _docx_runs(text: str) -> str:
+    """Converts **bold**, *italic* and _italic_ spans into WordprocessingML runs."""
+    runs = []
+    for part in _INLINE_EMPHASIS.split(text):
+        if not part:
+            continue
+        props = ""
+        if part.startswith("**") and part.endswith("**") and len(part) > 4:
+            part, props = part[2:-2], "<w:rPr><w:b/></w:rPr>"
+        elif (part[0] in "*_") and part[-1] == part[0] and len(part) > 2:
+            part, props = part[1:-1], "<w:rPr><w:i/></w:rPr>"
+        runs.append(f'<w:r>{props}<w:t xml:space="preserve">{escape(part)}</w:t></w:r>')
+    return "".join(runs)
+
+
+def _docx_paragraph(text: str, style: Optional[str] = None) -> str:
+    ppr = f'<w:pPr><w:pStyle w:val="{style}"/></w:pPr>' if style else ""
+    return f"<w:p>{ppr}{_docx_runs(text)}</w:p>\n"
+
+
+def _docx_scene_paragraphs(markdown_text: str) -> Iterator[str]:
+    """Yields one paragraph per Markdown block; headings inside a scene become Heading2."""
+    for block in re.split(r"\n\s*\n", markdown_text.strip()):
+        block = " ".join(line.strip() for line in block.splitlines()).strip()
+        if not block:
+            continue
+        if block.startswith("#"):
+            yield _docx_paragraph(block.lstrip("#").strip(), "Heading2")
+        elif block in ("---", "***", "* * *"):
+            yield _docx_paragraph("* * *", "SceneBreak")
+        else:
+            yield _docx_paragraph(block)
+
+
+def _open_docx(title: str, fileobj: BinaryIO) -> tuple[zipfile.ZipFile, BinaryIO]:
+    zf = zipfile.ZipFile(fileobj, "w", compression=zipfile.ZIP_DEFLATED)
+    zf.writestr("[Content_Types].xml", _DOCX_CONTENT_TYPES)
+    zf.writestr("_rels/.rels", _DOCX_RELS)
+    zf.writestr("word/_rels/document.xml.rels", _DOCX_DOCUMENT_RELS)
+    zf.writestr("word/styles.xml", _DOCX_STYLES)
+    document = zf.open(zipfile.ZipInfo("word/document.xml"), "w", force_zip64=True)
+    document.write(_DOCX_DOCUMENT_OPEN.encode("utf-8"))
+    document.write(_docx_paragraph(title, "Title").encode("utf-8"))
+    return zf, document
+
+
+def _write_docx_scene(document: BinaryIO, new_chapter: bool, scene: SceneText) -> None:
+    if new_chapter:
+        document.write(_docx_paragraph(scene.chapter_title, "Heading1").encode("utf-8"))
+    else:
+        document.write(_docx_paragraph("* * *", "SceneBreak").encode("utf-8"))
+    for paragraph in _docx_scene_paragraphs(scene.content):
+        document.write(paragraph.encode("utf-8"))
+
+
+def _finish_docx(zf: zipfile.ZipFile, document: BinaryIO) -> None:
+    document.write(_DOCX_DOCUMENT_CLOSE.encode("utf-8"))
+    document.close()
+    zf.close()
+
+
+async def build_docx(title: str, scenes: AsyncIterator[SceneText], fileobj: BinaryIO) -> int:
+    """Writes a DOCX document to `fileobj`, streaming word/document.xml scene by scene. Returns the chapter count."""
+    chapters = 0
+    zf, document = await asyncio.to_thread(_open_docx, title, fileobj)
+    try:
+        current_chapter = None
+        async for scene in scenes:
+            new_chapter = scene.chapter_index != current_chapter
+            if new_chapter:
+                current_chapter = scene.chapter_index
+                chapters += 1
+            await asyncio.to_thread(_write_docx_scene, document, new_chapter, scene)
+        await asyncio.to_thread(_finish_docx, zf, document)
+    except BaseException:
+        _abandon(zf, document)
+        raise
+    return chapters
+
+
+# --- Streaming helpers ---
+
+def new_spool_file() -> BinaryIO:
+    """A temporary file that stays in memory for small books and rolls over to disk for large ones."""
+    return tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_MAX_BYTES, mode="w+b")
+
+
+async def iter_spooled_file(fileobj: BinaryIO, chunk_size: int = EXPORT_CHUNK_BYTES) -> AsyncIterator[bytes]:
+    """Streams a finished spool file from the start and closes it afterwards."""
+    try:
+        fileobj.seek(0)
+        while True:
+            chunk = await asyncio.to_thread(fileobj.read, chunk_size)  # May have rolled over to disk
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        fileobj.close()
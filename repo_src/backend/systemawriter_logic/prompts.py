@@ -1,4 +1,15 @@
 # Prompts for SystemaWriter
+import re
+
+from .retrieval import relevant_excerpts
+
+# Scene-plan lines naming who is present and where carry most of the retrieval signal.
+_FOCUS_LINE_RE = re.compile(r"characters|setting|location", re.IGNORECASE)
+
+def _retrieval_query(*parts: str) -> str:
+    text = "\n".join(parts)
+    focus = [line for line in text.splitlines() if _FOCUS_LINE_RE.search(line)]
+    return "\n".join([text] + focus * 2)
 
 CONCEPT_DOCUMENT_GUIDE = """
 When crafting your concept, consider including:
@@ -86,12 +97,7 @@ Generate the worldbuilding document now in Markdown format:
 """
     return prompt
 
-def get_scene_breakdowns_prompt(chapter_title: str, chapter_summary_from_outline: str, approved_worldbuilding: str, full_approved_outline: str) -> str:
-    prompt = f"""
-You are a scene planner. For the given chapter, break it down into a sequence of distinct scenes.
-The chapter is: **{chapter_title}**
-Its summary from the overall outline is: "{chapter_summary_from_outline}"
-
+SCENE_BREAKDOWN_MARKDOWN_FORMAT = """
 For each scene, provide the following in Markdown list format:
 - **Scene Number:** (e.g., Scene 1.1, Scene 1.2)
 - **Goal:** What this scene needs to achieve for the plot or character development.
@@ -100,7 +106,37 @@ For each scene, provide the following in Markdown list format:
 - **Setting:** Where does this scene take place?
 - **Information Revealed (if any):** What new information does the audience or a character learn?
 - **Emotional Shift/Tone (Optional):** e.g., suspenseful, hopeful, tense.
+"""
+
+# Same fields as the Markdown format; must match scene_plans.ScenePlan.
+SCENE_BREAKDOWN_JSON_FORMAT = """
+Reply with only a JSON object of this shape, one entry per scene in order:
+{"scenes": [{
+  "title": "a short scene title",
+  "goal": "what this scene needs to achieve for the plot or character development",
+  "characters": ["main characters involved"],
+  "key_events": ["what happens, specifically, in order"],
+  "setting": "where the scene takes place",
+  "information_revealed": "new information the audience or a character learns, or an empty string",
+  "tone": "the emotional shift or tone, e.g. suspenseful, hopeful, tense"
+}]}
+"""
 
+def get_scene_breakdowns_prompt(
+    chapter_title: str,
+    chapter_summary_from_outline: str,
+    approved_worldbuilding: str,
+    full_approved_outline: str,
+    structured: bool = False,
+) -> str:
+    # Long worldbuilding documents are narrowed to the chunks relevant to this chapter (see retrieval.py).
+    approved_worldbuilding = relevant_excerpts(approved_worldbuilding, _retrieval_query(chapter_title, chapter_summary_from_outline))
+    output_format = SCENE_BREAKDOWN_JSON_FORMAT if structured else SCENE_BREAKDOWN_MARKDOWN_FORMAT
+    prompt = f"""
+You are a scene planner. For the given chapter, break it down into a sequence of distinct scenes.
+The chapter is: **{chapter_title}**
+Its summary from the overall outline is: "{chapter_summary_from_outline}"
+{output_format}
 Reference the approved worldbuilding document and the full story outline for context.
 
 **Full Approved Story Outline:**
@@ -119,8 +155,18 @@ def get_scene_narrative_prompt(
     full_chapter_scene_breakdown: str,
     approved_worldbuilding: str,
     full_approved_outline: str,
-    writing_style_notes: str = "Write in a clear, engaging narrative style. Show, don't just tell. Use vivid descriptions for settings and actions. Maintain consistent character voices based on the worldbuilding."
+    writing_style_notes: str = "Write in a clear, engaging narrative style. Show, don't just tell. Use vivid descriptions for settings and actions. Maintain consistent character voices based on the worldbuilding.",
+    continuity_notes: str = ""
 ) -> str:
+    query = _retrieval_query(chapter_title, scene_plan_from_breakdown)
+    approved_worldbuilding = relevant_excerpts(approved_worldbuilding, query)
+    full_approved_outline = relevant_excerpts(full_approved_outline, query)
+    continuity_section = ""
+    if continuity_notes:
+        continuity_section = f"""
+**Continuity Notes (state of the story just before this scene):**
+{continuity_notes}
+"""
     prompt = f"""
 You are a creative writer. Write the full narrative for the following scene.
 Adhere to the details provided in the scene plan, worldbuilding, and overall story outline.
@@ -135,7 +181,7 @@ Adhere to the details provided in the scene plan, worldbuilding, and overall sto
 
 **Full Scene Breakdown for this Chapter:**
 {full_chapter_scene_breakdown}
-
+{continuity_section}
 **Specific Scene to Write (Plan from Breakdown):**
 {scene_plan_from_breakdown}
 
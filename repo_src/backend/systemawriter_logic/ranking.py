@@ -0,0 +1,88 @@
+"""
+Cheap local ranking of alternative generations.
+
+When several candidates are generated for one prompt, they are scored
+without another LLM call using three signals, each in [0, 1]:
+
+    coverage    share of the reference's keywords (scene plan or concept)
+                that appear in the candidate
+    freshness   1 - share of repeated word trigrams (loops and padding
+                score low)
+    length_fit  closeness of the candidate's length to a target, on a log
+                scale; 1.0 when no target applies
+
+Failed generations ("Error: ...") always rank last.
+"""
+import math
+from dataclasses import dataclass, field
+from typing import Optional
+
+from .retrieval import tokenize
+from repo_src.backend.settings import get_settings
+
+# Roughly what fits in one completion; scenes far shorter or longer are usually worse.
+SCENE_TARGET_CHARS = get_settings().scene_target_chars
+
+WEIGHTS = {"coverage": 0.5, "freshness": 0.3, "length_fit": 0.2}
+
+
+@dataclass
+class Candidate:
+    index: int  # Generation order
+    text: str
+    score: float
+    signals: dict = field(default_factory=dict)
+
+    @property
+    def error(self) -> bool:
+        return self.text.startswith("Error:")
+
+
+def coverage(text: str, reference: str) -> float:
+    keywords = set(tokenize(reference))
+    if not keywords:
+        return 1.0
+    return len(keywords & set(tokenize(text))) / len(keywords)
+
+
+def freshness(text: str) -> float:
+    words = text.lower().split()
+    trigrams = [tuple(words[i:i + 3]) for i in range(len(words) - 2)]
+    if not trigrams:
+        return 1.0
+    return len(set(trigrams)) / len(trigrams)
+
+
+def length_fit(text: str, target_chars: Optional[int]) -> float:
+    if not target_chars:
+        return 1.0
+    if not text:
+        return 0.0
+    return math.exp(-abs(math.log(len(text) / target_chars)))
+
+
+def score_candidate(index: int, text: str, reference: str, target_chars: Optional[int] = None) -> Candidate:
+    if text.startswith("Error:"):
+        return Candidate(index=index, text=text, score=-1.0)
+    signals = {
+        "coverage": round(coverage(text, reference), 4),
+        "freshness": round(freshness(text), 4),
+        "length_fit": round(length_fit(text, target_chars), 4),
+    }
+    score = sum(WEIGHTS[name] * value for name, value in signals.items())
+    return Candidate(index=index, text=text, score=round(score, 4), signals=signals)
+
+
+def rank_candidates(
+    texts: list[str], reference: str, target_chars: Optional[int] = None, rank: bool = True
+) -> list[Candidate]:
+    """Scores every candidate; best first when `rank` is set, otherwise in generation order."""
+    candidates = [score_candidate(i, text, reference, target_chars) for i, text in enumerate(texts)]
+    if rank:
+        candidates.sort(key=lambda c: (-c.score, c.index))
+    return candidates
+
+
+def best_candidate(candidates: list[Candidate]) -> Candidate:
+    """The first successful candidate in the given order (or the first one if all failed)."""
+    return next((c for c in candidates if not c.error), candidates[0])
@@ -0,0 +1,324 @@
+"""
+Local BM25 retrieval over worldbuilding and outline documents.
+
+Long worldbuilding documents used to be pasted whole into every breakdown
+and scene prompt. Instead, a document is split into heading-scoped chunks
+and indexed once per version (keyed by its content hash); prompts include
+only the RETRIEVAL_TOP_K chunks most relevant to the scene plan, in
+document order. Documents shorter than RETRIEVAL_MIN_CHARS are used whole.
+
+Indexes are plain BM25 with no model download or network access. Each one
+is persisted under RETRIEVAL_INDEX_DIR as:
+
+    <hash>.terms     UTF-8 vocabulary terms in sorted order, back to back
+    <hash>.vocab     uint32 records (term offset, term length, posting offset,
+                     posting count), one per term, in the same order
+    <hash>.postings  uint32 pairs (chunk_id, term_frequency), grouped by term
+    <hash>.spans     uint32 records (byte offset, byte length, token count),
+                     one per chunk
+    <hash>.chunks    UTF-8 chunk texts, back to back
+    <hash>.json      format version and chunk count; written last, so its
+                     presence marks a complete index
+
+Every file but the JSON is memory-mapped on load and terms are found by
+binary search, so multiple worker processes share the same pages and only
+the terms and chunks a query touches are read.
+
+Building or loading an index is blocking work: async callers build their
+prompts in asyncio.to_thread (see core_logic.py). The directory is kept under
+RETRIEVAL_INDEX_MAX_BYTES by deleting the least recently used indexes after
+each save; loading an index refreshes its timestamp.
+"""
+import hashlib
+import json
+import math
+import mmap
+import os
+import re
+import tempfile
+import threading
+from array import array
+from collections import Counter, OrderedDict
+from typing import Optional
+
+from repo_src.backend.settings import get_settings
+_settings = get_settings()
+RETRIEVAL_INDEX_DIR = _settings.retrieval_index_dir
+RETRIEVAL_TOP_K = _settings.retrieval_top_k
+RETRIEVAL_MIN_CHARS = _settings.retrieval_min_chars  # Shorter documents are used whole
+RETRIEVAL_CHUNK_CHARS = _settings.retrieval_chunk_chars
+RETRIEVAL_CACHE_SIZE = _settings.retrieval_cache_size  # Open indexes kept per process
+RETRIEVAL_INDEX_MAX_BYTES = _settings.retrieval_index_max_bytes  # On disk
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+INDEX_FORMAT = 2
+INDEX_FILES = ("terms", "vocab", "postings", "spans", "chunks")  # Plus the .json marker
+
+_TOKEN_RE = re.compile(r"[a-z0-9][a-z0-9']*")
+_HEADING_RE = re.compile(r"^(#{1,6})\s+\S")
+_STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have he her his in is it its of on or she that the their them "
+    "they this to was were will with who what when where which while into than then there these those not no "
+    "scene chapter".split()
+)
+
+
+def tokenize(text: str) -> list[str]:
+    return [t for t in _TOKEN_RE.findall(text.lower()) if len(t) > 1 and t not in _STOPWORDS]
+
+
+def chunk_markdown(text: str, max_chars: int = RETRIEVAL_CHUNK_CHARS) -> list[str]:
+    """
+    Splits a Markdown document at headings, then splits long sections at blank lines
+    or top-level bullets. Every chunk starts with its heading path so it reads on its own.
+    """
+    sections: list[tuple[list[str], list[str]]] = []
+    headings: list[str] = []
+    body: list[str] = []
+    for line in text.splitlines():
+        match = _HEADING_RE.match(line)
+        if match:
+            if any(l.strip() for l in body):
+                sections.append((list(headings), body))
+            level = len(match.group(1))
+            headings = [h for h in headings if len(h) - len(h.lstrip("#")) < level] + [line.strip()]
+            body = []
+        else:
+            body.append(line)
+    if any(l.strip() for l in body):
+        sections.append((list(headings), body))
+
+    chunks: list[str] = []
+    for heading_path, lines in sections:
+        prefix = "\n".join(heading_path)
+        budget = max(1, max_chars - len(prefix))
+        pieces: list[list[str]] = [[]]
+        size = 0
+        for line in lines:
+            boundary = not line.strip() or line.startswith(("- ", "* "))
+            if boundary and size + len(line) > budget and pieces[-1]:
+                pieces.append([])
+                size = 0
+            pieces[-1].append(line)
+            size += len(line) + 1
+        for piece in pieces:
+            content = "\n".join(piece).strip()
+            if content:
+                chunks.append(f"{prefix}\n{content}" if prefix else content)
+    return chunks
+
+
+def document_key(document: str) -> str:
+    return hashlib.sha256(f"{INDEX_FORMAT}:{RETRIEVAL_CHUNK_CHARS}:{document}".encode("utf-8")).hexdigest()
+
+
+class BM25Index:
+    """A read-only BM25 index over chunks, either built in memory or memory-mapped from disk."""
+
+    def __init__(self, terms, vocab, postings, spans, chunk_data):
+        self.terms = terms  # sorted UTF-8 terms, back to back
+        self.vocab = vocab  # flat uint32 sequence: term offset, term length, posting offset, count, ...
+        self.postings = postings  # flat uint32 sequence: chunk_id, tf, chunk_id, tf, ...
+        self.spans = spans  # flat uint32 sequence: byte offset, byte length, tokens, ... per chunk
+        self.chunk_data = chunk_data
+        count = len(spans) // 3
+        self.avg_length = (sum(spans[3 * i + 2] for i in range(count)) / count) if count else 0.0
+        self._mmaps: list[mmap.mmap] = []
+
+    def __len__(self) -> int:
+        return len(self.spans) // 3
+
+    @classmethod
+    def build(cls, chunks: list[str]) -> "BM25Index":
+        per_term: dict[str, list[tuple[int, int]]] = {}
+        spans = array("I")
+        encoded = []
+        offset = 0
+        for chunk_id, chunk in enumerate(chunks):
+            counts = Counter(tokenize(chunk))
+            for term, tf in counts.items():
+                per_term.setdefault(term, []).append((chunk_id, tf))
+            data = chunk.encode("utf-8")
+            encoded.append(data)
+            spans.extend((offset, len(data), sum(counts.values())))
+            offset += len(data)
+        terms = bytearray()
+        vocab = array("I")
+        postings = array("I")
+        for term in sorted(per_term):  # Code-point order is UTF-8 byte order
+            data = term.encode("utf-8")
+            vocab.extend((len(terms), len(data), len(postings) // 2, len(per_term[term])))
+            terms += data
+            for chunk_id, tf in per_term[term]:
+                postings.extend((chunk_id, tf))
+        return cls(bytes(terms), vocab, postings, spans, b"".join(encoded))
+
+    def lookup(self, term: str) -> Optional[tuple[int, int]]:
+        """(posting offset, posting count) for `term`, by binary search over the sorted vocabulary."""
+        target = term.encode("utf-8")
+        lo, hi = 0, len(self.vocab) // 4
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start, length = self.vocab[4 * mid], self.vocab[4 * mid + 1]
+            candidate = bytes(self.terms[start:start + length])
+            if candidate < target:
+                lo = mid + 1
+            elif candidate > target:
+                hi = mid
+            else:
+                return self.vocab[4 * mid + 2], self.vocab[4 * mid + 3]
+        return None
+
+    def chunk(self, chunk_id: int) -> str:
+        start, length = self.spans[3 * chunk_id], self.spans[3 * chunk_id + 1]
+        return bytes(self.chunk_data[start:start + length]).decode("utf-8")
+
+    def search(self, query: str, k: int = RETRIEVAL_TOP_K) -> list[int]:
+        """Ids of the top-k chunks for `query`, best first."""
+        n = len(self)
+        if n == 0:
+            return []
+        scores: dict[int, float] = {}
+        for term, qtf in Counter(tokenize(query)).items():
+            entry = self.lookup(term)
+            if entry is None:
+                continue
+            offset, count = entry
+            idf = math.log(1 + (n - count + 0.5) / (count + 0.5))
+            for i in range(offset, offset + count):
+                chunk_id, tf = self.postings[2 * i], self.postings[2 * i + 1]
+                length = self.spans[3 * chunk_id + 2]
+                norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * length / (self.avg_length or 1))
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + qtf * idf * tf * (BM25_K1 + 1) / norm
+        return sorted(scores, key=lambda c: (-scores[c], c))[:k]
+
+    # --- persistence ---
+
+    def save(self, directory: str, key: str) -> None:
+        os.makedirs(directory, exist_ok=True)
+        meta = {"format": INDEX_FORMAT, "chunks": len(self)}
+        contents = [bytes(getattr(self, "chunk_data" if suffix == "chunks" else suffix)) for suffix in INDEX_FILES]
+        for suffix, data in zip(INDEX_FILES + ("json",), contents + [json.dumps(meta).encode("utf-8")]):
+            fd, tmp = tempfile.mkstemp(dir=directory, prefix=f".{key}.", suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, os.path.join(directory, f"{key}.{suffix}"))
+
+    @classmethod
+    def load(cls, directory: str, key: str) -> Optional["BM25Index"]:
+        meta_path = os.path.join(directory, f"{key}.json")
+        if not os.path.exists(meta_path):
+            return None
+        try:
+            with open(meta_path, "rb") as f:
+                meta = json.load(f)
+            if meta.get("format") != INDEX_FORMAT:
+                return None
+            maps = {suffix: _map_file(os.path.join(directory, f"{key}.{suffix}")) for suffix in INDEX_FILES}
+            os.utime(meta_path)  # Recently used; see prune_index_dir
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable retrieval index {key}: {e}")
+            return None
+
+        def words(suffix: str):
+            return memoryview(maps[suffix]).cast("I") if maps[suffix] is not None else array("I")
+
+        def raw(suffix: str):
+            return memoryview(maps[suffix]) if maps[suffix] is not None else b""
+
+        index = cls(raw("terms"), words("vocab"), words("postings"), words("spans"), raw("chunks"))
+        index._mmaps = [m for m in maps.values() if m is not None]
+        return index
+
+
+def _map_file(path: str) -> Optional[mmap.mmap]:
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None  # mmap cannot map empty files
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def prune_index_dir(directory: str, max_bytes: int, keep: frozenset = frozenset()) -> int:
+    """
+    Deletes the least recently used indexes (by the .json marker's mtime) until the
+    directory holds at most `max_bytes`. Indexes in `keep` are never deleted. Returns
+    the number removed.
+    """
+    indexes: dict[str, list] = {}  # key -> [last used, bytes, paths]
+    try:
+        entries = list(os.scandir(directory))
+    except OSError:
+        return 0
+    for entry in entries:
+        key, _, suffix = entry.name.partition(".")
+        if not key or suffix not in INDEX_FILES + ("json",):
+            continue
+        try:
+            stat = entry.stat()
+        except OSError:
+            continue
+        record = indexes.setdefault(key, [0.0, 0, []])
+        record[1] += stat.st_size
+        record[2].append(entry.path)
+        if suffix == "json":
+            record[0] = stat.st_mtime
+    total = sum(size for _, size, _ in indexes.values())
+    removed = 0
+    for key, (_, size, paths) in sorted(indexes.items(), key=lambda item: item[1][0]):
+        if total <= max_bytes:
+            break
+        if key in keep:
+            continue
+        for path in sorted(paths, key=lambda p: not p.endswith(".json")):  # Marker first: never a "complete" partial
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        total -= size
+        removed += 1
+    return removed
+
+
+_open_indexes: "OrderedDict[str, BM25Index]" = OrderedDict()
+_index_lock = threading.Lock()  # index_for runs in worker threads; one build per document at a time
+
+
+def index_for(document: str, index_dir: Optional[str] = None) -> BM25Index:
+    """
+    Returns the index for this exact document version, loading or building (and persisting) it once.
+    Blocking; call it from a worker thread when on the event loop.
+    """
+    key = document_key(document)
+    with _index_lock:
+        index = _open_indexes.get(key)
+        if index is not None:
+            _open_indexes.move_to_end(key)
+            return index
+        directory = index_dir or RETRIEVAL_INDEX_DIR
+        index = BM25Index.load(directory, key)
+        if index is None:
+            index = BM25Index.build(chunk_markdown(document))
+            try:
+                index.save(directory, key)
+                prune_index_dir(directory, RETRIEVAL_INDEX_MAX_BYTES, keep=frozenset(_open_indexes) | {key})
+            except OSError as e:
+                print(f"Could not persist retrieval index to {directory}: {e}")
+        _open_indexes[key] = index
+        while len(_open_indexes) > RETRIEVAL_CACHE_SIZE:
+            _open_indexes.popitem(last=False)
+        return index
+
+
+def relevant_excerpts(document: str, query: str, k: int = RETRIEVAL_TOP_K) -> str:
+    """
+    The top-k chunks of `document` for `query`, in document order. Short documents are
+    returned whole; a query that matches nothing gets the document's first k chunks.
+    """
+    if len(document) <= RETRIEVAL_MIN_CHARS:
+        return document
+    index = index_for(document)
+    if len(index) == 0:
+        return document
+    hits = index.search(query, k) or list(range(min(k, len(index))))
+    return "\n\n[...]\n\n".join(index.chunk(chunk_id) for chunk_id in sorted(hits))
@@ -0,0 +1,178 @@
+"""
+Structured scene breakdowns ("scene plans").
+
+In structured mode a chapter's breakdown is requested as JSON matching
+ChapterScenePlans (via response_format where the model supports it; the
+prompt spells out the same shape for models that ignore it) and validated
+with Pydantic. A reply that does not validate is retried with the validation
+errors, up to STRUCTURED_RETRIES times.
+
+When the breakdown belongs to a project, every scene is stored as its own
+"scene_plan" artifact at (chapter_index, scene_index), holding the plan as
+JSON. A scene narrative request can then name the scene by position instead
+of resending the chapter breakdown: its prompt gets that scene's plan plus a
+one-line overview of each scene in the chapter.
+"""
+import re
+from dataclasses import dataclass
+from typing import Optional
+
+from pydantic import BaseModel, ConfigDict, ValidationError, field_validator
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from repo_src.backend.adapters import artifact_store
+from repo_src.backend.settings import get_settings
+from .llm_interface import ask_llm_json
+
+SCENE_PLAN_KIND = "scene_plan"
+STRUCTURED_RETRIES = get_settings().structured_retries
+
+
+class ScenePlan(BaseModel):
+    # Every field is required and nothing else is allowed, as strict JSON-schema modes expect.
+    model_config = ConfigDict(extra="forbid")
+
+    title: str
+    goal: str
+    characters: list[str]
+    key_events: list[str]
+    setting: str
+    information_revealed: str  # "" when the scene reveals nothing new
+    tone: str
+
+
+class ChapterScenePlans(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    scenes: list[ScenePlan]
+
+    @field_validator("scenes")
+    @classmethod
+    def _not_empty(cls, scenes: list[ScenePlan]) -> list[ScenePlan]:
+        # Checked here rather than with min_length, which strict schema modes reject.
+        if not scenes:
+            raise ValueError("a chapter needs at least one scene")
+        return scenes
+
+
+CHAPTER_PLANS_SCHEMA = ChapterScenePlans.model_json_schema()
+
+
+class StructuredOutputError(Exception):
+    """The model's reply could not be validated as ChapterScenePlans."""
+
+
+def parse_chapter_plans(reply: str) -> ChapterScenePlans:
+    """Validates a reply, tolerating code fences or prose around the JSON object. Raises ValueError."""
+    text = re.sub(r"^```(?:json)?\s*|\s*```$", "", reply.strip())
+    start, end = text.find("{"), text.rfind("}")
+    if text.lstrip().startswith("["):  # A bare list of scenes
+        text = f'{{"scenes": {text}}}'
+    elif start != -1 and end > start:
+        text = text[start:end + 1]
+    try:
+        return ChapterScenePlans.model_validate_json(text)
+    except ValidationError as e:
+        raise ValueError(str(e)) from None
+
+
+def _repair_note(error: ValueError, reply: str) -> str:
+    return f"""
+
+Your previous reply did not match the required JSON format:
+{str(error)[:1500]}
+
+Previous reply:
+{reply[:4000]}
+
+Reply again with only the corrected JSON object."""
+
+
+async def ask_for_chapter_plans(prompt_text: str, system_message: str) -> ChapterScenePlans:
+    """One chapter's scene plans. Raises StructuredOutputError with an "Error: ..." message."""
+    reply = await ask_llm_json(prompt_text, CHAPTER_PLANS_SCHEMA, "chapter_scene_plans", system_message)
+    for attempt in range(STRUCTURED_RETRIES + 1):
+        if reply.startswith("Error:"):
+            raise StructuredOutputError(reply)
+        try:
+            return parse_chapter_plans(reply)
+        except ValueError as e:
+            if attempt == STRUCTURED_RETRIES:
+                raise StructuredOutputError(f"Error: Scene breakdown did not match the expected format: {e}")
+            print(f"Structured breakdown failed validation, retrying: {str(e)[:200]}")
+            reply = await ask_llm_json(
+                prompt_text + _repair_note(e, reply), CHAPTER_PLANS_SCHEMA, "chapter_scene_plans", system_message
+            )
+
+
+def scene_number(chapter_index: int, scene_index: int) -> str:
+    return f"Scene {chapter_index + 1}.{scene_index + 1}"
+
+
+def render_scene_plan(plan: ScenePlan, chapter_index: int, scene_index: int) -> str:
+    """The plan in the Markdown layout of free-form breakdowns, as scene prompts expect."""
+    lines = [
+        f"- **Scene Number:** {scene_number(chapter_index, scene_index)}: {plan.title}",
+        f"- **Goal:** {plan.goal}",
+        f"- **Characters Present:** {', '.join(plan.characters)}",
+        "- **Key Events/Actions:**",
+        *(f"  - {event}" for event in plan.key_events),
+        f"- **Setting:** {plan.setting}",
+    ]
+    if plan.information_revealed:
+        lines.append(f"- **Information Revealed:** {plan.information_revealed}")
+    if plan.tone:
+        lines.append(f"- **Emotional Shift/Tone:** {plan.tone}")
+    return "\n".join(lines)
+
+
+def render_chapter_plans(plans: list[ScenePlan], chapter_index: int) -> str:
+    return "\n\n".join(render_scene_plan(plan, chapter_index, i) for i, plan in enumerate(plans))
+
+
+def chapter_overview(plans: list[ScenePlan], chapter_index: int, current: Optional[int] = None) -> str:
+    """One line per scene (title and goal), standing in for the full chapter breakdown."""
+    return "\n".join(
+        f"- {scene_number(chapter_index, i)}: {plan.title} - {plan.goal}" + (" (this scene)" if i == current else "")
+        for i, plan in enumerate(plans)
+    )
+
+
+@dataclass(frozen=True)
+class StoredScene:
+    chapter_title: str
+    scene_plan_md: str
+    chapter_overview_md: str
+
+
+async def store_chapter_plans(
+    session_factory: async_sessionmaker, project_id: str, chapter_index: int, chapter_title: str, plans: list[ScenePlan]
+) -> None:
+    """Replaces the chapter's stored scene plans (scenes dropped by a regeneration go too)."""
+    async with session_factory() as session:
+        await artifact_store.replace_chapter_artifacts(
+            session, project_id, SCENE_PLAN_KIND, chapter_index, chapter_title,
+            [plan.model_dump_json() for plan in plans],
+        )
+
+
+async def get_chapter_plans(session: AsyncSession, project_id: str, chapter_index: int) -> tuple[str, list[ScenePlan]]:
+    """The chapter's title and stored scene plans in order ([] if none were stored)."""
+    artifacts = await artifact_store.get_chapter_artifacts(session, project_id, SCENE_PLAN_KIND, chapter_index)
+    chapter_title = (artifacts[0].chapter_title or "") if artifacts else ""
+    return chapter_title, [ScenePlan.model_validate_json(a.content) for a in artifacts]
+
+
+async def load_scene(
+    session_factory: async_sessionmaker, project_id: str, chapter_index: int, scene_index: int
+) -> Optional[StoredScene]:
+    """The stored plan for one scene and an overview of its chapter, or None if it was never stored."""
+    async with session_factory() as session:
+        chapter_title, plans = await get_chapter_plans(session, project_id, chapter_index)
+    if scene_index >= len(plans):
+        return None
+    return StoredScene(
+        chapter_title=chapter_title,
+        scene_plan_md=render_scene_plan(plans[scene_index], chapter_index, scene_index),
+        chapter_overview_md=chapter_overview(plans, chapter_index, current=scene_index),
+    )
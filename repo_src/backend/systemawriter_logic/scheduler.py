@@ -0,0 +1,297 @@
+"""
+Priority-aware admission control for upstream LLM calls.
+
+Every ask_llm/stream_llm call acquires a slot from `llm_scheduler` before
+contacting OpenRouter. Slots are bounded globally (LLM_MAX_CONCURRENCY) and
+per priority class:
+
+    interactive  - a user waiting on a single result (default)
+    batch        - fan-outs such as chapter breakdowns; never takes the last
+                   LLM_INTERACTIVE_RESERVED slots
+    speculative  - background prefetch; at most SPECULATIVE_MAX_CONCURRENT
+
+When slots are scarce, waiters are served highest class first. Within a
+class users are served round-robin, so one user's 50-chapter fan-out cannot
+starve another user's single scene. Waiters with a deadline inside
+LLM_DEADLINE_URGENCY seconds jump ahead within their class (earliest first),
+and a waiter whose deadline passes while queued is rejected without calling
+the LLM. Batch waiters queued longer than LLM_BATCH_AGING seconds are
+promoted to interactive so they cannot starve indefinitely.
+
+The class, user and deadline of a call come from context variables set with
+`llm_context(...)`, which asyncio tasks inherit, so they flow through
+core_logic fan-outs without extra parameters.
+"""
+import asyncio
+import contextlib
+import contextvars
+import statistics
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Iterator, Optional
+
+from repo_src.backend.settings import get_settings
+
+PRIORITIES = ("interactive", "batch", "speculative")  # Index is rank: lower is served first
+
+_settings = get_settings()
+LLM_MAX_CONCURRENCY = _settings.llm_max_concurrency
+LLM_INTERACTIVE_RESERVED = _settings.llm_interactive_reserved
+SPECULATIVE_MAX_CONCURRENT = _settings.speculative_max_concurrent
+LLM_DEADLINE_URGENCY = _settings.llm_deadline_urgency  # seconds
+LLM_BATCH_AGING = _settings.llm_batch_aging  # seconds
+
+_priority_var: contextvars.ContextVar[str] = contextvars.ContextVar("llm_priority", default="interactive")
+_user_var: contextvars.ContextVar[str] = contextvars.ContextVar("llm_user", default="anonymous")
+_deadline_var: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("llm_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """The call's deadline passed before an LLM slot became available."""
+
+
+def _rank(priority: str) -> int:
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown LLM priority {priority!r}; expected one of {PRIORITIES}")
+    return PRIORITIES.index(priority)
+
+
+@contextlib.contextmanager
+def llm_context(
+    priority: Optional[str] = None,
+    user_id: Optional[str] = None,
+    deadline: Optional[float] = None,
+    lower_only: bool = False,
+) -> Iterator[None]:
+    """
+    Sets the scheduling context for LLM calls made inside the block (and tasks created in it).
+    `deadline` is an absolute time.monotonic() value. With lower_only=True the priority is
+    only applied if it is lower than the current one (a speculative fan-out stays speculative).
+    """
+    tokens = []
+    if priority is not None:
+        _rank(priority)
+        if not lower_only or _rank(priority) > _rank(_priority_var.get()):
+            tokens.append((_priority_var, _priority_var.set(priority)))
+    if user_id is not None:
+        tokens.append((_user_var, _user_var.set(user_id)))
+    if deadline is not None:
+        tokens.append((_deadline_var, _deadline_var.set(deadline)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+def set_llm_context(priority: Optional[str] = None, user_id: Optional[str] = None, deadline: Optional[float] = None) -> None:
+    """Non-scoped variant of llm_context for request entry points (the context dies with the request task)."""
+    if priority is not None:
+        _rank(priority)
+        _priority_var.set(priority)
+    if user_id is not None:
+        _user_var.set(user_id)
+    if deadline is not None:
+        _deadline_var.set(deadline)
+
+
+def background_context(priority: str) -> contextvars.Context:
+    """
+    A copy of the current context for background work started by a request (tasks created
+    with `ctx.run(asyncio.create_task, ...)` inherit it): the request's deadline is dropped
+    and `priority` applies; the user and budget scope are kept.
+    """
+    _rank(priority)
+    context = contextvars.copy_context()
+
+    def detach() -> None:
+        _priority_var.set(priority)
+        _deadline_var.set(None)
+
+    context.run(detach)
+    return context
+
+
+def current_llm_context() -> dict:
+    return {"priority": _priority_var.get(), "user_id": _user_var.get(), "deadline": _deadline_var.get()}
+
+
+@dataclass
+class _Waiter:
+    future: asyncio.Future
+    user_id: str
+    rank: int
+    deadline: Optional[float]
+    enqueued_at: float = field(default_factory=time.monotonic)
+    granted: bool = False
+
+
+@dataclass
+class _ClassMetrics:
+    admitted: int = 0
+    deadline_expired: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+    recent_waits: deque = field(default_factory=lambda: deque(maxlen=1000))
+
+    def record(self, wait: float) -> None:
+        self.admitted += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.recent_waits.append(wait)
+
+
+class LLMScheduler:
+    def __init__(
+        self,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        interactive_reserved: int = LLM_INTERACTIVE_RESERVED,
+        speculative_max: int = SPECULATIVE_MAX_CONCURRENT,
+        deadline_urgency: float = LLM_DEADLINE_URGENCY,
+        batch_aging: float = LLM_BATCH_AGING,
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        reserved = min(interactive_reserved, self.max_concurrency - 1)
+        self.class_limits = [
+            self.max_concurrency,
+            self.max_concurrency - reserved,
+            max(1, min(speculative_max, self.max_concurrency - reserved)),
+        ]
+        self.deadline_urgency = deadline_urgency
+        self.batch_aging = batch_aging
+        # Per class: user -> FIFO of waiters. OrderedDict order is the round-robin order.
+        self._queues: list[OrderedDict[str, deque[_Waiter]]] = [OrderedDict() for _ in PRIORITIES]
+        self._in_flight = [0 for _ in PRIORITIES]
+        self._metrics = [_ClassMetrics() for _ in PRIORITIES]
+
+    # --- queue bookkeeping ---
+
+    def _enqueue(self, waiter: _Waiter) -> None:
+        self._queues[waiter.rank].setdefault(waiter.user_id, deque()).append(waiter)
+
+    def _remove(self, waiter: _Waiter) -> None:
+        queue = self._queues[waiter.rank].get(waiter.user_id)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            if not queue:
+                del self._queues[waiter.rank][waiter.user_id]
+
+    def _promote_aged(self, now: float) -> None:
+        batch = _rank("batch")
+        for user_id, queue in list(self._queues[batch].items()):
+            while queue and now - queue[0].enqueued_at > self.batch_aging:
+                waiter = queue.popleft()
+                waiter.rank = batch - 1
+                self._enqueue(waiter)
+            if not queue:
+                del self._queues[batch][user_id]
+
+    def _pick(self, rank: int, now: float) -> Optional[_Waiter]:
+        users = self._queues[rank]
+        if not users:
+            return None
+        # Earliest-deadline-first for waiters that are about to miss their deadline.
+        urgent = [
+            queue[0] for queue in users.values()
+            if queue[0].deadline is not None and queue[0].deadline - now <= self.deadline_urgency
+        ]
+        if urgent:
+            waiter = min(urgent, key=lambda w: w.deadline)
+        else:
+            waiter = users[next(iter(users))][0]
+        queue = users[waiter.user_id]
+        queue.popleft()
+        # Move this user to the back of the round-robin order.
+        del users[waiter.user_id]
+        if queue:
+            users[waiter.user_id] = queue
+        return waiter
+
+    def _can_run(self, rank: int) -> bool:
+        return sum(self._in_flight) < self.max_concurrency and self._in_flight[rank] < self.class_limits[rank]
+
+    def _dispatch(self) -> None:
+        now = time.monotonic()
+        self._promote_aged(now)
+        for rank in range(len(PRIORITIES)):
+            while self._queues[rank] and self._can_run(rank):
+                waiter = self._pick(rank, now)
+                if waiter.future.done():  # Cancelled or timed out concurrently
+                    continue
+                waiter.granted = True
+                self._in_flight[rank] += 1
+                self._metrics[rank].record(now - waiter.enqueued_at)
+                waiter.future.set_result(None)
+
+    def _release(self, rank: int) -> None:
+        self._in_flight[rank] -= 1
+        self._dispatch()
+
+    # --- public API ---
+
+    @contextlib.asynccontextmanager
+    async def slot(
+        self,
+        priority: Optional[str] = None,
+        user_id: Optional[str] = None,
+        deadline: Optional[float] = None,
+    ) -> AsyncIterator[None]:
+        """Holds one LLM slot for the duration of the block. Defaults come from llm_context()."""
+        rank = _rank(priority or _priority_var.get())
+        user_id = user_id or _user_var.get()
+        deadline = deadline if deadline is not None else _deadline_var.get()
+
+        queued_ahead = any(self._queues[r] for r in range(rank + 1))
+        if not queued_ahead and self._can_run(rank):
+            self._in_flight[rank] += 1
+            self._metrics[rank].record(0.0)
+        else:
+            waiter = _Waiter(asyncio.get_running_loop().create_future(), user_id, rank, deadline)
+            self._enqueue(waiter)
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+            except asyncio.TimeoutError:
+                if not waiter.granted:
+                    self._remove(waiter)
+                    waiter.future.cancel()
+                    self._metrics[waiter.rank].deadline_expired += 1
+                    raise DeadlineExceeded(f"Deadline passed after {time.monotonic() - waiter.enqueued_at:.1f}s in the LLM queue")
+            except BaseException:
+                if waiter.granted:
+                    self._release(waiter.rank)
+                else:
+                    self._remove(waiter)
+                    waiter.future.cancel()
+                raise
+            rank = waiter.rank  # May have been promoted by aging
+        try:
+            yield
+        finally:
+            self._release(rank)
+
+    def queue_depth(self) -> dict[str, int]:
+        return {name: sum(len(q) for q in self._queues[i].values()) for i, name in enumerate(PRIORITIES)}
+
+    def snapshot(self) -> dict:
+        classes = {}
+        for i, name in enumerate(PRIORITIES):
+            m = self._metrics[i]
+            recent = sorted(m.recent_waits)
+            classes[name] = {
+                "queued": sum(len(q) for q in self._queues[i].values()),
+                "queued_users": len(self._queues[i]),
+                "in_flight": self._in_flight[i],
+                "limit": self.class_limits[i],
+                "admitted": m.admitted,
+                "deadline_expired": m.deadline_expired,
+                "avg_wait_seconds": (m.total_wait / m.admitted) if m.admitted else 0.0,
+                "max_wait_seconds": m.max_wait,
+                "p50_wait_seconds": statistics.median(recent) if recent else 0.0,
+                "p95_wait_seconds": recent[int(0.95 * (len(recent) - 1))] if recent else 0.0,
+            }
+        return {"max_concurrency": self.max_concurrency, "in_flight": sum(self._in_flight), "classes": classes}
+
+
+llm_scheduler = LLMScheduler()
@@ -0,0 +1,456 @@
+"""
+Cache tier for generated results that every worker can reuse.
+
+An in-process dict is cold and duplicated in each uvicorn worker, so results
+worth keeping go through a SharedCache chosen by SHARED_CACHE_BACKEND:
+
+    memory  MemoryCache: this process only (the default; enough for one worker)
+    sqlite  SQLiteCache: one SQLite file in WAL mode (SHARED_CACHE_PATH), read
+            and written by every worker on the host
+    none    NullCache: nothing is kept ("off" works too)
+
+More backends can be added to BACKENDS (and to settings.SHARED_CACHE_BACKENDS,
+which validates the setting). Values are anything fast_json can
+encode. Stored bytes are bounded by SHARED_CACHE_MAX_BYTES, evicting the least
+recently used entries first.
+
+get_or_compute() is atomic. Concurrent callers for the same key, in this
+process or in another worker, wait for one computation instead of repeating
+it. In-process callers share a future. Across processes, the caller that
+finds neither a value nor a live lease row takes the lease, in the same
+transaction as the lookup. Other processes poll until the value appears or
+the lease is released. A lease expires after SHARED_CACHE_LEASE_SECONDS in
+case its holder dies.
+
+Current users:
+- continuity.fold_scene_into_state, keyed by the previous notes and the scene;
+- speculative prefetches, so the approving request may land on any worker.
+"""
+import abc
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Optional
+
+from repo_src.backend import fast_json
+from repo_src.backend.settings import get_settings
+
+_settings = get_settings()
+SHARED_CACHE_BACKEND = _settings.shared_cache_backend
+SHARED_CACHE_PATH = _settings.shared_cache_path
+SHARED_CACHE_MAX_BYTES = _settings.shared_cache_max_bytes
+SHARED_CACHE_LEASE_SECONDS = _settings.shared_cache_lease_seconds  # Longer than any one generation
+SHARED_CACHE_POLL_SECONDS = _settings.shared_cache_poll_seconds
+
+EVICT_TO_FRACTION = 0.9  # Evict below the bound, not just to it, so the next insert does not evict again
+TOUCH_INTERVAL = 60.0  # Seconds between recency updates of an entry that keeps being read
+
+_HIT, _OWNER, _WAIT = "hit", "owner", "wait"
+
+
+def cache_key(namespace: str, *parts: Any) -> str:
+    return f"{namespace}:{hashlib.sha256(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()}"
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    computed: int = 0
+    waited: int = 0  # Waits (or polls) for a computation running in another caller
+    evicted: int = 0
+
+
+class SharedCache(abc.ABC):
+    """
+    Base class: subclasses implement the storage primitives (_lookup, _claim, _store,
+    _release, _take, _delete, _exists); the single-flight logic lives here.
+    """
+
+    name = "base"
+    cross_process = False  # Whether other worker processes see this cache's entries and leases
+
+    def __init__(self, max_bytes: int = SHARED_CACHE_MAX_BYTES, poll_interval: float = SHARED_CACHE_POLL_SECONDS):
+        self.max_bytes = max_bytes
+        self.poll_interval = poll_interval
+        self.stats = CacheStats()
+        self._owner = uuid.uuid4().hex  # Identifies this process's leases
+        self._inflight: dict[str, asyncio.Future] = {}
+
+    @abc.abstractmethod
+    async def _lookup(self, key: str) -> Optional[bytes]:
+        """The live value, or None."""
+
+    @abc.abstractmethod
+    async def _claim(self, key: str) -> tuple[str, Optional[bytes]]:
+        """(_HIT, value), (_OWNER, None) with the lease taken, or (_WAIT, None) if another process holds it."""
+
+    @abc.abstractmethod
+    async def _store(self, key: str, value: bytes, ttl: Optional[float]) -> None:
+        """Stores the value and drops any lease on the key."""
+
+    @abc.abstractmethod
+    async def _release(self, key: str) -> None:
+        """Drops this process's lease on the key (its computation failed or was not cacheable)."""
+
+    @abc.abstractmethod
+    async def _take(self, key: str) -> tuple[Optional[bytes], bool]:
+        """Removes and returns the value, and whether another process holds a live lease on the key."""
+
+    @abc.abstractmethod
+    async def _delete(self, key: str) -> None:
+        """Removes the value, if any."""
+
+    @abc.abstractmethod
+    async def _exists(self, key: str) -> bool:
+        """Read-only: whether a live value, or another process's live lease, exists for the key."""
+
+    async def get(self, key: str) -> Optional[Any]:
+        value = await self._lookup(key)
+        if value is None:
+            self.stats.misses += 1
+            return None
+        self.stats.hits += 1
+        return fast_json.loads(value)
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        await self._store(key, fast_json.dumps(value), ttl)
+
+    async def delete(self, key: str) -> None:
+        await self._delete(key)
+
+    async def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[Any]],
+        ttl: Optional[float] = None,
+        cacheable: Optional[Callable[[Any], bool]] = None,
+    ) -> Any:
+        """
+        The cached value, or the result of compute(), which is stored unless
+        cacheable(result) is false. Only one caller per key computes at a time;
+        if it fails or its result is not cacheable, a waiting caller computes next.
+        """
+        while True:
+            pending = self._inflight.get(key)
+            if pending is not None:
+                self.stats.waited += 1
+                await asyncio.wait({pending})  # Cancelling this caller must not cancel the shared future
+                shared, result = pending.result()
+                if shared:
+                    return result
+                continue
+            state, value = await self._claim(key)
+            if state == _HIT:
+                self.stats.hits += 1
+                return fast_json.loads(value)
+            if state == _WAIT:
+                self.stats.waited += 1
+                await asyncio.sleep(self.poll_interval)
+                continue
+            break
+
+        self.stats.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        shared, result = False, None
+        try:
+            result = await compute()
+            self.stats.computed += 1
+            if cacheable is None or cacheable(result):
+                await self._store(key, fast_json.dumps(result), ttl)
+                shared = True
+            return result
+        finally:
+            try:
+                if not shared:
+                    await self._release(key)
+            finally:
+                del self._inflight[key]
+                future.set_result((shared, result))
+
+    async def contains(self, key: str) -> bool:
+        """Whether the key has a value or a computation in progress; cheaper than pop() on a miss."""
+        return key in self._inflight or await self._exists(key)
+
+    async def pop(self, key: str, wait: bool = False) -> Optional[Any]:
+        """
+        Removes and returns the value, or None. With wait=True, a value that is still
+        being computed (here or in another worker) is waited for.
+        """
+        while True:
+            pending = self._inflight.get(key)
+            if wait and pending is not None:
+                await asyncio.wait({pending})
+            value, leased = await self._take(key)
+            if value is not None:
+                self.stats.hits += 1
+                return fast_json.loads(value)
+            if not (wait and leased):
+                self.stats.misses += 1
+                return None
+            await asyncio.sleep(self.poll_interval)
+
+    def snapshot(self) -> dict:
+        return {"backend": self.name, "max_bytes": self.max_bytes, **self.stats.__dict__}
+
+
+class NullCache(SharedCache):
+    name = "none"
+
+    async def _lookup(self, key):
+        return None
+
+    async def _claim(self, key):
+        return _OWNER, None
+
+    async def _store(self, key, value, ttl):
+        pass
+
+    async def _release(self, key):
+        pass
+
+    async def _take(self, key):
+        return None, False
+
+    async def _delete(self, key):
+        pass
+
+    async def _exists(self, key):
+        return False
+
+
+class MemoryCache(SharedCache):
+    """Per-process LRU bounded by stored bytes. In-process single flight needs no leases."""
+
+    name = "memory"
+
+    def __init__(self, max_bytes: int = SHARED_CACHE_MAX_BYTES, **kwargs):
+        super().__init__(max_bytes, **kwargs)
+        self._entries: "OrderedDict[str, tuple[bytes, Optional[float]]]" = OrderedDict()
+        self._bytes = 0
+
+    def _get_live(self, key: str) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.time():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _remove(self, key: str) -> Optional[bytes]:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        self._bytes -= len(entry[0])
+        return entry[0]
+
+    async def _lookup(self, key):
+        return self._get_live(key)
+
+    async def _claim(self, key):
+        value = self._get_live(key)
+        return (_HIT, value) if value is not None else (_OWNER, None)
+
+    async def _store(self, key, value, ttl):
+        self._remove(key)
+        if len(value) > self.max_bytes:
+            return
+        self._entries[key] = (value, time.time() + ttl if ttl else None)
+        self._bytes += len(value)
+        if self._bytes > self.max_bytes:
+            while self._bytes > self.max_bytes * EVICT_TO_FRACTION:
+                self._remove(next(iter(self._entries)))
+                self.stats.evicted += 1
+
+    async def _release(self, key):
+        pass
+
+    async def _take(self, key):
+        value = self._get_live(key)
+        self._remove(key)
+        return value, False
+
+    async def _delete(self, key):
+        self._remove(key)
+
+    async def _exists(self, key):
+        return self._get_live(key) is not None
+
+    def snapshot(self) -> dict:
+        return {**super().snapshot(), "entries": len(self._entries), "bytes": self._bytes}
+
+
+class SQLiteCache(SharedCache):
+    """
+    Entries and leases in one SQLite file shared by every process on the host.
+    WAL lets readers proceed while a writer commits. Each operation is a short
+    transaction run in a worker thread, so the event loop never waits on the file lock.
+    """
+
+    name = "sqlite"
+    cross_process = True
+
+    def __init__(
+        self,
+        path: str = SHARED_CACHE_PATH,
+        max_bytes: int = SHARED_CACHE_MAX_BYTES,
+        lease_seconds: float = SHARED_CACHE_LEASE_SECONDS,
+        **kwargs,
+    ):
+        super().__init__(max_bytes, **kwargs)
+        self.path = path
+        self.lease_seconds = lease_seconds
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()  # One connection, used by one thread at a time
+        self._conn = sqlite3.connect(path, timeout=30.0, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS cache_entries (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                expires_at REAL,
+                accessed_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS ix_cache_entries_accessed_at ON cache_entries (accessed_at);
+            CREATE TABLE IF NOT EXISTS cache_leases (
+                key TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            );
+        """)
+
+    async def _run(self, fn: Callable, *args) -> Any:
+        def locked():
+            with self._lock:
+                return fn(*args)
+        return await asyncio.to_thread(locked)
+
+    def _transaction(self, fn: Callable, *args) -> Any:
+        # IMMEDIATE takes the write lock up front, so a lookup and the lease it leads to are atomic.
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(*args)
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+        return result
+
+    def _live_value(self, key: str, now: float) -> Optional[bytes]:
+        row = self._conn.execute(
+            "SELECT value, expires_at, accessed_at FROM cache_entries WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or (row[1] is not None and row[1] <= now):
+            return None
+        if row[2] < now - TOUCH_INTERVAL:
+            self._conn.execute("UPDATE cache_entries SET accessed_at = ? WHERE key = ?", (now, key))
+        return row[0]
+
+    def _lease_held(self, key: str, now: float) -> bool:
+        row = self._conn.execute(
+            "SELECT owner, expires_at FROM cache_leases WHERE key = ?", (key,)
+        ).fetchone()
+        return row is not None and row[0] != self._owner and row[1] > now
+
+    def _evict(self, now: float) -> None:
+        self._conn.execute("DELETE FROM cache_entries WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache_entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        victims = []
+        for key, size in self._conn.execute("SELECT key, size FROM cache_entries ORDER BY accessed_at"):
+            if total <= self.max_bytes * EVICT_TO_FRACTION:
+                break
+            victims.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM cache_entries WHERE key = ?", victims)
+        self.stats.evicted += len(victims)
+
+    async def _lookup(self, key):
+        return await self._run(self._live_value, key, time.time())  # Autocommit: readers take no write lock
+
+    async def _claim(self, key):
+        def claim(now: float):
+            value = self._live_value(key, now)
+            if value is not None:
+                return _HIT, value
+            if self._lease_held(key, now):
+                return _WAIT, None
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache_leases (key, owner, expires_at) VALUES (?, ?, ?)",
+                (key, self._owner, now + self.lease_seconds),
+            )
+            return _OWNER, None
+        return await self._run(self._transaction, claim, time.time())
+
+    async def _store(self, key, value, ttl):
+        def store(now: float):
+            self._conn.execute("DELETE FROM cache_leases WHERE key = ?", (key,))
+            if len(value) > self.max_bytes:
+                return
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache_entries (key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now + ttl if ttl else None, now),
+            )
+            self._evict(now)
+        await self._run(self._transaction, store, time.time())
+
+    async def _release(self, key):
+        def release():
+            self._conn.execute("DELETE FROM cache_leases WHERE key = ? AND owner = ?", (key, self._owner))
+        await self._run(release)
+
+    async def _take(self, key):
+        def take(now: float):
+            value = self._live_value(key, now)
+            self._conn.execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+            return value, self._lease_held(key, now)
+        return await self._run(self._transaction, take, time.time())
+
+    async def _delete(self, key):
+        def delete():
+            self._conn.execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+        await self._run(delete)
+
+    async def _exists(self, key):
+        def exists(now: float):
+            # Autocommit reads: unlike _take, no write lock is taken on a miss.
+            row = self._conn.execute(
+                "SELECT 1 FROM cache_entries WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)", (key, now)
+            ).fetchone()
+            return row is not None or self._lease_held(key, now)
+        return await self._run(exists, time.time())
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            entries, stored = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries").fetchone()
+        return {**super().snapshot(), "path": self.path, "entries": entries, "bytes": stored}
+
+
+BACKENDS: dict[str, Callable[[], SharedCache]] = {
+    "memory": MemoryCache,
+    "sqlite": SQLiteCache,
+    "none": NullCache,
+}
+
+
+def create_cache(backend: str = SHARED_CACHE_BACKEND) -> SharedCache:
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown SHARED_CACHE_BACKEND {backend!r}; expected one of {', '.join(BACKENDS)}")
+    return BACKENDS[backend]()
+
+
+cache = create_cache()
@@ -0,0 +1,262 @@
+"""
+Speculative prefetch of the next workflow stage.
+
+Users usually approve a generated artifact unchanged, so when a request opts
+in (`speculate: true`) the backend starts the next stage in the background as
+soon as the current one returns:
+
+    outline       -> worldbuilding      (inputs: concept, outline)
+    worldbuilding -> scene_breakdowns   (inputs: outline, worldbuilding)
+
+Speculations are keyed by a hash of the exact inputs the next stage will be
+called with. If the user approves as-is, the follow-up request carries the
+same inputs and is served from the speculation (awaiting it if still
+running). If the user edits the artifact the hash differs, so the stale
+speculation for that project/stage is cancelled and the request runs normally.
+
+Speculative spend is capped by SPECULATIVE_TOKEN_BUDGET estimated tokens per
+SPECULATIVE_BUDGET_WINDOW seconds; speculations that would exceed it are not
+started. Speculative LLM calls run in the scheduler's "speculative" class,
+so they only use capacity that interactive and batch work leave idle (at
+most SPECULATIVE_MAX_CONCURRENT slots), and without the deadline of the
+request that started them. A speculation not claimed within SPECULATIVE_TTL
+seconds is discarded.
+
+Results also go through the shared cache (shared_cache.py), so with several
+workers the approving request can claim a speculation that another worker
+ran, waiting for it if it is still running. That lookup is skipped unless
+speculation is enabled (a non-zero budget), the cache is shared between
+processes and it holds a value or a live lease for the key, so ordinary
+requests never take the cache's write lock. Only the worker that started a
+speculation can cancel it; an edit served elsewhere leaves it to finish and
+expire unclaimed after SPECULATIVE_TTL.
+"""
+import asyncio
+import hashlib
+import json
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Optional
+
+from . import core_logic, prompts, shared_cache
+from .llm_interface import estimate_tokens, DEFAULT_MAX_TOKENS
+from .scheduler import background_context
+from repo_src.backend.settings import get_settings
+
+_settings = get_settings()
+SPECULATIVE_TOKEN_BUDGET = _settings.speculative_token_budget
+SPECULATIVE_BUDGET_WINDOW = _settings.speculative_budget_window  # seconds
+SPECULATIVE_TTL = _settings.speculative_ttl  # seconds an unclaimed result is kept
+
+NEXT_STAGE = {"outline": "worldbuilding", "worldbuilding": "scene_breakdowns"}
+
+
+def inputs_hash(stage: str, inputs: dict) -> str:
+    return hashlib.sha256(json.dumps([stage, inputs], sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _shared_key(key: str) -> str:
+    return f"speculative:{key}"
+
+
+def estimate_stage_tokens(stage: str, inputs: dict) -> int:
+    """Upper-bound token estimate (prompt + max completion per call) used for the budget."""
+    if stage == "worldbuilding":
+        prompt = prompts.get_worldbuilding_prompt(inputs["concept_document"], inputs["approved_outline"])
+        return estimate_tokens(prompt) + DEFAULT_MAX_TOKENS
+    if stage == "scene_breakdowns":
+        chapters = core_logic._extract_chapters_from_outline(inputs["approved_outline"])
+        per_call = estimate_tokens(inputs["approved_outline"] + inputs["approved_worldbuilding"]) + DEFAULT_MAX_TOKENS
+        return max(1, len(chapters)) * per_call
+    raise ValueError(f"No speculative runner for stage {stage}")
+
+
+def _runner(stage: str, inputs: dict) -> Callable[[], Awaitable[Any]]:
+    if stage == "worldbuilding":
+        return lambda: core_logic.generate_worldbuilding_logic(inputs["concept_document"], inputs["approved_outline"])
+    if stage == "scene_breakdowns":
+        return lambda: core_logic.generate_all_scene_breakdowns_logic(inputs["approved_outline"], inputs["approved_worldbuilding"])
+    raise ValueError(f"No speculative runner for stage {stage}")
+
+
+def _is_error(result: Any) -> bool:
+    if isinstance(result, str):
+        return result.startswith("Error:")
+    return isinstance(result, dict) and "Error" in result
+
+
+@dataclass
+class _Speculation:
+    key: str
+    slot: tuple[str, str]
+    task: asyncio.Task
+    estimated_tokens: int
+    created_at: float = field(default_factory=time.monotonic)
+    expiry: Optional[asyncio.TimerHandle] = None
+
+
+@dataclass
+class SpeculationStats:
+    started: int = 0
+    hits: int = 0
+    misses: int = 0
+    discarded: int = 0  # Cancelled because the user edited the input, or expired unclaimed
+    skipped_over_budget: int = 0
+    tokens_reserved: int = 0  # Estimated tokens in the current budget window
+
+
+class SpeculativePrefetcher:
+    def __init__(
+        self,
+        token_budget: int = SPECULATIVE_TOKEN_BUDGET,
+        budget_window: float = SPECULATIVE_BUDGET_WINDOW,
+        ttl: float = SPECULATIVE_TTL,
+    ):
+        self.token_budget = token_budget
+        self.budget_window = budget_window
+        self.ttl = ttl
+        self.stats = SpeculationStats()
+        self._by_key: dict[str, _Speculation] = {}
+        self._by_slot: dict[tuple[str, str], _Speculation] = {}
+        self._window_started = time.monotonic()
+
+    def _discard(self, spec: _Speculation) -> None:
+        self._by_key.pop(spec.key, None)
+        if self._by_slot.get(spec.slot) is spec:
+            del self._by_slot[spec.slot]
+        if spec.expiry is not None:
+            spec.expiry.cancel()
+        if not spec.task.done():
+            spec.task.cancel()
+        self.stats.discarded += 1
+
+    def _expire(self, spec: _Speculation) -> None:
+        if self._by_key.get(spec.key) is spec:  # Still unclaimed
+            self._discard(spec)
+
+    def _evict_expired(self) -> None:
+        now = time.monotonic()
+        for spec in [s for s in self._by_key.values() if now - s.created_at > self.ttl]:
+            self._discard(spec)
+
+    def _reserve(self, tokens: int) -> bool:
+        now = time.monotonic()
+        if now - self._window_started > self.budget_window:
+            self._window_started = now
+            self.stats.tokens_reserved = 0
+        if self.stats.tokens_reserved + tokens > self.token_budget:
+            self.stats.skipped_over_budget += 1
+            return False
+        self.stats.tokens_reserved += tokens
+        return True
+
+    def schedule(self, project_id: str, stage: str, inputs: dict) -> bool:
+        """
+        Starts speculating `stage` for `inputs` unless an identical speculation exists.
+        Any other speculation for the same project and stage is cancelled.
+        Returns True if the speculation is running (new or existing).
+        """
+        self._evict_expired()
+        key = inputs_hash(stage, inputs)
+        if key in self._by_key:
+            return True
+        slot = (project_id, stage)
+        previous = self._by_slot.get(slot)
+        if previous is not None:
+            self._discard(previous)
+        estimated = estimate_stage_tokens(stage, inputs)
+        if not self._reserve(estimated):
+            return False
+
+        run = _runner(stage, inputs)
+
+        async def speculate():
+            return await shared_cache.cache.get_or_compute(
+                _shared_key(key), run, ttl=self.ttl, cacheable=lambda result: not _is_error(result),
+            )
+
+        # Not bound by the scheduling deadline or priority of the request that triggered it.
+        task = background_context("speculative").run(asyncio.create_task, speculate())
+        spec = _Speculation(key=key, slot=slot, task=task, estimated_tokens=estimated)
+        spec.expiry = asyncio.get_running_loop().call_later(self.ttl, self._expire, spec)
+        self._by_key[key] = spec
+        self._by_slot[slot] = spec
+        self.stats.started += 1
+        return True
+
+    def schedule_next(self, project_id: Optional[str], completed_stage: str, inputs: dict) -> bool:
+        """Schedules the stage that follows `completed_stage`, given the next stage's inputs."""
+        next_stage = NEXT_STAGE.get(completed_stage)
+        if not project_id or next_stage is None:
+            return False
+        return self.schedule(project_id, next_stage, inputs)
+
+    async def take(self, project_id: Optional[str], stage: str, inputs: dict) -> Optional[Any]:
+        """
+        Returns the speculative result for exactly these inputs (waiting for it if it is
+        still running), or None. A speculation for the same project/stage with different
+        inputs means the user edited the artifact, so it is cancelled.
+        """
+        key = inputs_hash(stage, inputs)
+        spec = self._by_key.pop(key, None)
+        if spec is None:
+            if project_id and (project_id, stage) in self._by_slot:
+                self._discard(self._by_slot[(project_id, stage)])
+            result = await self._take_shared(key)  # Speculated by another worker?
+            if result is None or _is_error(result):
+                self.stats.misses += 1
+                return None
+            self.stats.hits += 1
+            return result
+        if self._by_slot.get(spec.slot) is spec:
+            del self._by_slot[spec.slot]
+        if spec.expiry is not None:
+            spec.expiry.cancel()
+        try:
+            result = await asyncio.shield(spec.task)
+        except asyncio.CancelledError:
+            if spec.task.cancelled():
+                self.stats.misses += 1
+                return None
+            spec.task.cancel()  # Our caller went away; nobody else can claim this result
+            raise
+        except Exception:
+            self.stats.misses += 1
+            return None
+        if _is_error(result):
+            self.stats.misses += 1
+            return None
+        await shared_cache.cache.delete(_shared_key(key))  # Claimed once, like the local speculation
+        self.stats.hits += 1
+        return result
+
+    async def _take_shared(self, key: str) -> Optional[Any]:
+        cache = shared_cache.cache
+        if self.token_budget <= 0 or not cache.cross_process or not await cache.contains(_shared_key(key)):
+            return None
+        return await cache.pop(_shared_key(key), wait=True)
+
+    def discard_project(self, project_id: str) -> int:
+        """Cancels every speculation for a project (e.g. the user started editing). Returns how many."""
+        specs = [s for s in self._by_key.values() if s.slot[0] == project_id]
+        for spec in specs:
+            self._discard(spec)
+        return len(specs)
+
+    def discard_all(self) -> int:
+        """Cancels every speculation, e.g. when the server shuts down. Returns how many."""
+        specs = list(self._by_key.values())
+        for spec in specs:
+            self._discard(spec)
+        return len(specs)
+
+    def snapshot(self) -> dict:
+        return {
+            **self.stats.__dict__,
+            "token_budget": self.token_budget,
+            "budget_window_seconds": self.budget_window,
+            "pending": len(self._by_key),
+        }
+
+
+prefetcher = SpeculativePrefetcher()
@@ -0,0 +1,282 @@
+"""
+WebSocket project session: one connection carries many concurrent generations.
+
+Protocol (JSON text frames).
+
+Client -> server:
+  {"type": "context", "data": {...}}            merge shared context (concept_document,
+                                                 approved_outline_md, approved_worldbuilding_md,
+                                                 writing_style_notes) so it is uploaded once
+  {"type": "generate", "id": "t1", "stage": "outline" | "worldbuilding" | "scene_breakdowns"
+                       | "scene_narrative", "params": {...}}   params override the context
+  {"type": "regenerate", "id": "t1"}            cancel (if running) and rerun with the same inputs
+  {"type": "cancel", "id": "t1"}
+  {"type": "ping"}
+
+Server -> client:
+  ack, started, token {"delta"}, progress {"chapter", "completed", "total"},
+  result {"result"}, error {"detail"}, cancelled, pong
+
+Backpressure: outbound events go through a bounded queue drained by a single
+writer. Token deltas are not queued individually; they accumulate in a
+per-task buffer with at most one pending flush marker, so a slow client
+receives fewer, larger token frames while memory stays bounded by the text
+actually generated. If the queue is full when a buffer is started, its marker
+is queued by the task's next token or by the writer once there is room.
+Non-token events block their producer when the queue is
+full, which in turn stops reading from the upstream LLM stream.
+
+Each generation is recorded as a GenerationJob (adapters/job_store.py) with
+its status and streamed token count, written through the batched write queue.
+"""
+import asyncio
+import json
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Optional
+
+from fastapi import WebSocket, WebSocketDisconnect
+from repo_src.backend.adapters import job_store
+from repo_src.backend.settings import get_settings
+
+from . import core_logic
+from .llm_interface import estimate_tokens
+
+_settings = get_settings()
+WS_SEND_QUEUE_SIZE = _settings.ws_send_queue_size
+WS_MAX_CONCURRENT_TASKS = _settings.ws_max_concurrent_tasks
+WS_MAX_TASKS = _settings.ws_max_tasks  # Running + waiting tasks per session; also how many can be regenerated
+
+STAGES = ("outline", "worldbuilding", "scene_breakdowns", "scene_narrative")
+CONTEXT_KEYS = ("concept_document", "approved_outline_md", "approved_worldbuilding_md", "writing_style_notes")
+
+_FLUSH_TOKENS = object()
+
+
+class SessionProtocolError(ValueError):
+    pass
+
+
+class ProjectSession:
+    def __init__(self, websocket: WebSocket, project_id: str):
+        self.websocket = websocket
+        self.project_id = project_id
+        self.context: dict[str, Any] = {}
+        self._outbox: asyncio.Queue = asyncio.Queue(maxsize=WS_SEND_QUEUE_SIZE)
+        self._token_buffers: dict[str, list[str]] = {}
+        self._unqueued: set[str] = set()  # Buffered tasks whose flush marker did not fit in the queue
+        self._tasks: dict[str, asyncio.Task] = {}
+        # task id -> (stage, resolved params) for regenerate; the WS_MAX_TASKS most recent only
+        self._requests: "OrderedDict[str, tuple[str, dict]]" = OrderedDict()
+        self._slots = asyncio.Semaphore(WS_MAX_CONCURRENT_TASKS)
+
+    # --- outbound ---
+
+    async def emit(self, event: dict) -> None:
+        await self._outbox.put(event)
+
+    def emit_token(self, task_id: str, delta: str) -> None:
+        buffer = self._token_buffers.get(task_id)
+        if buffer is not None:
+            buffer.append(delta)
+            if task_id in self._unqueued:
+                self._queue_flush(task_id)
+            return  # Otherwise a flush marker for this task is already queued
+        self._token_buffers[task_id] = [delta]
+        self._queue_flush(task_id)
+
+    def _queue_flush(self, task_id: str) -> None:
+        try:
+            self._outbox.put_nowait((_FLUSH_TOKENS, task_id))
+            self._unqueued.discard(task_id)
+        except asyncio.QueueFull:
+            # Keep buffering; retried on the next token or by the writer when the queue drains.
+            self._unqueued.add(task_id)
+
+    async def _flush_tokens(self, task_id: str) -> None:
+        self._unqueued.discard(task_id)
+        buffer = self._token_buffers.pop(task_id, None)
+        if buffer:
+            await self.websocket.send_json({"type": "token", "id": task_id, "delta": "".join(buffer)})
+
+    async def _writer(self) -> None:
+        while True:
+            item = await self._outbox.get()
+            if isinstance(item, tuple) and item[0] is _FLUSH_TOKENS:
+                await self._flush_tokens(item[1])
+            else:
+                task_id = item.get("id")
+                if task_id is not None:
+                    # Preserve ordering: pending tokens precede the task's progress/result events.
+                    await self._flush_tokens(task_id)
+                await self.websocket.send_json(item)
+            for waiting in list(self._unqueued):  # There is room in the queue again
+                if self._outbox.full():
+                    break
+                self._queue_flush(waiting)
+
+    # --- inbound ---
+
+    def _resolve_params(self, stage: str, params: dict) -> dict:
+        if not isinstance(params, dict):
+            raise SessionProtocolError("params must be a JSON object")
+        merged = {**self.context, **params}
+        required = {
+            "outline": ("concept_document",),
+            "worldbuilding": ("concept_document", "approved_outline_md"),
+            "scene_breakdowns": ("approved_outline_md", "approved_worldbuilding_md"),
+            "scene_narrative": ("scene_plan_from_breakdown", "chapter_title", "full_chapter_scene_breakdown",
+                                "approved_worldbuilding_md", "approved_outline_md"),
+        }[stage]
+        missing = [key for key in required if not merged.get(key)]
+        if missing:
+            raise SessionProtocolError(f"Missing fields for {stage}: {', '.join(missing)}")
+        return merged
+
+    def _stage_stream(self, stage: str, p: dict) -> AsyncIterator[str]:
+        if stage == "outline":
+            return core_logic.stream_outline_logic(p["concept_document"])
+        if stage == "worldbuilding":
+            return core_logic.stream_worldbuilding_logic(p["concept_document"], p["approved_outline_md"])
+        return core_logic.stream_scene_narrative_logic(
+            scene_plan_from_breakdown=p["scene_plan_from_breakdown"],
+            chapter_title=p["chapter_title"],
+            full_chapter_scene_breakdown=p["full_chapter_scene_breakdown"],
+            approved_worldbuilding=p["approved_worldbuilding_md"],
+            full_approved_outline=p["approved_outline_md"],
+            writing_style_notes=p.get("writing_style_notes") or "",
+        )
+
+    async def _run_task(self, task_id: str, stage: str, params: dict) -> None:
+        job_id = None
+        try:
+            async with self._slots:
+                await self.emit({"type": "started", "id": task_id, "stage": stage})
+                job_id = await job_store.start_job(self.project_id, stage)
+                progress = 0
+                if stage == "scene_breakdowns":
+                    async def on_chapter_done(title: str, breakdown_md: str, completed: int, total: int) -> None:
+                        nonlocal progress
+                        progress += estimate_tokens(breakdown_md)
+                        await job_store.record_progress(job_id, progress)
+                        await self.emit({"type": "progress", "id": task_id, "chapter": title,
+                                         "breakdown_md": breakdown_md, "completed": completed, "total": total})
+
+                    result: Any = await core_logic.generate_all_scene_breakdowns_logic(
+                        approved_outline=params["approved_outline_md"],
+                        approved_worldbuilding=params["approved_worldbuilding_md"],
+                        on_chapter_done=on_chapter_done,
+                    )
+                    if "Error" in result:
+                        await job_store.finish_job(job_id, "failed", result["Error"])
+                        await self.emit({"type": "error", "id": task_id, "detail": result["Error"]})
+                        return
+                else:
+                    parts: list[str] = []
+                    async for delta in self._stage_stream(stage, params):
+                        if delta.startswith("Error:"):
+                            await job_store.finish_job(job_id, "failed", delta)
+                            await self.emit({"type": "error", "id": task_id, "detail": delta})
+                            return
+                        parts.append(delta)
+                        self.emit_token(task_id, delta)
+                        progress += estimate_tokens(delta)
+                        await job_store.record_progress(job_id, progress)
+                    result = "".join(parts).strip()
+                await job_store.finish_job(job_id, "succeeded")
+                await self.emit({"type": "result", "id": task_id, "stage": stage, "result": result})
+        except asyncio.CancelledError:
+            self._token_buffers.pop(task_id, None)
+            self._unqueued.discard(task_id)
+            try:
+                self._outbox.put_nowait({"type": "cancelled", "id": task_id})
+            except asyncio.QueueFull:
+                pass
+            await job_store.finish_job(job_id, "cancelled")
+            raise
+        except Exception as e:
+            detail = f"Error generating {stage}: {str(e)}"
+            await job_store.finish_job(job_id, "failed", detail)
+            await self.emit({"type": "error", "id": task_id, "detail": detail})
+        finally:
+            if self._tasks.get(task_id) is asyncio.current_task():
+                del self._tasks[task_id]
+
+    async def _cancel(self, task_id: str) -> bool:
+        task = self._tasks.pop(task_id, None)
+        if task is None:
+            return False
+        task.cancel()
+        try:
+            await task
+        except (asyncio.CancelledError, Exception):
+            pass
+        return True
+
+    async def _start(self, task_id: str, stage: str, params: dict) -> None:
+        await self._cancel(task_id)
+        if len(self._tasks) >= WS_MAX_TASKS:
+            raise SessionProtocolError(f"Too many tasks in this session (limit {WS_MAX_TASKS})")
+        self._requests[task_id] = (stage, params)
+        self._requests.move_to_end(task_id)
+        while len(self._requests) > WS_MAX_TASKS:
+            self._requests.popitem(last=False)
+        self._tasks[task_id] = asyncio.create_task(self._run_task(task_id, stage, params))
+
+    async def handle(self, message: dict) -> None:
+        kind = message.get("type")
+        task_id = message.get("id")
+        if kind == "ping":
+            await self.emit({"type": "pong"})
+        elif kind == "context":
+            data = message.get("data") or {}
+            if not isinstance(data, dict):
+                raise SessionProtocolError("context data must be a JSON object")
+            self.context.update({k: v for k, v in data.items() if k in CONTEXT_KEYS})
+            await self.emit({"type": "ack", "for": "context", "keys": sorted(self.context)})
+        elif kind == "generate":
+            stage = message.get("stage")
+            if stage not in STAGES:
+                raise SessionProtocolError(f"Unknown stage: {stage}")
+            if not task_id:
+                raise SessionProtocolError("generate requires an id")
+            await self._start(task_id, stage, self._resolve_params(stage, message.get("params") or {}))
+        elif kind == "regenerate":
+            if task_id not in self._requests:
+                raise SessionProtocolError(f"Unknown task id: {task_id}")
+            stage, params = self._requests[task_id]
+            await self._start(task_id, stage, params)
+        elif kind == "cancel":
+            if not await self._cancel(task_id):
+                await self.emit({"type": "error", "id": task_id, "detail": "No running task with this id"})
+        else:
+            raise SessionProtocolError(f"Unknown message type: {kind}")
+
+    async def run(self) -> None:
+        """Serves the connection until the client disconnects; cancels all its work afterwards."""
+        writer = asyncio.create_task(self._writer())
+        try:
+            while True:
+                try:
+                    message = json.loads(await self.websocket.receive_text())
+                    if not isinstance(message, dict):
+                        raise SessionProtocolError("Messages must be JSON objects")
+                    await self.handle(message)
+                except json.JSONDecodeError:
+                    await self.emit({"type": "error", "id": None, "detail": "Invalid JSON message"})
+                except SessionProtocolError as e:
+                    await self.emit({"type": "error", "id": message.get("id") if isinstance(message, dict) else None, "detail": str(e)})
+        except WebSocketDisconnect:
+            pass
+        finally:
+            for task_id in list(self._tasks):
+                await self._cancel(task_id)
+            writer.cancel()
+            try:
+                await writer
+            except (asyncio.CancelledError, Exception):
+                pass
+
+
+async def serve_project_session(websocket: WebSocket, project_id: str) -> None:
+    await websocket.accept()
+    await ProjectSession(websocket, project_id).run()
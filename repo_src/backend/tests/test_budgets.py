@@ -0,0 +1,119 @@
+import asyncio
+import json
+import os
+import sys
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import StaticPool
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../..')))
+from repo_src.backend.database.connection import Base, get_async_session_factory
+from repo_src.backend.main import app
+from repo_src.backend.systemawriter_logic import budgets, cassettes, llm_interface
+from repo_src.backend.systemawriter_logic.budgets import budget_ledger, budget_scope
+
+async_engine_test = create_async_engine("sqlite+aiosqlite:///:memory:", poolclass=StaticPool)
+TestingAsyncSessionLocal = async_sessionmaker(async_engine_test, expire_on_commit=False)
+
+@pytest.fixture()
+def client(monkeypatch):
+    async def reset():
+        async with async_engine_test.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+            await conn.run_sync(Base.metadata.create_all)
+
+    asyncio.run(reset())
+    monkeypatch.setattr(llm_interface, "OPENROUTER_API_KEY", "test-key")
+    monkeypatch.setattr(llm_interface, "DEFAULT_MODEL_NAME", "anthropic/claude-sonnet-4")
+    monkeypatch.setattr(llm_interface, "DEFAULT_MAX_TOKENS", 1000)
+    monkeypatch.setattr(budgets, "BUDGET_ADMIN_TOKEN", "admin")
+    app.dependency_overrides[get_async_session_factory] = lambda: TestingAsyncSessionLocal
+    yield TestClient(app)
+    app.dependency_overrides.pop(get_async_session_factory, None)
+
+ADMIN = {"X-Admin-Token": "admin"}
+
+def _upstream(monkeypatch, calls):
+    usage = {"prompt_tokens": 100, "completion_tokens": 50, "cost": 0.01}
+
+    def handler(request):
+        payload = json.loads(request.content)
+        calls.append(payload)
+        if not payload.get("stream"):
+            return httpx.Response(200, json={"choices": [{"message": {"content": "A scene."}, "finish_reason": "stop"}], "usage": usage})
+        body = (
+            f'data: {json.dumps({"choices": [{"delta": {"content": "A scene."}}]})}\n\n'
+            f'data: {json.dumps({"choices": [{"delta": {}, "finish_reason": "stop"}], "usage": usage})}\n\n'
+            "data: [DONE]\n\n"
+        )
+        return httpx.Response(200, headers={"content-type": "text/event-stream"}, text=body)
+    monkeypatch.setattr(cassettes, "llm_transport", lambda: httpx.MockTransport(handler))
+
+def _in_project(call, project_id="p1", user_id=None):
+    async def run():
+        with budget_scope(project_id=project_id, user_id=user_id, session_factory=TestingAsyncSessionLocal):
+            result = await call()
+        await budget_ledger.wait_settled()
+        return result
+    return asyncio.run(run())
+
+def test_usage_is_charged_to_every_scope(client, monkeypatch):
+    calls = []
+    _upstream(monkeypatch, calls)
+    assert _in_project(lambda: llm_interface.ask_llm("Write a scene."), user_id="maya") == "A scene."
+
+    async def stream():
+        return "".join([delta async for delta in llm_interface.stream_llm("Write a scene.")])
+    assert _in_project(stream, user_id="maya") == "A scene."
+    assert all(call["usage"] == {"include": True} for call in calls)
+
+    for scope, scope_id in (("project", "p1"), ("user", "maya")):
+        budget = client.get(f"/api/systemawriter/budgets/{scope}/{scope_id}").json()
+        assert budget["tokens_used"] == 300 and budget["cost_used_usd"] == pytest.approx(0.02)
+        assert budget["token_limit"] is None and budget["tokens_reserved"] == 0
+
+def test_over_budget_calls_are_rejected_before_dispatch(client, monkeypatch):
+    calls = []
+    _upstream(monkeypatch, calls)
+    response = client.put("/api/systemawriter/budgets/project/p1", json={"token_limit": 500}, headers=ADMIN)
+    assert response.status_code == 200 and response.json()["token_limit"] == 500
+
+    reply = _in_project(lambda: llm_interface.ask_llm("Write a scene."))
+    assert reply.startswith("Error: Budget exceeded: project p1 has 500 of 500 tokens left")
+    assert calls == [] and budget_ledger.reserved(("project", "p1")) == (0, 0.0)
+    # Other projects are unaffected.
+    assert _in_project(lambda: llm_interface.ask_llm("Write a scene."), project_id="p2") == "A scene."
+    assert client.put("/api/systemawriter/budgets/team/p1", json={}, headers=ADMIN).status_code == 422
+
+def test_cost_limit_routes_to_the_fallback_model_when_it_fits(client, monkeypatch):
+    calls = []
+    _upstream(monkeypatch, calls)
+    # ~1000 completion tokens cost ~$0.015 on the configured model but ~$0.004 on the fallback.
+    client.put("/api/systemawriter/budgets/project/p1", json={"cost_limit_usd": 0.01}, headers=ADMIN)
+    assert _in_project(lambda: llm_interface.ask_llm("Write a scene.")) == "A scene."
+    assert calls[-1]["model"] == "anthropic/claude-3.5-haiku"
+
+    # Spent: the recorded $0.01 leaves nothing for either model.
+    assert _in_project(lambda: llm_interface.ask_llm("Write a scene.")).startswith("Error: Budget exceeded")
+    assert len(calls) == 1
+
+    budget = client.put("/api/systemawriter/budgets/project/p1", json={"cost_limit_usd": 0.01, "reset_usage": True}, headers=ADMIN).json()
+    assert budget["cost_used_usd"] == 0.0 and budget["tokens_used"] == 0
+
+def test_limits_need_the_admin_token_and_bind_unscoped_calls(client, monkeypatch):
+    calls = []
+    _upstream(monkeypatch, calls)
+    url = "/api/systemawriter/budgets/user/maya"
+    assert client.put(url, json={"token_limit": 10**6, "reset_usage": True}).status_code == 401
+    assert client.put(url, json={"token_limit": 10**6}, headers={"X-Admin-Token": "wrong"}).status_code == 401
+    monkeypatch.setattr(budgets, "BUDGET_ADMIN_TOKEN", None)
+    assert client.put(url, json={"token_limit": 10**6}, headers=ADMIN).status_code == 403
+
+    monkeypatch.setattr(budgets, "BUDGET_ADMIN_TOKEN", "admin")
+    assert _in_project(lambda: llm_interface.ask_llm("Write a scene."), project_id=None) == "A scene."  # No limits yet
+    assert client.put(url, json={"token_limit": 10**6}, headers={"Authorization": "Bearer admin"}).status_code == 200
+    reply = _in_project(lambda: llm_interface.ask_llm("Write a scene."), project_id=None)
+    assert reply.startswith("Error: Budget exceeded: budgets are enforced") and len(calls) == 1
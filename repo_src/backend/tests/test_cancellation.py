@@ -0,0 +1,102 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../..')))
+from repo_src.backend.systemawriter_logic import cancellation, core_logic
+from repo_src.backend.systemawriter_logic.cancellation import RequestCancelled, run_cancellable, cancel_request
+
+class FakeRequest:
+    """Minimal stand-in for starlette's Request: disconnects after `disconnect_after` polls."""
+    def __init__(self, disconnect_after=None, request_id=None):
+        self.polls = 0
+        self.disconnect_after = disconnect_after
+        self.headers = {"x-request-id": request_id} if request_id else {}
+
+    async def is_disconnected(self):
+        self.polls += 1
+        return self.disconnect_after is not None and self.polls > self.disconnect_after
+
+@pytest.fixture()
+def stats(monkeypatch):
+    fresh = cancellation.CancellationStats()
+    monkeypatch.setattr(cancellation, "cancellation_stats", fresh)
+    monkeypatch.setattr(core_logic, "cancellation_stats", fresh)
+    monkeypatch.setattr(cancellation, "DISCONNECT_POLL_INTERVAL", 0.01)
+    return fresh
+
+def test_completed_work_is_returned(stats):
+    async def work():
+        return "outline"
+    assert asyncio.run(run_cancellable(FakeRequest(), work())) == "outline"
+    assert stats.cancelled_requests == 0
+
+def test_disconnect_cancels_fan_out_and_skips_queued_chapters(stats, monkeypatch):
+    started = []
+
+    async def fake_ask_llm(prompt_text, system_message=""):
+        started.append(prompt_text)
+        try:
+            await asyncio.sleep(30)
+        except asyncio.CancelledError:
+            stats.record_cancelled_call(100)
+            raise
+        return "never"
+
+    monkeypatch.setattr(core_logic, "ask_llm", fake_ask_llm)
+    monkeypatch.setattr(core_logic, "BREAKDOWN_CONCURRENCY", 2)
+    outline = "\n\n".join(f"## Chapter {i}\n- Beat {i}" for i in range(1, 7))
+
+    async def run():
+        await run_cancellable(
+            FakeRequest(disconnect_after=3),
+            core_logic.generate_all_scene_breakdowns_logic(outline, "## Main Characters"),
+        )
+
+    with pytest.raises(RequestCancelled) as excinfo:
+        asyncio.run(run())
+    assert excinfo.value.reason == "disconnect"
+    assert len(started) == 2  # Only the concurrency window was ever dispatched
+    assert stats.cancelled_calls == 2
+    assert stats.skipped_calls == 4
+    assert stats.cancelled_requests == 1
+    assert stats.estimated_tokens_saved > 200
+
+def test_explicit_cancel_by_request_id(stats):
+    async def work():
+        await asyncio.sleep(30)
+
+    async def run():
+        pending = asyncio.ensure_future(run_cancellable(FakeRequest(request_id="req-1"), work()))
+        await asyncio.sleep(0.05)
+        assert cancel_request("req-1") is True
+        with pytest.raises(RequestCancelled) as excinfo:
+            await pending
+        return excinfo.value.reason
+
+    assert asyncio.run(run()) == "cancel"
+    assert cancel_request("req-1") is False
+
+def test_cancelled_unstreamed_call_counts_only_an_upper_bound(stats, monkeypatch):
+    import httpx
+    from repo_src.backend.systemawriter_logic import cassettes, llm_interface
+
+    async def slow_upstream(request):
+        await asyncio.sleep(30)
+
+    monkeypatch.setattr(llm_interface, "cancellation_stats", stats)
+    monkeypatch.setattr(llm_interface, "OPENROUTER_API_KEY", "test-key")
+    monkeypatch.setattr(cassettes, "llm_transport", lambda: httpx.MockTransport(slow_upstream))
+
+    async def run():
+        task = asyncio.create_task(llm_interface.ask_llm("Write a scene."))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert stats.cancelled_calls == 1 and stats.estimated_tokens_saved == 0
+    assert stats.tokens_saved_upper_bound == llm_interface.DEFAULT_MAX_TOKENS
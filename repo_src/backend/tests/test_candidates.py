@@ -0,0 +1,88 @@
+import asyncio
+import os
+import sys
+
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../..')))
+from repo_src.backend.main import app
+from repo_src.backend.systemawriter_logic import core_logic, llm_interface
+from repo_src.backend.systemawriter_logic.ranking import rank_candidates, best_candidate
+
+PLAN = "Maya confronts ARIA in the observatory about the missing oxygen logs."
+
+def test_ranking_prefers_plan_coverage_and_penalises_repetition_and_errors():
+    on_plan = "Maya climbed to the observatory. ARIA hummed. 'Where are the oxygen logs?' she asked. The logs were missing."
+    off_plan = "The sea was calm and the gulls wheeled over the harbour while fishermen mended their nets."
+    looping = " ".join(["Maya looked at ARIA in the observatory."] * 12)
+    ranked = rank_candidates(["Error: HTTP 500", looping, off_plan, on_plan], reference=PLAN)
+    assert [c.index for c in ranked] == [3, 2, 1, 0]
+    assert ranked[0].signals["coverage"] > ranked[1].signals["coverage"]
+    assert ranked[2].signals["freshness"] < 0.5
+    assert best_candidate(rank_candidates(["Error: a", "ok"], reference=PLAN, rank=False)).index == 1
+
+def test_candidates_run_concurrently_without_n_support(monkeypatch):
+    running = peak = 0
+
+    async def fake_ask_llm(prompt_text, system_message=""):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return f"version {peak}"
+
+    monkeypatch.setattr(llm_interface, "LLM_SUPPORTS_N", False)
+    monkeypatch.setattr(llm_interface, "ask_llm", fake_ask_llm)
+    assert len(asyncio.run(llm_interface.ask_llm_candidates("prompt", n=3))) == 3
+    assert peak == 3
+
+def test_n_mode_tops_up_when_provider_returns_fewer_choices(monkeypatch):
+    requested = []
+
+    async def fake_choices(prompt_text, system_message, n):
+        requested.append(n)
+        return [llm_interface._Completion("a", "stop"), llm_interface._Completion("b", "stop")]
+
+    async def fake_ask_llm(prompt_text, system_message=""):
+        return "c"
+
+    monkeypatch.setattr(llm_interface, "LLM_SUPPORTS_N", True)
+    monkeypatch.setattr(llm_interface, "_ask_llm_choices", fake_choices)
+    monkeypatch.setattr(llm_interface, "ask_llm", fake_ask_llm)
+    assert asyncio.run(llm_interface.ask_llm_candidates("prompt", n=3)) == ["a", "b", "c"]
+    assert requested == [3]
+
+def test_outline_endpoint_returns_ranked_candidates(monkeypatch):
+    async def fake_candidates(prompt_text, system_message="", n=1):
+        return ["## Chapter 1\n- Pirates sail.", "Error: HTTP 502", "## Chapter 1: Kepler Station\n- Maya finds the AI anomaly."][:n]
+
+    monkeypatch.setattr(core_logic, "ask_llm_candidates", fake_candidates)
+    client = TestClient(app)
+    response = client.post("/api/systemawriter/generate-outline", json={
+        "concept_document": "Maya, an engineer on Kepler Station, discovers an AI anomaly.", "candidates": 3,
+    })
+    assert response.status_code == 200
+    body = response.json()
+    assert body["outline_md"].startswith("## Chapter 1: Kepler Station")
+    assert [c["index"] for c in body["candidates"]] == [2, 0, 1]
+
+    too_many = llm_interface.MAX_CANDIDATES + 1
+    single = client.post("/api/systemawriter/generate-outline", json={"concept_document": "x", "candidates": too_many})
+    assert single.status_code == 422
+
+def test_scene_candidates_use_long_form_continuation(monkeypatch):
+    calls = []
+
+    async def fake_choices(prompt_text, system_message, n=1, max_tokens=None, continue_from=None, **kwargs):
+        calls.append(continue_from)
+        if continue_from is None:
+            return [llm_interface._Completion("Maya opens the hatch", "length", completion_tokens=10)]
+        return [llm_interface._Completion(" and steps inside.", "stop", completion_tokens=5)]
+
+    monkeypatch.setattr(llm_interface, "LLM_SUPPORTS_N", True)  # Ignored: `n` choices cannot be continued
+    monkeypatch.setattr(llm_interface, "_ask_llm_choices", fake_choices)
+    texts = asyncio.run(core_logic.generate_scene_narrative_candidates_logic(
+        2, "- Maya opens the hatch", "Chapter 1", "breakdown", "world", "outline",
+    ))
+    assert texts == ["Maya opens the hatch and steps inside."] * 2 and calls.count(None) == 2
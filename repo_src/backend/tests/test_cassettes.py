@@ -0,0 +1,91 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../..')))
+from repo_src.backend.systemawriter_logic import cassettes, llm_interface
+from repo_src.backend.systemawriter_logic.cassettes import CassetteTransport
+
+def _upstream(calls):
+    async def handler(request):
+        calls.append(request)
+        payload = json.loads(request.content)
+        if not payload.get("stream"):
+            return httpx.Response(200, json={"choices": [{"message": {"content": f"Reply {len(calls)}"}, "finish_reason": "stop"}]})
+
+        async def events():
+            for word in ("Maya ", "opened ", "the hatch."):
+                await asyncio.sleep(0.05)
+                yield f'data: {json.dumps({"choices": [{"delta": {"content": word}}]})}\n\n'.encode()
+            yield b'data: {"choices": [{"delta": {}, "finish_reason": "stop"}]}\n\ndata: [DONE]\n\n'
+        return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=events())
+    return lambda: httpx.MockTransport(handler)
+
+def _use(monkeypatch, mode, directory, upstream=None, speed=0.0):
+    transport = CassetteTransport(mode, directory=str(directory), speed=speed, upstream=upstream or _upstream([]))
+    monkeypatch.setattr(cassettes, "LLM_CASSETTE_MODE", mode)
+    monkeypatch.setattr(cassettes, "_transport", transport)
+    return transport
+
+async def _stream(prompt):
+    return [delta async for delta in llm_interface.stream_llm(prompt)]
+
+def test_record_then_replay_offline(monkeypatch, tmp_path):
+    calls = []
+    monkeypatch.setattr(llm_interface, "OPENROUTER_API_KEY", "test-key")
+    _use(monkeypatch, "record", tmp_path, upstream=_upstream(calls))
+    assert asyncio.run(llm_interface.ask_llm("Write an opening line.")) == "Reply 1"
+    assert asyncio.run(llm_interface.ask_llm("Write an opening line.")) == "Reply 2"
+    recorded_stream = asyncio.run(_stream("Stream a scene."))
+    assert "".join(recorded_stream) == "Maya opened the hatch."
+    assert len(calls) == 3 and len(list(tmp_path.glob("*.json.gz"))) == 2
+
+    # Replay needs neither the network nor an API key, and repeats the recorded order.
+    monkeypatch.setattr(llm_interface, "OPENROUTER_API_KEY", None)
+    _use(monkeypatch, "replay", tmp_path, upstream=lambda: (_ for _ in ()).throw(AssertionError("network used")))
+    assert asyncio.run(llm_interface.ask_llm("Write an opening line.")) == "Reply 1"
+    assert asyncio.run(llm_interface.ask_llm("Write an opening line.")) == "Reply 2"
+    assert asyncio.run(_stream("Stream a scene.")) == recorded_stream
+    assert asyncio.run(llm_interface.ask_llm("Never recorded.")).startswith("Error: Could not get response from LLM. Details: No cassette")
+
+def test_replay_speed_controls_pacing(monkeypatch, tmp_path):
+    monkeypatch.setattr(llm_interface, "OPENROUTER_API_KEY", "test-key")
+    _use(monkeypatch, "auto", tmp_path)
+    asyncio.run(_stream("Stream a scene."))  # Miss: recorded
+
+    for speed, at_least, at_most in ((1.0, 0.14, 10.0), (0.0, 0.0, 0.1)):
+        _use(monkeypatch, "auto", tmp_path, upstream=lambda: (_ for _ in ()).throw(AssertionError("network used")), speed=speed)
+        started = time.monotonic()
+        assert "".join(asyncio.run(_stream("Stream a scene."))) == "Maya opened the hatch."
+        assert at_least <= time.monotonic() - started < at_most
+
+def test_cassettes_are_saved_off_the_event_loop(monkeypatch, tmp_path):
+    saved_from = []
+    save_cassette = cassettes.save_cassette
+
+    def recording_save(path, cassette):
+        saved_from.append(threading.current_thread() is threading.main_thread())
+        save_cassette(path, cassette)
+
+    monkeypatch.setattr(cassettes, "save_cassette", recording_save)
+    monkeypatch.setattr(llm_interface, "OPENROUTER_API_KEY", "test-key")
+    _use(monkeypatch, "record", tmp_path)
+
+    async def run():
+        return await asyncio.gather(*(llm_interface.ask_llm("Write an opening line.") for _ in range(3)))
+
+    assert sorted(asyncio.run(run())) == ["Reply 1", "Reply 2", "Reply 3"]
+    assert saved_from == [False] * 3
+    (path,) = tmp_path.glob("*.json.gz")
+    assert len(cassettes.load_cassette(str(path))["responses"]) == 3  # No save lost another's episode
+
+def test_unknown_mode_fails_the_call_not_the_import(monkeypatch):
+    monkeypatch.setattr(llm_interface, "OPENROUTER_API_KEY", "test-key")
+    monkeypatch.setattr(cassettes, "LLM_CASSETTE_MODE", "playback")
+    monkeypatch.setattr(cassettes, "_transport", None)
+    assert asyncio.run(llm_interface.ask_llm("Hello")).startswith("Error: Could not get response from LLM. Details: LLM_CASSETTE_MODE must be one of")
@@ -0,0 +1,99 @@
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../..')))
+from repo_src.backend.systemawriter_logic import llm_interface
+from repo_src.backend.systemawriter_logic.llm_interface import _Completion, stitch
+
+def test_stitch_trims_repeated_overlap_and_fixes_the_seam():
+    assert stitch("Maya opened the hatch and saw", "opened the hatch and saw the stars.") == "Maya opened the hatch and saw the stars."
+    assert stitch("The hatch hissed.", "She stepped out.") == "The hatch hissed. She stepped out."
+    assert stitch("The hatch hissed", ", and she stepped out.") == "The hatch hissed, and she stepped out."
+    assert stitch("Line one.\n", "Line two.") == "Line one.\nLine two."
+
+def test_continuation_payload_resends_only_a_tail(monkeypatch):
+    monkeypatch.setattr(llm_interface, "CONTINUATION_TAIL_CHARS", 10)
+    payload = llm_interface._build_payload("prompt", "system", max_tokens=100, continue_from="x" * 50 + "0123456789")
+    assert [m["role"] for m in payload["messages"]] == ["system", "user", "assistant", "user"]
+    assert payload["messages"][2]["content"] == "0123456789"
+    assert payload["max_tokens"] == 100
+
+def test_ask_llm_long_continues_until_stop(monkeypatch):
+    calls = []
+    replies = [
+        _Completion("Maya opened the hatch and saw", "length", 2048),
+        _Completion("opened the hatch and saw the stars", "length", 2048),
+        _Completion(" burning.", "stop", 3),
+    ]
+
+    async def fake_choices(prompt_text, system_message, n, max_tokens=None, continue_from=None):
+        calls.append((continue_from, max_tokens))
+        return [replies[len(calls) - 1]]
+
+    monkeypatch.setattr(llm_interface, "_ask_llm_choices", fake_choices)
+    text = asyncio.run(llm_interface.ask_llm_long("prompt", max_total_tokens=5000))
+    assert text == "Maya opened the hatch and saw the stars burning."
+    assert calls[0] == (None, 2048)
+    assert calls[1][0] == "Maya opened the hatch and saw"
+    assert calls[2][1] == 5000 - 4096  # Last call only gets the remaining budget
+
+def test_ask_llm_long_respects_the_hard_cap_and_keeps_partial_text(monkeypatch):
+    calls = []
+
+    async def always_length(prompt_text, system_message, n, max_tokens=None, continue_from=None):
+        calls.append(max_tokens)
+        return [_Completion(f"Part {len(calls)}.", "length", max_tokens)]
+
+    monkeypatch.setattr(llm_interface, "_ask_llm_choices", always_length)
+    assert asyncio.run(llm_interface.ask_llm_long("prompt", max_total_tokens=4096)) == "Part 1. Part 2."
+    assert len(calls) == 2
+
+    async def fail_on_continue(prompt_text, system_message, n, max_tokens=None, continue_from=None):
+        if continue_from:
+            return [_Completion("Error: HTTP 502 from LLM API.", "error")]
+        return [_Completion("First part.", "length", 2048)]
+
+    monkeypatch.setattr(llm_interface, "_ask_llm_choices", fail_on_continue)
+    assert asyncio.run(llm_interface.ask_llm_long("prompt")) == "First part."
+
+def test_stream_llm_long_streams_continuations_seamlessly(monkeypatch):
+    rounds = [
+        (["Maya opened ", "the hatch and saw"], "length"),
+        (["opened the hatch ", "and saw the stars", " burning."], "stop"),
+    ]
+    seen_continue_from = []
+
+    async def fake_stream(prompt_text, system_message, outcome, max_tokens=None, continue_from=None):
+        seen_continue_from.append(continue_from)
+        deltas, finish_reason = rounds[len(seen_continue_from) - 1]
+        for delta in deltas:
+            yield delta
+        outcome["finish_reason"] = finish_reason
+        outcome["completion_tokens"] = 10
+
+    monkeypatch.setattr(llm_interface, "_stream_completion", fake_stream)
+
+    async def collect():
+        return [delta async for delta in llm_interface.stream_llm_long("prompt")]
+
+    deltas = asyncio.run(collect())
+    assert deltas[:2] == ["Maya opened ", "the hatch and saw"]  # First call streams straight through
+    assert "".join(deltas) == "Maya opened the hatch and saw the stars burning."
+    assert seen_continue_from == [None, "Maya opened the hatch and saw"]
+
+def test_malformed_stream_lines_end_the_stream_with_an_error(monkeypatch):
+    import httpx
+    from repo_src.backend.systemawriter_logic import cassettes
+
+    def upstream(request):
+        body = 'data: {"choices": [{"delta": {"content": "Maya "}}]}\n\ndata: {"choices": [{"del\n\n'
+        return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=body.encode())
+
+    monkeypatch.setattr(llm_interface, "OPENROUTER_API_KEY", "test-key")
+    monkeypatch.setattr(cassettes, "llm_transport", lambda: httpx.MockTransport(upstream))
+
+    async def run():
+        return [delta async for delta in llm_interface.stream_llm("Write a scene.")]
+
+    assert asyncio.run(run()) == ["Maya ", "Error: Malformed response from LLM API stream."]
@@ -0,0 +1,67 @@
+import asyncio
+import os
+import sys
+
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import StaticPool
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../..')))
+from repo_src.backend.adapters import artifact_store
+from repo_src.backend.database.connection import Base
+from repo_src.backend.systemawriter_logic import continuity, prompts
+from repo_src.backend.systemawriter_logic.continuity import ContinuityStore, bound_state
+
+async def _session_factory():
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:", poolclass=StaticPool)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    return async_sessionmaker(engine, expire_on_commit=False)
+
+def test_each_scene_sees_the_state_left_by_the_scenes_before_it(monkeypatch):
+    prompts_seen = []
+
+    async def fake_ask_llm(prompt_text, system_message=""):
+        prompts_seen.append(prompt_text)
+        await asyncio.sleep(0.01)  # Still pending when the next lookup happens
+        previous = prompt_text.split("**Current Continuity Notes:**\n", 1)[1].split("\n\n", 1)[0]
+        scene = prompt_text.split("):**\n", 1)[1].split("\n\n", 1)[0]
+        return scene if previous.startswith("(none yet") else f"{previous} | {scene}"
+
+    monkeypatch.setattr(continuity, "ask_llm", fake_ask_llm)
+
+    async def scenario():
+        factory = await _session_factory()
+        async with factory() as session:
+            project_id = (await artifact_store.create_project(session, "Kepler Station")).id
+        store = ContinuityStore()
+        assert await store.state_before(factory, project_id, 0, 0) == ""
+        store.record_scene(factory, project_id, 0, 0, "Chapter 1", "Maya wakes.")
+        store.record_scene(factory, project_id, 0, 1, "Chapter 1", "The AI speaks.")
+        # Waits for both pending updates, chained in order.
+        state_ch2 = await store.state_before(factory, project_id, 1, 0)
+        # Regenerating the first scene only changes what later lookups at that position see.
+        store.record_scene(factory, project_id, 0, 0, "Chapter 1", "Maya oversleeps.")
+        state_scene2 = await store.state_before(factory, project_id, 0, 1)
+        return state_ch2, state_scene2
+
+    state_ch2, state_scene2 = asyncio.run(scenario())
+    assert state_ch2 == "Maya wakes. | The AI speaks."
+    assert state_scene2 == "Maya oversleeps."
+    # Earlier scene texts are never resent: only the previous state and the new scene.
+    assert "Maya wakes." not in prompts_seen[-1]
+
+def test_failed_update_keeps_previous_state(monkeypatch):
+    async def failing_ask_llm(prompt_text, system_message=""):
+        return "Error: HTTP 500 from LLM API."
+
+    monkeypatch.setattr(continuity, "ask_llm", failing_ask_llm)
+    assert asyncio.run(continuity.fold_scene_into_state("Maya is on deck 3.", "Chapter 1", "...")) == "Maya is on deck 3."
+
+def test_state_is_bounded_and_prompt_includes_it_only_when_present():
+    state = "\n".join(f"- Character {i} is somewhere" for i in range(500))
+    bounded = bound_state(state, max_chars=300)
+    assert len(bounded) <= 300 and bounded.endswith("somewhere")
+
+    args = ("plan", "Chapter 1", "breakdown", "world", "outline")
+    assert "Continuity Notes" not in prompts.get_scene_narrative_prompt(*args)
+    assert "Maya is on deck 3." in prompts.get_scene_narrative_prompt(*args, continuity_notes="Maya is on deck 3.")
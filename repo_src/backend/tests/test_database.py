@@ -59,4 +59,163 @@ client = TestClient(app) # TestClient that uses the overridden get_db
 def test_read_root_endpoint():
     response = client.get("/") # Uses TestClient with overridden DB
     assert response.status_code == 200
-    assert response.json() == {"message": "Welcome to the Backend API. Database is initialized."} 
\ No newline at end of file
+    assert response.json() == {"message": "Welcome to the Backend API. Database is initialized."} 
+
+def test_to_async_url_maps_drivers():
+    from repo_src.backend.database.connection import to_async_url
+    assert to_async_url("sqlite:///./app.db") == "sqlite+aiosqlite:///./app.db"
+    assert to_async_url("postgresql://u:p@h:5432/db") == "postgresql+asyncpg://u:p@h:5432/db"
+    assert to_async_url("postgresql+psycopg2://u:p@h/db") == "postgresql+asyncpg://u:p@h/db"
+    assert to_async_url("sqlite+aiosqlite:///:memory:") == "sqlite+aiosqlite:///:memory:"
+
+def test_async_session_executes_queries():
+    import asyncio
+    from sqlalchemy import text
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+    async def run() -> int:
+        async_engine_test = create_async_engine("sqlite+aiosqlite:///:memory:", poolclass=StaticPool)
+        session_factory = async_sessionmaker(async_engine_test, expire_on_commit=False)
+        async with async_engine_test.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with session_factory() as session:
+            result = await session.execute(text("SELECT 1"))
+            value = result.scalar_one()
+        await async_engine_test.dispose()
+        return value
+
+    assert asyncio.run(run()) == 1
+
+def test_batched_write_queue_coalesces_and_flushes():
+    import asyncio
+    from sqlalchemy import text
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from repo_src.backend.database.write_queue import BatchedWriteQueue
+
+    async def run():
+        async_engine_test = create_async_engine("sqlite+aiosqlite:///:memory:", poolclass=StaticPool)
+        async with async_engine_test.begin() as conn:
+            await conn.execute(text("CREATE TABLE progress (job_id TEXT PRIMARY KEY, tokens INTEGER)"))
+        upsert = text(
+            "INSERT INTO progress (job_id, tokens) VALUES (:job_id, :tokens) "
+            "ON CONFLICT(job_id) DO UPDATE SET tokens = excluded.tokens"
+        )
+        queue = BatchedWriteQueue(async_engine_test, max_batch=1000, flush_interval=60)
+        for i in range(50):
+            await queue.put(upsert, {"job_id": "a", "tokens": i}, key="a")
+            await queue.put(upsert, {"job_id": "b", "tokens": i * 2}, key="b")
+        assert queue.pending == 2
+        written = await queue.flush()
+        async with async_engine_test.connect() as conn:
+            rows = dict((await conn.execute(text("SELECT job_id, tokens FROM progress"))).all())
+        await async_engine_test.dispose()
+        return written, queue.writes_coalesced, rows
+
+    written, coalesced, rows = asyncio.run(run())
+    assert written == 2
+    assert coalesced == 98
+    assert rows == {"a": 49, "b": 98}
+
+def test_failed_flush_is_retried_without_overwriting_newer_writes():
+    import asyncio
+    from sqlalchemy import text
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from repo_src.backend.database.write_queue import BatchedWriteQueue
+
+    async def run():
+        async_engine_test = create_async_engine("sqlite+aiosqlite:///:memory:", poolclass=StaticPool)
+        upsert = text(
+            "INSERT INTO progress (job_id, tokens) VALUES (:job_id, :tokens) "
+            "ON CONFLICT(job_id) DO UPDATE SET tokens = excluded.tokens"
+        )
+        queue = BatchedWriteQueue(async_engine_test, max_batch=1000, flush_interval=60)
+        await queue.put(upsert, {"job_id": "a", "tokens": 1}, key="a")
+        await queue.put(upsert, {"job_id": "b", "tokens": 1}, key="b")
+        with pytest.raises(Exception):
+            await queue.flush()  # No table yet
+        await queue.put(upsert, {"job_id": "a", "tokens": 2}, key="a")
+        assert queue.pending == 2 and queue.flush_failures == 1
+        async with async_engine_test.begin() as conn:
+            await conn.execute(text("CREATE TABLE progress (job_id TEXT PRIMARY KEY, tokens INTEGER)"))
+        written = await queue.flush()
+        async with async_engine_test.connect() as conn:
+            rows = dict((await conn.execute(text("SELECT job_id, tokens FROM progress"))).all())
+        await async_engine_test.dispose()
+        return written, rows
+
+    assert asyncio.run(run()) == (2, {"a": 2, "b": 1})
+
+def test_sqlite_pragmas_skip_wal_for_memory():
+    from repo_src.backend.database.sqlite_tuning import sqlite_pragmas
+    assert "PRAGMA journal_mode=WAL" in sqlite_pragmas()
+    assert "PRAGMA journal_mode=WAL" not in sqlite_pragmas(in_memory=True)
+    assert "PRAGMA synchronous=NORMAL" in sqlite_pragmas(in_memory=True)
+
+def test_write_queue_backs_off_and_drops_a_batch_that_keeps_failing():
+    import asyncio
+    from sqlalchemy import text
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from repo_src.backend.database.write_queue import BatchedWriteQueue
+
+    async def run():
+        async_engine_test = create_async_engine("sqlite+aiosqlite:///:memory:", poolclass=StaticPool)
+        queue = BatchedWriteQueue(async_engine_test, flush_interval=0.001, max_retries=3, max_backoff=0.01)
+        await queue.start()
+        await queue.put(text("INSERT INTO missing (x) VALUES (:x)"), {"x": 1})  # No such table
+        while not queue.writes_dropped:
+            await asyncio.sleep(0.005)
+        failures = queue.flush_failures
+        await queue.stop()
+        await async_engine_test.dispose()
+        return queue, failures
+
+    queue, failures = asyncio.run(run())
+    assert failures == 4 and queue.writes_dropped == 1 and queue.pending == 0
+
+def test_streamed_generations_are_recorded_as_jobs(monkeypatch):
+    import asyncio
+    from sqlalchemy import select
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from repo_src.backend.database import write_queue
+    from repo_src.backend.database.models import GenerationJob, Project
+    from repo_src.backend.systemawriter_logic import core_logic, ws_session
+
+    async def fake_stream_llm(prompt_text, system_message=""):
+        for word in ["Maya ", "opened ", "the ", "hatch."]:
+            yield word
+
+    async def failing_stream_llm(prompt_text, system_message=""):
+        yield "Error: LLM down"
+
+    class FakeSocket:
+        async def send_json(self, event):
+            pass
+
+    async def run():
+        async_engine_test = create_async_engine("sqlite+aiosqlite:///:memory:", poolclass=StaticPool)
+        async with async_engine_test.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.execute(Project.__table__.insert().values(id="p1", title="Station"))
+        queue = write_queue.BatchedWriteQueue(async_engine_test, flush_interval=60)
+        monkeypatch.setattr(write_queue, "_write_queue", queue)
+        await queue.start()
+        session = ws_session.ProjectSession(FakeSocket(), "p1")
+        writer = asyncio.create_task(session._writer())
+        monkeypatch.setattr(core_logic, "stream_llm", fake_stream_llm)
+        await session._run_task("o1", "outline", {"concept_document": "A station AI wakes up."})
+        coalesced = queue.writes_coalesced
+        monkeypatch.setattr(core_logic, "stream_llm", failing_stream_llm)
+        await ws_session.ProjectSession(FakeSocket(), "unstored")._run_task("o2", "outline", {"concept_document": "x"})
+        writer.cancel()
+        await queue.stop()
+        async with async_engine_test.connect() as conn:
+            jobs = (await conn.execute(select(GenerationJob).order_by(GenerationJob.progress_tokens.desc()))).all()
+        await async_engine_test.dispose()
+        return jobs, coalesced
+
+    jobs, coalesced = asyncio.run(run())
+    assert coalesced == 3  # Four progress updates, one write
+    assert [(j.project_id, j.stage, j.status, j.progress_tokens) for j in jobs] == [
+        ("p1", "outline", "succeeded", 4), (None, "outline", "failed", 0),
+    ]
+    assert jobs[1].error == "Error: LLM down"
@@ -0,0 +1,83 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../..')))
+from repo_src.backend import diagnostics
+from repo_src.backend.main import app
+
+TOKEN = {"X-Diagnostics-Token": "s3cret"}
+
+@pytest.fixture()
+def client(monkeypatch):
+    monkeypatch.setattr(diagnostics, "diagnostics", diagnostics.Diagnostics("s3cret"))
+    yield TestClient(app)
+    if diagnostics.diagnostics.memory.tracing:
+        diagnostics.diagnostics.memory.stop()
+
+def _busy_loop(stop):
+    while not stop.is_set():
+        sum(range(200))
+
+def test_sampler_folds_stacks_root_first():
+    stop = threading.Event()
+    worker = threading.Thread(target=_busy_loop, args=(stop,), name="busy worker")
+    worker.start()
+    sampler = diagnostics.StackSampler(interval=0.001, thread_ids={worker.ident}).start()
+    time.sleep(0.1)
+    sampler.stop()
+    stop.set()
+    worker.join()
+
+    lines = sampler.collapsed().splitlines()
+    assert sampler.ticks > 0 and lines
+    stack, count = lines[0].rsplit(" ", 1)
+    assert int(count) > 0 and " " not in stack
+    assert "test_diagnostics:_busy_loop:" in stack.split(";")[-1]
+    assert stack.split(";")[0].startswith("threading:")
+
+def test_routes_need_the_configured_token(client, monkeypatch):
+    assert client.get("/api/diagnostics").status_code == 401
+    assert client.get("/api/diagnostics", headers={"X-Diagnostics-Token": "wrong"}).status_code == 401
+    assert client.get("/api/diagnostics", headers={"Authorization": "Bearer s3cret"}).json()["request_profiling"] is False
+
+    monkeypatch.setattr(diagnostics, "diagnostics", diagnostics.Diagnostics(None))
+    assert client.get("/api/diagnostics", headers=TOKEN).status_code == 404
+
+def test_cpu_profile_returns_collapsed_stacks(client):
+    response = client.get("/api/diagnostics/profile?seconds=0.1&interval_ms=1", headers=TOKEN)
+    assert response.status_code == 200 and response.headers["content-type"].startswith("text/plain")
+    assert all(line.startswith("thread:") for line in response.text.splitlines())
+    assert "thread:MainThread;" in response.text
+
+    stats = client.get("/api/diagnostics/profile?seconds=0.05&mode=cprofile", headers=TOKEN)
+    assert stats.status_code == 200 and "function calls" in stats.text
+
+def test_requests_are_profiled_only_when_enabled_and_asked(client):
+    assert "x-profile-id" not in client.get("/api/hello", headers={"X-Profile": "1", **TOKEN}).headers
+    client.put("/api/diagnostics", headers=TOKEN, json={"request_profiling": True})
+
+    assert "x-profile-id" not in client.get("/api/hello", headers={"X-Profile": "1"}).headers  # No token
+    response = client.get("/api/hello", headers={"X-Profile": "1", **TOKEN})
+    profile_id = response.headers["x-profile-id"]
+    listed = client.get("/api/diagnostics/profiles", headers=TOKEN).json()
+    assert listed[0]["id"] == profile_id and listed[0]["path"] == "/api/hello" and listed[0]["status"] == 200
+    assert client.get(f"/api/diagnostics/profiles/{profile_id}", headers=TOKEN).status_code == 200
+    assert client.get("/api/diagnostics/profiles/missing", headers=TOKEN).status_code == 404
+
+def test_memory_snapshots_report_growth(client):
+    assert client.get("/api/diagnostics/memory", headers=TOKEN).status_code == 409
+    assert client.put("/api/diagnostics", headers=TOKEN, json={"tracemalloc": True}).json()["tracemalloc"] is True
+
+    retained = [bytearray(1000) for _ in range(2000)]
+    snapshot = client.get("/api/diagnostics/memory?limit=50", headers=TOKEN).json()
+    assert snapshot["traced_bytes"] > 2_000_000
+    assert any("test_diagnostics.py" in site["location"] and site["size_diff_bytes"] >= 2_000_000
+               for site in snapshot["growth_since_previous"])
+    del retained
+
+    assert client.put("/api/diagnostics", headers=TOKEN, json={"tracemalloc": False}).json()["tracemalloc"] is False
@@ -0,0 +1,47 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../..')))
+from repo_src.scripts import export_context
+from repo_src.scripts.export_context import Registry
+
+@pytest.fixture()
+def tree(tmp_path, monkeypatch):
+    monkeypatch.setattr(export_context, "ROOT", tmp_path)
+    monkeypatch.setattr(export_context, "CONTEXT_DIR", tmp_path / "registry")
+    monkeypatch.setattr(export_context, "CACHE_FILE", tmp_path / ".cache" / "export_context.json")
+    (tmp_path / "repo_src/backend/pipelines/outline").mkdir(parents=True)
+    (tmp_path / "repo_src/frontend").mkdir(parents=True)
+    (tmp_path / "repo_src/backend/api.py").write_text('def ping():\n    """Health check."""\n')
+    (tmp_path / "repo_src/backend/pipelines/outline/README.md").write_text("# Outline\nBuilds outlines.\n")
+    return tmp_path
+
+def _names(registry, kind="backend"):
+    return sorted(f["name"] for f in registry.functions_of(kind))
+
+def test_registry_update_handles_modify_delete_and_rename(tree):
+    registry = Registry({}, jobs=1)
+    registry.write()
+    assert _names(registry) == ["ping"] and (tree / "registry/pipeline_context.md").exists()
+
+    api = tree / "repo_src/backend/api.py"
+    api.write_text('def ping():\n    """Health check."""\n\ndef pong():\n    """Reply."""\n')
+    assert registry.update({api}) == 1 and _names(registry) == ["ping", "pong"]
+
+    renamed = tree / "repo_src/backend/health.py"
+    api.rename(renamed)
+    registry.update({api, renamed})
+    assert set(registry.functions) == {"repo_src/backend/health.py"}
+
+    renamed.unlink()
+    registry.update({renamed})
+    assert _names(registry) == []
+
+    # Moving a pipeline directory away reports only the directory; its README is dropped with it.
+    pipeline_dir = tree / "repo_src/backend/pipelines/outline"
+    pipeline_dir.rename(tree / "outline-archived")
+    assert registry.update({pipeline_dir}) == 1 and registry.pipelines == {}
+    written = registry.write()
+    assert tree / "registry/pipeline_context.md" in written and not (tree / "registry/pipeline_context.md").exists()
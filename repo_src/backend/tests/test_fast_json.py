@@ -0,0 +1,53 @@
+import json
+import os
+import sys
+from datetime import datetime, timezone
+
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../..')))
+from repo_src.backend import fast_json
+from repo_src.backend.benchmarks.json_payloads import run
+from repo_src.backend.data import systemawriter_schemas as schemas
+from repo_src.backend.main import app
+from repo_src.backend.systemawriter_logic import core_logic
+
+client = TestClient(app)
+
+def test_models_and_plain_content_encode_like_the_stdlib(monkeypatch):
+    model = schemas.SceneBreakdownsResponseSchema(scene_breakdowns_by_chapter={"Chapter 1": "“Not yet,” Maya said — twice."})
+    assert json.loads(fast_json.dumps(model)) == model.model_dump()
+    assert "“Not yet,”".encode("utf-8") in fast_json.dumps(model)  # Unescaped UTF-8, as JSONResponse does
+
+    content = {"stats": {1: 2.5}, "when": datetime(2025, 1, 1, tzinfo=timezone.utc), "items": [model]}
+    decoded = fast_json.loads(fast_json.dumps(content))
+    assert decoded["stats"] == {"1": 2.5} and decoded["when"].startswith("2025-01-01T00:00:00")
+    assert decoded["items"][0]["scene_breakdowns_by_chapter"]["Chapter 1"].startswith("“Not yet")
+
+    # Without orjson the stdlib produces the same bytes.
+    plain = {"scene": "“Not yet,” Maya said.", "tokens": [1, 2]}
+    encoded = fast_json.dumps(plain)
+    monkeypatch.setattr(fast_json, "orjson", None)
+    assert fast_json.dumps(plain) == encoded and fast_json.loads(encoded) == plain
+
+def test_router_decodes_and_encodes_with_the_fast_path(monkeypatch):
+    async def fake_worldbuilding(concept_document, approved_outline):
+        return f"World of {concept_document}"
+
+    monkeypatch.setattr(core_logic, "generate_worldbuilding_logic", fake_worldbuilding)
+    response = client.post("/api/systemawriter/generate-worldbuilding", json={
+        "concept_document": "Kepler Station ✦", "approved_outline_md": "## Chapter 1",
+    })
+    assert response.status_code == 200 and response.headers["content-type"] == "application/json"
+    assert response.json() == {"worldbuilding_md": "World of Kepler Station ✦"}
+
+    malformed = client.post(
+        "/api/systemawriter/generate-worldbuilding", content=b'{"concept_document": ', headers={"content-type": "application/json"},
+    )
+    assert malformed.status_code == 422 and malformed.json()["detail"][0]["type"] == "json_invalid"
+    assert client.get("/api/systemawriter/scheduler-stats").status_code == 200
+
+def test_benchmark_covers_every_path():
+    results = run(chapters=3, repeat=1)
+    assert {(r.payload, r.path) for r in results} >= {("response", "fast-json"), ("request", "stdlib")}
+    assert all(r.ms > 0 and r.peak_mb > 0 for r in results)
@@ -0,0 +1,37 @@
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../..')))
+from repo_src.scripts import gemini_prd_generator as prd
+
+def _sources():
+    return iter([(f"module_{i}.py", f"def word_{i}(): pass\n" * (300 + i * 37)) for i in range(40)])
+
+def test_max_chunks_caps_the_chunks_sent():
+    pieces, _ = prd.select_pieces(_sources(), "word prd", 2000, 5)
+    assert len(list(prd.pack_chunks(pieces, 2000))) > 5  # Packing in order leaves gaps
+    chunks, kept = prd.fit_chunks(pieces, 2000, 5)
+    assert len(chunks) == 5 and all(chunk.tokens <= 2000 for chunk in chunks)
+    assert min(p.score for p in kept) >= max(p.score for p in pieces if p not in kept)
+
+def test_each_thread_uses_its_own_session(monkeypatch):
+    used = []
+    call_gemini = prd.call_gemini
+
+    def recording_call(session, *args, **kwargs):
+        used.append((threading.get_ident(), session))
+        return call_gemini(session, *args, **kwargs)
+
+    monkeypatch.setattr(prd, "call_gemini", recording_call)
+    server, endpoint = prd.start_stand_in_server()
+    try:
+        result = prd.send_to_gemini(_sources(), "word prd", "key", endpoint=endpoint, chunk_tokens=2000,
+                                    max_chunks=5, concurrency=3)
+    finally:
+        server.shutdown()
+    assert result.startswith("Stand-in response")
+    sessions = {}
+    for thread, session in used:
+        assert sessions.setdefault(thread, session) is session
+    assert len({id(s) for s in sessions.values()}) == len(sessions) > 1
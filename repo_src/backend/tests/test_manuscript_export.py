@@ -0,0 +1,147 @@
+import io
+import os
+import sys
+import zipfile
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import StaticPool
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../..')))
+from repo_src.backend.database.connection import Base, get_async_db, get_async_session_factory
+from repo_src.backend.main import app
+
+async_engine_test = create_async_engine("sqlite+aiosqlite:///:memory:", poolclass=StaticPool)
+TestingAsyncSessionLocal = async_sessionmaker(async_engine_test, expire_on_commit=False)
+
+async def override_get_async_db():
+    async with TestingAsyncSessionLocal() as session:
+        yield session
+
+@pytest.fixture()
+def client():
+    import asyncio
+
+    async def reset():
+        async with async_engine_test.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+            await conn.run_sync(Base.metadata.create_all)
+
+    asyncio.run(reset())
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    app.dependency_overrides[get_async_session_factory] = lambda: TestingAsyncSessionLocal
+    yield TestClient(app)
+    app.dependency_overrides.pop(get_async_db, None)
+    app.dependency_overrides.pop(get_async_session_factory, None)
+
+def _seed_project(client) -> str:
+    project_id = client.post("/api/systemawriter/projects", json={"title": "Kepler Station"}).json()["id"]
+    base = f"/api/systemawriter/projects/{project_id}/artifacts"
+    # Inserted out of order on purpose: export must follow chapter/scene indexes.
+    scenes = [
+        (1, "Chapter 2: The Choice", 0, "Maya *decides*."),
+        (0, "Chapter 1: Anomalies", 1, "The AI speaks."),
+        (0, "Chapter 1: Anomalies", 0, "Maya runs **diagnostics**."),
+    ]
+    for chapter_index, chapter_title, scene_index, content in scenes:
+        response = client.put(base, json={
+            "kind": "scene_narrative", "content": content, "chapter_index": chapter_index,
+            "chapter_title": chapter_title, "scene_index": scene_index,
+        })
+        assert response.status_code == 200
+    client.put(base, json={"kind": "outline", "content": "## Chapter 1: Anomalies"})
+    return project_id
+
+def test_markdown_export_streams_in_chapter_order(client):
+    project_id = _seed_project(client)
+    response = client.get(f"/api/systemawriter/projects/{project_id}/export?format=md&include_notes=true")
+    assert response.status_code == 200
+    assert "Kepler_Station_Story.md" in response.headers["content-disposition"]
+    body = response.text
+    assert body.startswith("# Kepler Station")
+    assert body.index("# Story Outline") < body.index("# Full Story Narrative")
+    order = [body.index(s) for s in ("diagnostics", "The AI speaks", "## Chapter 2: The Choice", "decides")]
+    assert order == sorted(order)
+    assert body.count("## Chapter 1: Anomalies") == 2  # Once in the outline notes, once as chapter header
+
+def test_epub_and_docx_exports_are_valid_containers(client):
+    project_id = _seed_project(client)
+
+    epub = client.get(f"/api/systemawriter/projects/{project_id}/export?format=epub")
+    assert epub.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(epub.content)) as zf:
+        assert zf.namelist()[0] == "mimetype"
+        assert zf.read("mimetype") == b"application/epub+zip"
+        assert "OEBPS/chapter-0002.xhtml" in zf.namelist()
+        assert b"<strong>diagnostics</strong>" in zf.read("OEBPS/chapter-0001.xhtml")
+        assert b"chapter-0002.xhtml" in zf.read("OEBPS/content.opf")
+
+    docx = client.get(f"/api/systemawriter/projects/{project_id}/export?format=docx")
+    assert docx.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(docx.content)) as zf:
+        document = zf.read("word/document.xml").decode()
+    assert document.index("Chapter 1: Anomalies") < document.index("Chapter 2: The Choice")
+    assert "<w:b/></w:rPr><w:t xml:space=\"preserve\">diagnostics" in document
+
+def test_export_unknown_project_returns_404(client):
+    assert client.get("/api/systemawriter/projects/missing/export").status_code == 404
+
+def test_zip_exports_convert_scenes_off_the_event_loop(monkeypatch):
+    import asyncio
+    import threading
+    from repo_src.backend.adapters.artifact_store import SceneText
+    from repo_src.backend.systemawriter_logic import manuscript_export
+
+    converted_on = []
+    original = manuscript_export._markdown_to_xhtml
+
+    def recording(text):
+        converted_on.append(threading.get_ident())
+        return original(text)
+
+    monkeypatch.setattr(manuscript_export, "_markdown_to_xhtml", recording)
+
+    async def scenes():
+        for i in range(3):
+            yield SceneText(chapter_index=i // 2, chapter_title=f"Chapter {i // 2 + 1}", scene_index=i % 2, content=f"Scene {i}")
+
+    async def run():
+        spool = manuscript_export.new_spool_file()
+        chapters = await manuscript_export.build_epub("Kepler", scenes(), spool)
+        return chapters, threading.get_ident(), b"".join([chunk async for chunk in manuscript_export.iter_spooled_file(spool)])
+
+    chapters, loop_thread, data = asyncio.run(run())
+    assert chapters == 2 and len(converted_on) == 3 and loop_thread not in converted_on
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert b"Scene 2" in zf.read("OEBPS/chapter-0002.xhtml")
+
+def test_generated_scenes_are_exported(client, monkeypatch):
+    from repo_src.backend.systemawriter_logic import core_logic
+    from repo_src.backend.systemawriter_logic.continuity import continuity_store
+
+    async def fake_long(prompt_text, system_message=""):
+        return "Maya seals the breach." if "Scene 2.1" in prompt_text else "Maya hears the alarm."
+
+    async def no_state(*args):
+        return ""
+
+    monkeypatch.setattr(core_logic, "ask_llm_long", fake_long)
+    monkeypatch.setattr(continuity_store, "state_before", no_state)
+    monkeypatch.setattr(continuity_store, "record_scene", lambda *args: None)
+    project_id = client.post("/api/systemawriter/projects", json={"title": "Kepler Station"}).json()["id"]
+    shared = {"approved_worldbuilding_md": "Deck 3 is flooded.", "full_approved_outline_md": "## Chapter 1", "project_id": project_id}
+
+    single = client.post("/api/systemawriter/generate-scene-narrative", json={
+        **shared, "chapter_index": 0, "scene_index": 0, "chapter_title": "Chapter 1: Anomalies",
+        "scene_plan_from_breakdown": "Scene 1.1", "full_chapter_scene_breakdown": "- Scene 1.1",
+    })
+    batch = client.post("/api/systemawriter/generate-scene-narratives", json={**shared, "scenes": [{
+        "chapter_index": 1, "scene_index": 0, "chapter_title": "Chapter 2: The Choice",
+        "scene_plan_from_breakdown": "Scene 2.1", "full_chapter_scene_breakdown": "- Scene 2.1",
+    }]})
+    assert single.status_code == 200 and batch.status_code == 200
+
+    body = client.get(f"/api/systemawriter/projects/{project_id}/export?format=md").text
+    order = [body.index(s) for s in ("## Chapter 1: Anomalies", "Maya hears the alarm.", "## Chapter 2: The Choice", "Maya seals the breach.")]
+    assert order == sorted(order)
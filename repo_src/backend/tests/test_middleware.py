@@ -0,0 +1,101 @@
+import gzip
+import os
+import sys
+import zlib
+
+from fastapi import FastAPI, Body
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../..')))
+from repo_src.backend import middleware
+from repo_src.backend.middleware import CompressionMiddleware, RequestBodyMiddleware, negotiate_encoding
+
+test_app = FastAPI()
+test_app.add_middleware(RequestBodyMiddleware, limits={"/small": 64}, default_limit=10_000)
+test_app.add_middleware(CompressionMiddleware, minimum_size=100)
+
+@test_app.post("/echo")
+async def echo(payload: dict = Body(...)):
+    return payload
+
+@test_app.post("/small")
+async def small(payload: dict = Body(...)):
+    return {"ok": True}
+
+@test_app.get("/stream")
+async def stream():
+    async def chunks():
+        for i in range(5):
+            yield f'{{"scene": {i}, "text": "{"lorem " * 50}"}}\n'.encode()
+    return StreamingResponse(chunks(), media_type="application/x-ndjson")
+
+client = TestClient(test_app)
+
+def test_negotiate_encoding_respects_q_values():
+    assert negotiate_encoding("gzip, br") == "br"
+    assert negotiate_encoding("br;q=0, gzip") == "gzip"
+    assert negotiate_encoding("identity") is None
+    assert negotiate_encoding(None) is None
+
+def test_large_responses_are_compressed_and_small_ones_are_not():
+    big = {"text": "word " * 500}
+    response = client.post("/echo", json=big, headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert response.json() == big  # httpx transparently decodes
+
+    response = client.post("/echo", json={"a": 1}, headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+
+def test_streamed_responses_are_compressed_per_chunk():
+    response = client.get("/stream", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    lines = response.text.strip().split("\n")
+    assert len(lines) == 5
+
+def test_gzip_request_bodies_are_decompressed():
+    raw = b'{"chapter": "one", "text": "' + b"x" * 5000 + b'"}'
+    response = client.post(
+        "/echo", content=gzip.compress(raw),
+        headers={"Content-Encoding": "gzip", "Content-Type": "application/json"},
+    )
+    assert response.status_code == 200
+    assert response.json()["chapter"] == "one"
+
+def test_oversized_bodies_get_413():
+    response = client.post("/small", json={"text": "x" * 200})
+    assert response.status_code == 413
+    assert "64 byte limit" in response.json()["detail"]
+
+def test_compressed_bombs_are_rejected_after_decompression():
+    bomb = gzip.compress(b'{"text": "' + b"a" * 50_000 + b'"}')
+    assert len(bomb) < 10_000
+    response = client.post("/echo", content=bomb, headers={"Content-Encoding": "gzip", "Content-Type": "application/json"})
+    assert response.status_code == 413
+
+def test_unknown_content_encoding_is_rejected():
+    response = client.post("/echo", content=b"{}", headers={"Content-Encoding": "zstd", "Content-Type": "application/json"})
+    assert response.status_code == 415
+
+def test_deflate_bodies_with_or_without_a_zlib_header_are_decompressed():
+    raw = b'{"chapter": "one"}'
+    compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+    for body in (zlib.compress(raw), compressor.compress(raw) + compressor.flush()):
+        response = client.post("/echo", content=body, headers={"Content-Encoding": "deflate", "Content-Type": "application/json"})
+        assert response.status_code == 200 and response.json() == {"chapter": "one"}
+
+def test_brotli_bodies_are_refused_without_a_bounded_decompressor(monkeypatch):
+    monkeypatch.setattr(middleware, "BROTLI_REQUESTS", False)
+    response = client.post("/echo", content=b"{}", headers={"Content-Encoding": "br", "Content-Type": "application/json"})
+    assert response.status_code == 415
+
+def test_rejections_carry_cors_headers():
+    from repo_src.backend.main import app, settings
+    origin = settings.cors_origins[0]
+    response = TestClient(app).post(
+        "/api/systemawriter/generate-outline", content=b"x" * (300 * 1024),
+        headers={"Origin": origin, "Content-Type": "application/json"},
+    )
+    assert response.status_code == 413
+    assert response.headers["access-control-allow-origin"] == origin
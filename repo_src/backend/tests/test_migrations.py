@@ -0,0 +1,40 @@
+import asyncio
+import os
+import sys
+
+from alembic.autogenerate import compare_metadata
+from alembic.runtime.migration import MigrationContext
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.ext.asyncio import create_async_engine
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../..')))
+from repo_src.backend.database import setup
+from repo_src.backend.database.connection import Base
+
+
+def test_migrations_match_models(tmp_path):
+    """Upgrading an empty database to head yields exactly the schema the models declare."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'migrate.db'}")
+    with engine.begin() as conn:
+        setup._check_and_migrate(conn)
+    with engine.connect() as conn:
+        assert setup._current_revision(conn) == setup.get_head_revision()
+        diff = compare_metadata(MigrationContext.configure(conn), Base.metadata)
+        indexes = {ix["name"] for ix in inspect(conn).get_indexes("artifacts")}
+    engine.dispose()
+    assert diff == []
+    assert {"ix_artifacts_project_id", "ix_artifacts_content_hash", "ix_artifacts_updated_at"} <= indexes
+
+
+def test_async_startup_check_is_idempotent(tmp_path):
+    async def run():
+        async_engine_test = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'startup.db'}")
+        for _ in range(2):  # Second startup only reads alembic_version
+            async with async_engine_test.begin() as conn:
+                await conn.run_sync(setup._check_and_migrate)
+        async with async_engine_test.connect() as conn:
+            revision = await conn.run_sync(setup._current_revision)
+        await async_engine_test.dispose()
+        return revision
+
+    assert asyncio.run(run()) == setup.get_head_revision()
@@ -0,0 +1,76 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../..')))
+from repo_src.backend.systemawriter_logic import prompts, retrieval
+from repo_src.backend.systemawriter_logic.retrieval import BM25Index, chunk_markdown, document_key
+
+def _worldbuilding(extra_characters: int = 40) -> str:
+    parts = ["# Worldbuilding", "## Main Characters"]
+    parts += [
+        "- **Maya Chen**: station engineer on Kepler Station, distrusts the AI.",
+        "- **ARIA**: the station's emergent AI, speaks in riddles.",
+    ]
+    parts += [f"- **Crew Member {i}**: works in hydroponics bay {i}, tends the algae vats." for i in range(extra_characters)]
+    parts += ["## Setting Details", "### The Observatory Deck", "- Glass dome where Maya runs diagnostics at night."]
+    parts += ["### Hydroponics", "- Humid bays full of algae vats and grow lights."]
+    return "\n".join(parts)
+
+def test_chunks_keep_their_heading_path():
+    chunks = chunk_markdown(_worldbuilding(extra_characters=0), max_chars=120)
+    assert any(c.startswith("# Worldbuilding\n## Setting Details\n### The Observatory Deck\n") for c in chunks)
+    assert all(len(c) <= 200 for c in chunks)
+
+def test_search_ranks_named_character_and_setting_first():
+    index = BM25Index.build(chunk_markdown(_worldbuilding(), max_chars=200))
+    top = [index.chunk(i) for i in index.search("Maya runs diagnostics in the Observatory", k=2)]
+    assert any("Observatory Deck" in c for c in top)
+    assert any("Maya Chen" in c for c in top)
+
+def test_index_is_persisted_and_memory_mapped(tmp_path):
+    document = _worldbuilding()
+    retrieval._open_indexes.clear()
+    built = retrieval.index_for(document, index_dir=str(tmp_path))
+    key = document_key(document)
+    assert {p.name for p in tmp_path.iterdir()} == {f"{key}.{suffix}" for suffix in retrieval.INDEX_FILES + ("json",)}
+
+    loaded = BM25Index.load(str(tmp_path), key)
+    assert all(isinstance(part, memoryview) for part in (loaded.terms, loaded.vocab, loaded.postings, loaded.spans))
+    assert loaded.lookup("aria") == built.lookup("aria") and loaded.lookup("zeppelin") is None
+    query = "ARIA speaks"
+    assert loaded.search(query) == built.search(query)
+    assert [loaded.chunk(i) for i in loaded.search(query)] == [built.chunk(i) for i in built.search(query)]
+
+def test_index_directory_evicts_least_recently_used(tmp_path, monkeypatch):
+    retrieval._open_indexes.clear()
+    documents = [_worldbuilding() + f"\n- Revision {n}" for n in range(3)]
+    retrieval.index_for(documents[0], index_dir=str(tmp_path))
+    size = sum(p.stat().st_size for p in tmp_path.iterdir())
+    monkeypatch.setattr(retrieval, "RETRIEVAL_INDEX_MAX_BYTES", size * 2.5)
+    retrieval.index_for(documents[1], index_dir=str(tmp_path))
+    os.utime(tmp_path / f"{document_key(documents[1])}.json", (1, 1))  # Long unused
+    retrieval._open_indexes.clear()  # Indexes open in this process are never evicted
+    retrieval.index_for(documents[2], index_dir=str(tmp_path))
+
+    kept = {p.name.split(".")[0] for p in tmp_path.iterdir()}
+    assert kept == {document_key(documents[0]), document_key(documents[2])}
+
+def test_scene_prompt_includes_only_relevant_worldbuilding(monkeypatch, tmp_path):
+    monkeypatch.setattr(retrieval, "RETRIEVAL_INDEX_DIR", str(tmp_path))
+    monkeypatch.setattr(retrieval, "RETRIEVAL_MIN_CHARS", 500)
+    monkeypatch.setattr(retrieval, "RETRIEVAL_TOP_K", 3)
+    worldbuilding = _worldbuilding(extra_characters=120)
+    prompt = prompts.get_scene_narrative_prompt(
+        scene_plan_from_breakdown="- **Characters Present:** Maya\n- **Setting:** Observatory Deck",
+        chapter_title="Chapter 1: Anomalies",
+        full_chapter_scene_breakdown="breakdown",
+        approved_worldbuilding=worldbuilding,
+        full_approved_outline="## Chapter 1: Anomalies\n- Maya notices odd readings.",
+    )
+    assert "Observatory Deck" in prompt and "Maya Chen" in prompt
+    assert "Crew Member 90" not in prompt
+    assert prompt.count("Crew Member") < worldbuilding.count("Crew Member") // 2
+
+    # Short documents are passed through untouched.
+    monkeypatch.setattr(retrieval, "RETRIEVAL_MIN_CHARS", 10 ** 6)
+    assert "Crew Member 90" in prompts.get_scene_breakdowns_prompt("Chapter 1", "summary", worldbuilding, "outline")
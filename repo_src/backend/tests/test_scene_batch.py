@@ -0,0 +1,86 @@
+import asyncio
+import json
+import os
+import sys
+
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../..')))
+from repo_src.backend.main import app
+from repo_src.backend.systemawriter_logic import core_logic
+from repo_src.backend.systemawriter_logic.cancellation import iter_completed
+
+def _payload(plans, **extra):
+    return {
+        "approved_worldbuilding_md": "## Main Characters\n- Maya",
+        "full_approved_outline_md": "## Chapter 1: Anomalies",
+        "scenes": [
+            {"id": f"s{i}", "scene_plan_from_breakdown": plan, "chapter_title": "Chapter 1: Anomalies",
+             "full_chapter_scene_breakdown": "breakdown"}
+            for i, plan in enumerate(plans)
+        ],
+        **extra,
+    }
+
+def test_batch_streams_scenes_in_completion_order(monkeypatch):
+    running = 0
+    peak = 0
+
+    async def fake_ask_llm(prompt_text, system_message=""):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        try:
+            if "PLAN-slow" in prompt_text:
+                await asyncio.sleep(0.2)
+                return "slow scene"
+            if "PLAN-broken" in prompt_text:
+                return "Error: HTTP 500 from LLM API."
+            await asyncio.sleep(0.01)
+            return "fast scene"
+        finally:
+            running -= 1
+
+    monkeypatch.setattr(core_logic, "ask_llm_long", fake_ask_llm)
+    client = TestClient(app)
+    response = client.post(
+        "/api/systemawriter/generate-scene-narratives",
+        json=_payload(["PLAN-slow", "PLAN-fast", "PLAN-broken", "PLAN-fast"], max_concurrency=2),
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+
+    assert lines[-1] == {"done": True, "completed": 3, "failed": 1}
+    results = lines[:-1]
+    # The slow first scene does not hold back the others.
+    assert results[-1] == {"index": 0, "id": "s0", "scene_narrative_md": "slow scene"}
+    assert {r["id"]: r.get("error") for r in results}["s2"].startswith("Error:")
+    assert peak == 2
+
+def test_batch_rejects_empty_scene_list():
+    client = TestClient(app)
+    assert client.post("/api/systemawriter/generate-scene-narratives", json=_payload([])).status_code == 422
+
+def test_closing_iter_completed_cancels_running_and_skips_unstarted():
+    started, cancelled = [], []
+
+    def job(i):
+        async def run():
+            started.append(i)
+            try:
+                await asyncio.sleep(0 if i == 0 else 10)
+            except asyncio.CancelledError:
+                cancelled.append(i)
+                raise
+            return i
+        return run
+
+    async def scenario():
+        results = iter_completed([job(i) for i in range(5)], limit=2)
+        first = await results.__anext__()
+        await results.aclose()
+        return first
+
+    assert asyncio.run(scenario()) == (0, 0)
+    assert started == [0, 1] and cancelled == [1]
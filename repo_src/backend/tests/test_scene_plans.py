@@ -0,0 +1,114 @@
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import StaticPool
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../..')))
+from repo_src.backend.database.connection import Base, get_async_db, get_async_session_factory
+from repo_src.backend.main import app
+from repo_src.backend.systemawriter_logic import core_logic, llm_interface, scene_plans
+from repo_src.backend.systemawriter_logic.continuity import continuity_store
+
+async_engine_test = create_async_engine("sqlite+aiosqlite:///:memory:", poolclass=StaticPool)
+TestingAsyncSessionLocal = async_sessionmaker(async_engine_test, expire_on_commit=False)
+
+OUTLINE = "## Chapter 1: Anomalies\nMaya finds a fault.\n\n## Chapter 2: The Choice\nMaya decides."
+
+def _scene(title, event):
+    return {"title": title, "goal": f"{title} matters", "characters": ["Maya"], "key_events": [event],
+            "setting": "Deck 3", "information_revealed": "", "tone": "tense"}
+
+async def override_get_async_db():
+    async with TestingAsyncSessionLocal() as session:
+        yield session
+
+@pytest.fixture()
+def client():
+    async def reset():
+        async with async_engine_test.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+            await conn.run_sync(Base.metadata.create_all)
+
+    asyncio.run(reset())
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    app.dependency_overrides[get_async_session_factory] = lambda: TestingAsyncSessionLocal
+    yield TestClient(app)
+    app.dependency_overrides.pop(get_async_db, None)
+    app.dependency_overrides.pop(get_async_session_factory, None)
+
+def test_replies_are_validated_and_retried_with_the_errors(monkeypatch):
+    replies = iter([
+        '```json\n{"scenes": [{"title": "Alarm"}]}\n```',
+        'Here you go: {"scenes": [' + json.dumps(_scene("Alarm", "The alarm sounds.")) + ']}',
+    ])
+    calls = []
+
+    async def fake_choices(prompt_text, system_message, n, response_format=None):
+        calls.append((prompt_text, response_format))
+        return [llm_interface._Completion(next(replies), "stop")]
+
+    monkeypatch.setattr(llm_interface, "_ask_llm_choices", fake_choices)
+    plans = asyncio.run(scene_plans.ask_for_chapter_plans("Plan chapter 1.", "system"))
+    assert [p.title for p in plans.scenes] == ["Alarm"]
+    assert calls[0][1]["type"] == "json_schema" and calls[0][1]["json_schema"]["schema"] == scene_plans.CHAPTER_PLANS_SCHEMA
+    assert "did not match the required JSON format" in calls[1][0] and "goal" in calls[1][0]
+
+    with pytest.raises(ValueError):
+        scene_plans.parse_chapter_plans('{"scenes": []}')
+
+def test_scenes_are_stored_and_narrated_by_position(client, monkeypatch):
+    async def fake_json(prompt_text, json_schema, schema_name, system_message=""):
+        if "The chapter is: **Chapter 2" in prompt_text:
+            return "Error: HTTP 500 from LLM API."
+        return json.dumps({"scenes": [_scene("Alarm", "The alarm sounds."), _scene("Vent", "Maya crawls the vent.")]})
+
+    monkeypatch.setattr(scene_plans, "ask_llm_json", fake_json)
+    project_id = client.post("/api/systemawriter/projects", json={"title": "Kepler Station"}).json()["id"]
+    response = client.post("/api/systemawriter/generate-scene-breakdowns", json={
+        "approved_outline_md": OUTLINE, "approved_worldbuilding_md": "Deck 3 is flooded.",
+        "structured": True, "project_id": project_id,
+    })
+    assert response.status_code == 200
+    body = response.json()
+    assert [s["title"] for s in body["scenes_by_chapter"]["Chapter 1: Anomalies"]] == ["Alarm", "Vent"]
+    assert "- **Scene Number:** Scene 1.2: Vent" in body["scene_breakdowns_by_chapter"]["Chapter 1: Anomalies"]
+    assert body["scene_breakdowns_by_chapter"]["Chapter 2: The Choice"].startswith("Error:")
+    assert "Chapter 2: The Choice" not in body["scenes_by_chapter"]
+
+    plan = client.get(f"/api/systemawriter/projects/{project_id}/scene-plans/0/1").json()
+    assert plan["key_events"] == ["Maya crawls the vent."] and plan["scene_index"] == 1
+    assert len(client.get(f"/api/systemawriter/projects/{project_id}/scene-plans/0").json()) == 2
+    assert client.get(f"/api/systemawriter/projects/{project_id}/scene-plans/0/2").status_code == 404
+
+    prompts_seen = []
+
+    async def fake_long(prompt_text, system_message=""):
+        prompts_seen.append(prompt_text)
+        return "Maya squeezes into the vent."
+
+    monkeypatch.setattr(core_logic, "ask_llm_long", fake_long)
+    monkeypatch.setattr(continuity_store, "record_scene", lambda *args: None)
+    response = client.post("/api/systemawriter/generate-scene-narrative", json={
+        "project_id": project_id, "chapter_index": 0, "scene_index": 1,
+        "approved_worldbuilding_md": "Deck 3 is flooded.", "full_approved_outline_md": OUTLINE,
+    })
+    assert response.status_code == 200 and response.json()["scene_narrative_md"] == "Maya squeezes into the vent."
+    # Only this scene's plan is sent in full; the others appear as one-line summaries.
+    assert "**Current Chapter:** Chapter 1: Anomalies" in prompts_seen[0]
+    assert "Maya crawls the vent." in prompts_seen[0] and "The alarm sounds." not in prompts_seen[0]
+    assert "Scene 1.1: Alarm - Alarm matters" in prompts_seen[0]
+
+    missing = client.post("/api/systemawriter/generate-scene-narrative", json={
+        "project_id": project_id, "chapter_index": 1, "scene_index": 0,
+        "approved_worldbuilding_md": "", "full_approved_outline_md": OUTLINE,
+    })
+    assert missing.status_code == 404
+    incomplete = client.post("/api/systemawriter/generate-scene-narrative", json={
+        "chapter_index": 0, "scene_index": 0, "approved_worldbuilding_md": "", "full_approved_outline_md": OUTLINE,
+    })
+    assert incomplete.status_code == 422
@@ -0,0 +1,150 @@
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../..')))
+from repo_src.backend.main import app
+from repo_src.backend.systemawriter_logic import core_logic
+from repo_src.backend.systemawriter_logic.scheduler import (
+    LLMScheduler, DeadlineExceeded, llm_context, current_llm_context,
+)
+
+async def _hold(scheduler, order, name, release, **slot_kwargs):
+    async with scheduler.slot(**slot_kwargs):
+        order.append(name)
+        await release.wait()
+
+def test_interactive_waiters_are_served_before_batch_and_speculative():
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=1, interactive_reserved=0)
+        order, release = [], asyncio.Event()
+        blocker = asyncio.create_task(_hold(scheduler, order, "blocker", release))
+        await asyncio.sleep(0)
+        waiters = [
+            asyncio.create_task(_hold(scheduler, order, name, release, priority=priority))
+            for name, priority in (("spec", "speculative"), ("batch", "batch"), ("interactive", "interactive"))
+        ]
+        await asyncio.sleep(0)
+        assert scheduler.queue_depth() == {"interactive": 1, "batch": 1, "speculative": 1}
+        release.set()
+        await asyncio.gather(blocker, *waiters)
+        return order
+
+    assert asyncio.run(scenario()) == ["blocker", "interactive", "batch", "spec"]
+
+def test_users_are_served_round_robin_within_a_class():
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=1, interactive_reserved=0)
+        order, release = [], asyncio.Event()
+        blocker = asyncio.create_task(_hold(scheduler, order, "blocker", release))
+        await asyncio.sleep(0)
+        waiters = [asyncio.create_task(_hold(scheduler, order, f"a{i}", release, user_id="a")) for i in range(3)]
+        waiters.append(asyncio.create_task(_hold(scheduler, order, "b0", release, user_id="b")))
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(blocker, *waiters)
+        return order
+
+    # User b's single call goes second, not after all of user a's fan-out.
+    assert asyncio.run(scenario()) == ["blocker", "a0", "b0", "a1", "a2"]
+
+def test_expired_deadline_is_rejected_without_taking_a_slot():
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=1, interactive_reserved=0)
+        order, release = [], asyncio.Event()
+        blocker = asyncio.create_task(_hold(scheduler, order, "blocker", release))
+        await asyncio.sleep(0)
+        with pytest.raises(DeadlineExceeded):
+            async with scheduler.slot(deadline=time.monotonic() + 0.02):
+                order.append("late")
+        release.set()
+        await blocker
+        return order, scheduler.snapshot()
+
+    order, snapshot = asyncio.run(scenario())
+    assert order == ["blocker"]
+    assert snapshot["classes"]["interactive"]["deadline_expired"] == 1
+    assert snapshot["in_flight"] == 0 and snapshot["classes"]["interactive"]["queued"] == 0
+
+def test_batch_leaves_reserved_slots_for_interactive():
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=3, interactive_reserved=1, speculative_max=1)
+        order, release = [], asyncio.Event()
+        tasks = [asyncio.create_task(_hold(scheduler, order, f"batch{i}", release, priority="batch")) for i in range(3)]
+        tasks += [asyncio.create_task(_hold(scheduler, order, f"spec{i}", release, priority="speculative")) for i in range(2)]
+        await asyncio.sleep(0)
+        admitted_before_interactive = list(order)
+        tasks.append(asyncio.create_task(_hold(scheduler, order, "interactive", release)))
+        await asyncio.sleep(0)
+        snapshot = scheduler.snapshot()
+        release.set()
+        await asyncio.gather(*tasks)
+        return admitted_before_interactive, order, snapshot
+
+    before, order, snapshot = asyncio.run(scenario())
+    assert before == ["batch0", "batch1"]  # Third slot is reserved; speculative waits behind batch
+    assert order[2] == "interactive"
+    assert snapshot["classes"]["batch"]["queued"] == 1 and snapshot["classes"]["speculative"]["queued"] == 2
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=1, interactive_reserved=0)
+        order, release = [], asyncio.Event()
+        blocker = asyncio.create_task(_hold(scheduler, order, "blocker", release))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(_hold(scheduler, order, "cancelled", release))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        release.set()
+        await blocker
+        return order, scheduler.snapshot()
+
+    order, snapshot = asyncio.run(scenario())
+    assert order == ["blocker"]
+    assert snapshot["in_flight"] == 0 and snapshot["classes"]["interactive"]["queued"] == 0
+
+def test_breakdown_fan_out_runs_as_batch_but_never_raises_priority(monkeypatch):
+    seen = []
+
+    async def fake_ask_llm(prompt_text, system_message=""):
+        seen.append(current_llm_context()["priority"])
+        return "breakdown"
+
+    monkeypatch.setattr(core_logic, "ask_llm", fake_ask_llm)
+    outline = "## Chapter 1: A\nx\n## Chapter 2: B\ny"
+
+    asyncio.run(core_logic.generate_all_scene_breakdowns_logic(outline, "world"))
+
+    async def speculative_run():
+        with llm_context(priority="speculative"):
+            await core_logic.generate_all_scene_breakdowns_logic(outline, "world")
+
+    asyncio.run(speculative_run())
+    assert seen == ["batch", "batch", "speculative", "speculative"]
+
+def test_router_tags_llm_calls_with_user_and_priority(monkeypatch):
+    seen = []
+
+    async def fake_ask_llm(prompt_text, system_message=""):
+        seen.append(current_llm_context())
+        return "# Outline"
+
+    monkeypatch.setattr(core_logic, "ask_llm", fake_ask_llm)
+    client = TestClient(app)
+    response = client.post(
+        "/api/systemawriter/generate-outline",
+        json={"concept_document": "A story"},
+        headers={"X-User-ID": "alice", "X-LLM-Priority": "batch", "X-LLM-Deadline-Ms": "5000"},
+    )
+    assert response.status_code == 200
+    assert seen[0]["user_id"] == "alice" and seen[0]["priority"] == "batch"
+    assert seen[0]["deadline"] is not None
+
+    assert client.post("/api/systemawriter/generate-outline", json={"concept_document": "A story"},
+                       headers={"X-LLM-Priority": "urgent"}).status_code == 400
+    assert set(client.get("/api/systemawriter/scheduler-stats").json()["classes"]) == {"interactive", "batch", "speculative"}
@@ -0,0 +1,80 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../..')))
+from repo_src.backend import server
+from repo_src.backend.database import setup
+from repo_src.backend.settings import Settings
+from repo_src.backend.systemawriter_logic import continuity, core_logic
+from repo_src.backend.systemawriter_logic.speculative import prefetcher
+
+def test_uvicorn_options_follow_the_settings():
+    single = server.uvicorn_options(Settings.from_env({}))
+    assert single["loop"] == "auto" and single["http"] == "auto" and "workers" not in single
+    assert single["timeout_graceful_shutdown"] == 30 and single["limit_concurrency"] is None
+
+    options = server.uvicorn_options(Settings.from_env({
+        "WEB_CONCURRENCY": "4", "SERVER_LOOP": "uvloop", "SERVER_HTTP": "httptools",
+        "SERVER_LIMIT_CONCURRENCY": "200", "SERVER_BACKLOG": "512", "SERVER_MAX_REQUESTS": "10000",
+    }))
+    assert options["workers"] == 4 and options["loop"] == "uvloop" and options["http"] == "httptools"
+    assert options["limit_concurrency"] == 200 and options["backlog"] == 512 and options["limit_max_requests"] == 10000
+
+    with pytest.raises(ValueError):
+        server.uvicorn_options(Settings.from_env({"SERVER_LOOP": "trio"}))
+
+def test_workers_initialise_the_database_one_at_a_time(monkeypatch):
+    running, overlaps, calls = [0], [], []
+
+    async def fake_init_db_async():
+        running[0] += 1
+        overlaps.append(running[0])
+        await asyncio.sleep(0.05)
+        calls.append(1)
+        running[0] -= 1
+
+    monkeypatch.setattr(setup, "init_db_async", fake_init_db_async)
+    monkeypatch.delenv(setup.DB_READY_ENV, raising=False)
+
+    async def run():
+        await asyncio.gather(setup.init_db_once(), setup.init_db_once(), setup.init_db_once())
+
+    asyncio.run(run())
+    assert len(calls) == 3 and max(overlaps) == 1
+
+    # Workers spawned by the launcher skip the check entirely.
+    monkeypatch.setenv(setup.DB_READY_ENV, setup.database_fingerprint())
+    asyncio.run(setup.init_db_once())
+    assert len(calls) == 3
+
+def test_shutdown_drains_continuity_and_cancels_speculation(monkeypatch):
+    folded = []
+
+    async def slow_fold(previous_state, chapter_title, scene_text):
+        await asyncio.sleep(0.05)
+        folded.append(scene_text)
+        return ""  # Nothing to store
+
+    async def slow_llm(prompt_text, system_message=""):
+        await asyncio.sleep(10)
+        return "never"
+
+    async def no_state(*args):
+        return ""
+
+    monkeypatch.setattr(continuity, "fold_scene_into_state", slow_fold)
+    monkeypatch.setattr(continuity.continuity_store, "state_before", no_state)
+    monkeypatch.setattr(core_logic, "ask_llm", slow_llm)
+
+    async def run():
+        continuity.continuity_store.record_scene(None, "p1", 0, 0, "Chapter 1", "Maya wakes.")
+        prefetcher.schedule("p1", "worldbuilding", {"concept_document": "c", "approved_outline": "## Chapter 1"})
+        await asyncio.sleep(0)
+        await server.drain_background_work(timeout=5)
+
+    asyncio.run(run())
+    assert folded == ["Maya wakes."]
+    assert prefetcher.snapshot()["pending"] == 0
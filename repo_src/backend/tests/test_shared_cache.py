@@ -0,0 +1,137 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../..')))
+from repo_src.backend.systemawriter_logic import core_logic, shared_cache
+from repo_src.backend.systemawriter_logic.shared_cache import MemoryCache, SQLiteCache
+from repo_src.backend.systemawriter_logic.speculative import SpeculativePrefetcher, _shared_key, inputs_hash
+
+def test_concurrent_callers_share_one_computation():
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.02)
+        return {"notes": f"computed #{len(calls)}"}
+
+    async def run():
+        cache = MemoryCache()
+        results = await asyncio.gather(*(cache.get_or_compute("k", compute) for _ in range(5)))
+        again = await cache.get_or_compute("k", compute)
+        failed = await cache.get_or_compute("e", lambda: asyncio.sleep(0, "Error: x"), cacheable=lambda r: not r.startswith("Error:"))
+        return cache, results, again, failed
+
+    cache, results, again, failed = asyncio.run(run())
+    assert calls == [1] and results == [{"notes": "computed #1"}] * 5 and again == results[0]
+    assert failed == "Error: x" and asyncio.run(cache.get("e")) is None
+    assert cache.stats.computed == 2 and cache.stats.hits == 1
+
+def test_sqlite_workers_wait_for_each_others_leases(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    worker_a, worker_b = SQLiteCache(path, poll_interval=0.01), SQLiteCache(path, poll_interval=0.01)
+    computed_by = []
+
+    def compute(worker):
+        async def run():
+            computed_by.append(worker)
+            await asyncio.sleep(0.1)
+            return f"summary from {worker}"
+        return run
+
+    async def run():
+        first = asyncio.create_task(worker_a.get_or_compute("summary", compute("a")))
+        await asyncio.sleep(0.02)  # a holds the lease; b finds it and waits
+        second = await worker_b.get_or_compute("summary", compute("b"))
+        return await first, second
+
+    assert asyncio.run(run()) == ("summary from a", "summary from a")
+    assert computed_by == ["a"] and worker_b.stats.waited > 0
+
+    # A released lease (failed computation) lets the next caller compute.
+    async def failing():
+        raise RuntimeError("LLM down")
+
+    async def retry():
+        try:
+            await worker_a.get_or_compute("other", failing)
+        except RuntimeError:
+            pass
+        return await worker_b.get_or_compute("other", compute("b"))
+
+    assert asyncio.run(retry()) == "summary from b"
+
+def test_sqlite_store_is_bounded_and_expires(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "cache.sqlite3"), max_bytes=1000)
+
+    async def run():
+        for i in range(10):
+            await cache.set(f"k{i}", "x" * 200)
+        await cache.set("short", "y", ttl=0.01)
+        await asyncio.sleep(0.02)
+        return [await cache.get(f"k{i}") for i in range(10)], await cache.get("short")
+
+    values, short = asyncio.run(run())
+    assert values[-1] == "x" * 200 and values[0] is None  # Oldest evicted first
+    assert cache.snapshot()["bytes"] <= 1000 and cache.stats.evicted > 0
+    assert short is None
+
+def test_speculation_is_claimable_from_another_worker(tmp_path, monkeypatch):
+    monkeypatch.setattr(shared_cache, "cache", SQLiteCache(str(tmp_path / "cache.sqlite3"), poll_interval=0.01))
+    calls = []
+
+    async def fake_ask_llm(prompt_text, system_message=""):
+        calls.append(prompt_text)
+        await asyncio.sleep(0.05)
+        return "worldbuilding"
+
+    monkeypatch.setattr(core_logic, "ask_llm", fake_ask_llm)
+    inputs = {"concept_document": "A station AI wakes up.", "approved_outline": "## Chapter 1\n- Discovery"}
+
+    async def run():
+        speculating, approving = SpeculativePrefetcher(token_budget=100_000), SpeculativePrefetcher(token_budget=100_000)
+        speculating.schedule("p1", "worldbuilding", dict(inputs))
+        key = _shared_key(inputs_hash("worldbuilding", inputs))
+        while not await shared_cache.cache.contains(key):  # Until the speculation holds its lease
+            await asyncio.sleep(0.005)
+        result = await approving.take("p1", "worldbuilding", dict(inputs))  # Waits for the running speculation
+        return approving, result, await approving.take("p1", "worldbuilding", dict(inputs))
+
+    approving, result, second = asyncio.run(run())
+    assert result == "worldbuilding" and len(calls) == 1 and approving.stats.hits == 1
+    assert second is None  # Claimed once
+
+def test_misses_skip_the_shared_lookup_unless_it_can_help(tmp_path, monkeypatch):
+    class CountingCache(SQLiteCache):
+        takes = 0
+
+        async def _take(self, key):
+            CountingCache.takes += 1
+            return await super()._take(key)
+
+    inputs = {"concept_document": "c", "approved_outline": "## Chapter 1"}
+
+    async def run():
+        prefetcher = SpeculativePrefetcher(token_budget=100_000)
+        monkeypatch.setattr(shared_cache, "cache", MemoryCache())
+        assert await prefetcher.take("p1", "worldbuilding", inputs) is None  # Not shared between processes
+
+        monkeypatch.setattr(shared_cache, "cache", CountingCache(str(tmp_path / "cache.sqlite3")))
+        assert await prefetcher.take("p1", "worldbuilding", inputs) is None  # Nothing stored or leased
+        assert CountingCache.takes == 0
+
+        await shared_cache.cache.set(_shared_key(inputs_hash("worldbuilding", inputs)), "from another worker")
+        assert await SpeculativePrefetcher(token_budget=0).take("p1", "worldbuilding", inputs) is None  # Disabled
+        return await prefetcher.take("p1", "worldbuilding", inputs)
+
+    assert asyncio.run(run()) == "from another worker" and CountingCache.takes == 1
+
+def test_backends_must_implement_every_primitive():
+    class Incomplete(shared_cache.SharedCache):
+        async def _lookup(self, key):
+            return None
+
+    with pytest.raises(TypeError, match="_claim"):
+        Incomplete()
@@ -0,0 +1,90 @@
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../..')))
+from repo_src.backend.systemawriter_logic import core_logic
+from repo_src.backend.systemawriter_logic.scheduler import current_llm_context, llm_context
+from repo_src.backend.systemawriter_logic.speculative import SpeculativePrefetcher
+
+@pytest.fixture()
+def llm_calls(monkeypatch):
+    calls = []
+
+    async def fake_ask_llm(prompt_text, system_message=""):
+        calls.append(prompt_text)
+        await asyncio.sleep(0.01)
+        return f"generated #{len(calls)}"
+
+    monkeypatch.setattr(core_logic, "ask_llm", fake_ask_llm)
+    return calls
+
+INPUTS = {"concept_document": "A station AI wakes up.", "approved_outline": "## Chapter 1\n- Discovery"}
+
+def test_unchanged_approval_is_served_from_speculation(llm_calls):
+    async def run():
+        prefetcher = SpeculativePrefetcher(token_budget=100_000)
+        assert prefetcher.schedule_next("p1", "outline", dict(INPUTS))
+        result = await prefetcher.take("p1", "worldbuilding", dict(INPUTS))
+        return prefetcher, result
+
+    prefetcher, result = asyncio.run(run())
+    assert result == "generated #1"
+    assert len(llm_calls) == 1
+    assert prefetcher.stats.hits == 1
+
+def test_edited_artifact_cancels_stale_speculation(llm_calls):
+    async def run():
+        prefetcher = SpeculativePrefetcher(token_budget=100_000)
+        prefetcher.schedule("p1", "worldbuilding", dict(INPUTS))
+        edited = {**INPUTS, "approved_outline": "## Chapter 1\n- Discovery, rewritten"}
+        result = await prefetcher.take("p1", "worldbuilding", edited)
+        await asyncio.sleep(0.05)
+        return prefetcher, result
+
+    prefetcher, result = asyncio.run(run())
+    assert result is None
+    assert prefetcher.stats.discarded == 1
+    assert prefetcher.stats.misses == 1
+    assert prefetcher.snapshot()["pending"] == 0
+
+def test_budget_cap_blocks_speculation(llm_calls):
+    async def run():
+        prefetcher = SpeculativePrefetcher(token_budget=100)  # Less than one call's max_tokens
+        return prefetcher, prefetcher.schedule("p1", "worldbuilding", dict(INPUTS))
+
+    prefetcher, started = asyncio.run(run())
+    assert started is False
+    assert prefetcher.stats.skipped_over_budget == 1
+    assert llm_calls == []
+
+def test_speculation_runs_detached_from_the_request_deadline(monkeypatch):
+    seen = []
+
+    async def fake_ask_llm(prompt_text, system_message=""):
+        seen.append(current_llm_context())
+        return "generated"
+
+    monkeypatch.setattr(core_logic, "ask_llm", fake_ask_llm)
+
+    async def run():
+        prefetcher = SpeculativePrefetcher(token_budget=100_000)
+        with llm_context(priority="interactive", user_id="u1", deadline=time.monotonic() + 0.01):
+            prefetcher.schedule("p1", "worldbuilding", dict(INPUTS))
+        return await prefetcher.take("p1", "worldbuilding", dict(INPUTS))
+
+    assert asyncio.run(run()) == "generated"
+    assert seen == [{"priority": "speculative", "user_id": "u1", "deadline": None}]
+
+def test_unclaimed_speculations_expire_without_further_scheduling(llm_calls):
+    async def run():
+        prefetcher = SpeculativePrefetcher(token_budget=100_000, ttl=0.05)
+        prefetcher.schedule("p1", "worldbuilding", dict(INPUTS))
+        await asyncio.sleep(0.1)
+        return prefetcher
+
+    prefetcher = asyncio.run(run())
+    assert len(llm_calls) == 1 and prefetcher.snapshot()["pending"] == 0 and prefetcher.stats.discarded == 1
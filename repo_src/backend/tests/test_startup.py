@@ -0,0 +1,41 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../..')))
+from repo_src.backend.benchmarks.cold_start import cumulative_ms, lazily_imported_violations, parse_importtime
+from repo_src.backend.settings import SHARED_CACHE_BACKENDS, Settings, get_settings
+
+IMPORTTIME = """\
+import time: self [us] | cumulative | imported package
+import time:       272 |        272 |   _io
+import time:      1200 |       1500 |     sqlalchemy.sql
+import time:       300 |       1800 |   sqlalchemy
+import time:      2106 |     821135 | repo_src.backend.main
+"""
+
+def test_settings_are_typed_and_loaded_once():
+    settings = Settings.from_env({"PORT": "9001", "LOG_LEVEL": "DEBUG", "CORS_ORIGINS": "http://a, http://b,", "DB_POOL_TIMEOUT": "2.5"})
+    assert settings.port == 9001 and settings.log_level == "debug"
+    assert settings.cors_origins == ("http://a", "http://b")
+    assert settings.db_pool_timeout == 2.5
+    assert settings.async_database_url is None and settings.openrouter_api_key is None
+    assert get_settings() is get_settings()
+
+def test_shared_cache_backend_is_validated_when_settings_load():
+    assert Settings.from_env({"SHARED_CACHE_BACKEND": "Off"}).shared_cache_backend == "none"
+    assert Settings.from_env({}).shared_cache_backend == "memory"
+    with pytest.raises(ValueError, match="SHARED_CACHE_BACKEND must be one of memory, sqlite, none"):
+        Settings.from_env({"SHARED_CACHE_BACKEND": "redis"})
+    from repo_src.backend.systemawriter_logic import shared_cache
+    assert set(SHARED_CACHE_BACKENDS) == set(shared_cache.BACKENDS)
+
+def test_importtime_report_is_parsed():
+    timings = parse_importtime(IMPORTTIME)
+    assert [t.module for t in timings] == ["_io", "sqlalchemy.sql", "sqlalchemy", "repo_src.backend.main"]
+    assert [t.depth for t in timings] == [1, 2, 1, 0]
+    assert cumulative_ms(timings, "repo_src.backend.main") == 821.135
+
+def test_app_import_leaves_optional_subsystems_unloaded():
+    assert lazily_imported_violations() == []
@@ -0,0 +1,119 @@
+import asyncio
+import os
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../..')))
+from repo_src.backend.main import app
+from repo_src.backend.systemawriter_logic import core_logic
+
+@pytest.fixture()
+def fake_llm(monkeypatch):
+    async def fake_stream_llm(prompt_text, system_message=""):
+        for word in ["Maya ", "opened ", "the ", "hatch."]:
+            await asyncio.sleep(0)
+            yield word
+
+    async def slow_stream_llm(prompt_text, system_message=""):
+        yield "Once "
+        await asyncio.sleep(30)
+        yield "never"
+
+    monkeypatch.setattr(core_logic, "stream_llm", fake_stream_llm)
+    monkeypatch.setattr(core_logic, "stream_llm_long", fake_stream_llm)
+    return monkeypatch, slow_stream_llm
+
+CONTEXT = {
+    "concept_document": "A station AI wakes up.",
+    "approved_outline_md": "## Chapter 1\n- Discovery",
+    "approved_worldbuilding_md": "## Main Characters\n- Maya",
+}
+
+def _collect_until(ws, predicate):
+    events = []
+    while True:
+        event = ws.receive_json()
+        events.append(event)
+        if predicate(event):
+            return events
+
+def test_session_streams_tokens_and_result(fake_llm):
+    client = TestClient(app)
+    with client.websocket_connect("/api/systemawriter/session/p1") as ws:
+        ws.send_json({"type": "context", "data": CONTEXT})
+        assert ws.receive_json()["type"] == "ack"
+        ws.send_json({"type": "generate", "id": "s1", "stage": "scene_narrative", "params": {
+            "scene_plan_from_breakdown": "Scene 1.1", "chapter_title": "Chapter 1",
+            "full_chapter_scene_breakdown": "- Scene 1.1",
+        }})
+        events = _collect_until(ws, lambda e: e["type"] == "result")
+    tokens = "".join(e["delta"] for e in events if e["type"] == "token")
+    assert events[0]["type"] == "started"
+    assert tokens == "Maya opened the hatch."
+    assert events[-1]["result"] == "Maya opened the hatch."
+
+def test_session_reports_missing_context():
+    client = TestClient(app)
+    with client.websocket_connect("/api/systemawriter/session/p1") as ws:
+        ws.send_json({"type": "generate", "id": "w1", "stage": "worldbuilding"})
+        event = ws.receive_json()
+    assert event["type"] == "error"
+    assert "approved_outline_md" in event["detail"]
+
+def test_session_cancel_stops_generation(fake_llm):
+    monkeypatch, slow_stream_llm = fake_llm
+    monkeypatch.setattr(core_logic, "stream_llm", slow_stream_llm)
+    client = TestClient(app)
+    with client.websocket_connect("/api/systemawriter/session/p1") as ws:
+        ws.send_json({"type": "context", "data": CONTEXT})
+        ws.receive_json()
+        ws.send_json({"type": "generate", "id": "o1", "stage": "outline"})
+        _collect_until(ws, lambda e: e["type"] == "token")
+        ws.send_json({"type": "cancel", "id": "o1"})
+        events = _collect_until(ws, lambda e: e["type"] in ("cancelled", "result"))
+    assert events[-1] == {"type": "cancelled", "id": "o1"}
+
+def test_tokens_buffered_while_the_queue_is_full_still_flush(monkeypatch):
+    from repo_src.backend.systemawriter_logic import ws_session
+
+    class FakeSocket:
+        def __init__(self):
+            self.sent = []
+
+        async def send_json(self, event):
+            self.sent.append(event)
+
+    monkeypatch.setattr(ws_session, "WS_SEND_QUEUE_SIZE", 1)
+    monkeypatch.setattr(ws_session, "WS_MAX_TASKS", 2)
+
+    async def run():
+        session = ws_session.ProjectSession(FakeSocket(), "p1")
+        await session.emit({"type": "pong"})  # Queue now full
+        session.emit_token("t1", "Maya ")  # Buffered, no room for its flush marker
+        writer = asyncio.create_task(session._writer())
+        await asyncio.sleep(0.01)  # Writer sends the pong, then queues the marker itself
+        session.emit_token("t1", "opened.")
+        await asyncio.sleep(0.01)
+        writer.cancel()
+        for task_id in ("a", "b", "c"):
+            session._requests[task_id] = ("outline", {})
+        await session._start("d", "outline", {"concept_document": "x"})
+        await session._cancel("d")
+        return session
+
+    session = asyncio.run(run())
+    tokens = [e for e in session.websocket.sent if e["type"] == "token"]
+    assert "".join(e["delta"] for e in tokens) == "Maya opened." and not session._unqueued
+    assert list(session._requests) == ["c", "d"]  # Only the WS_MAX_TASKS most recent can be regenerated
+
+def test_malformed_params_and_context_get_error_frames(fake_llm):
+    client = TestClient(app)
+    with client.websocket_connect("/api/systemawriter/session/p1") as ws:
+        ws.send_json({"type": "context", "data": ["not", "an", "object"]})
+        assert ws.receive_json()["detail"] == "context data must be a JSON object"
+        ws.send_json({"type": "generate", "id": "o1", "stage": "outline", "params": "concept"})
+        assert ws.receive_json() == {"type": "error", "id": "o1", "detail": "params must be a JSON object"}
+        ws.send_json({"type": "ping"})  # The session is still serving
+        assert ws.receive_json() == {"type": "pong"}
@@ -1,8 +1,18 @@
+export interface Candidate {
+    index: number;
+    text: string;
+    score: number;
+    signals: { [signal: string]: number };
+}
+
 interface ConceptInput {
     concept_document: string;
+    candidates?: number;
+    rank_candidates?: boolean;
 }
 interface OutlineResponse {
     outline_md: string;
+    candidates?: Candidate[] | null;
 }
 
 interface GenerateWorldbuildingInput {
@@ -16,21 +26,66 @@ interface WorldbuildingResponse {
 interface GenerateSceneBreakdownsInput {
     approved_outline_md: string;
     approved_worldbuilding_md: string;
+    structured?: boolean; // JSON scene plans, stored per scene when project_id is set
+    project_id?: string;
+}
+export interface ScenePlan {
+    chapter_index: number;
+    scene_index: number;
+    title: string;
+    goal: string;
+    characters: string[];
+    key_events: string[];
+    setting: string;
+    information_revealed: string;
+    tone: string;
 }
 interface SceneBreakdownsResponse {
     scene_breakdowns_by_chapter: { [key: string]: string };
+    scenes_by_chapter?: { [key: string]: ScenePlan[] } | null; // Structured mode only
 }
 
+// Either the scene inline (plan, chapter title and breakdown), or project_id with
+// chapter_index and scene_index of a stored scene plan.
 interface GenerateSceneNarrativeInput {
-    scene_plan_from_breakdown: string;
-    chapter_title: string;
-    full_chapter_scene_breakdown: string;
+    scene_plan_from_breakdown?: string;
+    chapter_title?: string;
+    full_chapter_scene_breakdown?: string;
     approved_worldbuilding_md: string;
     full_approved_outline_md: string;
     writing_style_notes?: string;
+    candidates?: number;
+    rank_candidates?: boolean;
+    project_id?: string;
+    chapter_index?: number;
+    scene_index?: number;
 }
 interface SceneNarrativeResponse {
     scene_narrative_md: string;
+    candidates?: Candidate[] | null;
+}
+
+interface BatchSceneItem {
+    id?: string;
+    scene_plan_from_breakdown?: string; // Omit the three to use the stored scene plan
+    chapter_title?: string;
+    full_chapter_scene_breakdown?: string;
+    chapter_index?: number;
+    scene_index?: number;
+}
+interface GenerateSceneNarrativesBatchInput {
+    approved_worldbuilding_md: string;
+    full_approved_outline_md: string;
+    writing_style_notes?: string;
+    project_id?: string;
+    scenes: BatchSceneItem[];
+    max_concurrency?: number;
+}
+export interface BatchSceneResult {
+    index: number;
+    id: string | null;
+    scene_narrative_md?: string;
+    error?: string;
 }
 
 
@@ -78,4 +133,181 @@ export const generateSceneNarrative = async (apiUrl: string, payload: GenerateSc
         body: JSON.stringify(payload),
     });
     return handleResponse(response);
-}; 
\ No newline at end of file
+}; 
+
+export const getScenePlans = async (apiUrl: string, projectId: string, chapterIndex: number): Promise<ScenePlan[]> => {
+    const response = await fetch(`${apiUrl}${API_BASE_PATH}/projects/${projectId}/scene-plans/${chapterIndex}`);
+    return handleResponse(response);
+};
+
+// --- Stored projects and manuscript export ---
+// Scenes generated with project_id, chapter_index and scene_index are stored on the
+// server; other artifacts (outline, worldbuilding, edited scenes) are saved with upsertArtifact.
+
+export type ArtifactKind = 'concept' | 'outline' | 'worldbuilding' | 'scene_breakdown' | 'scene_narrative';
+export type ExportFormat = 'md' | 'epub' | 'docx';
+export interface StoredProject {
+    id: string;
+    title: string;
+    owner_id?: string | null;
+    created_at?: string | null;
+    updated_at?: string | null;
+}
+interface ArtifactInput {
+    kind: ArtifactKind;
+    content: string;
+    chapter_index?: number; // Required for scene_breakdown and scene_narrative
+    chapter_title?: string;
+    scene_index?: number;
+    approved?: boolean;
+}
+export interface StoredArtifact {
+    id: number;
+    project_id: string;
+    kind: ArtifactKind;
+    chapter_index: number | null;
+    chapter_title: string | null;
+    scene_index: number | null;
+    content_hash: string;
+    approved: boolean;
+    updated_at: string | null;
+}
+
+export const createStoredProject = async (apiUrl: string, title: string, ownerId?: string): Promise<StoredProject> => {
+    const response = await fetch(`${apiUrl}${API_BASE_PATH}/projects`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ title, owner_id: ownerId }),
+    });
+    return handleResponse(response);
+};
+
+export const upsertArtifact = async (apiUrl: string, projectId: string, artifact: ArtifactInput): Promise<StoredArtifact> => {
+    const response = await fetch(`${apiUrl}${API_BASE_PATH}/projects/${encodeURIComponent(projectId)}/artifacts`, {
+        method: 'PUT',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(artifact),
+    });
+    return handleResponse(response);
+};
+
+// The manuscript is streamed as a download; point a link (or window.location) at this URL.
+export const manuscriptExportUrl = (apiUrl: string, projectId: string, format: ExportFormat = 'md', includeNotes = false): string => {
+    const query = new URLSearchParams({ format, include_notes: String(includeNotes) });
+    return `${apiUrl}${API_BASE_PATH}/projects/${encodeURIComponent(projectId)}/export?${query}`;
+};
+
+// --- Budgets ---
+// Read-only here: limits are set by operators with BUDGET_ADMIN_TOKEN (see README_backend.md),
+// which must never be shipped to the browser.
+
+export type BudgetScope = 'project' | 'user';
+export interface Budget {
+    scope: BudgetScope;
+    scope_id: string;
+    token_limit: number | null;
+    cost_limit_usd: number | null;
+    tokens_used: number;
+    cost_used_usd: number;
+    tokens_reserved: number;
+    cost_reserved_usd: number;
+}
+
+export const getBudget = async (apiUrl: string, scope: BudgetScope, scopeId: string): Promise<Budget> => {
+    const response = await fetch(`${apiUrl}${API_BASE_PATH}/budgets/${scope}/${encodeURIComponent(scopeId)}`);
+    return handleResponse(response);
+};
+
+// Generates many scenes in one request; `onScene` is called as each scene finishes (in completion order).
+export const generateSceneNarrativesBatch = async (
+    apiUrl: string,
+    payload: GenerateSceneNarrativesBatchInput,
+    onScene: (result: BatchSceneResult) => void,
+    signal?: AbortSignal,
+): Promise<{ completed: number; failed: number }> => {
+    const response = await fetch(`${apiUrl}${API_BASE_PATH}/generate-scene-narratives`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(payload),
+        signal,
+    });
+    if (!response.ok || !response.body) {
+        await handleResponse(response);
+        throw new Error(`HTTP error! status: ${response.status}`);
+    }
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffered = '';
+    let summary = { completed: 0, failed: 0 };
+    for (;;) {
+        const { value, done } = await reader.read();
+        buffered += decoder.decode(value, { stream: !done });
+        const lines = buffered.split('\n');
+        buffered = lines.pop() ?? '';
+        for (const line of lines) {
+            if (!line.trim()) continue;
+            const event = JSON.parse(line);
+            if (event.done) {
+                summary = { completed: event.completed, failed: event.failed };
+            } else {
+                onScene(event as BatchSceneResult);
+            }
+        }
+        if (done) break;
+    }
+    return summary;
+};
+
+// --- Project session (WebSocket) ---
+// One connection per open project: upload shared context once, then issue
+// generate/regenerate/cancel commands and receive streamed tokens and progress.
+
+export type SessionStage = 'outline' | 'worldbuilding' | 'scene_breakdowns' | 'scene_narrative';
+
+export interface SessionEvent {
+    type: 'ack' | 'started' | 'token' | 'progress' | 'result' | 'error' | 'cancelled' | 'pong';
+    id?: string | null;
+    stage?: SessionStage;
+    delta?: string;
+    chapter?: string;
+    breakdown_md?: string;
+    completed?: number;
+    total?: number;
+    result?: string | { [key: string]: string };
+    detail?: string;
+}
+
+export interface ProjectSession {
+    setContext: (data: Partial<GenerateSceneNarrativeInput & GenerateWorldbuildingInput & GenerateSceneBreakdownsInput>) => void;
+    generate: (id: string, stage: SessionStage, params?: Record<string, string>) => void;
+    regenerate: (id: string) => void;
+    cancel: (id: string) => void;
+    close: () => void;
+}
+
+export const openProjectSession = (apiUrl: string, projectId: string, onEvent: (event: SessionEvent) => void): ProjectSession => {
+    const wsUrl = `${apiUrl.replace(/^http/, 'ws')}${API_BASE_PATH}/session/${encodeURIComponent(projectId)}`;
+    const socket = new WebSocket(wsUrl);
+    const pending: string[] = [];
+
+    const send = (message: object) => {
+        const text = JSON.stringify(message);
+        if (socket.readyState === WebSocket.OPEN) {
+            socket.send(text);
+        } else {
+            pending.push(text);
+        }
+    };
+
+    socket.onopen = () => pending.splice(0).forEach(text => socket.send(text));
+    socket.onmessage = (message) => onEvent(JSON.parse(message.data) as SessionEvent);
+    socket.onerror = () => onEvent({ type: 'error', id: null, detail: 'Session connection error' });
+
+    return {
+        setContext: (data) => send({ type: 'context', data }),
+        generate: (id, stage, params = {}) => send({ type: 'generate', id, stage, params }),
+        regenerate: (id) => send({ type: 'regenerate', id }),
+        cancel: (id) => send({ type: 'cancel', id }),
+        close: () => socket.close(),
+    };
+};
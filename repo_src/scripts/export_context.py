@@ -5,22 +5,54 @@ Walk backend & frontend dirs and emit:
   registry/backend_context.md     - Backend summary
   registry/pipeline_context.md    - Pipeline summary
   registry/function_registry.json           - Machine-readable for LLM prompts
+
+Only files whose path, mtime, size or content hash changed since the last run
+are re-parsed: per-file results are cached in .cache/export_context.json, and
+changed files are parsed in parallel across a process pool.
+
+With --watch the script keeps running after the export, picks up changed
+.py/.ts/.tsx/README files (inotify on Linux, mtime polling elsewhere),
+re-extracts only those files and atomically rewrites the outputs that changed.
+
+Usage:
+  python repo_src/scripts/export_context.py [--jobs N] [--no-cache]
+  python repo_src/scripts/export_context.py --watch [--poll] [--debounce SECONDS]
 """
+import argparse
 import ast
+import bisect
 import json
 import hashlib
 import pathlib
 import os
 import re
+import select
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
 from typing import List, Dict, Any, Optional
 
 # Get the root directory of the project
 ROOT = pathlib.Path(__file__).resolve().parents[2]
-BACKEND_PKGS = ["cce/backend"]
-FRONTEND_PKGS = ["cce/frontend"]
-PIPELINE_DOCS = ["cce/backend/pipelines"]
+BACKEND_PKGS = ["repo_src/backend"]
+FRONTEND_PKGS = ["repo_src/frontend"]
+PIPELINE_DOCS = ["repo_src/backend/pipelines"]
 OUTPUT_DIR = ROOT / "registry"
 CONTEXT_DIR = ROOT / "registry"
+CACHE_FILE = ROOT / ".cache" / "export_context.json"
+CACHE_VERSION = 2  # Bump whenever the extracted fields change, so stale entries are discarded
+PARALLEL_MIN_FILES = 16  # Below this, parsing in-process beats starting a pool
+DEBOUNCE_SECONDS = 0.3  # --watch: quiet period after the last change before the registry is rewritten
+OPTIONAL_OUTPUTS = ("pipeline_context.md",)  # Only written while there is something to put in them
+SKIP_DIRS = {"node_modules", "dist", "build", "__pycache__", ".venv", "venv", ".cache"}
+
+# Extract function components and hooks
+# This is a simplistic approach; a proper implementation would use a TypeScript parser
+COMPONENT_RE = re.compile(r'export\s+const\s+(\w+)(?:\s*:\s*React\.FC<.*?>)?\s*=\s*\(\{([^}]*)\}\)')
+HOOK_RE = re.compile(r'export\s+function\s+use(\w+)\s*\(([^)]*)\)')
+FUNCTION_RE = re.compile(r'(?:export\s+)?(?:async\s+)?function\s+(\w+)\s*\(([^)]*)\)')
+# JSDoc comments above functions
+JSDOC_RE = re.compile(r'/\*\*\s*([\s\S]*?)\s*\*/')
 
 
 def extract_docstring(node: ast.AST) -> str:
@@ -37,12 +69,21 @@ def extract_docstring(node: ast.AST) -> str:
     return doc.split("\n")[0]  # First line only
 
 
-def extract_function_info_python(file_path: pathlib.Path) -> List[Dict[str, Any]]:
+def _line_offsets(source: bytes) -> List[int]:
+    """Byte offset of the start of every line (ast positions are line number + UTF-8 byte column)."""
+    offsets = [0]
+    for line in source.splitlines(keepends=True):
+        offsets.append(offsets[-1] + len(line))
+    return offsets
+
+
+def extract_function_info_python(file_path: pathlib.Path, source: Optional[bytes] = None) -> List[Dict[str, Any]]:
     """
     Extract information about functions in a Python file.
     
     Args:
         file_path: Path to the Python file
+        source: The file's content, if already read
         
     Returns:
         List of dictionaries containing function information
@@ -55,7 +96,10 @@ def extract_function_info_python(file_path: pathlib.Path) -> List[Dict[str, Any]
     
     try:
         # Parse the file
-        node = ast.parse(file_path.read_text())
+        if source is None:
+            source = file_path.read_bytes()
+        node = ast.parse(source)
+        offsets = _line_offsets(source)
         
         # Extract information from each function definition
         for item in node.body:
@@ -66,8 +110,11 @@ def extract_function_info_python(file_path: pathlib.Path) -> List[Dict[str, Any]
                 # Get function docstring
                 doc = extract_docstring(item)
                 
-                # Generate a hash of the function for change detection
-                func_hash = hashlib.md5(ast.unparse(item).encode()).hexdigest()[:8]
+                # Hash the function's source (decorators included) for change detection
+                first = item.decorator_list[0] if item.decorator_list else item
+                start = offsets[first.lineno - 1] + first.col_offset
+                end = offsets[item.end_lineno - 1] + item.end_col_offset
+                func_hash = hashlib.md5(source[start:end]).hexdigest()[:8]
                 
                 functions.append({
                     "file": str(file_path.relative_to(ROOT)),
@@ -83,12 +130,39 @@ def extract_function_info_python(file_path: pathlib.Path) -> List[Dict[str, Any]
     return functions
 
 
-def extract_function_info_typescript(file_path: pathlib.Path) -> List[Dict[str, Any]]:
+def _jsdoc_summary(jsdoc_content: str) -> str:
+    """First description line of a JSDoc block (tags such as @param are skipped)."""
+    doc_lines = [line.strip().lstrip('*').strip() for line in jsdoc_content.split('\n')]
+    doc_lines = [line for line in doc_lines if line and not line.startswith('@')]
+    return doc_lines[0] if doc_lines else "No description"
+
+
+class _JSDocIndex:
+    """
+    All JSDoc blocks of a file, found in one scan, so each declaration can look
+    up the closest block ending before it by binary search instead of
+    re-scanning the file up to the declaration.
+    """
+
+    def __init__(self, content: str):
+        self.ends: List[int] = []
+        self.docs: List[str] = []
+        for match in JSDOC_RE.finditer(content):
+            self.ends.append(match.end())
+            self.docs.append(_jsdoc_summary(match.group(1)))
+
+    def doc_before(self, pos: int) -> str:
+        i = bisect.bisect_right(self.ends, pos) - 1
+        return self.docs[i] if i >= 0 else "No description"
+
+
+def extract_function_info_typescript(file_path: pathlib.Path, source: Optional[bytes] = None) -> List[Dict[str, Any]]:
     """
     Extract information about functions and components in a TypeScript/TSX file.
     
     Args:
         file_path: Path to the TypeScript file
+        source: The file's content, if already read
         
     Returns:
         List of dictionaries containing function information
@@ -101,107 +175,34 @@ def extract_function_info_typescript(file_path: pathlib.Path) -> List[Dict[str,
     
     try:
         # Read the file content
-        content = file_path.read_text()
-        
-        # Extract function components and hooks
-        # This is a simplistic approach; a proper implementation would use a TypeScript parser
-        component_pattern = r'export\s+const\s+(\w+)(?:\s*:\s*React\.FC<.*?>)?\s*=\s*\(\{([^}]*)\}\)'
-        hook_pattern = r'export\s+function\s+use(\w+)\s*\(([^)]*)\)'
-        function_pattern = r'(?:export\s+)?(?:async\s+)?function\s+(\w+)\s*\(([^)]*)\)'
+        content = source.decode("utf-8") if source is not None else file_path.read_text()
+        jsdoc = _JSDocIndex(content)
         
-        # Check for JSDoc comments above functions
-        jsdoc_pattern = r'/\*\*\s*([\s\S]*?)\s*\*/'
-        
-        # Find components
-        for match in re.finditer(component_pattern, content):
-            name = match.group(1)
+        def add(match: re.Match, name: str, kind: str) -> None:
             args = [arg.strip().split(':')[0].strip() for arg in match.group(2).split(',')] if match.group(2) else []
-            
-            # Try to find JSDoc above the component
-            doc = "No description"
-            start_pos = match.start()
-            jsdoc_matches = list(re.finditer(jsdoc_pattern, content[:start_pos]))
-            if jsdoc_matches:
-                last_jsdoc = jsdoc_matches[-1]
-                jsdoc_content = last_jsdoc.group(1)
-                # Extract the first line of the description
-                doc_lines = [line.strip().lstrip('*').strip() for line in jsdoc_content.split('\n')]
-                doc_lines = [line for line in doc_lines if line and not line.startswith('@')]
-                if doc_lines:
-                    doc = doc_lines[0]
-            
-            func_hash = hashlib.md5(match.group(0).encode()).hexdigest()[:8]
-            
             functions.append({
                 "file": str(file_path.relative_to(ROOT)),
                 "name": name,
                 "language": "typescript",
-                "type": "component",
+                "type": kind,
                 "args": args,
-                "doc": doc,
-                "hash": func_hash,
+                "doc": jsdoc.doc_before(match.start()),  # Nearest JSDoc above the declaration
+                "hash": hashlib.md5(match.group(0).encode()).hexdigest()[:8],
             })
         
+        # Find components
+        for match in COMPONENT_RE.finditer(content):
+            add(match, match.group(1), "component")
+        
         # Find hooks
-        for match in re.finditer(hook_pattern, content):
-            name = f"use{match.group(1)}"
-            args = [arg.strip().split(':')[0].strip() for arg in match.group(2).split(',')] if match.group(2) else []
-            
-            # Try to find JSDoc above the hook
-            doc = "No description"
-            start_pos = match.start()
-            jsdoc_matches = list(re.finditer(jsdoc_pattern, content[:start_pos]))
-            if jsdoc_matches:
-                last_jsdoc = jsdoc_matches[-1]
-                jsdoc_content = last_jsdoc.group(1)
-                # Extract the first line of the description
-                doc_lines = [line.strip().lstrip('*').strip() for line in jsdoc_content.split('\n')]
-                doc_lines = [line for line in doc_lines if line and not line.startswith('@')]
-                if doc_lines:
-                    doc = doc_lines[0]
-            
-            func_hash = hashlib.md5(match.group(0).encode()).hexdigest()[:8]
-            
-            functions.append({
-                "file": str(file_path.relative_to(ROOT)),
-                "name": name,
-                "language": "typescript",
-                "type": "hook",
-                "args": args,
-                "doc": doc,
-                "hash": func_hash,
-            })
+        for match in HOOK_RE.finditer(content):
+            add(match, f"use{match.group(1)}", "hook")
         
         # Find regular functions
-        for match in re.finditer(function_pattern, content):
+        for match in FUNCTION_RE.finditer(content):
             name = match.group(1)
             if name != "use" and not name.startswith('use'):  # Avoid matching hooks again
-                args = [arg.strip().split(':')[0].strip() for arg in match.group(2).split(',')] if match.group(2) else []
-                
-                # Try to find JSDoc above the function
-                doc = "No description"
-                start_pos = match.start()
-                jsdoc_matches = list(re.finditer(jsdoc_pattern, content[:start_pos]))
-                if jsdoc_matches:
-                    last_jsdoc = jsdoc_matches[-1]
-                    jsdoc_content = last_jsdoc.group(1)
-                    # Extract the first line of the description
-                    doc_lines = [line.strip().lstrip('*').strip() for line in jsdoc_content.split('\n')]
-                    doc_lines = [line for line in doc_lines if line and not line.startswith('@')]
-                    if doc_lines:
-                        doc = doc_lines[0]
-                
-                func_hash = hashlib.md5(match.group(0).encode()).hexdigest()[:8]
-                
-                functions.append({
-                    "file": str(file_path.relative_to(ROOT)),
-                    "name": name,
-                    "language": "typescript",
-                    "type": "function",
-                    "args": args,
-                    "doc": doc,
-                    "hash": func_hash,
-                })
+                add(match, name, "function")
     
     except Exception as e:
         print(f"Error processing {file_path}: {e}")
@@ -209,6 +210,117 @@ def extract_function_info_typescript(file_path: pathlib.Path) -> List[Dict[str,
     return functions
 
 
+def _extract(file_path: pathlib.Path, source: bytes) -> List[Dict[str, Any]]:
+    """Dispatches on the file type; module-level so it can run in pool workers."""
+    if file_path.suffix == ".py":
+        return extract_function_info_python(file_path, source)
+    return extract_function_info_typescript(file_path, source)
+
+
+def load_cache() -> Dict[str, Any]:
+    try:
+        cache = json.loads(CACHE_FILE.read_text())
+    except (OSError, ValueError):
+        return {}
+    return cache.get("files", {}) if cache.get("version") == CACHE_VERSION else {}
+
+
+def save_cache(entries: Dict[str, Any]) -> None:
+    CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+    tmp = CACHE_FILE.with_suffix(".tmp")
+    tmp.write_text(json.dumps({"version": CACHE_VERSION, "files": entries}))
+    os.replace(tmp, CACHE_FILE)  # Atomic: an interrupted run never leaves a truncated cache
+
+
+def extract_functions(
+    file_paths: List[pathlib.Path], cache: Dict[str, Any], jobs: Optional[int] = None
+) -> tuple[Dict[str, List[Dict[str, Any]]], Dict[str, Any], int]:
+    """
+    Returns (functions by relative path, new cache entries, number of files parsed).
+
+    A file is reused from the cache when its mtime and size are unchanged, or,
+    failing that, when its content hash is; everything else is re-parsed,
+    across a process pool when there are enough files to make it worthwhile.
+    """
+    entries: Dict[str, Any] = {}
+    pending: List[tuple[str, pathlib.Path, bytes, os.stat_result, str]] = []
+    for file_path in file_paths:
+        rel = str(file_path.relative_to(ROOT))
+        stat = file_path.stat()
+        cached = cache.get(rel)
+        if cached and cached["mtime_ns"] == stat.st_mtime_ns and cached["size"] == stat.st_size:
+            entries[rel] = cached
+            continue
+        source = file_path.read_bytes()
+        digest = hashlib.sha1(source).hexdigest()
+        if cached and cached["sha1"] == digest:  # Touched but not modified
+            entries[rel] = {**cached, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+            continue
+        pending.append((rel, file_path, source, stat, digest))
+
+    paths = [item[1] for item in pending]
+    sources = [item[2] for item in pending]
+    if len(pending) >= PARALLEL_MIN_FILES and jobs != 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(_extract, paths, sources, chunksize=8))
+    else:
+        results = [_extract(path, source) for path, source in zip(paths, sources)]
+
+    for (rel, _, _, stat, digest), functions in zip(pending, results):
+        entries[rel] = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "sha1": digest, "functions": functions}
+    return {rel: entry["functions"] for rel, entry in entries.items()}, entries, len(pending)
+
+
+def extract_pipeline_summary(readme_path: pathlib.Path) -> Optional[Dict[str, Any]]:
+    """
+    Extract the summary of one pipeline README file.
+    
+    Args:
+        readme_path: Path to the README file
+        
+    Returns:
+        Dictionary containing pipeline information, or None if it could not be read
+    """
+    try:
+        content = readme_path.read_text()
+        
+        # Extract the title (first heading)
+        title_match = re.search(r'^#\s+(.+)$', content, re.MULTILINE)
+        title = title_match.group(1) if title_match else os.path.basename(readme_path.parent)
+        
+        # Extract the first paragraph as summary
+        paragraph_match = re.search(r'^(?!#)(.+?)$', content, re.MULTILINE)
+        summary = paragraph_match.group(1).strip() if paragraph_match else "No description available"
+        
+        # Extract section headers for structure overview
+        sections = []
+        for section_match in re.finditer(r'^##\s+(.+)$', content, re.MULTILINE):
+            sections.append(section_match.group(1).strip())
+        
+        # Extract code examples
+        code_examples = []
+        for code_match in re.finditer(r'```python\s+(.*?)\s+```', content, re.DOTALL):
+            code = code_match.group(1).strip()
+            if len(code) > 0:
+                # Just take the first few lines as a sample
+                code_lines = code.split('\n')[:5]
+                if len(code_lines) < len(code.split('\n')):
+                    code_lines.append('# ...')
+                code_examples.append('\n'.join(code_lines))
+        
+        return {
+            "file": str(readme_path.relative_to(ROOT)),
+            "title": title,
+            "summary": summary,
+            "sections": sections,
+            "code_examples": code_examples[:1],  # Limit to first example
+            "path": str(readme_path.parent.relative_to(ROOT))
+        }
+    except Exception as e:
+        print(f"Error processing {readme_path}: {e}")
+        return None
+
+
 def extract_pipeline_summaries() -> List[Dict[str, Any]]:
     """
     Extract summaries from pipeline README files.
@@ -216,90 +328,64 @@ def extract_pipeline_summaries() -> List[Dict[str, Any]]:
     Returns:
         List of dictionaries containing pipeline information
     """
-    pipeline_info = []
-    
-    for pkg in PIPELINE_DOCS:
-        pkg_path = ROOT / pkg
-        # Find all README files in the pipeline directory
-        for readme_path in pkg_path.glob("**/README*.md"):
-            try:
-                content = readme_path.read_text()
-                
-                # Extract the title (first heading)
-                title_match = re.search(r'^#\s+(.+)$', content, re.MULTILINE)
-                title = title_match.group(1) if title_match else os.path.basename(readme_path.parent)
-                
-                # Extract the first paragraph as summary
-                paragraph_match = re.search(r'^(?!#)(.+?)$', content, re.MULTILINE)
-                summary = paragraph_match.group(1).strip() if paragraph_match else "No description available"
-                
-                # Extract section headers for structure overview
-                sections = []
-                for section_match in re.finditer(r'^##\s+(.+)$', content, re.MULTILINE):
-                    sections.append(section_match.group(1).strip())
-                
-                # Extract code examples
-                code_examples = []
-                for code_match in re.finditer(r'```python\s+(.*?)\s+```', content, re.DOTALL):
-                    code = code_match.group(1).strip()
-                    if len(code) > 0:
-                        # Just take the first few lines as a sample
-                        code_lines = code.split('\n')[:5]
-                        if len(code_lines) < len(code.split('\n')):
-                            code_lines.append('# ...')
-                        code_examples.append('\n'.join(code_lines))
-                
-                pipeline_info.append({
-                    "file": str(readme_path.relative_to(ROOT)),
-                    "title": title,
-                    "summary": summary,
-                    "sections": sections,
-                    "code_examples": code_examples[:1],  # Limit to first example
-                    "path": str(readme_path.parent.relative_to(ROOT))
-                })
-            except Exception as e:
-                print(f"Error processing {readme_path}: {e}")
-    
-    return pipeline_info
+    summaries = (extract_pipeline_summary(path) for path in _pipeline_readmes())
+    return [summary for summary in summaries if summary is not None]
 
 
-def main() -> None:
-    """
-    Main function that processes Python and TypeScript files and generates documentation.
-    """
-    backend_functions = []
-    frontend_functions = []
-    pipeline_summaries = []
-    
-    # Extract information from Python files (backend)
-    for pkg in BACKEND_PKGS:
-        pkg_path = ROOT / pkg
-        for file_path in pkg_path.rglob("*.py"):
-            functions = extract_function_info_python(file_path)
-            backend_functions.extend(functions)
-    
-    # Extract information from TypeScript/TSX files (frontend)
-    for pkg in FRONTEND_PKGS:
-        pkg_path = ROOT / pkg
-        for file_path in pkg_path.rglob("*.tsx"):
-            functions = extract_function_info_typescript(file_path)
-            frontend_functions.extend(functions)
-        for file_path in pkg_path.rglob("*.ts"):
-            functions = extract_function_info_typescript(file_path)
-            frontend_functions.extend(functions)
-    
-    # Extract information from pipeline documentation
-    pipeline_summaries = extract_pipeline_summaries()
-    
-    # Create output directories if they don't exist
-    OUTPUT_DIR.mkdir(exist_ok=True, parents=True)
+def _walk(pkgs: List[str]):
+    """(directory, file names) under each package, never descending into SKIP_DIRS."""
+    for pkg in pkgs:
+        for dirpath, dirnames, filenames in os.walk(ROOT / pkg):
+            dirnames[:] = sorted(d for d in dirnames if d not in SKIP_DIRS)
+            yield pathlib.Path(dirpath), sorted(filenames)
+
+
+def _source_files(pkgs: List[str], suffixes: tuple[str, ...]) -> List[pathlib.Path]:
+    """Files with the given suffixes under each package."""
+    return [dirpath / name for dirpath, filenames in _walk(pkgs) for name in filenames if name.endswith(suffixes)]
+
+
+def _pipeline_readmes() -> List[pathlib.Path]:
+    return [dirpath / name for dirpath, filenames in _walk(PIPELINE_DOCS) for name in filenames if _is_readme(name)]
+
+
+def _is_readme(name: str) -> bool:
+    return name.startswith("README") and name.endswith(".md")
+
+
+def _under(path: pathlib.Path, pkgs: List[str]) -> bool:
+    rel = path.relative_to(ROOT)
+    return not SKIP_DIRS.intersection(rel.parts) and any(rel.parts[:len(pathlib.PurePath(pkg).parts)] == pathlib.PurePath(pkg).parts for pkg in pkgs)
+
+
+def classify(path: pathlib.Path) -> Optional[str]:
+    """Which part of the registry a file feeds: "backend", "frontend", "pipeline" or None."""
+    try:
+        path.relative_to(ROOT)
+    except ValueError:
+        return None
+    if path.suffix == ".py" and _under(path, BACKEND_PKGS):
+        return "backend"
+    if path.suffix in (".ts", ".tsx") and _under(path, FRONTEND_PKGS):
+        return "frontend"
+    if _is_readme(path.name) and _under(path, PIPELINE_DOCS):
+        return "pipeline"
+    return None
+
+
+def render_registry(
+    backend_functions: List[Dict[str, Any]],
+    frontend_functions: List[Dict[str, Any]],
+    pipeline_summaries: List[Dict[str, Any]],
+) -> Dict[pathlib.Path, str]:
+    """Builds the content of every registry file, keyed by output path."""
+    outputs = {}
     
-    # Write machine-readable context (all functions)
+    # Machine-readable context (all functions)
     all_functions = backend_functions + frontend_functions
-    context_file = CONTEXT_DIR / "function_registry.json"
-    context_file.write_text(json.dumps(all_functions, indent=2))
+    outputs[CONTEXT_DIR / "function_registry.json"] = json.dumps(all_functions, indent=2)
     
-    # Write backend context file
+    # Backend context file
     backend_md_lines = ["# Backend Context", "", "A concise index of backend functionality.", ""]
     
     # Group backend functions by file path
@@ -318,10 +404,9 @@ def main() -> None:
             backend_md_lines.append(f"- `{func['name']}({args_str})`: {func['doc']}")
         backend_md_lines.append("")
     
-    backend_context_file = CONTEXT_DIR / "backend_context.md"
-    backend_context_file.write_text("\n".join(backend_md_lines))
+    outputs[CONTEXT_DIR / "backend_context.md"] = "\n".join(backend_md_lines)
     
-    # Write frontend context file
+    # Frontend context file
     frontend_md_lines = ["# Frontend Context", "", "A concise index of frontend functionality.", ""]
     
     # Group by type
@@ -350,10 +435,9 @@ def main() -> None:
             frontend_md_lines.append(f"- `{func['name']}({args_str})`: {func['doc']} ({func['file']})")
         frontend_md_lines.append("")
     
-    frontend_context_file = CONTEXT_DIR / "frontend_context.md"
-    frontend_context_file.write_text("\n".join(frontend_md_lines))
+    outputs[CONTEXT_DIR / "frontend_context.md"] = "\n".join(frontend_md_lines)
     
-    # Write pipeline context file
+    # Pipeline context file
     if pipeline_summaries:
         pipeline_md_lines = ["# Pipeline Context", "", "Summary of all pipelines in the application.", ""]
         
@@ -377,18 +461,288 @@ def main() -> None:
             pipeline_md_lines.append(f"\nLocated at: `{pipeline['path']}`")
             pipeline_md_lines.append("")
         
-        pipeline_context_file = CONTEXT_DIR / "pipeline_context.md"
-        pipeline_context_file.write_text("\n".join(pipeline_md_lines))
+        outputs[CONTEXT_DIR / "pipeline_context.md"] = "\n".join(pipeline_md_lines)
     
+    return outputs
+
+
+def write_atomic(path: pathlib.Path, content: str) -> bool:
+    """
+    Replaces `path` with `content` via a temp file + rename, so readers never see a
+    half-written file. Returns False (and leaves the file alone) if nothing changed.
+    """
+    try:
+        if path.read_text() == content:
+            return False
+    except OSError:
+        pass
+    path.parent.mkdir(exist_ok=True, parents=True)
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_text(content)
+    os.replace(tmp, path)
+    return True
+
+
+class Registry:
+    """
+    In-memory registry: functions per source file and pipeline summaries per
+    README. `update()` re-extracts only the given files; `write()` re-renders the
+    outputs and rewrites the ones whose content changed.
+    """
+
+    def __init__(self, cache: Dict[str, Any], jobs: Optional[int] = None):
+        self.jobs = jobs
+        files = _source_files(BACKEND_PKGS, (".py",)) + _source_files(FRONTEND_PKGS, (".tsx", ".ts"))
+        self.functions, self.cache_entries, self.parsed = extract_functions(files, cache, jobs=jobs)
+        self.pipelines = {}
+        for readme_path in _pipeline_readmes():
+            summary = extract_pipeline_summary(readme_path)
+            if summary is not None:
+                self.pipelines[summary["file"]] = summary
+
+    def _known_under(self, directory: pathlib.Path) -> set:
+        """Registry files (functions or pipeline READMEs) inside a directory that no longer exists."""
+        try:
+            prefix = str(directory.relative_to(ROOT)) + os.sep
+        except ValueError:
+            return set()
+        return {ROOT / rel for rel in self.functions.keys() | self.pipelines.keys() if rel.startswith(prefix)}
+
+    def update(self, paths: set) -> int:
+        """
+        Re-extracts the given (created, modified or deleted) files; returns how many affect the
+        registry. A deleted or moved-away directory drops every file the registry had under it.
+        """
+        expanded = set()
+        for path in paths:
+            expanded.add(path)
+            if not path.exists():
+                expanded |= self._known_under(path)
+        sources, affected = [], 0
+        for path in expanded:
+            kind = classify(path)
+            if kind is None:
+                continue
+            affected += 1
+            rel = str(path.relative_to(ROOT))
+            if kind == "pipeline":
+                summary = extract_pipeline_summary(path) if path.is_file() else None
+                if summary is None:
+                    self.pipelines.pop(rel, None)
+                else:
+                    self.pipelines[rel] = summary
+            elif path.is_file():
+                sources.append(path)
+            else:
+                self.functions.pop(rel, None)
+                self.cache_entries.pop(rel, None)
+        if sources:
+            functions, entries, _ = extract_functions(sources, self.cache_entries, jobs=self.jobs)
+            self.functions.update(functions)
+            self.cache_entries.update(entries)
+        return affected
+
+    def functions_of(self, kind: str) -> List[Dict[str, Any]]:
+        return [f for rel in sorted(self.functions) if classify(ROOT / rel) == kind for f in self.functions[rel]]
+
+    def render(self) -> Dict[pathlib.Path, str]:
+        pipelines = [self.pipelines[rel] for rel in sorted(self.pipelines)]
+        return render_registry(self.functions_of("backend"), self.functions_of("frontend"), pipelines)
+
+    def write(self) -> List[pathlib.Path]:
+        """Writes the registry files whose content changed and removes emptied ones; returns their paths."""
+        outputs = self.render()
+        written = [path for path, content in outputs.items() if write_atomic(path, content)]
+        for path in (CONTEXT_DIR / name for name in OPTIONAL_OUTPUTS):
+            if path not in outputs and path.exists():
+                path.unlink()
+                written.append(path)
+        save_cache(self.cache_entries)
+        return written
+
+
+class PollingWatcher:
+    """Detects changes by re-scanning mtimes and sizes every `interval` seconds."""
+
+    def __init__(self, interval: float = 1.0):
+        self.interval = interval
+        self.snapshot = self._scan()
+
+    @staticmethod
+    def _scan() -> Dict[pathlib.Path, tuple]:
+        snapshot = {}
+        for dirpath, filenames in _walk(sorted(set(BACKEND_PKGS + FRONTEND_PKGS + PIPELINE_DOCS))):
+            for name in filenames:
+                path = dirpath / name
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def wait(self, timeout: Optional[float]) -> set:
+        """Blocks until something changed (or `timeout` passed); returns the changed paths."""
+        remaining = timeout
+        while True:
+            delay = self.interval if remaining is None else min(self.interval, remaining)
+            time.sleep(delay)
+            current = self._scan()
+            changed = {p for p in current.keys() | self.snapshot.keys() if current.get(p) != self.snapshot.get(p)}
+            self.snapshot = current
+            if changed:
+                return changed
+            if remaining is not None:
+                remaining -= delay
+                if remaining <= 0:
+                    return set()
+
+    def close(self) -> None:
+        pass
+
+
+class InotifyWatcher:
+    """
+    Linux inotify through ctypes (no third-party dependency). Every directory
+    under the watched packages gets a watch; directories created later are
+    added as their IN_CREATE event arrives. A directory deleted or moved away
+    is reported as its own path, which Registry.update expands to the files it
+    held.
+    """
+    IN_MODIFY, IN_CLOSE_WRITE, IN_MOVED_FROM, IN_MOVED_TO = 0x002, 0x008, 0x040, 0x080
+    IN_CREATE, IN_DELETE, IN_ISDIR, IN_NONBLOCK, IN_CLOEXEC = 0x100, 0x200, 0x40000000, 0o4000, 0o2000000
+    MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    EVENT = struct.Struct("iIII")  # wd, mask, cookie, len (followed by the NUL-padded name)
+
+    def __init__(self):
+        import ctypes
+        self._libc = ctypes.CDLL(None, use_errno=True)
+        self._libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = self._libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.dirs: Dict[int, pathlib.Path] = {}
+        for pkg in sorted(set(BACKEND_PKGS + FRONTEND_PKGS + PIPELINE_DOCS)):
+            if (ROOT / pkg).is_dir():
+                self._watch_tree(ROOT / pkg)
+
+    def _watch_tree(self, root: pathlib.Path) -> set:
+        """Watches `root` and its subdirectories; returns the files already inside them."""
+        found = set()
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = [d for d in dirnames if d not in SKIP_DIRS]
+            wd = self._libc.inotify_add_watch(self.fd, os.fsencode(dirpath), self.MASK)
+            if wd >= 0:
+                self.dirs[wd] = pathlib.Path(dirpath)
+            found.update(pathlib.Path(dirpath, name) for name in filenames)
+        return found
+
+    def _forget_tree(self, root: pathlib.Path) -> None:
+        """Drops the watch paths under a removed directory (a move back in re-adds them under the new path)."""
+        for wd, directory in list(self.dirs.items()):
+            if directory == root or root in directory.parents:
+                del self.dirs[wd]
+
+    def wait(self, timeout: Optional[float]) -> set:
+        """Blocks until events arrive (or `timeout` passed); returns the changed paths."""
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return set()
+        changed = set()
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return changed
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = self.EVENT.unpack_from(data, offset)
+                offset += self.EVENT.size
+                name = data[offset:offset + length].rstrip(b"\0")
+                offset += length
+                directory = self.dirs.get(wd)
+                if directory is None or not name:
+                    continue
+                path = directory / os.fsdecode(name)
+                if mask & self.IN_ISDIR:
+                    if mask & (self.IN_CREATE | self.IN_MOVED_TO) and path.name not in SKIP_DIRS:
+                        changed |= self._watch_tree(path)
+                    elif mask & (self.IN_DELETE | self.IN_MOVED_FROM):
+                        self._forget_tree(path)
+                        changed.add(path)
+                    continue
+                changed.add(path)
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+def make_watcher(poll: bool = False, interval: float = 1.0):
+    """inotify where available, otherwise (or when `poll` is set) mtime polling."""
+    if not poll:
+        try:
+            return InotifyWatcher()
+        except (OSError, AttributeError) as e:  # Not Linux, or no inotify in this libc
+            print(f"inotify unavailable ({e}); falling back to polling every {interval}s")
+    return PollingWatcher(interval)
+
+
+def watch(registry: Registry, debounce: float = DEBOUNCE_SECONDS, poll: bool = False, interval: float = 1.0) -> None:
+    """
+    Keeps the registry current until interrupted: changes are collected until
+    `debounce` seconds pass without another one, then only the affected files
+    are re-extracted and only the changed outputs rewritten.
+    """
+    watcher = make_watcher(poll, interval)
+    print(f"Watching for changes ({type(watcher).__name__}); press Ctrl+C to stop.")
+    try:
+        while True:
+            changed = watcher.wait(None)
+            while True:  # Debounce: editors and git checkouts touch files in bursts
+                more = watcher.wait(debounce)
+                if not more:
+                    break
+                changed |= more
+            if not registry.update(changed):
+                continue
+            written = registry.write()
+            names = ", ".join(path.name for path in written) or "no output changes"
+            print(f"[{time.strftime('%H:%M:%S')}] {len(changed)} file(s) changed: {names}")
+    except KeyboardInterrupt:
+        print("Stopped watching.")
+    finally:
+        watcher.close()
+
+
+def main() -> None:
+    """
+    Main function that processes Python and TypeScript files and generates documentation.
+    """
+    parser = argparse.ArgumentParser(description="Regenerate the registry/ context files.")
+    parser.add_argument("--jobs", type=int, default=None, help="Parser processes (default: CPU count; 1 disables the pool)")
+    parser.add_argument("--no-cache", action="store_true", help="Re-parse every file and rebuild the cache")
+    parser.add_argument("--watch", action="store_true", help="Keep running and update the registry as files change")
+    parser.add_argument("--poll", action="store_true", help="With --watch: poll for changes instead of using inotify")
+    parser.add_argument("--debounce", type=float, default=DEBOUNCE_SECONDS, help="With --watch: quiet period before rewriting")
+    args = parser.parse_args()
+    
+    registry = Registry({} if args.no_cache else load_cache(), jobs=args.jobs)
+    registry.write()
+    
+    backend_functions = registry.functions_of("backend")
+    frontend_functions = registry.functions_of("frontend")
+    print(f"Parsed {registry.parsed} changed file(s), reused {len(registry.cache_entries) - registry.parsed} from cache")
     print(f"Exported {len(backend_functions)} backend functions")
     print(f"Exported {len(frontend_functions)} frontend components/functions")
-    print(f"Exported {len(pipeline_summaries)} pipeline summaries")
-    print(f"Machine-readable context: {context_file}")
-    print(f"Backend context: {backend_context_file}")
-    print(f"Frontend context: {frontend_context_file}")
-    if pipeline_summaries:
-        print(f"Pipeline context: {pipeline_context_file}")
+    print(f"Exported {len(registry.pipelines)} pipeline summaries")
+    print(f"Machine-readable context: {CONTEXT_DIR / 'function_registry.json'}")
+    print(f"Backend context: {CONTEXT_DIR / 'backend_context.md'}")
+    print(f"Frontend context: {CONTEXT_DIR / 'frontend_context.md'}")
+    if registry.pipelines:
+        print(f"Pipeline context: {CONTEXT_DIR / 'pipeline_context.md'}")
+    
+    if args.watch:
+        watch(registry, debounce=args.debounce, poll=args.poll)
 
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
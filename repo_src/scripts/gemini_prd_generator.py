@@ -3,16 +3,29 @@
 Gemini PRD Generator
 
 This script:
-1. Runs git dump to capture repository context
-2. Sends the context to Google Gemini API with a prompt to create a PRD
+1. Streams the repository context (git-tracked files, or a `git dump` file)
+   into token-budgeted chunks and keeps the ones most relevant to the prompt
+2. Sends the context to Google Gemini API with a prompt to create a PRD,
+   condensing the chunks concurrently first when they do not fit one request
 3. Saves the response in the docs/guides directory
+
+`--stand-in` runs everything against a local stand-in for the Gemini API.
 """
 
 import os
+import re
 import sys
 import json
+import math
+import heapq
+import random
 import argparse
+import threading
 import subprocess
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
 import requests
 import time
@@ -37,6 +50,25 @@ GEMINI_MODELS = {
     }
 }
 
+DEFAULT_ENDPOINT = os.environ.get("GEMINI_API_BASE", "https://generativelanguage.googleapis.com")
+DEFAULT_CHUNK_TOKENS = 60000  # Per map request; keeps each call well inside the input limit
+DEFAULT_MAX_CHUNKS = 16  # Only the most relevant chunks are sent
+DEFAULT_CONCURRENCY = 4
+DEFAULT_RETRIES = 4
+NOTES_OUTPUT_TOKENS = 2048  # Map/merge calls
+FINAL_OUTPUT_TOKENS = 8192  # The PRD itself
+REQUEST_TIMEOUT = 300
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_FILE_BYTES = 1024 * 1024  # Larger tracked files are generated or data, not useful context
+BINARY_SUFFIXES = {
+    ".png", ".jpg", ".jpeg", ".gif", ".ico", ".webp", ".pdf", ".zip", ".gz", ".db", ".sqlite",
+    ".woff", ".woff2", ".ttf", ".mp3", ".mp4", ".lock",
+}
+STOPWORDS = {"the", "and", "for", "with", "that", "this", "from", "are", "was", "will", "should", "into", "not"}
+
+class GeminiError(Exception):
+    """The Gemini API failed or returned something unusable."""
+
 def load_env_file():
     """Load environment variables from .env file in the scripts directory"""
     env_path = SCRIPT_DIR / ".env"
@@ -72,66 +104,290 @@ def run_git_dump():
     print(f"Git dump successful, context saved to {repo_context_path}")
     return repo_context_path
 
-def send_to_gemini(repo_context_path, prompt, api_key, model_name="gemini-1.5-pro"):
-    """Send repository context and prompt to Gemini API"""
-    
-    # Read the repository context
-    with open(repo_context_path, 'r') as file:
-        repo_context = file.read()
-    
-    # Construct the full prompt
-    full_prompt = f"{prompt}\n\nRepository Context:\n{repo_context}"
-    
-    # Get the appropriate API version for the selected model
+def iter_repository_files(root=PROJECT_ROOT):
+    """
+    Yields (path, text) for every git-tracked text file, one file at a time,
+    so the context never has to be held in memory as a whole.
+    """
+    listing = subprocess.run(["git", "ls-files", "-z"], cwd=root, capture_output=True, check=True)
+    for rel in listing.stdout.decode("utf-8", "replace").split("\0"):
+        if not rel or Path(rel).suffix.lower() in BINARY_SUFFIXES:
+            continue
+        path = root / rel
+        try:
+            if path.stat().st_size > MAX_FILE_BYTES:
+                continue
+            with open(path, "r", encoding="utf-8") as file:
+                yield rel, file.read()
+        except (OSError, UnicodeDecodeError):
+            continue  # Unreadable or binary
+
+def iter_context_dump(repo_context_path):
+    """Yields the lines of a `git dump` output file as one streamed source."""
+    with open(repo_context_path, "r", encoding="utf-8", errors="replace") as file:
+        yield str(repo_context_path.name), file
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token), matching the backend's estimate."""
+    return max(1, len(text) // 4)
+
+def tokenize(text):
+    return [t for t in re.findall(r"[a-z0-9_]+", text.lower()) if len(t) > 2 and t not in STOPWORDS]
+
+@dataclass
+class Chunk:
+    sources: list
+    text: str
+    tokens: int
+
+@dataclass
+class Piece:
+    """A file, or a line-aligned part of one, small enough for a single chunk."""
+    source: str
+    text: str
+    tokens: int
+    order: int = 0
+    score: float = 0.0
+
+def iter_pieces(sources, max_tokens):
+    """Splits streamed (name, text-or-lines) sources into pieces of at most ~max_tokens, on line boundaries."""
+    budget_chars = max_tokens * 4
+    for name, content in sources:
+        lines = content.splitlines(keepends=True) if isinstance(content, str) else content
+        parts, size = [], 0
+        for line in lines:
+            if size + len(line) > budget_chars and parts:
+                yield Piece(source=name, text="".join(parts), tokens=estimate_tokens("".join(parts)))
+                parts, size = [], 0
+            parts.append(line)
+            size += len(line)
+        if parts:
+            yield Piece(source=name, text="".join(parts), tokens=estimate_tokens("".join(parts)))
+
+def relevance(piece, query_terms):
+    """Overlap of the prompt's terms with the piece (damped term counts, file path weighted up), per length."""
+    if not query_terms:
+        return 0.0
+    counts = Counter(tokenize(piece.text))
+    path_terms = set(tokenize(piece.source))
+    score = sum(math.log1p(counts[t]) + (2.0 if t in path_terms else 0.0) for t in query_terms)
+    return score / math.log2(2 + piece.tokens / 250)
+
+def select_pieces(sources, prompt, chunk_tokens, max_chunks):
+    """
+    Streams the sources and keeps the pieces most relevant to the prompt within
+    a budget of max_chunks * chunk_tokens tokens (a heap from which the least
+    relevant pieces are evicted, so memory stays bounded by the budget).
+    Returns the kept pieces in repository order, plus the number of pieces seen.
+    """
+    query_terms = set(tokenize(prompt))
+    budget = chunk_tokens * max_chunks
+    heap, total, seen = [], 0, 0
+    for order, piece in enumerate(iter_pieces(sources, chunk_tokens)):
+        seen += 1
+        piece.order, piece.score = order, relevance(piece, query_terms)
+        heapq.heappush(heap, (piece.score, -order, piece))
+        total += piece.tokens
+        while total > budget:
+            total -= heapq.heappop(heap)[2].tokens
+    return sorted((entry[2] for entry in heap), key=lambda p: p.order), seen
+
+def fit_chunks(pieces, chunk_tokens, max_chunks):
+    """
+    Packs pieces into at most max_chunks chunks. Packing in repository order leaves
+    gaps at chunk ends, so the budget kept by select_pieces can spill into extra
+    chunks; the least relevant pieces are dropped until it does not.
+    Returns the chunks and the pieces they hold.
+    """
+    pieces = list(pieces)
+    chunks = list(pack_chunks(pieces, chunk_tokens))
+    while len(chunks) > max_chunks:
+        least = min(pieces, key=lambda p: (p.score, -p.order))
+        pieces.remove(least)
+        chunks = list(pack_chunks(pieces, chunk_tokens))
+    return chunks, pieces
+
+def pack_chunks(pieces, chunk_tokens):
+    """Packs pieces, in order, into chunks of at most ~chunk_tokens, each piece headed by its file name."""
+    parts, names, size = [], [], 0
+    for piece in pieces:
+        text = f"\n===== {piece.source} =====\n{piece.text}"
+        if parts and size + piece.tokens > chunk_tokens:
+            yield Chunk(sources=names, text="".join(parts), tokens=size)
+            parts, names, size = [], [], 0
+        parts.append(text)
+        names.append(piece.source)
+        size += piece.tokens
+    if parts:
+        yield Chunk(sources=names, text="".join(parts), tokens=size)
+
+def call_gemini(session, text, api_key, model_name, endpoint, max_output_tokens, retries=DEFAULT_RETRIES, backoff=1.0):
+    """
+    One generateContent call with retries: connection errors, timeouts, 429 and
+    5xx responses are retried with exponential backoff and jitter (honouring
+    Retry-After); other errors fail immediately. Returns the generated text.
+    """
     api_version = GEMINI_MODELS[model_name]["api_version"]
-    
-    # Set up the API request
-    url = f"https://generativelanguage.googleapis.com/{api_version}/models/{model_name}:generateContent"
-    headers = {
-        "Content-Type": "application/json"
-    }
-    
+    url = f"{endpoint.rstrip('/')}/{api_version}/models/{model_name}:generateContent"
     data = {
-        "contents": [
-            {
-                "parts": [
-                    {
-                        "text": full_prompt
-                    }
-                ]
-            }
-        ],
+        "contents": [{"parts": [{"text": text}]}],
         "generationConfig": {
             "temperature": 0.2,
             "topP": 0.8,
             "topK": 40,
-            "maxOutputTokens": 8192
+            "maxOutputTokens": max_output_tokens
         }
     }
-    
-    # Add API key as query parameter
-    params = {
-        "key": api_key
-    }
-    
-    print(f"Sending request to Gemini API using model: {model_name} (API version: {api_version})...")
-    response = requests.post(url, headers=headers, json=data, params=params)
-    
-    if response.status_code != 200:
-        print(f"Error from Gemini API: {response.status_code}")
-        print(response.text)
-        sys.exit(1)
-    
-    response_data = response.json()
-    
-    # Extract the generated text from the response
+    for attempt in range(retries + 1):
+        retry_after = None
+        try:
+            response = session.post(url, headers={"Content-Type": "application/json"}, json=data,
+                                    params={"key": api_key}, timeout=REQUEST_TIMEOUT)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error = f"{type(e).__name__}: {e}"
+        else:
+            if response.status_code == 200:
+                try:
+                    return response.json()["candidates"][0]["content"]["parts"][0]["text"]
+                except (KeyError, IndexError, ValueError) as e:
+                    raise GeminiError(f"Error parsing Gemini API response: {e}: {response.text[:500]}")
+            if response.status_code not in RETRY_STATUSES:
+                raise GeminiError(f"Error from Gemini API: {response.status_code}\n{response.text}")
+            error = f"HTTP {response.status_code}"
+            retry_after = response.headers.get("Retry-After")
+        if attempt == retries:
+            raise GeminiError(f"Gemini API still failing after {retries + 1} attempts ({error})")
+        delay = float(retry_after) if retry_after and retry_after.isdigit() else backoff * 2 ** attempt
+        delay += random.uniform(0, backoff)
+        print(f"  {error}; retrying in {delay:.1f}s (attempt {attempt + 2}/{retries + 1})")
+        time.sleep(delay)
+
+def map_prompt(prompt, chunk, index, total):
+    return (
+        f"You are helping write a PRD. The request is:\n\n{prompt}\n\n"
+        f"Below is part {index} of {total} of the repository. Extract only what matters for this request: "
+        "relevant modules, functions, data models, endpoints, conventions and constraints, with file paths. "
+        "Be concise and factual. If nothing in this part is relevant, answer 'Nothing relevant.'\n"
+        f"{chunk.text}"
+    )
+
+def reduce_prompt(prompt, notes):
+    return f"{prompt}\n\nRepository notes (extracted from the most relevant parts of the codebase):\n\n" + "\n\n".join(notes)
+
+def merge_prompt(prompt, notes):
+    return (
+        f"The following are repository notes gathered for this request:\n\n{prompt}\n\n"
+        "Merge them into one concise set of notes, removing duplicates and anything irrelevant. Keep file paths.\n\n"
+        + "\n\n".join(notes)
+    )
+
+def send_to_gemini(sources, prompt, api_key, model_name="gemini-1.5-pro", endpoint=DEFAULT_ENDPOINT,
+                   chunk_tokens=DEFAULT_CHUNK_TOKENS, max_chunks=DEFAULT_MAX_CHUNKS, concurrency=DEFAULT_CONCURRENCY,
+                   retries=DEFAULT_RETRIES):
+    """
+    Send repository context and prompt to Gemini API.
+
+    The context is streamed file by file; only the pieces most relevant to the
+    prompt are kept and packed into at most max_chunks chunks. If a single chunk remains it is sent with the prompt as before.
+    Otherwise each chunk is condensed into notes concurrently (map), the notes are
+    merged until they fit one request (reduce), and the PRD is written from them.
+    Each thread uses its own requests.Session, since sessions are not thread-safe.
+    """
+    pieces, seen = select_pieces(sources, prompt, chunk_tokens, max_chunks)
+    chunks, pieces = fit_chunks(pieces, chunk_tokens, max_chunks)
+    if not chunks:
+        raise GeminiError("No repository context found.")
+    print(f"Context: kept the {len(pieces)} most relevant of {seen} file piece(s), "
+          f"in {len(chunks)} chunk(s) of up to ~{chunk_tokens} tokens.")
+    print(f"Sending requests to Gemini API using model: {model_name} ({endpoint})...")
+
+    local, sessions, sessions_lock = threading.local(), [], threading.Lock()
+
+    def call(text, max_output_tokens):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+            with sessions_lock:
+                sessions.append(session)
+        return call_gemini(session, text, api_key, model_name, endpoint, max_output_tokens, retries=retries)
+
     try:
-        generated_text = response_data["candidates"][0]["content"]["parts"][0]["text"]
-        return generated_text
-    except (KeyError, IndexError) as e:
-        print(f"Error parsing Gemini API response: {e}")
-        print(f"Response: {response_data}")
-        sys.exit(1)
+        if len(chunks) == 1:
+            return call(f"{prompt}\n\nRepository Context:\n{chunks[0].text}", FINAL_OUTPUT_TOKENS)
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            futures = [pool.submit(call, map_prompt(prompt, chunk, i + 1, len(chunks)), NOTES_OUTPUT_TOKENS)
+                       for i, chunk in enumerate(chunks)]
+            notes = []
+            for chunk, future in zip(chunks, futures):
+                text = future.result().strip()
+                if text and not text.lower().startswith("nothing relevant"):
+                    notes.append(f"### Notes from {', '.join(chunk.sources[:5])}\n{text}")
+            print(f"Map step: {len(notes)} of {len(chunks)} chunk(s) had relevant notes.")
+
+            # Reduce: merge batches of notes until they fit a single request.
+            while len(notes) > 1 and estimate_tokens("\n\n".join(notes)) > chunk_tokens:
+                batches, batch, size = [], [], 0
+                for note in notes:
+                    if batch and size + estimate_tokens(note) > chunk_tokens:
+                        batches.append(batch)
+                        batch, size = [], 0
+                    batch.append(note)
+                    size += estimate_tokens(note)
+                batches.append(batch)
+                if len(batches) == len(notes):  # Each note alone fills a request; merging cannot shrink further
+                    break
+                notes = list(pool.map(lambda b: call(merge_prompt(prompt, b), NOTES_OUTPUT_TOKENS), batches))
+                print(f"Reduce step: merged into {len(notes)} note set(s).")
+
+        return call(reduce_prompt(prompt, notes), FINAL_OUTPUT_TOKENS)
+    finally:
+        for session in sessions:
+            session.close()
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    """Answers generateContent like Gemini does, with a deterministic summary of the request."""
+    fail_every = 0
+    requests_seen = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        with self.lock:
+            type(self).requests_seen += 1
+            count = self.requests_seen
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.fail_every and count % self.fail_every == 0:
+            self._reply(503, {"error": {"code": 503, "message": "Stand-in: simulated overload"}})
+            return
+        text = body["contents"][0]["parts"][0]["text"]
+        files = re.findall(r"^===== (.+?) =====$", text, re.MULTILINE)
+        summary = f"Stand-in response #{count} ({estimate_tokens(text)} prompt tokens"
+        summary += f", files: {', '.join(files[:5])})" if files else ")"
+        self._reply(200, {"candidates": [{"content": {"parts": [{"text": summary}]}}]})
+
+    def _reply(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        if status == 503:
+            self.send_header("Retry-After", "0")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_stand_in_server(port=0, fail_every=0):
+    """
+    Starts a local stand-in for the Gemini API in a background thread and returns
+    (server, endpoint). With fail_every=N every Nth request gets a 503, to
+    exercise the retry path.
+    """
+    handler = type("StandInHandler", (_StandInHandler,), {"fail_every": fail_every, "requests_seen": 0})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
 
 def save_to_guides(content, filename):
     """Save the generated PRD to the docs/guides directory"""
@@ -171,11 +427,24 @@ def main():
         model_help += f"  - {model}: {info['description']} (API version: {info['api_version']})\n"
     
     parser.add_argument("--model", choices=model_choices, default=default_model, help=model_help)
+    parser.add_argument("--git-dump", action="store_true", help="Use `git dump` output instead of streaming git-tracked files")
+    parser.add_argument("--chunk-tokens", type=int, default=DEFAULT_CHUNK_TOKENS, help="Approximate tokens per context chunk")
+    parser.add_argument("--max-chunks", type=int, default=DEFAULT_MAX_CHUNKS, help="Most context chunks to send; the most relevant files fill them")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Concurrent map requests")
+    parser.add_argument("--retries", type=int, default=DEFAULT_RETRIES, help="Retries per request on 429/5xx/network errors")
+    parser.add_argument("--endpoint", default=DEFAULT_ENDPOINT, help="API base URL (env: GEMINI_API_BASE)")
+    parser.add_argument("--stand-in", action="store_true", help="Use a local stand-in for the Gemini API (no key needed)")
+    parser.add_argument("--stand-in-fail-every", type=int, default=0, help="With --stand-in: answer every Nth request with 503")
     
     args = parser.parse_args()
     
+    endpoint = args.endpoint
+    if args.stand_in:
+        server, endpoint = start_stand_in_server(fail_every=args.stand_in_fail_every)
+        print(f"Using local Gemini stand-in at {endpoint}")
+    
     # Get API key from args or environment variable
-    api_key = args.api_key or os.environ.get("GOOGLE_API_KEY")
+    api_key = args.api_key or os.environ.get("GOOGLE_API_KEY") or ("stand-in" if args.stand_in else None)
     if not api_key:
         print("Error: Google API key is required. Provide it with --api-key or set GOOGLE_API_KEY environment variable.")
         sys.exit(1)
@@ -184,12 +453,19 @@ def main():
     print(f"Using model: {args.model} - {GEMINI_MODELS[args.model]['description']}")
     
     # Run the workflow
-    repo_context_path = run_git_dump()
-    generated_content = send_to_gemini(repo_context_path, args.prompt, api_key, args.model)
+    sources = iter_context_dump(run_git_dump()) if args.git_dump else iter_repository_files()
+    try:
+        generated_content = send_to_gemini(
+            sources, args.prompt, api_key, args.model, endpoint=endpoint, chunk_tokens=args.chunk_tokens,
+            max_chunks=args.max_chunks, concurrency=args.concurrency, retries=args.retries,
+        )
+    except GeminiError as e:
+        print(e)
+        sys.exit(1)
     output_path = save_to_guides(generated_content, args.filename)
     
     print(f"✅ PRD generation complete!")
     print(f"Output file: {output_path}")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()